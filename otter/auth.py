@@ -37,12 +37,13 @@ a token.)
 """
 
 import json
+import random
 from itertools import groupby
 from functools import partial
 
 from characteristic import attributes
 
-from twisted.internet.defer import succeed
+from twisted.internet.defer import fail, succeed
 
 from txeffect import deferred_performer
 
@@ -52,6 +53,8 @@ from otter.log import BoundLog, log as default_log
 from otter.util import logging_treq as treq
 from otter.util.deferredutils import delay, wait
 from otter.util.http import (
+    APIError,
+    UpstreamError,
     append_segments,
     check_success,
     headers,
@@ -102,7 +105,58 @@ class ICachingAuthenticator(IAuthenticator):
 
         :param tenant_id: A keystone tenant ID
 
-        :returns: :data:`None`
+        :returns: :data:`None` or Deferred that fires with :data:`None`
+        """
+
+
+class ITokenCache(Interface):
+    """
+    A cache of tenants' tokens shared between otter processes.
+    """
+    def get_token(tenant_id):
+        """
+        Get the cached token of a tenant.
+
+        :param tenant_id: A keystone tenant ID
+
+        :returns: Deferred that fires with a 2-tuple of the EPOCH seconds when
+            the token was created and the 2-tuple of auth token and service
+            catalog, or None if there is no token cached
+        """
+
+    def set_token(tenant_id, created, data, ttl):
+        """
+        Cache a tenant's token.
+
+        :param tenant_id: A keystone tenant ID
+        :param float created: EPOCH seconds when the token was created
+        :param data: 2-tuple of auth token and service catalog
+        :param int ttl: Number of seconds after which the token is not to be
+            returned anymore
+
+        :returns: Deferred that fires with None
+        """
+
+    def delete_token(tenant_id):
+        """
+        Remove a tenant's token from the cache.
+
+        :param tenant_id: A keystone tenant ID
+
+        :returns: Deferred that fires with None
+        """
+
+    def claim_refresh(tenant_id, ttl):
+        """
+        Claim the right to refresh a tenant's token. At most one claim of a
+        tenant succeeds within ``ttl`` seconds, so that only one process
+        re-authenticates the tenant.
+
+        :param tenant_id: A keystone tenant ID
+        :param int ttl: Number of seconds the claim is held for
+
+        :returns: Deferred that fires with True if the claim succeeded,
+            False otherwise
         """
 
 
@@ -154,26 +208,65 @@ class WaitingAuthenticator(object):
         return d
 
 
+def _is_rejection(f):
+    """
+    Is given authentication failure a definitive rejection by identity, as
+    opposed to a transient error?
+    """
+    if f.check(UpstreamError):
+        f = f.value.reason
+    return bool(f.check(APIError)) and f.value.code in (401, 403, 404)
+
+
 @implementer(ICachingAuthenticator)
 class CachingAuthenticator(object):
     """
     An authenticator which cases the result of the provided auth_function
     based on the tenant_id.
 
+    If a shared cache is given, it is used when the token is not found in
+    memory. Tokens got from the provided authenticator are stored in it so
+    that other processes can use them.
+
+    If a refresh margin is given, tokens of tenants used within the last TTL
+    are refreshed in the background at a random time between the margin and
+    half the margin before they expire. A token used within the margin of
+    its expiry is also refreshed while the cached token continues to be
+    returned. With a shared cache, only the process that claims the refresh
+    re-authenticates.
+
+    If a failure TTL is given, authentication failures where identity
+    definitively rejected the tenant (401, 403 or 404) are cached for that
+    many seconds and returned without authenticating again. Other failures,
+    such as timeouts, connection errors or 5xx responses, are not cached.
+
     :param IReactorTime reactor: An IReactorTime provider used for enforcing
         the cache TTL.
     :param IAuthenticator authenticator:
     :param int ttl: An integer indicating the TTL of a cache entry in seconds.
-    """
-    def __init__(self, reactor, authenticator, ttl):
+    :param ITokenCache shared_cache: Optional cache shared between processes
+    :param int refresh_margin: Number of seconds before expiry when a used
+        token is refreshed in the background. 0 disables refreshing ahead.
+    :param int failure_ttl: Number of seconds definitive authentication
+        failures are cached for. 0 disables caching failures.
+    """
+    def __init__(self, reactor, authenticator, ttl, shared_cache=None,
+                 refresh_margin=0, failure_ttl=0):
         self._reactor = reactor
         self._authenticator = authenticator
         self._ttl = ttl
+        self._shared_cache = shared_cache
+        self._refresh_margin = refresh_margin
+        self._failure_ttl = failure_ttl
 
         self._waiters = {}
         self._cache = {}
+        self._failures = {}
+        self._last_used = {}
+        self._timers = {}
+        self._refreshing = set()
         self._log = self._bind_log(default_log)
-        self._auth_func = wait(ignore_kwargs=['log'])(self._authenticator.authenticate_tenant)
+        self._auth_func = wait(ignore_kwargs=['log'])(self._authenticate)
 
     def _bind_log(self, log, **kwargs):
         """
@@ -193,30 +286,183 @@ class CachingAuthenticator(object):
         else:
             log = self._bind_log(log, tenant_id=tenant_id)
 
+        now = self._reactor.seconds()
         if tenant_id in self._cache:
             (created, data) = self._cache[tenant_id]
-            now = self._reactor.seconds()
 
             if now - created <= self._ttl:
                 log.msg('otter.auth.cache.hit', age=now - created)
+                self._record_use(tenant_id, now)
+                self._refresh_ahead(tenant_id, created, log)
                 return succeed(data)
 
             log.msg('otter.auth.cache.expired', age=now - created)
+            self._expire(tenant_id)
+
+        self._record_use(tenant_id, now)
+
+        f = self._recent_failure(tenant_id)
+        if f is not None:
+            log.msg('otter.auth.cache.failure-hit')
+            return fail(f)
+
+        log.msg('otter.auth.cache.miss')
+        if self._shared_cache is None:
+            return self._auth_func(tenant_id, log=log)
 
+        def got_shared(entry):
+            now = self._reactor.seconds()
+            if entry is None or now - entry[0] > self._ttl:
+                return self._auth_func(tenant_id, log=log)
+            log.msg('otter.auth.cache.shared.hit', age=now - entry[0])
+            self._populate(tenant_id, entry)
+            self._refresh_ahead(tenant_id, entry[0], log)
+            return entry[1]
+
+        d = self._shared_cache.get_token(tenant_id)
+        d.addErrback(log.err, 'otter.auth.cache.shared.error')
+        return d.addCallback(got_shared)
+
+    def _authenticate(self, tenant_id, log):
+        """
+        Authenticate with the provided authenticator and populate the caches
+        """
         def when_authenticated(result):
             log.msg('otter.auth.cache.populate')
-            self._cache[tenant_id] = (self._reactor.seconds(), result)
+            created = self._reactor.seconds()
+            self._failures.pop(tenant_id, None)
+            self._populate(tenant_id, (created, result))
+            if self._shared_cache is not None:
+                sd = self._shared_cache.set_token(
+                    tenant_id, created, result, self._ttl)
+                sd.addErrback(log.err, 'otter.auth.cache.shared.error')
             return result
 
-        log.msg('otter.auth.cache.miss')
-        d = self._auth_func(tenant_id, log=log)
-        d.addCallback(when_authenticated)
+        def when_failed(f):
+            if self._failure_ttl > 0 and _is_rejection(f):
+                self._failures[tenant_id] = (self._reactor.seconds(), f)
+            if tenant_id not in self._cache:
+                # No token to refresh
+                self._last_used.pop(tenant_id, None)
+            return f
 
-        return d
+        d = self._authenticator.authenticate_tenant(tenant_id, log=log)
+        return d.addCallbacks(when_authenticated, when_failed)
 
-    def invalidate(self, tenant_id):
-        """Remove a tenant's token from the cache."""
+    def _recent_failure(self, tenant_id):
+        """
+        Return failure of tenant's authentication if it happened within the
+        failure TTL, None otherwise
+        """
+        if tenant_id not in self._failures:
+            return None
+        (failed, f) = self._failures[tenant_id]
+        if self._reactor.seconds() - failed <= self._failure_ttl:
+            return f
+        del self._failures[tenant_id]
+
+    def _record_use(self, tenant_id, now):
+        """
+        Remember when the tenant was last used if refreshing ahead, to only
+        refresh tokens of tenants in use
+        """
+        if self._refresh_margin > 0:
+            self._last_used[tenant_id] = now
+
+    def _expire(self, tenant_id):
+        """
+        Forget tenant's token along with when it was used and its scheduled
+        refresh
+        """
         self._cache.pop(tenant_id, None)
+        self._last_used.pop(tenant_id, None)
+        timer = self._timers.pop(tenant_id, None)
+        if timer is not None and timer.active():
+            timer.cancel()
+
+    def _populate(self, tenant_id, entry):
+        """
+        Cache given entry of (created, data) in memory and schedule its
+        refresh if refreshing ahead
+        """
+        self._cache[tenant_id] = entry
+        if self._refresh_margin <= 0:
+            return
+        timer = self._timers.pop(tenant_id, None)
+        if timer is not None and timer.active():
+            timer.cancel()
+        delay = (entry[0] + self._ttl - self._reactor.seconds() -
+                 random.uniform(self._refresh_margin / 2.0,
+                                self._refresh_margin))
+        self._timers[tenant_id] = self._reactor.callLater(
+            max(delay, 0), self._scheduled_refresh, tenant_id, entry[0])
+
+    def _scheduled_refresh(self, tenant_id, created):
+        """
+        Refresh tenant's token if the tenant was used within the last TTL.
+        Otherwise forget when it was used
+        """
+        del self._timers[tenant_id]
+        if (self._last_used.get(tenant_id, -self._ttl) <
+                self._reactor.seconds() - self._ttl):
+            self._last_used.pop(tenant_id, None)
+            return
+        self._refresh(tenant_id, created, self._log.bind(tenant_id=tenant_id))
+
+    def _refresh_ahead(self, tenant_id, created, log):
+        """
+        Refresh tenant's token in the background if it expires within the
+        refresh margin
+        """
+        age = self._reactor.seconds() - created
+        if self._refresh_margin > 0 and age > self._ttl - self._refresh_margin:
+            self._refresh(tenant_id, created, log)
+
+    def _refresh(self, tenant_id, created, log):
+        """
+        Refresh tenant's token created at given time in the background
+        """
+        if (tenant_id in self._refreshing or
+                self._recent_failure(tenant_id) is not None):
+            return
+
+        def refresh_if_claimed(claimed):
+            if claimed:
+                return self._auth_func(tenant_id, log=log)
+
+        def claim(entry):
+            if entry is not None and entry[0] > created:
+                # Another process has already refreshed it
+                self._populate(tenant_id, entry)
+                return
+            d = self._shared_cache.claim_refresh(tenant_id,
+                                                 self._refresh_margin)
+            return d.addCallback(refresh_if_claimed)
+
+        log.msg('otter.auth.cache.refresh',
+                age=self._reactor.seconds() - created)
+        self._refreshing.add(tenant_id)
+        if self._shared_cache is None:
+            d = self._auth_func(tenant_id, log=log)
+        else:
+            d = self._shared_cache.get_token(tenant_id).addCallback(claim)
+        d.addErrback(log.err, 'otter.auth.cache.refresh.error')
+        d.addBoth(lambda _: self._refreshing.discard(tenant_id))
+
+    def invalidate(self, tenant_id):
+        """
+        Remove a tenant's token from the cache.
+
+        :return: Deferred that fires with None when the token is also removed
+            from the shared cache, if there is one
+        """
+        self._expire(tenant_id)
+        self._failures.pop(tenant_id, None)
+        if self._shared_cache is not None:
+            d = self._shared_cache.delete_token(tenant_id)
+            d.addErrback(self._log.err, 'otter.auth.cache.shared.error',
+                         tenant_id=tenant_id)
+            return d.addCallback(lambda _: None)
 
 
 @implementer(IAuthenticator)
@@ -575,12 +821,14 @@ def perform_invalidate_token(dispatcher, intent):
     return intent.authenticator.invalidate(intent.tenant_id)
 
 
-def generate_authenticator(reactor, config):
+def generate_authenticator(reactor, config, shared_cache=None):
     """
     Generate authenticator based on settings in config
 
     :param reactor: Twisted reactor
     :param dict config: Identity specific config
+    :param ITokenCache shared_cache: Optional token cache shared between
+        processes
     """
     # FIXME: Pick an arbitrary cache ttl value based on absolutely no science.
     cache_ttl = config.get('cache_ttl', 300)
@@ -606,4 +854,7 @@ def generate_authenticator(reactor, config):
                 max_retries=config['max_retries'],
                 retry_interval=config['retry_interval']),
             config.get('wait', 5)),
-        cache_ttl)
+        cache_ttl,
+        shared_cache=shared_cache,
+        refresh_margin=config.get('cache_refresh_margin', 0),
+        failure_ttl=config.get('cache_failure_ttl', 0))
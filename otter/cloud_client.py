@@ -30,6 +30,7 @@ from otter.auth import Authenticate, InvalidateToken, public_endpoint_url
 from otter.constants import ServiceType
 from otter.log.intents import msg as msg_effect
 from otter.util.config import config_value
+from otter.util.dispatcher import flatten_dispatcher
 from otter.util.http import APIError, append_segments, try_json_with_keys
 from otter.util.http import headers as otter_headers
 from otter.util.pure_http import (
@@ -42,6 +43,7 @@ from otter.util.pure_http import (
     has_code,
     request,
 )
+from otter.util.ratelimit import rate_limiters as _rate_limiters
 from otter.util.weaklocks import WeakLocks
 
 
@@ -265,11 +267,27 @@ _CFG_NAMES_PER_TENANT = {
     (ServiceType.CLOUD_LOAD_BALANCERS, 'delete'): 'delete_clb_delay',
 }
 
+# Token-bucket rate limits, which take precedence over the delays above when
+# configured under ``cloud_client.rate_limits``
+_RATE_LIMIT_NAMES = {
+    (ServiceType.CLOUD_SERVERS, 'post'): 'create_server',
+}
+
 
-def _default_throttler(locks, clock, stype, method, tenant_id):
+def _default_throttler(locks, clock, stype, method, tenant_id,
+                       rate_limiters=None):
     """
     Get a throttler function with throttling policies based on configuration.
+
+    :param rate_limiters: :obj:`RateLimiters` to look up token-bucket rate
+        limits in.
     """
+    name = _RATE_LIMIT_NAMES.get((stype, method))
+    if name is not None and rate_limiters is not None:
+        limiter = rate_limiters.get(name, clock)
+        if limiter is not None:
+            return partial(limiter.run, tenant_id)
+
     cfg_name = _CFG_NAMES.get((stype, method))
     if cfg_name is not None:
         delay = config_value('cloud_client.throttling.' + cfg_name)
@@ -305,9 +323,9 @@ def perform_tenant_scope(
         return _concretize(
             authenticator, log, service_configs, throttler,
             tenant_scope.tenant_id, service_request)
-    new_disp = ComposedDispatcher([
+    new_disp = flatten_dispatcher(ComposedDispatcher([
         TypeDispatcher({ServiceRequest: scoped_performer}),
-        dispatcher])
+        dispatcher]))
     perform(new_disp, tenant_scope.effect.on(box.succeed, box.fail))
 
 
@@ -318,7 +336,8 @@ def get_cloud_client_dispatcher(reactor, authenticator, log, service_configs):
     """
     # this throttler could be parameterized but for now it's basically a hack
     # that we want to keep private to this module
-    throttler = partial(_default_throttler, WeakLocks(), reactor)
+    throttler = partial(_default_throttler, WeakLocks(), reactor,
+                        rate_limiters=_rate_limiters)
     return TypeDispatcher({
         TenantScope: partial(perform_tenant_scope, authenticator, log,
                              service_configs, throttler),
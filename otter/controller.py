@@ -21,6 +21,7 @@ Storage model for state information:
  * last touched information for policy
 """
 import json
+from copy import deepcopy
 from datetime import datetime
 from decimal import Decimal, ROUND_UP
 from functools import partial
@@ -39,6 +40,7 @@ from six import reraise
 from toolz.dicttoolz import get_in
 
 from twisted.internet import defer
+from twisted.python.failure import Failure
 
 from txeffect import perform
 
@@ -303,29 +305,141 @@ def empty_group(log, trans_id, group):
     return d
 
 
-@defer.inlineCallbacks
+# Modifications of each group, keyed by tenant ID and group ID, that are
+# waiting for the group's lock and can be coalesced with new ones
+_pending_modifications = {}
+
+
+class _NoModification(Exception):
+    """
+    Raised to :meth:`IScalingGroup.modify_state` when none of the coalesced
+    modifications succeeded, so that the group state is not written.
+    """
+
+
 def modify_and_trigger(dispatcher, group, logargs, modifier, *args, **kwargs):
     """
     Modify group state and trigger convergence after that
 
+    Modifications of a group requested while an earlier one is still waiting
+    for the group's lock are coalesced with it: they are applied in the order
+    they were requested in a single call to ``group.modify_state``, each one
+    getting the state returned by the last successful one (so that cooldowns
+    are checked against the policy executions before it), and convergence is
+    triggered once for all of them. Only modifications with the same
+    ``modify_state_reason`` are coalesced.
+
     :param IScalingGroup group: Scaling group whose state is getting modified
     :param log: Bound logger
     :param modifier: Callable as described in IScalingGroup.modify_state
 
     :return: Deferred with None
     """
-    cannot_exec_pol_err = None
-    try:
-        yield group.modify_state(modifier, *args, **kwargs)
-    except CannotExecutePolicyError as ce:
-        cannot_exec_pol_err = ce
-    if tenant_is_enabled(group.tenant_id, config_value):
+    reason = kwargs.pop('modify_state_reason', None)
+    d = defer.Deferred()
+    key = (group.tenant_id, group.uuid, reason)
+    batch = _pending_modifications.get(key)
+    if batch is not None:
+        batch.append((modifier, args, kwargs, d))
+        return d
+    batch = _pending_modifications[key] = [(modifier, args, kwargs, d)]
+    _modify_and_trigger_batch(dispatcher, group, logargs, key, batch, reason)
+    return d
+
+
+def _apply_modifications(batch, failures, group, state):
+    """
+    Apply coalesced modifications in order, each to the state returned by
+    the last successful one, recording the failures by index in ``failures``.
+    When there are several, every modification gets a copy of that state, so
+    that the changes made by one that fails are not kept.
+
+    :return: Deferred that fires with the final state
+    :raises: :class:`_NoModification` if all of them fail
+    """
+    def apply_modification(state, index, modifier, args, kwargs):
+        d = defer.maybeDeferred(
+            modifier, group, deepcopy(state) if len(batch) > 1 else state,
+            *args, **kwargs)
+
+        def failed(f):
+            failures[index] = f
+            return state
+
+        return d.addErrback(failed)
+
+    def check_modified(state):
+        if len(failures) == len(batch):
+            raise _NoModification()
+        return state
+
+    d = defer.succeed(state)
+    for index, (modifier, args, kwargs, _) in enumerate(batch):
+        d.addCallback(apply_modification, index, modifier, args, kwargs)
+    return d.addCallback(check_modified)
+
+
+@defer.inlineCallbacks
+def _trigger_modifications(dispatcher, group, logargs, batch, failures):
+    """
+    Trigger convergence once for a batch of coalesced modifications if the
+    tenant is a convergence tenant. Like a single modification, this is done
+    even if a policy could not be executed. If triggering fails, its failure
+    is recorded in ``failures`` for all the modifications that triggered it.
+    """
+    triggered = [index for index in range(len(batch))
+                 if index not in failures or
+                 failures[index].check(CannotExecutePolicyError)]
+    if triggered and tenant_is_enabled(group.tenant_id, config_value):
         eff = Effect(
             BoundFields(
                 trigger_convergence(group.tenant_id, group.uuid), logargs))
-        yield perform(dispatcher, eff)
-    if cannot_exec_pol_err is not None:
-        raise cannot_exec_pol_err
+        try:
+            yield perform(dispatcher, eff)
+        except Exception:
+            f = Failure()
+            for index in triggered:
+                failures[index] = f
+
+
+@defer.inlineCallbacks
+def _modify_and_trigger_batch(dispatcher, group, logargs, key, batch,
+                              reason):
+    """
+    Apply a batch of coalesced modifications with one ``modify_state`` and
+    fire each modification's Deferred with its own outcome.
+    """
+    failures = {}
+
+    def close_batch():
+        if _pending_modifications.get(key) is batch:
+            del _pending_modifications[key]
+
+    def modify_all(group, state):
+        close_batch()
+        # the state may be modified again if it changed concurrently
+        failures.clear()
+        return _apply_modifications(batch, failures, group, state)
+
+    try:
+        yield group.modify_state(modify_all, modify_state_reason=reason)
+    except _NoModification:
+        pass
+    except Exception:
+        # Only the modifications that succeeded or were never applied get
+        # the failure of reading or writing the state
+        f = Failure()
+        for index in range(len(batch)):
+            failures.setdefault(index, f)
+    finally:
+        close_batch()
+
+    yield _trigger_modifications(dispatcher, group, logargs, batch, failures)
+    for index, (_, _, _, d) in enumerate(batch):
+        if index in failures:
+            d.errback(failures[index])
+        else:
+            d.callback(None)
 
 
 def converge(log, transaction_id, config, scaling_group, state, launch_config,
@@ -1,7 +1,13 @@
 """Code related to gathering data to inform convergence."""
+import json
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
 from functools import partial
 
-from effect import catch, parallel
+import attr
+
+from effect import Effect, TypeDispatcher, catch, parallel
 from effect.do import do, do_return
 
 from toolz.curried import filter, groupby, keyfilter, map
@@ -9,6 +15,10 @@ from toolz.dicttoolz import assoc, get_in, merge
 from toolz.functoolz import compose, curry, identity
 from toolz.itertoolz import concat
 
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
+
+from txeffect import deferred_performer, perform
+
 from otter.auth import NoSuchEndpoint
 from otter.cloud_client import (
     CLBNotFoundError,
@@ -26,12 +36,13 @@ from otter.convergence.model import (
     RCv3Node,
     group_id_from_metadata)
 from otter.indexer import atom
+from otter.log.intents import msg
 from otter.models.cass import CassScalingGroupServersCache
 from otter.util.fp import assoc_obj
 from otter.util.http import append_segments
 from otter.util.retry import (
     exponential_backoff_interval, retry_effect, retry_times)
-from otter.util.timestamp import timestamp_to_epoch
+from otter.util.timestamp import datetime_to_epoch, timestamp_to_epoch
 
 
 def _retry(eff):
@@ -112,11 +123,52 @@ def server_of_group(group_id, server):
     return group_id_from_metadata(server.get('metadata', {})) == group_id
 
 
+def _fetch_stats(servers, batch_size):
+    """
+    Return number of pages and approximate number of bytes it takes to list
+    given servers from Nova. The bytes are estimated from the size of the
+    first server so that all the servers are not encoded on every iteration.
+    """
+    size = len(json.dumps(servers[0])) * len(servers) if servers else 0
+    return len(servers) // batch_size + 1, size
+
+
+def resync_offset(group_id, resync_interval):
+    """
+    Return the offset in seconds of the group's resync windows, so that the
+    full listings of all the groups are spread over the interval instead of
+    all happening just after the same wall-clock time.
+    """
+    return zlib.crc32(group_id) % resync_interval
+
+
+def needs_full_sync(last_update, now, resync_interval, offset=0):
+    """
+    Should the servers cache updated at ``last_update`` be refreshed with a
+    full listing of servers instead of servers changed since then?
+
+    Time is split into ``resync_interval`` sized windows, starting ``offset``
+    seconds after the epoch, and a full listing is done for the first
+    iteration in each window, so that any drift between the cache and Nova
+    does not outlive a window.
+
+    :param datetime last_update: Time when cache was last updated
+    :param datetime now: Current time
+    :param number resync_interval: Seconds between full listings
+    :param number offset: Seconds by which windows are shifted
+    """
+    return ((datetime_to_epoch(last_update) - offset) // resync_interval !=
+            (datetime_to_epoch(now) - offset) // resync_interval)
+
+
 @do
 def get_scaling_group_servers(tenant_id, group_id, now,
                               all_as_servers=get_all_scaling_group_servers,
                               all_servers=get_all_server_details,
-                              cache_class=CassScalingGroupServersCache):
+                              cache_class=CassScalingGroupServersCache,
+                              resync_interval=3600,
+                              changes_since_margin=60,
+                              batch_size=100):
     """
     Get a group's servers taken from cache if it exists. Updates cache
     if it is empty from newly fetched servers
@@ -124,6 +176,20 @@ def get_scaling_group_servers(tenant_id, group_id, now,
     # scoped on the tenant because cache calls require tenant_id. Should
     # they also not take tenant_id and work on the scope?
 
+    When the cache exists, only servers changed since the cache was last
+    updated (less ``changes_since_margin`` seconds to allow for clock skew
+    between otter and Nova) are fetched and merged into the cached servers,
+    except when :func:`needs_full_sync` says all servers should be fetched,
+    in resync windows offset by :func:`resync_offset` of the group.
+    Number of pages and bytes fetched are logged. For changed servers, a lower
+    bound of the pages and bytes saved is also logged, based on the group's
+    cached servers that a full listing would have included.
+
+    :param number resync_interval: Seconds between full listings of servers
+    :param number changes_since_margin: Seconds subtracted from cache's last
+        update time when fetching changed servers
+    :param int batch_size: Number of servers fetched per page
+
     :return: Servers as list of dicts
     :rtype: Effect
     """
@@ -131,10 +197,26 @@ def get_scaling_group_servers(tenant_id, group_id, now,
     cached_servers, last_update = yield cache.get_servers(False)
     if last_update is None:
         servers = (yield all_as_servers()).get(group_id, [])
-    else:
-        current = yield all_servers()
+    elif needs_full_sync(last_update, now, resync_interval,
+                         resync_offset(group_id, resync_interval)):
+        current = yield all_servers(None, batch_size)
+        pages, _bytes = _fetch_stats(current, batch_size)
+        yield msg('gather-servers', sync='full', servers=len(current),
+                  pages=pages, bytes=_bytes)
         servers = mark_deleted_servers(cached_servers, current)
         servers = list(filter(server_of_group(group_id), servers))
+    else:
+        changes_since = last_update - timedelta(seconds=changes_since_margin)
+        changed = yield all_servers(changes_since, batch_size)
+        pages, _bytes = _fetch_stats(changed, batch_size)
+        cached_pages, cached_bytes = _fetch_stats(cached_servers, batch_size)
+        yield msg('gather-servers', sync='delta', servers=len(changed),
+                  pages=pages, bytes=_bytes,
+                  pages_saved=max(cached_pages - pages, 0),
+                  bytes_saved=max(cached_bytes - _bytes, 0))
+        servers = merge({s['id']: s for s in cached_servers},
+                        {s['id']: s for s in changed}).values()
+        servers = list(filter(server_of_group(group_id), servers))
     yield do_return(servers)
 
 
@@ -232,6 +314,112 @@ def get_rcv3_contents():
         error=catch(NoSuchEndpoint, lambda _: []))
 
 
+class TenantDataCache(object):
+    """
+    A short-lived cache of tenant-wide data, like the tenant's load balancer
+    nodes, that is needed by convergence of every group of that tenant.
+
+    Concurrent requests for the same data of the same tenant share a single
+    fetch, and the fetched result is then reused for ``ttl`` seconds after the
+    fetch started. Failures are not cached. Expired entries are removed
+    whenever data is cached, so entries of tenants that are not looked up
+    again do not pile up.
+
+    :param IReactorTime clock: Used to expire entries.
+    :param number ttl: Number of seconds for which fetched data is reused.
+    """
+    def __init__(self, clock, ttl):
+        self._clock = clock
+        self._ttl = ttl
+        self._cache = OrderedDict()  # {(tenant_id, key): (fetched, data)}
+        self._waiters = {}
+
+    def get(self, tenant_id, key, fetch):
+        """
+        Get data of a tenant, fetching it if it is not cached or has expired.
+
+        :param str tenant_id: tenant whose data is being fetched
+        :param key: identifies the kind of data being fetched
+        :param callable fetch: no-argument function returning Deferred of the
+            data. Only called if there is no fresh cached data and no fetch in
+            progress for the same tenant and key.
+
+        :return: Deferred of the data
+        """
+        k = (tenant_id, key)
+        now = self._clock.seconds()
+        if k in self._cache:
+            fetched, data = self._cache[k]
+            if now - fetched < self._ttl:
+                return succeed(data)
+            del self._cache[k]
+
+        if k in self._waiters:
+            d = Deferred()
+            self._waiters[k].append(d)
+            return d
+
+        def release_waiters(result, fire):
+            for waiter in self._waiters.pop(k):
+                fire(waiter, result)
+            return result
+
+        def populate(result):
+            self._evict_expired()
+            self._cache[k] = (now, result)
+            return result
+
+        self._waiters[k] = []
+        d = maybeDeferred(fetch)
+        d.addCallback(populate)
+        d.addCallbacks(release_waiters, release_waiters,
+                       callbackArgs=(Deferred.callback,),
+                       errbackArgs=(Deferred.errback,))
+        return d
+
+    def _evict_expired(self):
+        """
+        Remove expired entries. Entries are kept in the order they were
+        cached, so this stops at the first one that has not expired.
+        """
+        now = self._clock.seconds()
+        while self._cache:
+            k, (fetched, _) = next(self._cache.iteritems())
+            if now - fetched < self._ttl:
+                break
+            del self._cache[k]
+
+
+@attr.s
+class GetTenantData(object):
+    """
+    Intent to get tenant-wide data through a :obj:`TenantDataCache`.
+
+    :ivar str tenant_id: tenant whose data is being fetched
+    :ivar key: identifies the kind of data being fetched
+    :ivar Effect effect: effect that fetches the data when it is not cached
+    """
+    tenant_id = attr.ib()
+    key = attr.ib()
+    effect = attr.ib()
+
+
+@deferred_performer
+def perform_get_tenant_data(cache, dispatcher, intent):
+    """Perform :obj:`GetTenantData` with the given :obj:`TenantDataCache`."""
+    return cache.get(intent.tenant_id, intent.key,
+                     partial(perform, dispatcher, intent.effect))
+
+
+def get_tenant_data_dispatcher(cache):
+    """
+    Get dispatcher that performs :obj:`GetTenantData` with the given
+    :obj:`TenantDataCache`.
+    """
+    return TypeDispatcher({
+        GetTenantData: partial(perform_get_tenant_data, cache)})
+
+
 def get_all_launch_server_data(
         tenant_id,
         group_id,
@@ -243,13 +431,17 @@ def get_all_launch_server_data(
     Gather all launch_server data relevant for convergence w.r.t given time,
     in parallel where possible.
 
+    Load balancer contents are the same for every group of the tenant, so they
+    are fetched via :obj:`GetTenantData` to share them between groups being
+    converged at the same time.
+
     Returns an Effect of {'servers': [NovaServer], 'lb_nodes': [LBNode]}.
     """
     eff = parallel(
         [get_scaling_group_servers(tenant_id, group_id, now)
          .on(map(NovaServer.from_server_details_json)).on(list),
-         get_clb_contents(),
-         get_rcv3_contents()]
+         Effect(GetTenantData(tenant_id, 'clb', get_clb_contents())),
+         Effect(GetTenantData(tenant_id, 'rcv3', get_rcv3_contents()))]
     ).on(lambda (servers, clb, rcv3): {
         'servers': servers,
         'lb_nodes': list(concat([clb, rcv3]))
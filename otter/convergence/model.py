@@ -4,13 +4,14 @@ representation across the different phases of convergence.
 """
 import json
 import re
+from collections import Mapping
 
 import attr
 from attr.validators import instance_of
 
 from characteristic import Attribute, attributes
 
-from pyrsistent import PMap, PSet, freeze, pmap, pset, pvector, thaw
+from pyrsistent import PSet, freeze, pmap, pset, pvector, thaw
 
 from six import string_types
 
@@ -212,6 +213,59 @@ def _lbs_from_metadata(metadata):
     return pset(desired_lbs)
 
 
+class RawJSON(Mapping):
+    """
+    Immutable view of a JSON object that is not deep-frozen up front. Values
+    are frozen when they are looked up, and the whole object only when it is
+    hashed, so holding a server's JSON for the servers cache costs nothing
+    when the planner only looks at a few of its keys.
+
+    The wrapped object must not be modified after it is wrapped.
+
+    An instance is equal to a :obj:`PMap` of the frozen JSON object.
+    """
+    __slots__ = ('_raw', '_frozen')
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._frozen = None
+
+    def __getitem__(self, key):
+        return freeze(self._raw[key])
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __contains__(self, key):
+        return key in self._raw
+
+    def __eq__(self, other):
+        if isinstance(other, RawJSON):
+            return self._raw == other._raw
+        return Mapping.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._frozen is None:
+            self._frozen = freeze(self._raw)
+        return hash(self._frozen)
+
+    def __repr__(self):
+        return 'RawJSON({!r})'.format(self._raw)
+
+    def to_dict(self):
+        """
+        Return a shallow copy of the JSON object as a `dict`. Only its top
+        level can be modified.
+        """
+        return dict(self._raw)
+
+
 def _validate_state(_1, _2, state):
     """
     Assert that a state is in ServerState
@@ -237,8 +291,8 @@ class NovaServer(object):
     :ivar str flavor_id: The ID of the flavor the server was launched with
     :ivar PSet desired_lbs: An immutable mapping of load balancer IDs to lists
         of :class:`CLBDescription` instances.
-    :var dict json: JSON dict received from Nova from which this server
-        is created
+    :var json: JSON dict received from Nova from which this server
+        is created, as a :obj:`PMap` or :obj:`RawJSON`
     """
     id = attr.ib()
     state = attr.ib(validator=_validate_state)
@@ -252,7 +306,7 @@ class NovaServer(object):
                           validator=instance_of(PSet))
     servicenet_address = attr.ib(default='',
                                  validator=instance_of(string_types))
-    json = attr.ib(default=attr.Factory(pmap), validator=instance_of(PMap))
+    json = attr.ib(default=attr.Factory(pmap), validator=instance_of(Mapping))
 
     @classmethod
     def from_server_details_json(cls, server_json):
@@ -284,7 +338,16 @@ class NovaServer(object):
             links=freeze(server_json['links']),
             desired_lbs=_lbs_from_metadata(metadata),
             servicenet_address=_servicenet_address(server_json),
-            json=freeze(server_json))
+            json=RawJSON(server_json))
+
+    def json_dict(self):
+        """
+        Return the JSON of the server as a `dict` whose top level can be
+        modified.
+        """
+        if isinstance(self.json, RawJSON):
+            return self.json.to_dict()
+        return thaw(self.json)
 
     def __repr__(self):
         """
@@ -296,7 +359,7 @@ class NovaServer(object):
         for a in attr.fields(self.__class__):
             value = thaw(getattr(self, a.name))
             if a.name == "json":
-                value = {k: v for k, v in value.items() if k in
+                value = {k: v for k, v in self.json_dict().items() if k in
                          ('status', 'metadata', 'updated', 'name',
                           'OS-EXT-STS:task_state')}
             kvpairs.append("{0}={1}".format(a.name, repr(value)))
@@ -599,3 +662,46 @@ class RCv3Node(object):
         """
         return (isinstance(server, NovaServer) and
                 server.id == self.cloud_server_id)
+
+
+class LBNodeIndex(object):
+    """
+    Index of :obj:`ILBNode` providers by the server they can match, so that
+    the nodes of a server can be found without checking every node of the
+    tenant. :obj:`CLBNode` is indexed by its address, :obj:`RCv3Node` by its
+    server ID, and any other node is checked against every server.
+
+    :param lb_nodes: sequence of :obj:`ILBNode` providers
+    """
+    def __init__(self, lb_nodes):
+        self._by_address = {}
+        self._by_server_id = {}
+        self._others = []
+        for position, node in enumerate(lb_nodes):
+            entry = (position, node)
+            if type(node) is CLBNode:
+                self._by_address.setdefault(node.address, []).append(entry)
+            elif type(node) is RCv3Node:
+                self._by_server_id.setdefault(
+                    node.cloud_server_id, []).append(entry)
+            else:
+                self._others.append(entry)
+
+    def nodes_of(self, server):
+        """
+        Return the nodes that match the given server, in the order they were
+        given.
+
+        :param server: the server whose nodes are returned
+        :type server: :class:`NovaServer`
+        :return: `list` of :obj:`ILBNode` providers
+        """
+        if isinstance(server, NovaServer):
+            candidates = (
+                self._by_address.get(server.servicenet_address, []) +
+                self._by_server_id.get(server.id, []) +
+                self._others)
+        else:
+            candidates = self._others
+        return [node for _, node in sorted(candidates)
+                if node.matches(server)]
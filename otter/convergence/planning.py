@@ -15,6 +15,7 @@ from otter.convergence.model import (
     CLBNodeCondition,
     ErrorReason,
     IDrainable,
+    LBNodeIndex,
     RCv3Description,
     RCv3Node,
     ServerState)
@@ -280,6 +281,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
 
     """
     newest_to_oldest = sorted(servers_with_cheese, key=lambda s: -s.created)
+    lb_nodes = LBNodeIndex(load_balancer_contents)
 
     servers = defaultdict(lambda: [], groupby(get_destiny, newest_to_oldest))
     servers_in_active = servers[Destiny.CONSIDER_AVAILABLE]
@@ -316,7 +318,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
         return _drain_and_delete(
             server,
             desired_state.draining_timeout,
-            [node for node in load_balancer_contents if node.matches(server)],
+            lb_nodes.nodes_of(server),
             now)
 
     scale_down_steps = list(mapcat(drain_and_delete_a_server,
@@ -332,7 +334,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
     cleanup_errored_and_deleted_steps = [
         remove_node_from_lb(lb_node)
         for server in servers[Destiny.DELETE] + servers[Destiny.CLEANUP]
-        for lb_node in load_balancer_contents if lb_node.matches(server)]
+        for lb_node in lb_nodes.nodes_of(server)]
 
     # converge all the servers that remain to their desired load balancer state
     still_active_servers = filter(lambda s: s not in servers_to_delete,
@@ -340,9 +342,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
     lb_converge_steps = [
         step
         for server in still_active_servers
-        for step in _converge_lb_state(
-            server,
-            [node for node in load_balancer_contents if node.matches(server)])
+        for step in _converge_lb_state(server, lb_nodes.nodes_of(server))
         ]
 
     # Converge again if we expect state transitions on any servers
@@ -89,10 +89,12 @@ import uuid
 from datetime import datetime
 from functools import partial
 from hashlib import sha1
+from heapq import heappop, heappush
+from itertools import count
 
 import attr
 
-from effect import Constant, Effect, Func, parallel
+from effect import Constant, Effect, Func, TypeDispatcher, parallel
 from effect.do import do, do_return
 from effect.ref import Reference
 
@@ -106,11 +108,12 @@ import six
 
 from sumtypes import match
 
-from toolz.functoolz import curry
+from toolz.functoolz import curry, memoize
 
 from twisted.application.service import MultiService
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
 
-from txeffect import exc_info_to_failure, perform
+from txeffect import deferred_performer, exc_info_to_failure, perform
 
 from otter.cloud_client import TenantScope
 from otter.constants import CONVERGENCE_DIRTY_DIR
@@ -120,8 +123,9 @@ from otter.convergence.errors import present_reasons, structure_reason
 from otter.convergence.gathering import get_all_launch_server_data
 from otter.convergence.logging import log_steps
 from otter.convergence.model import (
-    ConvergenceIterationStatus, ServerState, StepResult)
+    ConvergenceIterationStatus, LBNodeIndex, ServerState, StepResult)
 from otter.convergence.planning import plan_launch_server
+from otter.convergence.steps import CreateServer
 from otter.log.cloudfeeds import cf_err, cf_msg
 from otter.log.intents import err, msg, msg_with_time, with_log
 from otter.models.intents import (
@@ -183,9 +187,10 @@ def update_servers_cache(group, now, servers, lb_nodes, include_deleted=True):
     :param include_deleted: Include deleted servers in cache. Defaults to True.
     """
     server_dicts = []
+    lb_node_index = LBNodeIndex(lb_nodes)
     for server in servers:
-        sd = thaw(server.json)
-        if is_autoscale_active(server, lb_nodes):
+        sd = server.json_dict()
+        if is_autoscale_active(server, lb_node_index.nodes_of(server)):
             sd["_is_as_active"] = True
         if server.state != ServerState.DELETED or include_deleted:
             server_dicts.append(sd)
@@ -264,9 +269,16 @@ def _clean_waiting(waiting, group_id):
         lambda group_iterations: group_iterations.discard(group_id))
 
 
+def _record_creating(creating, group_id, steps):
+    if any(isinstance(step, CreateServer) for step in steps):
+        return creating.modify(lambda groups: groups.add(group_id))
+    return creating.modify(lambda groups: groups.discard(group_id))
+
+
 @do
 def execute_convergence(tenant_id, group_id, build_timeout, waiting,
-                        limited_retry_iterations, get_executor=get_executor):
+                        limited_retry_iterations, get_executor=get_executor,
+                        creating=None):
     """
     Gather data, plan a convergence, save active and pending servers to the
     group state, and then execute the convergence.
@@ -278,6 +290,8 @@ def execute_convergence(tenant_id, group_id, build_timeout, waiting,
     :param Reference waiting: pmap of waiting groups
     :param int limited_retry_iterations: number of iterations to wait for
         LIMITED_RETRY steps
+    :param Reference creating: pset of groups whose last plan created
+        servers. Not updated if None.
     :param callable get_all_convergence_data: like
         :func`get_all_convergence_data`, used for testing.
     :param callable plan: like :func:`plan`, to be used for test injection only
@@ -300,6 +314,8 @@ def execute_convergence(tenant_id, group_id, build_timeout, waiting,
     steps = executor.plan(desired_group_state, datetime_to_epoch(now_dt),
                           build_timeout, **resources)
     yield log_steps(steps)
+    if creating is not None:
+        yield _record_creating(creating, group_id, steps)
 
     # Execute plan
     yield msg('execute-convergence',
@@ -500,6 +516,161 @@ def non_concurrently(locks, key, eff):
     yield do_return(result)
 
 
+class ConvergencePriority(object):
+    """
+    Priorities with which groups are converged by a :obj:`ConvergenceQueue`.
+    Groups with lower values are converged first.
+
+    :cvar FRESH: The group has just been marked divergent.
+    :cvar CREATING: The last convergence of the group created servers.
+    :cvar RECHECK: The group is still divergent after its last convergence.
+    :cvar LIMITED_RETRY: The last convergence of the group is waiting on
+        LIMITED_RETRY steps.
+    """
+    FRESH = 0
+    CREATING = 1
+    RECHECK = 2
+    LIMITED_RETRY = 3
+
+
+class ConvergenceQueue(object):
+    """
+    Runs convergences in the order of their priority, with a bound on the
+    number of convergences running at a time, both in total and per tenant.
+
+    :param limit: maximum number of convergences running at a time, or None
+        for no limit
+    :param tenant_limit: maximum number of convergences of a single tenant
+        running at a time, or None for no limit
+    """
+    def __init__(self, limit=None, tenant_limit=None):
+        self.limit = limit
+        self.tenant_limit = tenant_limit
+        self.running = 0
+        self._tenants = {}  # {tenant_id: number of running convergences}
+        self._heap = []  # [priority, sequence, key, tenant_id, deferred]
+        self._queued = {}  # {key: entry in _heap}
+        self._sequence = count()
+
+    def run(self, key, tenant_id, priority, f, *args, **kwargs):
+        """
+        Call ``f`` with given arguments once there is a free slot and nothing
+        of higher priority is waiting for it.
+
+        :param key: identifies what is being run. If something with the same
+            key is already waiting then it is not queued again but will be run
+            with the higher of the two priorities.
+        :param str tenant_id: tenant whose convergence is being run
+        :param int priority: one of the :obj:`ConvergencePriority` values
+
+        :return: Deferred fired with result of ``f``, or with None if ``key``
+            was already waiting
+        """
+        entry = self._queued.get(key)
+        if entry is not None:
+            if priority < entry[0]:
+                self._push(key, tenant_id, priority, entry[4])
+                entry[4] = None
+            return succeed(None)
+        d = Deferred()
+        self._push(key, tenant_id, priority, d)
+        d.addCallback(lambda _: maybeDeferred(f, *args, **kwargs))
+        d.addBoth(self._finished, tenant_id)
+        self._start_next()
+        return d
+
+    def _push(self, key, tenant_id, priority, d):
+        entry = [priority, next(self._sequence), key, tenant_id, d]
+        self._queued[key] = entry
+        heappush(self._heap, entry)
+
+    def _start_next(self):
+        """
+        Start the highest priority waiting calls while there are free slots,
+        skipping the ones whose tenant is at its limit.
+        """
+        blocked, started = [], []
+        while self._heap and (self.limit is None or self.running < self.limit):
+            entry = heappop(self._heap)
+            _, _, key, tenant_id, d = entry
+            if d is None:
+                # replaced by an entry with higher priority
+                continue
+            running = self._tenants.get(tenant_id, 0)
+            if self.tenant_limit is not None and running >= self.tenant_limit:
+                blocked.append(entry)
+                continue
+            del self._queued[key]
+            self.running += 1
+            self._tenants[tenant_id] = running + 1
+            started.append(d)
+        for entry in blocked:
+            heappush(self._heap, entry)
+        for d in started:
+            d.callback(None)
+
+    def _finished(self, result, tenant_id):
+        self.running -= 1
+        self._tenants[tenant_id] -= 1
+        if self._tenants[tenant_id] == 0:
+            del self._tenants[tenant_id]
+        self._start_next()
+        return result
+
+
+@attr.s
+class QueueConvergence(object):
+    """
+    Intent to converge a group through a :obj:`ConvergenceQueue`.
+
+    :ivar str tenant_id: tenant ID of the group
+    :ivar str group_id: ID of the group
+    :ivar int priority: one of the :obj:`ConvergencePriority` values
+    :ivar Effect effect: effect that converges the group
+    """
+    tenant_id = attr.ib()
+    group_id = attr.ib()
+    priority = attr.ib()
+    effect = attr.ib()
+
+
+@deferred_performer
+def perform_queue_convergence(queue, dispatcher, intent):
+    """Perform :obj:`QueueConvergence` with the given :obj:`ConvergenceQueue`.
+    """
+    return queue.run(intent.group_id, intent.tenant_id, intent.priority,
+                     perform, dispatcher, intent.effect)
+
+
+def get_convergence_queue_dispatcher(queue):
+    """
+    Get dispatcher that performs :obj:`QueueConvergence` with the given
+    :obj:`ConvergenceQueue`.
+    """
+    return TypeDispatcher({
+        QueueConvergence: partial(perform_queue_convergence, queue)})
+
+
+def convergence_priority(flag, group_id, fresh_flags, creating, waiting):
+    """
+    Return the :obj:`ConvergencePriority` of a divergent group.
+
+    :param str flag: the group's divergent flag
+    :param str group_id: ID of the group
+    :param fresh_flags: collection of flags that have just been created
+    :param creating: collection of IDs of groups whose last plan created
+        servers
+    :param waiting: collection of IDs of groups waiting on LIMITED_RETRY steps
+    """
+    if flag in fresh_flags:
+        return ConvergencePriority.FRESH
+    elif group_id in creating:
+        return ConvergencePriority.CREATING
+    elif group_id in waiting:
+        return ConvergencePriority.LIMITED_RETRY
+    return ConvergencePriority.RECHECK
+
+
 def get_my_divergent_groups(my_buckets, all_buckets, divergent_flags):
     """
     Given a list of dirty-flags, filter out the ones that aren't associated
@@ -537,7 +708,8 @@ def eff_finally(eff, after_eff):
 def converge_one_group(currently_converging, recently_converged, waiting,
                        tenant_id, group_id, version,
                        build_timeout, limited_retry_iterations,
-                       execute_convergence=execute_convergence):
+                       execute_convergence=execute_convergence,
+                       creating=None):
     """
     Converge one group, non-concurrently, and clean up the dirty flag when
     done.
@@ -545,6 +717,8 @@ def converge_one_group(currently_converging, recently_converged, waiting,
     :param Reference currently_converging: pset of currently converging groups
     :param Reference recently_converged: pmap of recently converged groups
     :param Reference waiting: pmap of waiting groups
+    :param Reference creating: pset of groups whose last plan created
+        servers. Not updated if None.
     :param str tenant_id: the tenant ID of the group that is converging
     :param str group_id: the ID of the group that is converging
     :param version: version number of ZNode of the group's dirty flag
@@ -558,9 +732,10 @@ def converge_one_group(currently_converging, recently_converged, waiting,
     mark_recently_converged = Effect(Func(time.time)).on(
         lambda time_done: recently_converged.modify(
             lambda rcg: rcg.set(group_id, time_done)))
+    ekwargs = {} if creating is None else {'creating': creating}
     cvg = eff_finally(
         execute_convergence(tenant_id, group_id, build_timeout, waiting,
-                            limited_retry_iterations),
+                            limited_retry_iterations, **ekwargs),
         mark_recently_converged)
 
     try:
@@ -571,6 +746,8 @@ def converge_one_group(currently_converging, recently_converged, waiting,
     except NoSuchScalingGroupError:
         yield err(None, 'converge-fatal-error')
         yield _clean_waiting(waiting, group_id)
+        if creating is not None:
+            yield creating.modify(lambda groups: groups.discard(group_id))
         yield delete_divergent_flag(tenant_id, group_id, version)
         return
     except Exception:
@@ -599,11 +776,15 @@ def converge_all_groups(
         my_buckets, all_buckets,
         divergent_flags, build_timeout, interval,
         limited_retry_iterations,
+        take_fresh=None, creating=None,
         converge_one_group=converge_one_group):
     """
     Check for groups that need convergence and which match up to the
     buckets we've been allocated.
 
+    Each group is converged through :obj:`QueueConvergence` with a
+    :obj:`ConvergencePriority` based on why it is divergent.
+
     :param Reference currently_converging: pset of currently converging groups
     :param Reference recently_converged: pmap of group ID to time last
         convergence finished
@@ -621,6 +802,11 @@ def converge_all_groups(
         passed since the end of its last convergence.
     :param int limited_retry_iterations: number of iterations to wait for
         LIMITED_RETRY steps
+    :param callable take_fresh: called with the divergent flags of the groups
+        that are queued, returns the ones that have just been created and
+        stops considering them fresh. None if no flags are fresh.
+    :param Reference creating: pset of groups whose last plan created
+        servers, or None if it is not tracked
     :param callable converge_one_group: function to use to converge a single
         group - to be used for test injection only
     """
@@ -646,23 +832,38 @@ def converge_all_groups(
         if stat is None:
             yield msg('converge-divergent-flag-disappeared', znode=dirty_flag)
         else:
+            kwargs = {} if creating is None else {'creating': creating}
             eff = converge_one_group(currently_converging, recently_converged,
                                      waiting,
                                      tenant_id, group_id,
                                      stat.version, build_timeout,
-                                     limited_retry_iterations)
+                                     limited_retry_iterations, **kwargs)
             result = yield Effect(TenantScope(eff, tenant_id))
             yield do_return(result)
 
     recent_groups = yield get_recently_converged_groups(recently_converged,
                                                         interval)
+    waiting_groups = yield waiting.read()
+    creating_groups = pset()
+    if creating is not None:
+        creating_groups = yield creating.read()
+    # Don't converge a group if it has recently been converged.
+    group_infos = [info for info in group_infos
+                   if info['group_id'] not in recent_groups]
+    fresh_flags = frozenset()
+    if take_fresh is not None and group_infos:
+        fresh_flags = take_fresh(
+            [format_dirty_flag(info['tenant_id'], info['group_id'])
+             for info in group_infos])
     effs = []
     for info in group_infos:
         tenant_id, group_id = info['tenant_id'], info['group_id']
-        if group_id in recent_groups:
-            # Don't converge a group if it has recently been converged.
-            continue
-        eff = converge(tenant_id, group_id, info['dirty-flag'])
+        priority = convergence_priority(
+            format_dirty_flag(tenant_id, group_id), group_id, fresh_flags,
+            creating_groups, waiting_groups)
+        eff = Effect(QueueConvergence(
+            tenant_id, group_id, priority,
+            converge(tenant_id, group_id, info['dirty-flag'])))
         effs.append(
             with_log(eff, tenant_id=tenant_id, scaling_group_id=group_id))
 
@@ -691,6 +892,7 @@ def _stable_hash(s):
     return int(sha1(s).hexdigest(), 16)
 
 
+@memoize
 def bucket_of_tenant(tenant, num_buckets):
     """
     Return the bucket associated with the given tenant.
@@ -701,6 +903,80 @@ def bucket_of_tenant(tenant, num_buckets):
     return _stable_hash(tenant) % num_buckets
 
 
+class DivergentFlags(object):
+    """
+    Divergent flags indexed by the bucket of their tenant. The index is
+    updated with the complete list of flags given by the ZooKeeper children
+    watch, but only the flags that were added or removed since the previous
+    update are processed.
+
+    :ivar bool initialized: Has the index been updated at least once since it
+        was last reset?
+    :ivar set fresh: Flags added by updates after the first one that have not
+        been taken with :meth:`take_fresh` yet.
+    """
+
+    def __init__(self, num_buckets):
+        """
+        :param int num_buckets: global number of buckets
+        """
+        self.num_buckets = num_buckets
+        self.initialized = False
+        self.fresh = set()
+        self._buckets = {}  # {flag: bucket}
+        self._flags = {}  # {bucket: set of flags}
+
+    def update(self, flags):
+        """
+        Replace the indexed flags with given flags.
+
+        :param flags: All the divergent flags found in ZooKeeper
+        :return: set of buckets that have got new flags
+        """
+        flags = set(flags)
+        known = self._buckets.viewkeys()
+        for flag in known - flags:
+            self.fresh.discard(flag)
+            bucket = self._buckets.pop(flag)
+            self._flags[bucket].discard(flag)
+            if not self._flags[bucket]:
+                del self._flags[bucket]
+        changed = set()
+        for flag in flags - known:
+            bucket = bucket_of_tenant(parse_dirty_flag(flag)[0],
+                                      self.num_buckets)
+            self._buckets[flag] = bucket
+            self._flags.setdefault(bucket, set()).add(flag)
+            changed.add(bucket)
+            if self.initialized:
+                self.fresh.add(flag)
+        self.initialized = True
+        return changed
+
+    def reset(self):
+        """
+        Stop considering the index current, so that the flags are got again
+        from ZooKeeper. The indexed flags are kept until then.
+        """
+        self.initialized = False
+
+    def take_fresh(self, flags):
+        """
+        Return the fresh flags among given flags, and stop considering them
+        fresh.
+        """
+        fresh = self.fresh.intersection(flags)
+        self.fresh -= fresh
+        return fresh
+
+    def in_buckets(self, buckets):
+        """
+        Return list of flags in given buckets
+        """
+        return [flag for bucket in buckets
+                for flag in self._flags.get(bucket, ())]
+
+
 class Converger(MultiService):
     """
     A service that searches for groups that need converging and then does the
@@ -716,12 +992,17 @@ class Converger(MultiService):
       :obj:`ConvergenceStarter` service, and determine if they're "ours" with
       the partitioner.
     - we ensure we don't execute convergence for the same group concurrently.
+    - groups are converged through :obj:`QueueConvergence`, so the dispatcher
+      must be able to perform it (see :func:`get_convergence_queue_dispatcher`)
+    - dirty flags indexed from the children watch are got again from ZooKeeper
+      every ``relist_ticks`` partitioner ticks and after any change in the
+      ZooKeeper connection state, in case the watch missed some changes.
     """
 
     def __init__(self, log, dispatcher, num_buckets, partitioner_factory,
                  build_timeout, interval,
                  limited_retry_iterations,
-                 converge_all_groups=converge_all_groups):
+                 converge_all_groups=converge_all_groups, relist_ticks=10):
         """
         :param log: a bound log
         :param dispatcher: The dispatcher to use to perform effects.
@@ -739,6 +1020,8 @@ class Converger(MultiService):
             to be used for test injection only
         :param int limited_retry_iterations: number of iterations to wait for
             LIMITED_RETRY steps
+        :param int relist_ticks: number of partitioner ticks after which the
+            dirty flags are got from ZooKeeper again
         """
         MultiService.__init__(self)
         self.log = log.bind(otter_service='converger')
@@ -752,12 +1035,17 @@ class Converger(MultiService):
         self._converge_all_groups = converge_all_groups
         self.interval = interval
         self.limited_retry_iterations = limited_retry_iterations
+        self.relist_ticks = relist_ticks
+        self._ticks = 0
 
         # ephemeral mutable state
         self.currently_converging = Reference(pset())
         self.recently_converged = Reference(pmap())
         # Groups we're waiting on temporarily, and may give up on.
         self.waiting = Reference(pmap())  # {group_id: num_iterations_waited}
+        # Groups whose last plan created servers
+        self.creating = Reference(pset())
+        self.divergent_flags = DivergentFlags(num_buckets)
 
     def _converge_all(self, my_buckets, divergent_flags):
         """Run :func:`converge_all_groups` and log errors."""
@@ -765,7 +1053,9 @@ class Converger(MultiService):
             self.currently_converging, self.recently_converged,
             self.waiting,
             my_buckets, self._buckets, divergent_flags, self.build_timeout,
-            self.interval, self.limited_retry_iterations)
+            self.interval, self.limited_retry_iterations,
+            take_fresh=self.divergent_flags.take_fresh,
+            creating=self.creating)
         return eff.on(
             error=lambda e: err(
                 exc_info_to_failure(e), 'converge-all-groups-error'))
@@ -778,36 +1068,60 @@ class Converger(MultiService):
             lambda uid: with_log(eff, otter_service='converger',
                                  converger_run_id=uid))
 
+    def _got_divergent_flags(self, my_buckets, children):
+        """Index flags got from ZooKeeper and converge ones in my buckets."""
+        self.divergent_flags.update(children)
+        return self._converge_all(
+            my_buckets, self.divergent_flags.in_buckets(my_buckets))
+
     def buckets_acquired(self, my_buckets):
         """
-        Get dirty flags from zookeeper and run convergence with them.
+        Run convergence with dirty flags of given buckets. The flags are got
+        from zookeeper only if they haven't been got from the children watch
+        yet, or if they have not been got for ``relist_ticks`` calls.
 
         This is used as the partitioner callback.
         """
-        ceff = Effect(GetChildren(CONVERGENCE_DIRTY_DIR)).on(
-            partial(self._converge_all, my_buckets))
+        self._ticks = (self._ticks + 1) % self.relist_ticks
+        if self._ticks == 0:
+            self.divergent_flags.reset()
+        if self.divergent_flags.initialized:
+            ceff = self._converge_all(
+                my_buckets, self.divergent_flags.in_buckets(my_buckets))
+        else:
+            ceff = Effect(GetChildren(CONVERGENCE_DIRTY_DIR)).on(
+                partial(self._got_divergent_flags, my_buckets))
         # Return deferred as 1-element tuple for testing only.
         # Returning deferred would block otter from shutting down until
         # it is fired which we don't need to do since convergence is itempotent
         # and will be triggered in next start of otter
         return (perform(self._dispatcher, self._with_conv_runid(ceff)), )
 
+    def connection_state_changed(self, state):
+        """
+        Kazoo connection listener that gets the dirty flags from ZooKeeper
+        again on the next partitioner tick, since the children watch may have
+        missed changes while the connection was suspended or the session lost.
+        """
+        self.log.msg('converger-zk-state-changed', zk_state=state)
+        self.divergent_flags.reset()
+
     def divergent_changed(self, children):
         """
         ZooKeeper children-watch callback that lets this service know when the
-        divergent groups have changed. If any of the divergent flags are for
-        tenants associated with this service's buckets, a convergence will be
-        triggered.
+        divergent groups have changed. If any of the new divergent flags are
+        for tenants associated with this service's buckets, a convergence
+        will be triggered with the flags of those buckets.
         """
+        changed_buckets = self.divergent_flags.update(children)
         if self.partitioner.get_current_state() != PartitionState.ACQUIRED:
             return
         my_buckets = self.partitioner.get_current_buckets()
-        changed_buckets = set(
-            bucket_of_tenant(parse_dirty_flag(child)[0], len(self._buckets))
-            for child in children)
-        if set(my_buckets).intersection(changed_buckets):
+        buckets = changed_buckets.intersection(my_buckets)
+        if buckets:
             # the return value is ignored, but we return this for testing
-            eff = self._converge_all(my_buckets, children)
+            eff = self._converge_all(
+                my_buckets, self.divergent_flags.in_buckets(buckets))
             return perform(self._dispatcher, self._with_conv_runid(eff))
 
 
@@ -18,6 +18,7 @@ from .cloud_client import get_cloud_client_dispatcher
 from .log.intents import get_log_dispatcher, get_msg_time_dispatcher
 from .models.cass import get_cql_dispatcher
 from .models.intents import get_model_dispatcher
+from .util.dispatcher import flatten_dispatcher
 from .util.pure_http import Request, perform_request
 from .util.retry import Retry, perform_retry
 from .util.zk import get_zk_dispatcher
@@ -34,7 +35,7 @@ def get_simple_dispatcher(reactor):
     function. The simple dispatcher should only be used in tests or legacy
     code.
     """
-    return ComposedDispatcher([
+    return flatten_dispatcher(ComposedDispatcher([
         base_dispatcher,
         TypeDispatcher({
             Authenticate: perform_authenticate,
@@ -44,15 +45,16 @@ def get_simple_dispatcher(reactor):
         }),
         make_twisted_dispatcher(reactor),
         reference_dispatcher,
-    ])
+    ]))
 
 
 def get_full_dispatcher(reactor, authenticator, log, service_configs,
                         kz_client, store, supervisor, cass_client):
     """
-    Return a dispatcher that can perform all of Otter's effects.
+    Return a dispatcher that can perform all of Otter's effects. All its
+    performers are looked up by intent type in one flat mapping.
     """
-    return ComposedDispatcher([
+    return flatten_dispatcher(ComposedDispatcher([
         get_legacy_dispatcher(reactor, authenticator, log, service_configs),
         get_zk_dispatcher(kz_client),
         get_model_dispatcher(log, store),
@@ -60,7 +62,7 @@ def get_full_dispatcher(reactor, authenticator, log, service_configs,
         get_log_dispatcher(log, {}),
         get_msg_time_dispatcher(reactor),
         get_cql_dispatcher(cass_client)
-    ])
+    ]))
 
 
 def get_working_cql_dispatcher(reactor, cass_client):
@@ -68,10 +70,10 @@ def get_working_cql_dispatcher(reactor, cass_client):
     Get dispatcher with CQLQueryExecute performer along with any other
     dependent performers to make it work
     """
-    return ComposedDispatcher([
+    return flatten_dispatcher(ComposedDispatcher([
         get_simple_dispatcher(reactor),
         get_cql_dispatcher(cass_client)
-    ])
+    ]))
 
 
 def get_legacy_dispatcher(reactor, authenticator, log, service_configs):
@@ -79,8 +81,8 @@ def get_legacy_dispatcher(reactor, authenticator, log, service_configs):
     Return a dispatcher that can perform effects that are needed by the old
     worker code.
     """
-    return ComposedDispatcher([
+    return flatten_dispatcher(ComposedDispatcher([
         get_cloud_client_dispatcher(
             reactor, authenticator, log, service_configs),
         get_simple_dispatcher(reactor),
-    ])
+    ]))
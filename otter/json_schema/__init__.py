@@ -1,12 +1,70 @@
 """
-Draft 3 JSON schemas (http://tools.ietf.org/html/draft-zyp-json-schema-03)
-of data that will be transmitted to and from otter.
+JSON schemas and their validation.
 """
-import functools
 
-from jsonschema import Draft3Validator, validate, FormatChecker
+from jsonschema import Draft3Validator, FormatChecker
+from jsonschema.validators import extend
 
 # This is there since later modules need to add specific format validators to this.
 format_checker = FormatChecker()
 
-validate = functools.partial(validate, cls=Draft3Validator, format_checker=format_checker)
+_type_draft3 = Draft3Validator.VALIDATORS['type']
+
+
+def _type_hinted(validator, types, instance, schema):
+    """
+    Draft 3 "type" validator that first tries the schema of a union of types
+    that the previously valid instance matched. Instances mostly have the same
+    shape, e.g. almost all launch_server servers are not booted from a volume,
+    so this skips validating them against the alternatives that do not match
+    before the one that does. Invalid instances get exactly the same errors as
+    they would from :obj:`Draft3Validator`.
+    """
+    if not isinstance(types, list):
+        return _type_draft3(validator, types, instance, schema)
+    hint = validator.union_hints.get(id(types))
+    if hint is not None and validator.is_valid(instance, types[hint]):
+        return
+    for index, type in enumerate(types):
+        if type == "any":
+            return
+        if validator.is_type(type, "object"):
+            if index != hint and validator.is_valid(instance, type):
+                validator.union_hints[id(types)] = index
+                return
+        elif validator.is_type(instance, type):
+            return
+    return _type_draft3(validator, types, instance, schema)
+
+
+class _HintedDraft3Validator(extend(Draft3Validator, {"type": _type_hinted})):
+    """
+    :obj:`Draft3Validator` that remembers which schema of each union of types
+    in its schema was matched last.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_HintedDraft3Validator, self).__init__(*args, **kwargs)
+        self.union_hints = {}
+
+
+def validator(schema):
+    """
+    Check the schema and build a Draft 3 validator for it with the format
+    checker. Building a validator is several times more expensive than using
+    it, so anything validating many instances against the same schema should
+    build the validator once and call its ``validate`` method.
+
+    :raises: :obj:`jsonschema.SchemaError` if the schema is invalid
+    """
+    Draft3Validator.check_schema(schema)
+    return _HintedDraft3Validator(schema, format_checker=format_checker)
+
+
+def validate(instance, schema):
+    """
+    Validate the instance against the schema.
+
+    :raises: :obj:`jsonschema.ValidationError` if the instance is invalid
+    """
+    validator(schema).validate(instance)
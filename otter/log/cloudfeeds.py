@@ -1,13 +1,16 @@
 """
 Publishing events to Cloud feeds
 """
-from copy import deepcopy
+from collections import deque
 
 from characteristic import attributes
 
 from effect import Effect
 
-from toolz.dicttoolz import keyfilter
+from toolz.dicttoolz import keyfilter, merge
+
+from twisted.application.service import Service
+from twisted.internet.defer import Deferred, succeed
 
 from txeffect import perform
 
@@ -16,6 +19,7 @@ from otter.effect_dispatcher import get_legacy_dispatcher
 from otter.log import log as otter_log
 from otter.log.formatters import LogLevel
 from otter.log.intents import err as err_effect, msg as msg_effect
+from otter.util.deferredutils import TimedOutError, timeout_deferred
 from otter.util.http import APIError
 from otter.util.retry import (
     compose_retries,
@@ -138,17 +142,21 @@ request_format = {
 
 def prepare_request(req_fmt, event, error, timestamp, region, tenant_id, _id):
     """
-    Prepare request based on request format
+    Prepare request based on request format. Only the dicts on the path to
+    the event are copied; the rest is shared with ``req_fmt``.
     """
-    request = deepcopy(req_fmt)
+    entry = req_fmt['entry']
+    cf_event = merge(entry['content']['event'], {
+        'region': region,
+        'eventTime': timestamp,
+        'product': merge(entry['content']['event']['product'], event),
+        'tenantId': tenant_id,
+        'id': _id})
     if error:
-        request['entry']['content']['event']['type'] = 'ERROR'
-    request['entry']['content']['event']['region'] = region
-    request['entry']['content']['event']['eventTime'] = timestamp
-    request['entry']['content']['event']['product'].update(event)
-    request['entry']['content']['event']['tenantId'] = tenant_id
-    request['entry']['content']['event']['id'] = _id
-    return request
+        cf_event['type'] = 'ERROR'
+    return merge(req_fmt, {
+        'entry': merge(entry, {
+            'content': merge(entry['content'], {'event': cf_event})})})
 
 
 def add_event(event, admin_tenant_id, region, log):
@@ -170,13 +178,148 @@ def add_event(event, admin_tenant_id, region, log):
     return Effect(TenantScope(tenant_id=admin_tenant_id, effect=eff))
 
 
+class CloudFeedsPublisher(Service, object):
+    """
+    Publishes cloud feed events from a bounded in-memory queue. Up to
+    ``concurrency`` workers take events from the queue and publish them one
+    after the other, so that at most that many requests are in flight however
+    many events are logged, and an event that takes long to publish holds up
+    only its own worker. Events added when the queue is full or the service
+    is not running are dropped.
+
+    :param dispatcher: Dispatcher used to perform every event's effect. The
+        event's own log context is carried by its effect.
+    :param clock: Reactor used to time out draining the queue on stop
+    :param int max_size: Maximum number of queued events
+    :param int concurrency: Maximum number of events published at a time
+    :param int stop_timeout: Seconds to wait for the queue to drain when
+        stopping, after which the events still queued are dropped
+    """
+
+    def __init__(self, dispatcher, clock, log=otter_log, max_size=10000,
+                 concurrency=10, stop_timeout=30):
+        self.dispatcher = dispatcher
+        self.clock = clock
+        self.log = log.bind(system='otter.cloud_feed')
+        self.max_size = max_size
+        self.concurrency = concurrency
+        self.stop_timeout = stop_timeout
+        self._queue = deque()
+        self._workers = 0
+        self._waiters = []
+        self.in_flight = 0
+        self.published = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def add(self, eff, log):
+        """
+        Queue event's effect to be published.
+
+        :param log: Bound log of the event, used to log failure to publish it
+        :return: True if the event was queued, False if it was dropped
+        """
+        if not self.running:
+            self.dropped += 1
+            log.msg('cf-publisher-stopped', dropped=self.dropped)
+            return False
+        if len(self._queue) >= self.max_size:
+            self.dropped += 1
+            log.msg('cf-queue-full', dropped=self.dropped)
+            return False
+        self._queue.append((eff, log))
+        while self._queue and self._workers < self.concurrency:
+            self._workers += 1
+            self._work()
+        return True
+
+    def _publish(self, eff, log):
+        def done(result):
+            self.in_flight -= 1
+            self.published += 1
+            return result
+
+        def failed(f):
+            self.in_flight -= 1
+            self.failed += 1
+            log.err(f, 'cf-add-failure')
+
+        self.in_flight += 1
+        return perform(self.dispatcher, eff).addCallbacks(done, failed)
+
+    def _work(self):
+        """
+        Publish queued events one at a time until the queue is empty
+        """
+        while self._queue:
+            d = self._publish(*self._queue.popleft())
+            if not d.called:
+                d.addCallback(lambda _: self._work())
+                return
+        self._workers -= 1
+        if self._workers == 0:
+            waiters, self._waiters = self._waiters, []
+            for d in waiters:
+                d.callback(None)
+
+    def flush(self):
+        """
+        Wait for all the queued events to be published.
+
+        :return: `Deferred` fired with None once there are no queued or
+            in-flight events. Cancelling it stops the wait.
+        """
+        if self._workers == 0:
+            return succeed(None)
+        d = Deferred(lambda d: self._waiters.remove(d))
+        self._waiters.append(d)
+        return d
+
+    def stats(self):
+        """
+        Queue metrics of the publisher.
+        """
+        return {'queued': len(self._queue), 'in_flight': self.in_flight,
+                'published': self.published, 'failed': self.failed,
+                'dropped': self.dropped, 'max_size': self.max_size}
+
+    def health_check(self):
+        """
+        Report queue metrics. A full queue does not make the node unhealthy
+        since events are only dropped.
+        """
+        return True, self.stats()
+
+    def stopService(self):
+        """
+        Stop and wait up to ``stop_timeout`` seconds for whatever is left in
+        the queue to be published, then drop the events still queued
+        """
+        Service.stopService(self)
+        d = self.flush()
+        timeout_deferred(d, self.stop_timeout, self.clock,
+                         'cloud feeds queue drain')
+
+        def timed_out(f):
+            f.trap(TimedOutError)
+            dropped = len(self._queue)
+            self._queue.clear()
+            self.dropped += dropped
+            self.log.msg('cf-stop-timeout', dropped=dropped,
+                         in_flight=self.in_flight)
+
+        return d.addErrback(timed_out)
+
+
 @attributes(['reactor', 'authenticator', 'tenant_id', 'region',
-             'service_configs', 'log', 'get_disp', 'add_event'],
+             'service_configs', 'log', 'get_disp', 'add_event', 'publisher'],
             defaults={'log': otter_log, 'get_disp': get_legacy_dispatcher,
-                      'add_event': add_event})
+                      'add_event': add_event, 'publisher': None})
 class CloudFeedsObserver(object):
     """
-    Log observer that pushes events to cloud feeds
+    Log observer that pushes events to cloud feeds. Events are given to
+    ``publisher`` if there is one, otherwise each is published as soon as it
+    is logged.
     """
 
     def __call__(self, event_dict):
@@ -198,6 +341,9 @@ class CloudFeedsObserver(object):
             log.err(None, 'cf-unsuitable-message',
                     unsuitable_message=me.unsuitable_message)
         else:
+            if self.publisher is not None:
+                self.publisher.add(eff, log)
+                return
             return perform(
                 self.get_disp(self.reactor, self.authenticator, log,
                               self.service_configs),
@@ -113,20 +113,44 @@ class LoggingEncoder(json.JSONEncoder):
         return repr(obj)
 
 
+class EncodedJSON(str):
+    """
+    The already JSON-encoded value of an event field.
+    :func:`JSONObserverWrapper` writes it out as it is instead of encoding it
+    again as a JSON string.
+    """
+
+
+# Stands in for an EncodedJSON value while the rest of the event is encoded
+_encoded_placeholder = 'encoded-json-{}-{{}}'.format(uuid4().hex)
+
+
 def JSONObserverWrapper(observer, **kwargs):
     """
     Create an observer that will format the eventDict as JSON using the
-    supplied keyword arguments and delegate to `observer`.
+    supplied keyword arguments and delegate to `observer`. Top-level
+    :class:`EncodedJSON` values are written out without being encoded again.
+    The eventDict itself is not changed, since other observers may get it
+    too.
 
     :param ILogObserver observer: The observer to delegate message delivery to.
 
     :rtype: :class:`ILogObserver`
     """
     def JSONObserver(eventDict):
+        eventDict = dict(eventDict)
         if 'message' in eventDict:
             eventDict['message'] = ''.join(eventDict['message'])
-        observer({'message': (json.dumps(eventDict,
-                                         cls=LoggingEncoder, **kwargs),)})
+        encoded = {}
+        for key, value in eventDict.items():
+            if isinstance(value, EncodedJSON):
+                placeholder = _encoded_placeholder.format(len(encoded))
+                encoded[json.dumps(placeholder)] = value
+                eventDict[key] = placeholder
+        message = json.dumps(eventDict, cls=LoggingEncoder, **kwargs)
+        for placeholder, value in encoded.iteritems():
+            message = message.replace(placeholder, value, 1)
+        observer({'message': (message,)})
 
     return JSONObserver
 
@@ -5,15 +5,40 @@ import json
 import math
 
 from toolz.curried import assoc
-from toolz.dicttoolz import keyfilter
+from toolz.dicttoolz import keyfilter, merge
 from toolz.functoolz import compose, curry
 
 from twisted.python.failure import Failure
 
-from otter.log.formatters import LoggingEncoder
+from otter.log.formatters import EncodedJSON, LoggingEncoder
 
 
-_json_len = compose(len, curry(json.dumps, cls=LoggingEncoder))
+_encode = curry(json.dumps, cls=LoggingEncoder, sort_keys=True)
+_json_len = compose(len, _encode)
+
+
+def _encode_list(parts):
+    """
+    JSON-encode a list from its already encoded elements
+    """
+    return '[' + ', '.join(parts) + ']'
+
+
+def _entry_len(key, value_len):
+    """
+    Length of a ``"key": value`` entry of a JSON object whose value is
+    ``value_len`` long once encoded
+    """
+    return _json_len(key) + len(': ') + value_len
+
+
+def _object_len(entry_lens):
+    """
+    Length of a JSON object made of entries of the given lengths
+    """
+    separators = max(len(entry_lens) - 1, 0)
+    return len('{}') + sum(entry_lens) + len(', ') * separators
+
 
 # Maximum length of entire JSON-formatted event dictionary
 event_max_length = 50000
@@ -29,6 +54,13 @@ def split_execute_convergence(event, max_length=event_max_length):
     Experimentally determined that probably logs cut off at around 75k,
     characters - we're going to limit it to 50k.
 
+    Every field and every server and CLB node is JSON-encoded only once: the
+    lengths of the events are worked out from the lengths of the encoded
+    parts, the servers and CLB nodes are packed greedily into as few events as
+    possible, and the large fields of the returned events are
+    :class:`EncodedJSON` so that they do not get encoded again when the event
+    is written out.
+
     :param dict event: The 'execute-convergence' type event dictionary to split
     :param int max_length: The maximum length of the entire JSON-formatted
         dictionary.
@@ -39,29 +71,35 @@ def split_execute_convergence(event, max_length=event_max_length):
         have one tuple.
     """
     message = "Executing convergence"
-    if _json_len(event) <= max_length:
-        return [(event, message)]
-
-    events = [(event, message)]
-    large_things = sorted(('servers', 'lb_nodes'),
-                          key=compose(_json_len, event.get),
-                          reverse=True)
+    large_things = ('desired', 'servers', 'lb_nodes', 'steps')
+    lists = [thing for thing in ('servers', 'lb_nodes') if thing in event]
+    elements = {thing: map(_encode, event[thing]) for thing in lists}
+    encoded = {k: _encode(v) for k, v in event.iteritems()
+               if k not in elements}
+    encoded.update({thing: _encode_list(parts)
+                    for thing, parts in elements.iteritems()})
+    entries = {k: _entry_len(k, len(v)) for k, v in encoded.iteritems()}
 
     # simplified event which serves as a base for the split out events
-    base_event = keyfilter(
-        lambda k: k not in ('desired', 'servers', 'lb_nodes', 'steps'),
-        event)
-
-    for thing in large_things:
-        split_up_events = split(
-            assoc(base_event, thing), event[thing], max_length,
-            _json_len)
-        events.extend([(e, message) for e in split_up_events])
-        del event[thing]
-        if _json_len(event) <= max_length:
+    base_event = keyfilter(lambda k: k not in large_things, event)
+    base_entries = [entries[k] for k in base_event]
+
+    split_events = []
+    for thing in sorted(lists, key=entries.get, reverse=True):
+        if _object_len(entries.values()) <= max_length:
             break
+        budget = max_length - _object_len(
+            base_entries + [_entry_len(thing, len('[]'))])
+        parts = elements[thing]
+        split_events.extend(
+            assoc(base_event, thing, EncodedJSON(_encode_list(parts[s:e])))
+            for s, e in pack(map(len, parts), budget, len(', ')))
+        del entries[thing]
 
-    return events
+    event = merge(
+        keyfilter(entries.__contains__, event),
+        {k: EncodedJSON(encoded[k]) for k in large_things if k in entries})
+    return [(e, message) for e in [event] + split_events]
 
 
 def split_list_servers(event, maxlength=event_max_length):
@@ -83,12 +121,13 @@ def split_list_servers(event, maxlength=event_max_length):
         event["response_body"] = _json
         return [(event, message)]
 
-    def part_json(servers):
-        return json.dumps({"servers": servers})
-
-    parts = split(part_json, event["response_body"]["servers"], maxlength, len)
+    servers = map(json.dumps, event["response_body"]["servers"])
+    budget = maxlength - len(json.dumps({"servers": []}))
     del event["response_body"]
-    return [(assoc(event, "response_body", part), message) for part in parts]
+    return [(assoc(event, "response_body",
+                   '{"servers": ' + _encode_list(servers[s:e]) + '}'),
+             message)
+            for s, e in pack(map(len, servers), budget, len(', '))]
 
 
 @curry
@@ -264,6 +303,36 @@ def split(render, elements, max_len, calculate_len=len):
         return [m]
 
 
+def pack(sizes, max_len, separator_len=0):
+    """
+    Greedily group consecutive elements into as few chunks as possible, such
+    that the sizes of the elements of each chunk, plus ``separator_len``
+    between every two of them, add up to at most ``max_len``.
+
+    Elements bigger than ``max_len`` get a chunk of their own, so ``max_len``
+    mustn't be assumed to be a hard constraint.
+
+    :param list sizes: The size of each element
+    :param int max_len: Maximum size of a chunk
+    :param int separator_len: Size of the separator between two elements
+
+    :return: `list` of ``(start, end)`` slice indexes of the chunks. There is
+        always at least one chunk, even if there are no elements.
+    """
+    chunks = []
+    start, total = 0, 0
+    for i, size in enumerate(sizes):
+        if i == start:
+            total = size
+        elif total + separator_len + size > max_len:
+            chunks.append((start, i))
+            start, total = i, size
+        else:
+            total += separator_len + size
+    chunks.append((start, len(sizes)))
+    return chunks
+
+
 def error_event(event, failure, why):
     """
     Convert event to error with failure and why
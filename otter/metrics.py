@@ -5,7 +5,6 @@ Script to collect metrics (total desired, actual and pending) from a DC
 from __future__ import print_function
 
 import json
-import operator
 import sys
 import time
 from collections import defaultdict, namedtuple
@@ -37,7 +36,7 @@ from otter.convergence.gathering import get_all_scaling_group_servers
 from otter.effect_dispatcher import get_legacy_dispatcher, get_log_dispatcher
 from otter.log import log as otter_log
 from otter.log.intents import err
-from otter.models.cass import CassScalingGroupCollection
+from otter.models.cass import CassScalingGroupCollection, CassTokenCache
 from otter.models.intents import GetAllGroups, get_model_dispatcher
 from otter.util.fileio import (
     ReadFileLines, WriteFileLines, get_dispatcher as file_dispatcher)
@@ -64,11 +63,15 @@ def update_last_info(fname, tenants_len, time):
     return eff.on(error=lambda e: err(e, "error updating number of tenants"))
 
 
+# Number of tenants enabled every day
+TENANTS_BATCH_SIZE = 5
+
+
 def get_todays_tenants(tenants, today, last_tenants_len, last_date):
     """
     Get tenants that are enabled till today
     """
-    batch_size = 5
+    batch_size = TENANTS_BATCH_SIZE
     tenants = sorted(tenants)
     if last_tenants_len is None:
         return tenants[:batch_size], batch_size, today
@@ -82,13 +85,19 @@ def get_todays_tenants(tenants, today, last_tenants_len, last_date):
 
 
 @do
-def get_todays_scaling_groups(convergence_tids, fname):
+def get_todays_scaling_groups(convergence_tids, fname, parallel=1):
     """
-    Get scaling groups that from tenants that are enabled till today
+    Get scaling groups that from tenants that are enabled till today.
+
+    Only the groups of the tenants that can be enabled today are kept while
+    scanning ``parallel`` token ranges of the groups concurrently.
     """
-    groups = yield Effect(GetAllGroups())
-    non_conv_tenants = set(groups.keys()) - set(convergence_tids)
     last_tenants_len, last_date = yield get_last_info(fname)
+    groups = yield Effect(GetAllGroups(
+        parallel=parallel,
+        max_tenants=(last_tenants_len or 0) + TENANTS_BATCH_SIZE,
+        always_tenants=tuple(convergence_tids)))
+    non_conv_tenants = set(groups.keys()) - set(convergence_tids)
     now = yield Effect(Func(datetime.utcnow))
     tenants, last_tenants_len, last_date = get_todays_tenants(
         non_conv_tenants, now, last_tenants_len, last_date)
@@ -136,10 +145,9 @@ def get_all_metrics_effects(tenanted_groups, log, _print=False):
     :param dict tenanted_groups: Scaling groups grouped with tenantId
     :param bool _print: Should the function print while processing?
 
-    :return: ``list`` of :obj:`Effect` of (``list`` of :obj:`GroupMetrics`)
-             or None
+    :return: iterable of :obj:`Effect` of (``list`` of :obj:`GroupMetrics`)
+             or None. Effects are created as they are iterated over.
     """
-    effs = []
     for tenant_id, groups in tenanted_groups.iteritems():
         eff = get_all_scaling_group_servers(
             server_predicate=lambda s: s['status'] in ('ACTIVE', 'BUILD'))
@@ -148,27 +156,41 @@ def get_all_metrics_effects(tenanted_groups, log, _print=False):
                              _print=_print))
         eff = eff.on(
             error=lambda exc_info: log.err(exc_info_to_failure(exc_info)))
-        effs.append(eff)
-    return effs
+        yield eff
 
 
-def _perform_limited_effects(dispatcher, effects, limit):
+def _perform_limited_effects(dispatcher, effects, limit, consume):
     """
-    Perform the effects in parallel up to a limit.
+    Perform the effects in parallel up to a limit. ``limit`` workers take the
+    next effect from ``effects`` only once they are done with their previous
+    one, so effects can be generated lazily.
 
     It'd be nice if effect.parallel had a "limit" parameter.
+
+    :param callable consume: Called with the result of every effect as
+        soon as it is performed
+
+    :return: `Deferred` fired with None when all the effects are performed
     """
-    # TODO: Use cooperator instead
-    sem = defer.DeferredSemaphore(limit)
-    defs = [sem.run(perform, dispatcher, eff) for eff in effects]
-    return defer.gatherResults(defs)
+    effects = iter(effects)
+
+    @defer.inlineCallbacks
+    def worker():
+        for eff in effects:
+            result = yield perform(dispatcher, eff)
+            consume(result)
+
+    d = defer.gatherResults([worker() for _ in range(limit)],
+                            consumeErrors=True)
+    return d.addCallback(lambda _: None)
 
 
 def get_all_metrics(dispatcher, tenanted_groups, log, _print=False,
                     get_all_metrics_effects=get_all_metrics_effects):
     """
     Gather server data and produce metrics for all groups across all tenants
-    in a region.
+    in a region. Each tenant's metrics are added to the result as soon as
+    they are produced.
 
     :param dispatcher: An Effect dispatcher.
     :param dict tenanted_groups: Scaling Groups grouped on tenantid
@@ -176,10 +198,15 @@ def get_all_metrics(dispatcher, tenanted_groups, log, _print=False,
 
     :return: ``list`` of `GroupMetrics` as `Deferred`
     """
+    metrics = []
+
+    def add_metrics(tenant_metrics):
+        if tenant_metrics is not None:
+            metrics.extend(tenant_metrics)
+
     effs = get_all_metrics_effects(tenanted_groups, log, _print=_print)
-    d = _perform_limited_effects(dispatcher, effs, 10)
-    d.addCallback(filter(lambda x: x is not None))
-    return d.addCallback(lambda x: reduce(operator.add, x, []))
+    d = _perform_limited_effects(dispatcher, effs, 10, add_metrics)
+    return d.addCallback(lambda _: metrics)
 
 
 @attr.s
@@ -191,9 +218,9 @@ class Metric(object):
 
 def calc_total(group_metrics):
     """
-    Calculate total metric for all groups and per tenant
+    Calculate total metric for all groups and per tenant in one pass
 
-    :param group_metrics: List of :obj:`GroupMetric`
+    :param group_metrics: Iterable of :obj:`GroupMetric`
     :return (``dict``, :obj:`Metric`) where dict is tenant-id -> `Metric`
         representing per tenant metric and second element is total metric
     """
@@ -303,9 +330,10 @@ def collect_metrics(reactor, config, log, client=None, authenticator=None,
     # calculate metrics
     fpath = get_in(["metrics", "last_tenant_fpath"], config,
                    default="last_tenant.txt")
+    parallel = get_in(["metrics", "scan_parallel"], config, default=1)
     tenanted_groups = yield perform(
         dispatcher,
-        get_todays_scaling_groups(convergence_tids, fpath))
+        get_todays_scaling_groups(convergence_tids, fpath, parallel))
     group_metrics = yield get_all_metrics(
         dispatcher, tenanted_groups, log, _print=_print)
 
@@ -419,7 +447,10 @@ class MetricsService(Service, object):
             config,
             self.log,
             client=self._client,
-            authenticator=generate_authenticator(reactor, config['identity']))
+            authenticator=generate_authenticator(
+                reactor, config['identity'],
+                CassTokenCache(self._client, reactor)
+                if get_in(['identity', 'shared_cache'], config) else None))
         self._service.clock = clock or reactor
 
     @defer.inlineCallbacks
@@ -2,10 +2,13 @@
 Cassandra implementation of the store for the front-end scaling groups engine
 """
 
+import bisect
 import functools
 import json
 import time
 import uuid
+from collections import OrderedDict, defaultdict
+from copy import deepcopy
 from datetime import datetime
 from itertools import cycle, takewhile
 
@@ -23,8 +26,9 @@ from pyrsistent import freeze
 from silverberg.client import ConsistencyLevel
 
 from toolz.curried import filter, groupby, map
-from toolz.dicttoolz import keymap, merge
+from toolz.dicttoolz import keymap, merge, merge_with
 from toolz.functoolz import compose
+from toolz.itertoolz import concat, partition_all
 
 from twisted.internet import defer
 
@@ -32,6 +36,8 @@ from txeffect import deferred_performer
 
 from zope.interface import implementer
 
+from otter.auth import ITokenCache
+from otter.convergence.composition import tenant_is_enabled
 from otter.log import log as otter_log
 from otter.models.interface import (
     GroupNotEmptyError,
@@ -127,10 +133,25 @@ def serialize_json_data(data, ver):
 _cql_view = ('SELECT {column}, created_at FROM {cf} '
              'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
              'AND deleting=false;')
+# Reading a column of the group with the time it was written, which changes
+# whenever the column is updated, and only that time to check if a cached
+# value of the column is still current
+_cql_view_with_writetime = (
+    'SELECT {column}, created_at, WRITETIME({column}) FROM {cf} '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+    'AND deleting=false;')
+_cql_view_writetime = (
+    'SELECT WRITETIME({column}) FROM {cf} '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+    'AND deleting=false;')
 _cql_view_policy = (
     'SELECT data, version FROM {cf} '
     'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
     'AND "policyId" = :policyId;')
+_cql_view_policy_version = (
+    'SELECT version FROM {cf} '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+    'AND "policyId" = :policyId;')
 _cql_view_webhook = (
     'SELECT data, capability FROM {cf} '
     'WHERE "tenantId" = :tenantId AND '
@@ -159,6 +180,21 @@ _cql_insert_group_state = (
     '"policyTouched", paused, desired) VALUES(:tenantId, :groupId, :active, '
     ':pending, :groupTouched, :policyTouched, :paused, :desired) '
     'USING TIMESTAMP :ts')
+# Reading the state with its version, and writing it only if the version has
+# not changed with a lightweight transaction. The condition on created_at
+# ensures that a deleted group is not resurrected.
+_cql_view_versioned_state = (
+    'SELECT "tenantId", "groupId", group_config, '
+    'launch_config, active, pending, "groupTouched", '
+    '"policyTouched", paused, desired, created_at, status, error_reasons, '
+    'deleting, state_version FROM {cf} '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId')
+_cql_update_group_state_if_version = (
+    'UPDATE {cf} SET active = :active, pending = :pending, '
+    '"groupTouched" = :groupTouched, "policyTouched" = :policyTouched, '
+    'paused = :paused, desired = :desired, state_version = :newVersion '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+    'IF created_at = :created_at AND state_version = :version')
 
 # --- Event related queries
 _cql_insert_group_event = (
@@ -184,6 +220,12 @@ _cql_delete_bucket_event = (
     'DELETE FROM {cf} WHERE bucket = :bucket '
     'AND trigger = :{name}trigger AND "policyId" = :{name}policyId;')
 _cql_oldest_event = 'SELECT * from {cf} WHERE bucket=:bucket LIMIT 1;'
+# Every write of an event also marks its bucket changed, so that the
+# scheduler can tell which of its preloaded buckets need to be read again
+_cql_mark_bucket_changed = (
+    'UPDATE {cf} SET changed = :{name}version WHERE bucket = :{name}bucket')
+_cql_bucket_changes = (
+    'SELECT bucket, changed FROM {cf} WHERE bucket IN ({buckets});')
 
 _cql_insert_webhook = (
     'INSERT INTO {cf}("tenantId", "groupId", "policyId", "webhookId", data, '
@@ -193,6 +235,10 @@ _cql_insert_webhook = (
 _cql_update = (
     'INSERT INTO {cf}("tenantId", "groupId", {column}) '
     'VALUES (:tenantId, :groupId, {name}) USING TIMESTAMP :ts')
+_cql_set_deleting = (
+    'UPDATE {cf} SET deleting = true '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+    'IF deleting = false;')
 _cql_update_webhook = (
     'INSERT INTO {cf}("tenantId", "groupId", "policyId", "webhookId", data) '
     'VALUES (:tenantId, :groupId, :policyId, :webhookId, :data);')
@@ -244,6 +290,35 @@ _cql_count_for_group = (
     'AND "groupId" = :groupId;')
 _cql_count_all = ('SELECT COUNT(*) FROM {cf};')
 
+# Range of tokens given to partition keys by Murmur3Partitioner. No key has
+# the minimum token.
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
+# Tenant resource counts table. The counts are only written with lightweight
+# transactions: once when they are initialized and then conditional on their
+# version, so that concurrent writes are never lost or applied twice.
+_cql_get_counts = (
+    'SELECT groups, policies, webhooks, version FROM {cf} '
+    'WHERE "tenantId" = :tenantId;')
+_cql_insert_counts = (
+    'INSERT INTO {cf} ("tenantId", groups, policies, webhooks, version) '
+    'VALUES (:tenantId, :groups, :policies, :webhooks, 1) IF NOT EXISTS;')
+_cql_update_counts_if_version = (
+    'UPDATE {cf} SET groups = :groups, policies = :policies, '
+    'webhooks = :webhooks, version = :newVersion '
+    'WHERE "tenantId" = :tenantId IF version = :version;')
+
+_cql_get_token = (
+    'SELECT created, token, catalog FROM {cf} WHERE "tenantId" = :tenantId;')
+_cql_set_token = (
+    'INSERT INTO {cf} ("tenantId", created, token, catalog) '
+    'VALUES (:tenantId, :created, :token, :catalog) USING TTL :ttl;')
+_cql_delete_token = 'DELETE FROM {cf} WHERE "tenantId" = :tenantId;'
+_cql_claim_token_refresh = (
+    'INSERT INTO {cf} ("tenantId", claimed) VALUES (:tenantId, :claimed) '
+    'IF NOT EXISTS USING TTL :ttl;')
+
 # seems to be pretty quick no matter the consistency - unfortunately this only
 # checks we can connect to Cassandra, and not whether the otter keyspace is
 # correct, etc.
@@ -313,8 +388,8 @@ def _paginated_list(tenant_id, group_id=None, policy_id=None, limit=100,
     return (''.join(cql_parts), params)
 
 
-def _build_policies(policies, policies_table, event_table, queries, data,
-                    buckets):
+def _build_policies(policies, policies_table, event_table, buckets_table,
+                    queries, data, buckets):
     """
     Because inserting many values into a table with compound keys with one
     insert statement is hard. This builds a bunch of insert statements and a
@@ -326,6 +401,13 @@ def _build_policies(policies, policies_table, event_table, queries, data,
     :param policies_table: the name of the policies table
     :type policies_table: ``str``
 
+    :param event_table: the name of the scheduled events table
+    :type event_table: ``str``
+
+    :param buckets_table: the name of the table marking changed buckets of
+        scheduled events
+    :type buckets_table: ``str``
+
     :param queries: a list of existing CQL queries to add to
     :type queries: ``list`` of ``str``
 
@@ -349,8 +431,8 @@ def _build_policies(policies, policies_table, event_table, queries, data,
             data[polname + 'version'] = uuid.uuid1()
 
             if policy.get("type") == 'schedule':
-                _build_schedule_policy(policy, event_table, queries,
-                                       data, polname, buckets)
+                _build_schedule_policy(policy, event_table, buckets_table,
+                                       queries, data, polname, buckets)
 
             outpolicies.append(policy.copy())
             outpolicies[-1]['id'] = polId
@@ -358,12 +440,14 @@ def _build_policies(policies, policies_table, event_table, queries, data,
     return outpolicies
 
 
-def _build_schedule_policy(policy, event_table, queries, data, polname,
-                           buckets):
+def _build_schedule_policy(policy, event_table, buckets_table, queries, data,
+                           polname, buckets):
     """
     Build schedule-type policy
     """
     data[polname + 'bucket'] = buckets.next()
+    queries.append(_cql_mark_bucket_changed.format(cf=buckets_table,
+                                                   name=polname))
     if 'at' in policy["args"]:
         queries.append(_cql_insert_group_event
                        .format(cf=event_table, name=polname))
@@ -575,6 +659,19 @@ def _del_webhook_queries(table, webhooks):
     return queries, params
 
 
+def token_ranges(n):
+    """
+    Split the token ring into ``n`` contiguous ranges of about the same size.
+    Each range can be scanned separately, by a different worker if needed.
+
+    :return: ``list`` of ``(start, end)`` tuples where ``start`` is exclusive
+        and ``end`` is inclusive
+    """
+    bounds = [MIN_TOKEN + (MAX_TOKEN - MIN_TOKEN) * i // n
+              for i in range(n)] + [MAX_TOKEN]
+    return zip(bounds, bounds[1:])
+
+
 def get_client_ts(reactor):
     """
     Return EPOCH with microseconds precision synchronously
@@ -582,6 +679,17 @@ def get_client_ts(reactor):
     return int(reactor.seconds() * 1000000)
 
 
+class StateConflictError(Exception):
+    """
+    Error to be raised when a scaling group's state could not be written
+    because it kept being changed concurrently.
+    """
+    def __init__(self, tenant_id, group_id, attempts):
+        super(StateConflictError, self).__init__(
+            "State of scaling group {g} for tenant {t} changed concurrently "
+            "{n} times in a row".format(t=tenant_id, g=group_id, n=attempts))
+
+
 def _check_deleting(group, get_deleting=False):
     """
     Given a single group from reading the scaling group table, and whether
@@ -620,6 +728,34 @@ class CassScalingGroup(object):
     :ivar local_locks: Local locks used when modifying state
     :type local_locks: :class:`WeakLocks`
 
+    :ivar webhook_cache: Cache of webhook capabilities whose entries are
+        invalidated when webhooks are deleted, or None
+    :type webhook_cache: :class:`WebhookCapabilityCache`
+
+    :ivar group_cache: Cache of group configs, launch configs and policies
+        whose entries are invalidated when they are changed, or None
+    :type group_cache: :class:`GroupConfigCache`
+
+    :ivar counts: Tenant resource counts updated when policies, webhooks
+        or the group are created or deleted, or None
+    :type counts: :class:`TenantResourceCounts`
+
+    :ivar versioned_state: Whether :meth:`modify_state` writes the state
+        with a lightweight transaction conditional on its version, bumping
+        the version and retrying the modifier when the state changed in the
+        meantime. The modifier may then be called more than once, so this
+        must only be enabled for groups whose modifiers have no side effects,
+        i.e. those of convergence tenants. Every node must write the states
+        of these groups this way, whether or not it holds the group's
+        ZooKeeper lock, so that no write goes unnoticed by the ones that do
+        not hold it.
+    :type versioned_state: ``bool``
+
+    :ivar optimistic_state: Whether :meth:`modify_state` writes a versioned
+        state without holding the group's ZooKeeper lock. Implies
+        ``versioned_state``.
+    :type optimistic_state: ``bool``
+
     IMPORTANT REMINDER: In CQL, update will create a new row if one doesn't
     exist.  Therefore, before doing an update, a read must be performed first
     else an entry is created where none should have been.
@@ -633,8 +769,13 @@ class CassScalingGroup(object):
     deletes are also updates and hence a read must be performed before deletes.
 
     """
+    # Number of times the state is read and modified again after finding it
+    # changed concurrently before giving up
+    max_state_conflicts = 10
+
     def __init__(self, log, tenant_id, uuid, connection, buckets, kz_client,
-                 reactor, local_locks):
+                 reactor, local_locks, webhook_cache=None, group_cache=None,
+                 counts=None, versioned_state=False, optimistic_state=False):
         """
         Creates a CassScalingGroup object.
         """
@@ -648,6 +789,11 @@ class CassScalingGroup(object):
         self.kz_client = kz_client
         self.reactor = reactor
         self.local_locks = local_locks
+        self.webhook_cache = webhook_cache
+        self.group_cache = group_cache
+        self.counts = counts
+        self.versioned_state = versioned_state
+        self.optimistic_state = optimistic_state
 
         self.group_table = "scaling_group"
         self.launch_table = "launch_config"
@@ -656,7 +802,26 @@ class CassScalingGroup(object):
         self.webhooks_table = "policy_webhooks"
         self.webhooks_keys_table = "webhook_keys"
         self.event_table = "scaling_schedule_v2"
+        self.event_buckets_table = "scaling_schedule_buckets"
         self.servers_cache_table = "servers_cache"
+        self.servers_cache_delta_table = "servers_cache_delta"
+
+    def _invalidate_webhooks(self, result, capability_hashes):
+        """
+        Invalidate cached webhook capabilities and return ``result``
+        """
+        if self.webhook_cache is not None:
+            self.webhook_cache.invalidate(capability_hashes)
+        return result
+
+    def _update_counts(self, result, **deltas):
+        """
+        Update the tenant's resource counts and return ``result``
+        """
+        if self.counts is None:
+            return result
+        d = self.counts.update(self.log, self.tenant_id, **deltas)
+        return d.addCallback(lambda _: result)
 
     def with_timestamp(self, func):
         """
@@ -730,10 +895,72 @@ class CassScalingGroup(object):
 
         return d
 
+    def _cached(self, item, fetch, current_stamp):
+        """
+        Get an item of this group through :attr:`group_cache`.
+
+        :param callable fetch: no-argument function returning Deferred of
+            ``(item, stamp)``
+        :param callable current_stamp: no-argument function returning
+            Deferred of the current stamp of the item or None
+        """
+        return self.group_cache.get(
+            (self.tenant_id, self.uuid), item, fetch, current_stamp)
+
+    def _cached_column(self, column):
+        """
+        Get a JSON column of this group through :attr:`group_cache`, checking
+        that a cached value is still the current one by the time the column
+        was written.
+        """
+        params = {"tenantId": self.tenant_id, "groupId": self.uuid}
+        writetime = 'writetime({})'.format(column)
+
+        def fetch():
+            view_query = _cql_view_with_writetime.format(
+                cf=self.group_table, column=column)
+            del_query = _cql_delete_all_in_group.format(
+                cf=self.group_table, name='')
+            d = verified_view(self.connection, view_query, del_query, params,
+                              DEFAULT_CONSISTENCY,
+                              NoSuchScalingGroupError(self.tenant_id,
+                                                      self.uuid),
+                              self.log)
+            return d.addCallback(lambda group: (_jsonloads_data(group[column]),
+                                                group[writetime]))
+
+        def current_stamp():
+            d = self.connection.execute(
+                _cql_view_writetime.format(cf=self.group_table,
+                                           column=column),
+                params, DEFAULT_CONSISTENCY)
+            return d.addCallback(
+                lambda rows: rows[0][writetime] if rows else None)
+
+        return self._cached(column, fetch, current_stamp)
+
+    def _invalidate_group(self, result):
+        """
+        Invalidate the cached configuration and policies of this group and
+        return ``result``
+        """
+        if self.group_cache is not None:
+            self.group_cache.invalidate((self.tenant_id, self.uuid))
+        return result
+
     def view_config(self):
         """
         see :meth:`otter.models.interface.IScalingGroup.view_config`
         """
+        if self.group_cache is None:
+            return self._view_config()
+        return self._cached_column('group_config')
+
+    def _view_config(self):
+        """
+        Like :meth:`view_config` but always reads the config from
+        cassandra. Used to ensure the group exists before writing to it.
+        """
         view_query = _cql_view.format(
             cf=self.group_table, column='group_config')
         del_query = _cql_delete_all_in_group.format(
@@ -752,6 +979,15 @@ class CassScalingGroup(object):
         """
         see :meth:`otter.models.interface.IScalingGroup.view_launch_config`
         """
+        if self.group_cache is None:
+            return self._view_launch_config()
+        return self._cached_column('launch_config')
+
+    def _view_launch_config(self):
+        """
+        Like :meth:`view_launch_config` but always reads the launch config
+        from cassandra
+        """
         view_query = _cql_view.format(
             cf=self.group_table, column='launch_config')
         del_query = _cql_delete_all_in_group.format(
@@ -822,15 +1058,93 @@ class CassScalingGroup(object):
                 self, state, *args, **kwargs))
             return d.addCallback(_write_state)
 
+        local_lock = self.local_locks.get_lock(self.uuid)
+        if self.versioned_state or self.optimistic_state:
+            modify = functools.partial(
+                self._modify_versioned_state, log, modifier_callable, args,
+                kwargs)
+        else:
+            modify = _modify_state
+        if self.optimistic_state:
+            return local_lock.run(modify)
+
         lock = self.kz_client.Lock(LOCK_PATH + '/' + self.uuid)
         lock.acquire = functools.partial(lock.acquire, timeout=120)
-        local_lock = self.local_locks.get_lock(self.uuid)
         return local_lock.run(
-            with_lock, self.reactor, lock, _modify_state,
+            with_lock, self.reactor, lock, modify,
             log.bind(category='locking', lock_reason='modify_state'),
             acquire_timeout=150,
             release_timeout=30)
 
+    def _modify_versioned_state(self, log, modifier_callable, args, kwargs):
+        """
+        Modify the state so that it does not need the group's ZooKeeper lock:
+        the new state is written only if the state's version is still the
+        one that was read, and the state is read and modified again
+        otherwise.
+
+        The state's version is bumped only by these writes, so all the nodes
+        must agree on whether a group's state is versioned.
+
+        :raises StateConflictError: if the state changed concurrently
+            :attr:`max_state_conflicts` times in a row
+        """
+        def _write_state(new_state, group):
+            assert (new_state.tenant_id == self.tenant_id and
+                    new_state.group_id == self.uuid)
+            version = group['state_version']
+            params = {
+                'tenantId': new_state.tenant_id,
+                'groupId': new_state.group_id,
+                'active': serialize_json_data(new_state.active, 1),
+                'pending': serialize_json_data(new_state.pending, 1),
+                'paused': new_state.paused,
+                'desired': new_state.desired,
+                'groupTouched': new_state.group_touched,
+                'policyTouched': serialize_json_data(new_state.policy_touched,
+                                                     1),
+                'created_at': group['created_at'],
+                'version': version,
+                'newVersion': (version or 0) + 1
+            }
+            d = self.connection.execute(
+                _cql_update_group_state_if_version.format(
+                    cf=self.group_table),
+                params, DEFAULT_CONSISTENCY)
+            return d.addCallback(lambda rows: rows[0]['[applied]'])
+
+        def _modify(group):
+            d = defer.succeed(_unmarshal_state(group))
+            d.addCallback(lambda state: modifier_callable(
+                self, state, *args, **kwargs))
+            return d.addCallback(_write_state, group)
+
+        def _check_applied(applied, attempt):
+            if applied:
+                return None
+            if attempt >= self.max_state_conflicts:
+                raise StateConflictError(self.tenant_id, self.uuid, attempt)
+            log.msg("Group state changed concurrently, modifying it again",
+                    attempt=attempt, otter_msg_type="modify-state-conflict")
+            return _attempt(attempt + 1)
+
+        def _attempt(attempt):
+            view_query = _cql_view_versioned_state.format(cf=self.group_table)
+            del_query = _cql_delete_all_in_group.format(
+                cf=self.group_table, name='')
+            d = verified_view(self.connection, view_query, del_query,
+                              {"tenantId": self.tenant_id,
+                               "groupId": self.uuid},
+                              DEFAULT_CONSISTENCY,
+                              NoSuchScalingGroupError(self.tenant_id,
+                                                      self.uuid),
+                              self.log)
+            d.addCallback(_check_deleting)
+            d.addCallback(_modify)
+            return d.addCallback(_check_applied, attempt)
+
+        return _attempt(1)
+
     def update_status(self, status):
         """
         see :meth:`otter.models.interface.IScalingGroup.update_status`
@@ -849,19 +1163,19 @@ class CassScalingGroup(object):
                  'status': status.name},
                 DEFAULT_CONSISTENCY)
 
-        @self.with_timestamp
-        def set_deleting(ts, _):
-            return self.connection.execute(
-                _cql_update.format(cf=self.group_table,
-                                   column='deleting',
-                                   name=':deleting'),
-                {'tenantId': self.tenant_id,
-                 'groupId': self.uuid,
-                 'ts': ts,
-                 'deleting': True},
+        def set_deleting(_):
+            # The group is only uncounted by the call that marks it deleting
+            def _uncount(rows):
+                if rows[0]['[applied]']:
+                    return self._update_counts(None, groups=-1)
+
+            d = self.connection.execute(
+                _cql_set_deleting.format(cf=self.group_table),
+                {'tenantId': self.tenant_id, 'groupId': self.uuid},
                 DEFAULT_CONSISTENCY)
+            return d.addCallback(_uncount)
 
-        d = self.view_config()
+        d = self._view_config()
         if status == ScalingGroupStatus.DELETING:
             d.addCallback(set_deleting)
         else:
@@ -884,7 +1198,7 @@ class CassScalingGroup(object):
                  "reasons": reasons, "ts": ts},
                 DEFAULT_CONSISTENCY)
 
-        d = self.view_config()
+        d = self._view_config()
         d.addCallback(_do_update)
         return d
 
@@ -906,9 +1220,9 @@ class CassScalingGroup(object):
                       consistency=DEFAULT_CONSISTENCY)
             return b.execute(self.connection)
 
-        d = self.view_config()
+        d = self._view_config()
         d.addCallback(_do_update_config)
-        return d
+        return d.addCallback(self._invalidate_group)
 
     def update_launch_config(self, data):
         """
@@ -929,9 +1243,9 @@ class CassScalingGroup(object):
             d = b.execute(self.connection)
             return d
 
-        d = self.view_config()
+        d = self._view_config()
         d.addCallback(_do_update_launch)
-        return d
+        return d.addCallback(self._invalidate_group)
 
     def _naive_list_policies(self, limit=None, marker=None):
         """
@@ -965,7 +1279,7 @@ class CassScalingGroup(object):
         # doesn't exist
         def _check_if_empty(policies_dict):
             if len(policies_dict) == 0:
-                return self.view_config().addCallback(lambda _: policies_dict)
+                return self._view_config().addCallback(lambda _: policies_dict)
             return policies_dict
 
         d = self._naive_list_policies(limit=limit, marker=marker)
@@ -974,6 +1288,51 @@ class CassScalingGroup(object):
     def get_policy(self, policy_id, version=None):
         """
         see :meth:`otter.models.interface.IScalingGroup.get_policy`
+
+        A cached policy is only used if its version is still the current one.
+        """
+        if self.group_cache is None:
+            return self._get_policy(policy_id, version)
+
+        def fetch():
+            d = self._get_policy_with_version(policy_id)
+            return d.addCallback(lambda result: (result, result[1]))
+
+        def current_stamp():
+            d = self.connection.execute(
+                _cql_view_policy_version.format(cf=self.policies_table),
+                {"tenantId": self.tenant_id, "groupId": self.uuid,
+                 "policyId": policy_id},
+                DEFAULT_CONSISTENCY)
+            return d.addCallback(
+                lambda rows: rows[0]['version'] if rows else None)
+
+        def _check_version((policy, policy_version)):
+            if version and policy_version != version:
+                raise NoSuchPolicyError(self.tenant_id, self.uuid, policy_id)
+            return policy
+
+        d = self._cached(('policy', policy_id), fetch, current_stamp)
+        return d.addCallback(_check_version)
+
+    def _get_policy(self, policy_id, version=None):
+        """
+        Like :meth:`get_policy` but always reads the policy from cassandra.
+        Used to ensure the policy exists before writing to it.
+        """
+        def _check_version((policy, policy_version)):
+            if version and policy_version != version:
+                raise NoSuchPolicyError(self.tenant_id, self.uuid, policy_id)
+            return policy
+
+        d = self._get_policy_with_version(policy_id)
+        return d.addCallback(_check_version)
+
+    def _get_policy_with_version(self, policy_id):
+        """
+        Read a policy and its version after ensuring the group exists
+
+        :return: Deferred of ``(policy, version)``
         """
         def fetch_policy(_):
             query = _cql_view_policy.format(cf=self.policies_table)
@@ -985,11 +1344,11 @@ class CassScalingGroup(object):
             return d.addCallback(_extract_policy)
 
         def _extract_policy(rows):
-            if len(rows) == 0 or version and rows[0]['version'] != version:
+            if len(rows) == 0:
                 raise NoSuchPolicyError(self.tenant_id, self.uuid, policy_id)
-            return _jsonloads_data(rows[0]['data'])
+            return _jsonloads_data(rows[0]['data']), rows[0].get('version')
 
-        d = self.view_config()  # Ensure group exists
+        d = self._view_config()  # Ensure group exists
         return d.addCallback(fetch_policy)
 
     def create_policies(self, data):
@@ -1023,15 +1382,17 @@ class CassScalingGroup(object):
                        "groupId": self.uuid}
 
             outpolicies = _build_policies(data, self.policies_table,
-                                          self.event_table, queries, cqldata,
-                                          self.buckets)
+                                          self.event_table,
+                                          self.event_buckets_table, queries,
+                                          cqldata, self.buckets)
 
             b = Batch(queries, cqldata,
                       consistency=DEFAULT_CONSISTENCY)
             d = b.execute(self.connection)
+            d.addCallback(self._update_counts, policies=len(outpolicies))
             return d.addCallback(lambda _: outpolicies)
 
-        d = self.view_config()
+        d = self._view_config()
         d.addCallback(_do_limits_check)
         d.addCallback(_do_create_pol)
         return d
@@ -1055,7 +1416,8 @@ class CassScalingGroup(object):
                     raise ValidationError("Cannot change type of "
                                           "a scaling policy")
                 if lastRev["type"] == 'schedule':
-                    _build_schedule_policy(data, self.event_table, queries,
+                    _build_schedule_policy(data, self.event_table,
+                                           self.event_buckets_table, queries,
                                            cqldata, '', self.buckets)
 
         def _do_update_policy(_):
@@ -1066,10 +1428,10 @@ class CassScalingGroup(object):
                       consistency=DEFAULT_CONSISTENCY)
             return b.execute(self.connection)
 
-        d = self.get_policy(policy_id)
+        d = self._get_policy(policy_id)
         d.addCallback(_do_update_schedule)
         d.addCallback(_do_update_policy)
-        return d
+        return d.addCallback(self._invalidate_group)
 
     def delete_policy(self, policy_id):
         """
@@ -1079,9 +1441,10 @@ class CassScalingGroup(object):
 
         def _do_delete(webhooks):
             # delete webhook keys
+            capability_hashes = [w['capability']['hash'] for w in webhooks]
             queries, params = _del_webhook_queries(
                 self.webhooks_keys_table,
-                [{'webhookKey': w['id']} for w in webhooks])
+                [{'webhookKey': h} for h in capability_hashes])
             queries.extend([
                 _cql_delete_all_in_policy.format(cf=self.policies_table),
                 _cql_delete_all_in_policy.format(cf=self.webhooks_table)])
@@ -1089,13 +1452,16 @@ class CassScalingGroup(object):
                            "policyId": policy_id})
             b = Batch(queries, params,
                       consistency=DEFAULT_CONSISTENCY)
-            return b.execute(self.connection)
+            d = b.execute(self.connection).addCallback(
+                self._invalidate_webhooks, capability_hashes)
+            return d.addCallback(
+                self._update_counts, policies=-1, webhooks=-len(webhooks))
 
-        d = self.get_policy(policy_id)
+        d = self._get_policy(policy_id)
         d.addCallback(
             lambda _: self._naive_list_webhooks(policy_id, QUERY_LIMIT, None))
         d.addCallback(_do_delete)
-        return d
+        return d.addCallback(self._invalidate_group)
 
     def _naive_list_all_webhooks(self):
         """
@@ -1134,7 +1500,7 @@ class CassScalingGroup(object):
         """
         def _check_if_empty(webhooks_dict):
             if len(webhooks_dict) == 0:
-                policy_there = self.get_policy(policy_id)
+                policy_there = self._get_policy(policy_id)
                 return policy_there.addCallback(lambda _: webhooks_dict)
             return webhooks_dict
 
@@ -1153,7 +1519,7 @@ class CassScalingGroup(object):
                        "groupId": self.uuid,
                        "policyId": policy_id}
 
-        d = self.get_policy(policy_id)  # check that policy exists first
+        d = self._get_policy(policy_id)  # check that policy exists first
 
         def _check_limit(curr_webhooks):
             max_webhooks = config_value('limits.absolute.maxWebhooksPerPolicy')
@@ -1186,6 +1552,7 @@ class CassScalingGroup(object):
             b = Batch(queries, cql_params,
                       consistency=DEFAULT_CONSISTENCY)
             d = b.execute(self.connection)
+            d.addCallback(self._update_counts, webhooks=len(output))
             return d.addCallback(lambda _: output)
 
         d.addCallback(_do_create)
@@ -1216,7 +1583,7 @@ class CassScalingGroup(object):
         # corresponding policy and webhook entries will remain.
         # We need not check if policy exists since corresponding
         # webhook row will not be there if policy is not there
-        return self.view_config().addCallback(fetch_webhook)
+        return self._view_config().addCallback(fetch_webhook)
 
     def update_webhook(self, policy_id, webhook_id, data):
         """
@@ -1260,7 +1627,9 @@ class CassScalingGroup(object):
                  "webhookId": webhook_id,
                  "webhookKey": lastRev['capability']['hash']},
                 DEFAULT_CONSISTENCY)
-            return d
+            d.addCallback(self._update_counts, webhooks=-1)
+            return d.addCallback(self._invalidate_webhooks,
+                                 [lastRev['capability']['hash']])
 
         return self.get_webhook(policy_id, webhook_id).addCallback(_do_delete)
 
@@ -1270,16 +1639,28 @@ class CassScalingGroup(object):
         """
         log = self.log.bind(system='CassScalingGroup.delete_group')
 
+        def _count_policies(webhooks):
+            if self.counts is None:
+                return webhooks, 0
+            d = self.connection.execute(
+                _cql_count_for_group.format(cf=self.policies_table),
+                {'tenantId': self.tenant_id, 'groupId': self.uuid},
+                DEFAULT_CONSISTENCY)
+            return d.addCallback(lambda rows: (webhooks, rows[0]['count']))
+
         @self.with_timestamp
-        def _delete_everything(ts, webhooks):
+        def _delete_everything(ts, (webhooks, num_policies), deleting):
             # delete webhook keys
             queries, params = _del_webhook_queries(
                 self.webhooks_keys_table, webhooks)
 
+            tables = [self.policies_table, self.webhooks_table,
+                      self.servers_cache_table]
+            if config_value('servers_cache.delta'):
+                tables.append(self.servers_cache_delta_table)
             queries.extend([
-                _cql_delete_all_in_group.format(cf=table, name='') for table in
-                (self.policies_table, self.webhooks_table,
-                 self.servers_cache_table)])
+                _cql_delete_all_in_group.format(cf=table, name='')
+                for table in tables])
             queries.append(_cql_delete_group.format(cf=self.group_table))
             params.update({'tenantId': self.tenant_id,
                            'groupId': self.uuid,
@@ -1288,15 +1669,24 @@ class CassScalingGroup(object):
             b = Batch(queries, params,
                       consistency=DEFAULT_CONSISTENCY)
 
-            return b.execute(self.connection)
+            d = b.execute(self.connection).addCallback(
+                self._invalidate_webhooks,
+                [webhook['webhookKey'] for webhook in webhooks])
+            # groups being deleted are already not counted
+            d.addCallback(self._update_counts,
+                          groups=0 if deleting else -1,
+                          policies=-num_policies, webhooks=-len(webhooks))
+            return d.addCallback(self._invalidate_group)
 
         def _maybe_delete(state):
-            if (state.status != ScalingGroupStatus.DELETING and
+            deleting = state.status == ScalingGroupStatus.DELETING
+            if (not deleting and
                     len(state.active) + len(state.pending) > 0):
                 raise GroupNotEmptyError(self.tenant_id, self.uuid)
 
             d = self._naive_list_all_webhooks()
-            d.addCallback(_delete_everything)
+            d.addCallback(_count_policies)
+            d.addCallback(_delete_everything, deleting)
             return d
 
         def _delete_group():
@@ -1330,6 +1720,427 @@ class CassScalingGroup(object):
         return d
 
 
+class WebhookCapabilityCache(object):
+    """
+    In-process LRU cache of webhook capability hash to the
+    ``(tenant ID, group ID, policy ID)`` it executes, which saves reading
+    the ``webhook_keys`` table when the same webhooks are executed repeatedly.
+
+    Found capabilities are cached for ``ttl`` seconds and unrecognized ones for
+    ``negative_ttl`` seconds. Entries are invalidated when their webhooks are
+    deleted through this process; webhooks deleted through other processes
+    keep being cached until their entries expire.
+
+    :param IReactorTime clock: Used to expire entries.
+    :param int size: Maximum number of entries cached.
+    :param number ttl: Seconds for which a found capability is cached.
+    :param number negative_ttl: Seconds for which an unrecognized capability
+        is cached.
+    """
+    def __init__(self, clock, size=10000, ttl=60, negative_ttl=10):
+        self._clock = clock
+        self._size = size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # {hash: (expiry time, info or None)}
+        self._invalidations = 0
+
+    def get(self, capability_hash, fetch):
+        """
+        Get webhook info of a capability hash, fetching it if it is not cached
+        or has expired.
+
+        :param str capability_hash: the capability hash
+        :param callable fetch: no-argument function returning Deferred of the
+            ``(tenant ID, group ID, policy ID)`` tuple, that fails with
+            :class:`UnrecognizedCapabilityError` if the capability is unknown
+
+        :return: Deferred of the webhook info
+        """
+        entry = self._entries.pop(capability_hash, None)
+        if entry is not None and entry[0] > self._clock.seconds():
+            # Re-inserting moves the entry to the most recently used end
+            self._entries[capability_hash] = entry
+            if entry[1] is None:
+                return defer.fail(
+                    UnrecognizedCapabilityError(capability_hash, 1))
+            return defer.succeed(entry[1])
+
+        invalidations = self._invalidations
+
+        def store(info, ttl):
+            # Do not store info fetched before an invalidation as it may be
+            # of a deleted webhook
+            if invalidations == self._invalidations:
+                self._entries[capability_hash] = (
+                    self._clock.seconds() + ttl, info)
+                while len(self._entries) > self._size:
+                    self._entries.popitem(last=False)
+
+        def found(info):
+            store(info, self._ttl)
+            return info
+
+        def not_found(f):
+            f.trap(UnrecognizedCapabilityError)
+            store(None, self._negative_ttl)
+            return f
+
+        return fetch().addCallbacks(found, not_found)
+
+    def invalidate(self, capability_hashes):
+        """
+        Remove entries of given capability hashes
+        """
+        self._invalidations += 1
+        for capability_hash in capability_hashes:
+            self._entries.pop(capability_hash, None)
+
+
+class GroupConfigCache(object):
+    """
+    In-process LRU cache of the configs, launch configs and policies of
+    groups, which change rarely but are read on every policy execution.
+
+    Every item is cached with a stamp that changes whenever the item does,
+    like the version of a policy or the time a config was written. Within
+    ``fresh_ttl`` seconds of being fetched or checked, a cached item is used
+    as is. After that, it is only used after checking that its stamp is
+    still the current one, which is cheaper than reading and parsing the
+    item again, so that changes through other processes are seen at most
+    ``fresh_ttl`` seconds late. All of a group's entries are also
+    invalidated when any of them is changed or the group is deleted through
+    this process, and entries expire after ``ttl`` seconds.
+
+    :param IReactorTime clock: Used to expire entries.
+    :param int size: Maximum number of groups cached.
+    :param number ttl: Seconds for which an item is cached.
+    :param number fresh_ttl: Seconds for which an item is used without
+        checking its stamp. 0 checks it on every get.
+
+    :ivar int hits: Number of gets answered from the cache
+    :ivar int misses: Number of gets that had to fetch
+    :ivar int stale: Number of those misses whose cached item had changed
+    """
+    def __init__(self, clock, size=10000, ttl=30, fresh_ttl=1):
+        self._clock = clock
+        self._size = size
+        self._ttl = ttl
+        self._fresh_ttl = fresh_ttl
+        # {group key: {item: (expiry time, stamp, value, fresh until)}}
+        self._groups = OrderedDict()
+        self._invalidations = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, group_key, item, fetch, current_stamp):
+        """
+        Get an item of a group, fetching it if it is not cached, has expired
+        or has changed.
+
+        :param group_key: ``(tenant ID, group ID)``
+        :param item: hashable name of the item
+        :param callable fetch: no-argument function returning Deferred of
+            ``(item, stamp)``. Failures are not cached.
+        :param callable current_stamp: no-argument function returning
+            Deferred of the item's current stamp, or of None if it does not
+            exist anymore
+
+        :return: Deferred of a copy of the item
+        """
+        items = self._groups.pop(group_key, None)
+        if items is not None:
+            # Re-inserting moves the group to the most recently used end
+            self._groups[group_key] = items
+            entry = items.get(item)
+            now = self._clock.seconds()
+            if entry is not None and entry[0] > now:
+                if entry[3] > now:
+                    self.hits += 1
+                    return defer.succeed(deepcopy(entry[2]))
+                return current_stamp().addCallback(
+                    self._check_stamp, group_key, item, entry, fetch)
+            items.pop(item, None)
+        return self._fetch(group_key, item, fetch)
+
+    def _check_stamp(self, stamp, group_key, item, entry, fetch):
+        """
+        Return a copy of the cached ``entry`` if its stamp is the current
+        ``stamp``, or fetch the item again otherwise
+        """
+        expiry, cached_stamp, value, _ = entry
+        items = self._groups.get(group_key, {})
+        if stamp is not None and stamp == cached_stamp:
+            self.hits += 1
+            if items.get(item) is entry:
+                items[item] = (expiry, cached_stamp, value,
+                               self._clock.seconds() + self._fresh_ttl)
+            return deepcopy(value)
+        self.stale += 1
+        if items.get(item) is entry:
+            del items[item]
+        return self._fetch(group_key, item, fetch)
+
+    def _fetch(self, group_key, item, fetch):
+        """
+        Fetch an item and cache it unless the cache was invalidated meanwhile
+        """
+        self.misses += 1
+        invalidations = self._invalidations
+
+        def store((value, stamp)):
+            # Do not store values fetched before an invalidation as they may
+            # have been changed
+            if invalidations == self._invalidations:
+                items = self._groups.pop(group_key, {})
+                now = self._clock.seconds()
+                items[item] = (now + self._ttl, stamp, deepcopy(value),
+                               now + self._fresh_ttl)
+                self._groups[group_key] = items
+                while len(self._groups) > self._size:
+                    self._groups.popitem(last=False)
+            return value
+
+        return fetch().addCallback(store)
+
+    def invalidate(self, group_key):
+        """
+        Remove all the entries of a group
+        """
+        self._invalidations += 1
+        self._groups.pop(group_key, None)
+
+    def health_check(self):
+        """
+        Report the hit and miss counters. The cache is always healthy.
+        """
+        return True, {'hits': self.hits, 'misses': self.misses,
+                      'stale': self.stale, 'groups': len(self._groups)}
+
+
+class TenantResourceCounts(object):
+    """
+    Number of groups, policies and webhooks of every tenant kept in a single
+    Cassandra row, so that limits can be checked by reading it instead of
+    counting all of the tenant's rows.
+
+    The counts are written with lightweight transactions: they are
+    initialized only if the tenant has none yet, and then changed only if
+    their version is the one that was read, reading them again otherwise.
+    Concurrent changes are thus never lost or applied twice.
+
+    The counts are not written in the same batch as the rows: they are
+    updated in a separate write after the rows have been written. If that
+    write fails, or the node crashes in between, the counts are wrong and
+    limits are checked against them until the tenant is reconciled. Tenants
+    whose counts are initialized or updated are remembered in
+    :attr:`touched` until :meth:`reconcile_touched` counts their rows again
+    and repairs the counts. As :attr:`touched` is only kept in memory, a
+    tenant whose counts were left wrong by a crash is only reconciled after
+    its counts are next updated.
+
+    :ivar set touched: Tenants whose counts changed since they were last
+        reconciled
+    :ivar kz_client: Kazoo client used to reconcile from one node at a time.
+        Nothing is reconciled until it is set.
+    :type kz_client: :class:`txkazoo.TxKazooClient`
+    """
+    table = 'tenant_resource_counts'
+    resources = ('groups', 'policies', 'webhooks')
+    lock_path = LOCK_PATH + '/reconcile_counts'
+    # Number of times the counts are read and updated again after finding
+    # them changed concurrently before giving up
+    max_conflicts = 10
+
+    def __init__(self, connection, reactor):
+        self.connection = connection
+        self.reactor = reactor
+        self.kz_client = None
+        self.touched = set()
+
+    def _get(self, tenant_id):
+        """
+        Read the tenant's counts with their version.
+
+        :return: Deferred that fires with ``(dict of resource to count,
+            version)`` or None if the tenant has no counts yet
+        """
+        def _to_counts(rows):
+            if not rows:
+                return None
+            row = rows[0]
+            return ({r: row[r] or 0 for r in self.resources},
+                    row['version'])
+
+        d = self.connection.execute(
+            _cql_get_counts.format(cf=self.table), {'tenantId': tenant_id},
+            DEFAULT_CONSISTENCY)
+        return d.addCallback(_to_counts)
+
+    def _set(self, tenant_id, counts, version):
+        """
+        Write the tenant's counts if they have not changed since ``version``
+        was read, or if they do not exist when ``version`` is None.
+
+        :return: Deferred that fires with whether the counts were written
+        """
+        params = merge(counts, {'tenantId': tenant_id})
+        if version is None:
+            query = _cql_insert_counts
+        else:
+            query = _cql_update_counts_if_version
+            params.update(version=version, newVersion=version + 1)
+        d = self.connection.execute(query.format(cf=self.table), params,
+                                    DEFAULT_CONSISTENCY)
+        return d.addCallback(lambda rows: rows[0]['[applied]'])
+
+    def get(self, tenant_id):
+        """
+        Read the tenant's counts.
+
+        :return: Deferred that fires with ``dict`` of resource to count or
+            None if the tenant has no counts yet
+        """
+        d = self._get(tenant_id)
+        return d.addCallback(lambda result: result and result[0])
+
+    def count_rows(self, tenant_id):
+        """
+        Count the tenant's non-deleting groups and all its policies and
+        webhooks by scanning their rows.
+
+        :return: Deferred that fires with ``dict`` of resource to count
+        """
+        queries = [
+            _cql_count_for_tenant.format(cf='scaling_group',
+                                         deleting='AND deleting=false'),
+            _cql_count_for_tenant.format(cf='scaling_policies', deleting=''),
+            _cql_count_for_tenant.format(cf='policy_webhooks', deleting='')]
+        d = defer.gatherResults(
+            [self.connection.execute(query, {'tenantId': tenant_id},
+                                     DEFAULT_CONSISTENCY)
+             for query in queries],
+            consumeErrors=True)
+        return d.addCallback(lambda results: {
+            resource: rows[0]['count']
+            for resource, rows in zip(self.resources, results)})
+
+    def reconcile(self, tenant_id):
+        """
+        Set the tenant's counts to the number of rows it has, unless they
+        are changed while the rows are counted, in which case the tenant is
+        kept in :attr:`touched` to be reconciled again later.
+
+        :return: Deferred that fires with ``dict`` of resource to count,
+            the current counts if they were initialized concurrently
+        """
+        def _set((current, actual)):
+            version = current and current[1]
+            d = self._set(tenant_id, actual, version)
+            return d.addCallback(_check, actual)
+
+        def _check(applied, actual):
+            if applied:
+                return actual
+            self.touched.add(tenant_id)
+            return self.get(tenant_id)
+
+        d = defer.gatherResults(
+            [self._get(tenant_id), self.count_rows(tenant_id)],
+            consumeErrors=True)
+        return d.addCallback(_set)
+
+    def get_counts(self, tenant_id):
+        """
+        Get the tenant's counts, counting its rows the first time. Tenants
+        initialized this way are reconciled later, since rows written while
+        they were being counted may have been missed.
+
+        :return: Deferred that fires with ``dict`` of resource to count
+        """
+        def _check(counts):
+            if counts is None:
+                self.touched.add(tenant_id)
+                return self.reconcile(tenant_id)
+            return counts
+
+        return self.get(tenant_id).addCallback(_check)
+
+    def update(self, log, tenant_id, **deltas):
+        """
+        Add ``deltas`` to the tenant's counts after its rows have been
+        written. If the tenant has no counts yet, they are initialized by
+        counting its rows, which already include the change.
+
+        :param log: Bound logger used to log failures
+        :param deltas: Resource name to the change in its count
+        :return: Deferred that fires with None once the counts are updated.
+            It never fails since the rows have already been written;
+            failures are logged and repaired by the next reconciliation.
+        """
+        def _apply(result, conflicts):
+            if result is None:
+                return self.reconcile(tenant_id)
+            counts, version = result
+            new_counts = {r: counts[r] + deltas.get(r, 0)
+                          for r in self.resources}
+            d = self._set(tenant_id, new_counts, version)
+            return d.addCallback(_check, conflicts)
+
+        def _check(applied, conflicts):
+            if applied:
+                return
+            if conflicts >= self.max_conflicts:
+                log.msg('update-counts-conflicts', tenant_id=tenant_id,
+                        conflicts=conflicts)
+                return
+            return _update(conflicts + 1)
+
+        def _update(conflicts):
+            return self._get(tenant_id).addCallback(_apply, conflicts)
+
+        if not any(deltas.itervalues()):
+            return defer.succeed(None)
+        self.touched.add(tenant_id)
+        d = _update(0)
+        d.addErrback(log.err, 'update-counts-failed')
+        return d.addCallback(lambda _: None)
+
+    def reconcile_touched(self, log):
+        """
+        Reconcile the counts of every tenant in :attr:`touched`, one tenant
+        at a time, while holding a ZooKeeper lock so that only one node
+        reconciles at any time. Tenants whose reconciliation fails are kept
+        for the next run, as are all of them if the lock cannot be acquired.
+
+        :return: Deferred that fires with None when done
+        """
+        if self.kz_client is None or not self.touched:
+            return defer.succeed(None)
+
+        def _failed(f, tenant_id):
+            self.touched.add(tenant_id)
+            log.err(f, 'reconcile-counts-failed', tenant_id=tenant_id)
+
+        def _reconcile():
+            tenants, self.touched = self.touched, set()
+            d = defer.succeed(None)
+            for tenant_id in tenants:
+                d.addCallback(
+                    lambda _, t=tenant_id: self.reconcile(t).addErrback(
+                        _failed, t))
+            return d
+
+        d = with_lock(self.reactor, self.kz_client.Lock(self.lock_path),
+                      _reconcile,
+                      log.bind(category='locking',
+                               lock_reason='reconcile_counts'),
+                      acquire_timeout=120, release_timeout=30)
+        d.addErrback(log.err, 'reconcile-counts-lock-failed')
+        return d.addCallback(lambda _: None)
+
+
 @implementer(IScalingGroupCollection, IScalingScheduleCollection)
 class CassScalingGroupCollection:
     """
@@ -1366,18 +2177,28 @@ class CassScalingGroupCollection:
     Also, because deletes are done as tombstones rather than actually deleting,
     deletes are also updates and hence a read must be performed before deletes.
     """
-    def __init__(self, connection, reactor, max_groups):
+    def __init__(self, connection, reactor, max_groups, counts=None,
+                 optimistic_state=False):
         """
         Init
 
         :param CQLClient connection: Silverberg client implementation
         :param reactor: Twisted reactor
         :param int max_groups: Maximum number of groups allowed per tenant
+        :param counts: :class:`TenantResourceCounts` used to get and maintain
+            tenants' counts. Rows are counted on every request if None.
+        :param bool optimistic_state: Whether the states of the groups of
+            convergence tenants are modified without holding their locks (see
+            :attr:`CassScalingGroup.optimistic_state`)
         """
         self.connection = connection
         self.reactor = reactor
         self.max_groups = max_groups
+        self.counts = counts
+        self.optimistic_state = optimistic_state
         self.local_locks = WeakLocks()
+        self.webhook_cache = WebhookCapabilityCache(reactor)
+        self.group_cache = GroupConfigCache(reactor)
         self.group_table = "scaling_group"
         self.launch_table = "launch_config"
         self.policies_table = "scaling_policies"
@@ -1385,6 +2206,7 @@ class CassScalingGroupCollection:
         self.webhook_keys_table = "webhook_keys"
         self.state_table = "group_state"
         self.event_table = "scaling_schedule_v2"
+        self.event_buckets_table = "scaling_schedule_buckets"
         self.buckets = None
         self.kz_client = None
 
@@ -1444,13 +2266,16 @@ class CassScalingGroupCollection:
                 desired=data['desired']
             )
             outpolicies = _build_policies(
-                policies, self.policies_table,
-                self.event_table, queries, data, self.buckets)
+                policies, self.policies_table, self.event_table,
+                self.event_buckets_table, queries, data, self.buckets)
 
             b = Batch(queries, data,
                       consistency=DEFAULT_CONSISTENCY)
 
             bd = b.execute(self.connection)
+            if self.counts is not None:
+                bd.addCallback(lambda _: self.counts.update(
+                    log, tenant_id, groups=1, policies=len(outpolicies)))
             bd.addCallback(lambda _: {
                 'groupConfiguration': config,
                 'launchConfiguration': launch,
@@ -1515,10 +2340,20 @@ class CassScalingGroupCollection:
     def get_scaling_group(self, log, tenant_id, scaling_group_id):
         """
         see :meth:`IScalingGroupCollection.get_scaling_group`
+
+        The states of the groups of convergence tenants are always versioned,
+        so that nodes with and without ``optimistic_state`` can run together.
         """
+        versioned = tenant_is_enabled(tenant_id, config_value)
         return CassScalingGroup(log, tenant_id, scaling_group_id,
                                 self.connection, self.buckets, self.kz_client,
-                                self.reactor, self.local_locks)
+                                self.reactor, self.local_locks,
+                                webhook_cache=self.webhook_cache,
+                                group_cache=self.group_cache,
+                                counts=self.counts,
+                                versioned_state=versioned,
+                                optimistic_state=(
+                                    self.optimistic_state and versioned))
 
     def fetch_and_delete(self, bucket, now, size=100):
         """
@@ -1545,6 +2380,28 @@ class CassScalingGroupCollection:
             {"size": size, "now": now, "bucket": bucket}, DEFAULT_CONSISTENCY)
         return d.addCallback(delete_events)
 
+    def get_events(self, bucket, until, size=100):
+        """
+        see :meth:`IScalingScheduleCollection.get_events`
+        """
+        return self.connection.execute(
+            _cql_fetch_batch_of_events.format(cf=self.event_table),
+            {"size": size, "now": until, "bucket": bucket},
+            DEFAULT_CONSISTENCY)
+
+    def get_bucket_changes(self, buckets):
+        """
+        see :meth:`IScalingScheduleCollection.get_bucket_changes`
+        """
+        names = ['bucket{}'.format(i) for i in range(len(buckets))]
+        d = self.connection.execute(
+            _cql_bucket_changes.format(
+                cf=self.event_buckets_table,
+                buckets=', '.join(':' + name for name in names)),
+            dict(zip(names, buckets)), DEFAULT_CONSISTENCY)
+        return d.addCallback(
+            lambda rows: {row['bucket']: row['changed'] for row in rows})
+
     def add_cron_events(self, cron_events):
         """
         Add cron events to event table
@@ -1554,6 +2411,8 @@ class CassScalingGroupCollection:
             event_name = 'event{}'.format(i)
             queries.append(_cql_insert_cron_event.format(cf=self.event_table,
                                                          name=event_name))
+            queries.append(_cql_mark_bucket_changed.format(
+                cf=self.event_buckets_table, name=event_name) + ';')
             data[event_name + 'bucket'] = self.buckets.next()
             data.update({event_name + key: event[key] for key in event})
         b = Batch(queries, data, ConsistencyLevel.ONE)
@@ -1572,10 +2431,14 @@ class CassScalingGroupCollection:
     def webhook_info_by_hash(self, log, capability_hash):
         """
         see :meth:`IScalingGroupCollection.webhook_info_by_hash`
+
+        The info is cached in :attr:`webhook_cache`.
         """
-        d = self.connection.execute(
-            _cql_find_webhook_token.format(cf=self.webhook_keys_table),
-            {"webhookKey": capability_hash}, ConsistencyLevel.ONE)
+        def fetch():
+            d = self.connection.execute(
+                _cql_find_webhook_token.format(cf=self.webhook_keys_table),
+                {"webhookKey": capability_hash}, ConsistencyLevel.ONE)
+            return d.addCallback(extract_info)
 
         def extract_info(rows):
             if len(rows) == 0:
@@ -1583,8 +2446,7 @@ class CassScalingGroupCollection:
             r = rows[0]
             return (r['tenantId'], r['groupId'], r['policyId'])
 
-        d.addCallback(extract_info)
-        return d
+        return self.webhook_cache.get(capability_hash, fetch)
 
     def get_webhook_index_only(self):
         """
@@ -1637,6 +2499,9 @@ class CassScalingGroupCollection:
         """
         Return number of valid (non-deleting) groups of the tenant
         """
+        if self.counts is not None:
+            d = self.counts.get_counts(tenant_id)
+            return d.addCallback(lambda counts: counts['groups'])
         d = self.connection.execute(
             _cql_count_for_tenant.format(cf='scaling_group',
                                          deleting='AND deleting=false'),
@@ -1647,6 +2512,8 @@ class CassScalingGroupCollection:
         """
         see :meth:`otter.models.interface.IScalingGroupCollection.get_counts`
         """
+        if self.counts is not None:
+            return self.counts.get_counts(tenant_id)
         deferreds = []
         for table in ['scaling_policies', 'policy_webhooks']:
             d = self.connection.execute(
@@ -1710,10 +2577,17 @@ class CassScalingGroupCollection:
                               self.reactor.seconds() - start_time}))
         return d
 
-    def get_all_groups(self):
+    def get_all_groups(self, parallel=1, max_tenants=None, always_tenants=()):
         """
-        Get *all* valid scaling groups, grouped by tenantId.
+        Get *all* valid scaling groups, grouped by tenantId. Groups are
+        filtered as they are scanned and only have 'tenantId', 'groupId',
+        'desired', 'status', 'deleting' and 'created_at'.
 
+        :param int parallel: Number of token ranges to scan concurrently
+        :param int max_tenants: If given, only the groups of this many
+            tenants with the smallest IDs are kept as they are scanned, in
+            addition to the tenants in ``always_tenants``
+        :param always_tenants: Tenants whose groups are always kept
         :return: `Deferred` fired with ``dict`` of the form
             {"tenantId1": [{group_dict_1...}, {group_dict_2..}],
              "tenantId2": [{group_dict_1...}, {group_dict_2..}, ...]}
@@ -1724,110 +2598,293 @@ class CassScalingGroupCollection:
                     row.get('status') not in ('DISABLED', 'ERROR') and
                     not row.get('deleting', False))
 
-        d = self.get_scaling_group_rows(
-            props=["status", "deleting", "created_at"])
-        d.addCallback(filter(_valid_group_row))
-        return d.addCallback(groupby(lambda g: g["tenantId"]))
+        groups = defaultdict(list)
+        always_tenants = set(always_tenants)
+        # Sorted IDs of the tenants kept up to max_tenants
+        kept = []
+
+        def _keep(tenant_id):
+            if (max_tenants is None or tenant_id in always_tenants or
+                    tenant_id in groups):
+                return True
+            if len(kept) == max_tenants:
+                if not kept or tenant_id > kept[-1]:
+                    return False
+                del groups[kept.pop()]
+            bisect.insort(kept, tenant_id)
+            return True
+
+        def _add_groups(rows):
+            for row in rows:
+                if _valid_group_row(row) and _keep(row['tenantId']):
+                    groups[row['tenantId']].append(row)
+
+        d = self.scan_all_scaling_group_rows(
+            _add_groups, props=["status", "deleting", "created_at"],
+            parallel=parallel)
+        return d.addCallback(lambda _: dict(groups))
 
-    @defer.inlineCallbacks
     def get_scaling_group_rows(self, props=None, batch_size=100):
         """
         Return scaling group rows from Cassandra as a list of ``dict`` where
         each dict has 'tenantId', 'groupId', 'desired', 'active', 'pending' and
-        any other properties given in `props`
+        any other properties given in `props`. Prefer
+        :meth:`scan_all_scaling_group_rows` which does not hold all the rows
+        in memory.
 
         :param ``list`` props: List of extra properties to extract
         :param int batch_size: Number of groups to fetch at a time
         :return: `Deferred` fired with ``list`` of ``dict``
         """
-        # TODO: Currently returning all groups as one giant list for now.
-        # Will try to use Twisted tubes to do streaming later
-        _props = set(['"tenantId"', '"groupId"', 'desired',
-                      'active', 'pending']) | set(props or [])
-        query = ('SELECT ' + ','.join(sorted(list(_props))) +
+        groups = []
+        d = self.scan_scaling_group_rows(
+            groups.extend, props=['active', 'pending'] + list(props or []),
+            batch_size=batch_size)
+        return d.addCallback(lambda _: groups)
+
+    def scan_all_scaling_group_rows(self, consume, props=None,
+                                    batch_size=100, parallel=1):
+        """
+        Scan all scaling group rows by splitting the token ring into
+        ``parallel`` ranges scanned concurrently. See
+        :meth:`scan_scaling_group_rows`.
+
+        :return: `Deferred` fired with None when all rows have been consumed
+        """
+        d = defer.gatherResults(
+            [self.scan_scaling_group_rows(consume, props, batch_size, r)
+             for r in token_ranges(parallel)],
+            consumeErrors=True)
+        return d.addCallback(lambda _: None)
+
+    @defer.inlineCallbacks
+    def scan_scaling_group_rows(self, consume, props=None, batch_size=100,
+                                token_range=(MIN_TOKEN, MAX_TOKEN)):
+        """
+        Scan the scaling group rows whose tenant's token is in the given
+        range, one batch at a time. The next batch is fetched only after
+        the previous one has been consumed, so at most one batch of rows per
+        scan is held in memory.
+
+        Rows come sorted first by the hash of their tenant id and then by
+        group id. Once a batch is full, the rest of its last tenant's groups
+        are fetched by asking for greater group ids before moving on to the
+        tenants with greater tokens.
+
+        :param callable consume: Called with every non-empty ``list`` of
+            rows, each a ``dict`` with 'tenantId', 'groupId', 'desired' and
+            the properties in ``props``. It can return a `Deferred` to delay
+            fetching the next batch.
+        :param ``list`` props: List of extra properties to extract
+        :param int batch_size: Number of groups to fetch at a time
+        :param tuple token_range: ``(start, end)`` tokens. Tenants whose token
+            is greater than ``start`` and at most ``end`` are scanned.
+            See :func:`token_ranges`.
+        :return: `Deferred` fired with None when all rows have been consumed
+        """
+        _props = set(['"tenantId"', '"groupId"', 'desired']) | set(props or [])
+        query = ('SELECT ' + ','.join(sorted(_props)) +
                  ' FROM scaling_group {where} LIMIT :limit;')
+        where_range = ('WHERE token("tenantId") > :start '
+                       'AND token("tenantId") <= :end')
         where_key = 'WHERE "tenantId"=:tenantId AND "groupId">:groupId'
-        where_token = 'WHERE token("tenantId") > token(:tenantId)'
-
-        # We first start by getting all groups limited on batch size
-        # It will return groups sorted first based on hash of tenant id
-        # and then based group id. Note that only tenant id is sorted
-        # based on hash; group id is sorted normally
-        batch = yield self.connection.execute(
-            query.format(where=''),
-            {'limit': batch_size}, ConsistencyLevel.ONE)
-        if len(batch) < batch_size:
-            defer.returnValue(batch)
-
-        # We got batch size response. That means there are probably more groups
-        groups = batch
-        while batch != []:
-            # We start by getting all the groups of last tenant ID we received
-            # except the ones we already got. We do that by asking
-            # groups > last group id since groups are sorted
-            tenant_id = batch[-1]['tenantId']
-            while len(batch) == batch_size:
-                batch = yield self.connection.execute(
-                    query.format(where=where_key),
-                    {'limit': batch_size,
-                     'tenantId': tenant_id,
-                     'groupId': batch[-1]['groupId']},
-                    ConsistencyLevel.ONE)
-                groups.extend(batch)
-            # We then get next tenant's groups by using there hash value. i.e
-            # tenants whose hash > last tenant id we just fetched
+        where_next = ('WHERE token("tenantId") > token(:tenantId) '
+                      'AND token("tenantId") <= :end')
+
+        start, end = token_range
+        where, params = where_range, {'start': start, 'end': end}
+        while True:
             batch = yield self.connection.execute(
-                query.format(where=where_token),
-                {'limit': batch_size, 'tenantId': tenant_id},
-                ConsistencyLevel.ONE)
-            groups.extend(batch)
-        defer.returnValue(groups)
+                query.format(where=where),
+                merge(params, {'limit': batch_size}), ConsistencyLevel.ONE)
+            if batch:
+                yield consume(batch)
+            if len(batch) == batch_size:
+                # the last tenant may have more groups
+                last = batch[-1]
+                where, params = where_key, {'tenantId': last['tenantId'],
+                                            'groupId': last['groupId']}
+            elif where is where_key:
+                # done with this tenant; move on to the next ones
+                where, params = where_next, {'tenantId': params['tenantId'],
+                                             'end': end}
+            else:
+                break
 
 
 @implementer(IScalingGroupServersCache)
 class CassScalingGroupServersCache(object):
     """
     Collection of cache of scaling group servers
+
+    The cache is stored in one of two layouts. In the legacy ``servers_cache``
+    table, every update writes all the servers of the group again under a new
+    ``last_update`` clustering key. In the ``servers_cache_delta`` table, used
+    when ``delta`` is True, the group's current servers are stored once keyed
+    by their ID, along with the time each one was last changed and the time
+    of the whole cache in a static column. Every update then writes only the
+    servers that changed and deletes the ones that are gone, in a single
+    partition batch, so that readers always see a consistent cache. In both
+    layouts, the servers read are the ones of the latest update.
+
+    When ``dual_write`` is True as well, every update is also written in the
+    legacy layout, and readers take whichever layout was updated last. This
+    lets nodes with different settings run together while switching layouts:
+
+    1. Enable ``delta`` and ``dual_write`` on every node. Nodes without them
+       keep reading and writing an up-to-date legacy cache.
+    2. Once all nodes have both, disable ``dual_write`` on every node. Nodes
+       still dual-writing take the newer delta cache.
+
+    Rolling back goes through the same steps in reverse, so that the legacy
+    cache is up to date again before nodes stop using the delta layout.
+    Groups without a cache in the delta layout yet are read from the legacy
+    table. Without ``dual_write``, their legacy rows are deleted on their
+    first update in the delta layout.
+
+    :param bool delta: Whether to use the delta layout. Defaults to the
+        ``servers_cache.delta`` config value.
+    :param bool dual_write: Whether to also write the legacy layout when using
+        the delta layout. Defaults to the ``servers_cache.dual_write`` config
+        value.
     """
 
-    def __init__(self, tenant_id, group_id, clock=None):
+    def __init__(self, tenant_id, group_id, clock=None, delta=None,
+                 dual_write=None):
         self.tenantId = tenant_id
         self.groupId = group_id
         self.table = "servers_cache"
+        self.delta_table = "servers_cache_delta"
         self.params = {"tenantId": self.tenantId, "groupId": self.groupId}
         if clock is None:
             from twisted.internet import reactor
             self.clock = reactor
         else:
             self.clock = clock
+        if delta is None:
+            delta = bool(config_value('servers_cache.delta'))
+        self.delta = delta
+        if dual_write is None:
+            dual_write = bool(config_value('servers_cache.dual_write'))
+        self.dual_write = dual_write
+
+    def _get_delta_rows(self):
+        """
+        Effect of the group's rows in the delta layout
+        """
+        query = ('SELECT server_id, server_blob, server_as_active, '
+                 'last_update FROM {cf} '
+                 'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
+        return cql_eff(query.format(cf=self.delta_table), self.params)
 
     @do
     def get_servers(self, only_as_active):
         """
         See :method:`IScalingGroupServersCache.get_servers`
         """
+        current = ([], None)
+        if self.delta:
+            rows = yield self._get_delta_rows()
+            current = _current_cached_servers(rows, only_as_active)
+            if rows and not self.dual_write:
+                yield do_return(current)
         query = ('SELECT server_blob, server_as_active, last_update FROM {cf} '
                  'WHERE "tenantId"=:tenantId AND "groupId"=:groupId '
                  'ORDER BY last_update DESC;')
         rows = yield cql_eff(query.format(cf=self.table), self.params)
-        if len(rows) == 0:
-            yield do_return(([], None))
-        last_update = rows[0]['last_update']
-        rows = takewhile(lambda r: r['last_update'] == last_update, rows)
-
-        def _dict(r): return json.loads(r['server_blob'])
-        rfunc = (
-            compose(map(_dict), filter(lambda r: r['server_as_active']))
-            if only_as_active else map(_dict))
-
-        yield do_return((list(rfunc(rows)), last_update))
+        yield do_return(
+            _newer_cached_servers(
+                current, _latest_cached_servers(rows, only_as_active)))
+
+    @classmethod
+    def get_servers_of_groups(cls, tenant_id, group_ids, only_as_active,
+                              batch_size=25, delta=None, dual_write=None):
+        """
+        Return latest cache of servers of many groups of a tenant. Groups
+        are fetched ``batch_size`` at a time in a single query per batch and
+        these queries are run in parallel.
+
+        :param str tenant_id: Tenant ID owning the groups
+        :param list group_ids: IDs of groups whose servers are fetched
+        :param bool only_as_active: Should it return only otter active
+            servers?
+        :param int batch_size: Number of groups fetched per query
+        :param bool delta: Whether to use the delta layout. Defaults to the
+            ``servers_cache.delta`` config value.
+        :param bool dual_write: Whether the legacy layout is also written.
+            Defaults to the ``servers_cache.dual_write`` config value.
+
+        :return: Effect of dict mapping group ID to (servers, last update time)
+            tuple like the one returned by :meth:`get_servers`
+        """
+        if delta is None:
+            delta = bool(config_value('servers_cache.delta'))
+        if dual_write is None:
+            dual_write = bool(config_value('servers_cache.dual_write'))
+
+        def legacy_servers(group_ids):
+            query = ('SELECT "groupId", server_blob, server_as_active, '
+                     'last_update FROM servers_cache '
+                     'WHERE "tenantId"=:tenantId AND "groupId" IN ({groups});')
+
+            def group_servers(rows):
+                servers = {}
+                for group_id in group_ids:
+                    group_rows = sorted(rows.get(group_id, []),
+                                        key=lambda r: r['last_update'],
+                                        reverse=True)
+                    servers[group_id] = _latest_cached_servers(
+                        group_rows, only_as_active)
+                return servers
+
+            return _rows_of_groups(
+                query, tenant_id, group_ids, batch_size).on(group_servers)
+
+        if not delta:
+            return legacy_servers(group_ids)
+
+        def with_legacy_servers(rows):
+            servers = {group_id: _current_cached_servers(rows[group_id],
+                                                         only_as_active)
+                       for group_id in group_ids if group_id in rows}
+            missing = [group_id for group_id in group_ids
+                       if dual_write or group_id not in rows]
+            if not missing:
+                return servers
+            return legacy_servers(missing).on(
+                lambda legacy: merge_with(
+                    lambda cached: reduce(_newer_cached_servers, cached),
+                    servers, legacy))
+
+        query = ('SELECT "groupId", server_id, server_blob, server_as_active, '
+                 'last_update FROM servers_cache_delta '
+                 'WHERE "tenantId"=:tenantId AND "groupId" IN ({groups});')
+        return _rows_of_groups(
+            query, tenant_id, group_ids, batch_size).on(with_legacy_servers)
 
     def insert_servers(self, last_update, servers, clear_others):
         """
         See :method:`IScalingGroupServersCache.insert_servers`
+
+        In the delta layout, there are no other caches: the servers that are
+        not given are always deleted.
         """
         if len(servers) == 0:
             return Effect(Constant(None))
+        if not self.delta:
+            return self._insert_legacy(last_update, servers, clear_others)
+        delta_eff = self._get_delta_rows().on(
+            lambda rows: self._update_delta(rows, last_update, servers))
+        if not self.dual_write:
+            return delta_eff
+        return self._insert_legacy(
+            last_update, [server.copy() for server in servers],
+            clear_others).on(lambda _: delta_eff)
+
+    def _insert_legacy(self, last_update, servers, clear_others):
+        """
+        Write all the servers in the legacy layout
+        """
         query = ('INSERT INTO {cf} ("tenantId", "groupId", last_update, '
                  'server_id, server_blob, server_as_active) '
                  'VALUES(:tenantId, :groupId, :last_update, :server_id{i}, '
@@ -1841,21 +2898,145 @@ class CassScalingGroupServersCache(object):
             params['server_blob{}'.format(i)] = json.dumps(server)
             queries.append(query.format(cf=self.table, i=i))
         if clear_others:
-            return self.delete_servers().on(
+            return self._delete_tables([self.table]).on(
                 lambda _: cql_eff(
                     batch(queries, get_client_ts(self.clock)), params))
         else:
             return cql_eff(batch(queries, get_client_ts(self.clock)), params)
 
-    def delete_servers(self):
+    def _update_delta(self, rows, last_update, servers):
         """
-        See :method:`IScalingGroupServersCache.delete_servers`
+        Write the servers that are different from the ones in ``rows``, the
+        group's current rows in the delta layout, and delete the ones that are
+        not in ``servers``.
+        """
+        insert = ('INSERT INTO {cf} ("tenantId", "groupId", server_id, '
+                  'server_blob, server_as_active, updated) '
+                  'VALUES(:tenantId, :groupId, :server_id{i}, '
+                  ':server_blob{i}, :server_as_active{i}, :last_update);')
+        delete = ('DELETE FROM {cf} WHERE "tenantId"=:tenantId AND '
+                  '"groupId"=:groupId AND server_id=:deleted_id{i};')
+        current = {r['server_id']: (r['server_blob'], r['server_as_active'])
+                   for r in rows if r['server_id'] is not None}
+        params = merge(self.params, {"last_update": last_update})
+        queries = []
+        for i, server in enumerate(servers):
+            as_active = server.pop('_is_as_active', False)
+            cached = (json.dumps(server, sort_keys=True), as_active)
+            if current.pop(server['id'], None) != cached:
+                params['server_id{}'.format(i)] = server['id']
+                params['server_blob{}'.format(i)] = cached[0]
+                params['server_as_active{}'.format(i)] = cached[1]
+                queries.append(insert.format(cf=self.delta_table, i=i))
+        for i, server_id in enumerate(sorted(current)):
+            params['deleted_id{}'.format(i)] = server_id
+            queries.append(delete.format(cf=self.delta_table, i=i))
+        queries.append(
+            'UPDATE {cf} SET last_update=:last_update '
+            'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;'.format(
+                cf=self.delta_table))
+        if not rows and not self.dual_write:
+            # First update in the delta layout: the legacy cache is not
+            # needed anymore
+            queries.append(
+                'DELETE FROM {cf} '
+                'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;'.format(
+                    cf=self.table))
+        return cql_eff(batch(queries, get_client_ts(self.clock)), params)
+
+    def _delete_tables(self, tables):
+        """
+        Delete the group's cache in the given tables
         """
         query = ('DELETE FROM {cf} USING TIMESTAMP :ts '
                  'WHERE "tenantId"=:tenantId AND "groupId"=:groupId')
-        return cql_eff(
-            query.format(cf=self.table),
-            merge(self.params, {"ts": get_client_ts(self.clock)}))
+        params = merge(self.params, {"ts": get_client_ts(self.clock)})
+        if len(tables) == 1:
+            return cql_eff(query.format(cf=tables[0]), params)
+        return cql_eff(batch([query.format(cf=cf) + ';' for cf in tables]),
+                       params)
+
+    def delete_servers(self):
+        """
+        See :method:`IScalingGroupServersCache.delete_servers`
+        """
+        if self.delta:
+            return self._delete_tables([self.table, self.delta_table])
+        return self._delete_tables([self.table])
+
+
+def _rows_of_groups(query, tenant_id, group_ids, batch_size):
+    """
+    Get the rows of many groups of a tenant from a servers cache table,
+    ``batch_size`` groups at a time with queries run in parallel.
+
+    :param str query: Query with a ``{groups}`` placeholder for the group
+        IDs parameters
+    :return: Effect of dict mapping group ID to its rows
+    """
+    def batch_eff(group_ids):
+        params = {'groupId{}'.format(i): group_id
+                  for i, group_id in enumerate(group_ids)}
+        groups = ', '.join(':groupId{}'.format(i)
+                           for i in range(len(group_ids)))
+        return cql_eff(query.format(groups=groups),
+                       merge(params, {'tenantId': tenant_id}))
+
+    return parallel(
+        [batch_eff(group_batch)
+         for group_batch in partition_all(batch_size, group_ids)]
+    ).on(lambda results: groupby(lambda r: r['groupId'], concat(results)))
+
+
+def _cached_servers(rows, only_as_active):
+    """
+    Return servers in the given servers cache rows
+    """
+    def _dict(r):
+        return json.loads(r['server_blob'])
+
+    rfunc = (
+        compose(map(_dict), filter(lambda r: r['server_as_active']))
+        if only_as_active else map(_dict))
+
+    return list(rfunc(rows))
+
+
+def _latest_cached_servers(rows, only_as_active):
+    """
+    Return servers and their update time from latest cache in ``rows`` of
+    ``servers_cache`` table of a group sorted by last_update in descending
+    order.
+    """
+    if len(rows) == 0:
+        return ([], None)
+    last_update = rows[0]['last_update']
+    rows = takewhile(lambda r: r['last_update'] == last_update, rows)
+    return (_cached_servers(rows, only_as_active), last_update)
+
+
+def _newer_cached_servers(cached1, cached2):
+    """
+    Return whichever of two (servers, last update time) tuples was updated
+    last, preferring the first one
+    """
+    if cached2[1] is not None and (cached1[1] is None or
+                                   cached2[1] > cached1[1]):
+        return cached2
+    return cached1
+
+
+def _current_cached_servers(rows, only_as_active):
+    """
+    Return servers and their update time from the rows of a group in the
+    ``servers_cache_delta`` table. A group without servers has a single row
+    with only the static update time.
+    """
+    if len(rows) == 0:
+        return ([], None)
+    last_update = rows[0]['last_update']
+    rows = [r for r in rows if r['server_id'] is not None]
+    return (_cached_servers(rows, only_as_active), last_update)
 
 
 @implementer(IAdmin)
@@ -1898,3 +3079,69 @@ class CassAdmin(object):
 
         deferreds = [_get_metric(table, label) for table, label in mapping]
         return defer.gatherResults(deferreds, consumeErrors=True)
+
+
+@implementer(ITokenCache)
+class CassTokenCache(object):
+    """
+    Tenants' tokens shared between otter nodes in Cassandra. Rows are written
+    with a TTL so that expired tokens and refresh claims are removed by
+    Cassandra.
+    """
+    token_table = 'identity_tokens'
+    claims_table = 'identity_token_claims'
+
+    def __init__(self, connection, clock):
+        self.connection = connection
+        self.clock = clock
+
+    def get_token(self, tenant_id):
+        """
+        see :meth:`otter.auth.ITokenCache.get_token`
+        """
+        def _to_entry(rows):
+            if not rows:
+                return None
+            row = rows[0]
+            return (timestamp.datetime_to_epoch(row['created']),
+                    (row['token'], json.loads(row['catalog'])))
+
+        d = self.connection.execute(
+            _cql_get_token.format(cf=self.token_table),
+            {'tenantId': tenant_id}, ConsistencyLevel.ONE)
+        return d.addCallback(_to_entry)
+
+    def set_token(self, tenant_id, created, data, ttl):
+        """
+        see :meth:`otter.auth.ITokenCache.set_token`
+        """
+        token, catalog = data
+        d = self.connection.execute(
+            _cql_set_token.format(cf=self.token_table),
+            {'tenantId': tenant_id,
+             'created': datetime.utcfromtimestamp(created),
+             'token': token, 'catalog': json.dumps(catalog),
+             'ttl': int(ttl)},
+            ConsistencyLevel.ONE)
+        return d.addCallback(lambda _: None)
+
+    def delete_token(self, tenant_id):
+        """
+        see :meth:`otter.auth.ITokenCache.delete_token`
+        """
+        d = self.connection.execute(
+            _cql_delete_token.format(cf=self.token_table),
+            {'tenantId': tenant_id}, ConsistencyLevel.ONE)
+        return d.addCallback(lambda _: None)
+
+    def claim_refresh(self, tenant_id, ttl):
+        """
+        see :meth:`otter.auth.ITokenCache.claim_refresh`
+        """
+        d = self.connection.execute(
+            _cql_claim_token_refresh.format(cf=self.claims_table),
+            {'tenantId': tenant_id,
+             'claimed': datetime.utcfromtimestamp(self.clock.seconds()),
+             'ttl': int(ttl)},
+            DEFAULT_CONSISTENCY)
+        return d.addCallback(lambda rows: rows[0]['[applied]'])
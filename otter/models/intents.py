@@ -17,12 +17,22 @@ from otter.util.fp import assoc_obj
 
 @attr.s
 class GetAllGroups(object):
-    pass
+    """
+    Get all the valid scaling groups grouped by tenant, scanning
+    ``parallel`` token ranges concurrently. See
+    :meth:`otter.models.cass.CassScalingGroupCollection.get_all_groups` for
+    ``max_tenants`` and ``always_tenants``.
+    """
+    parallel = attr.ib(default=1)
+    max_tenants = attr.ib(default=None)
+    always_tenants = attr.ib(default=())
 
 
 @deferred_performer
 def perform_get_all_groups(store, dispatcher, intent):
-    return store.get_all_groups()
+    return store.get_all_groups(parallel=intent.parallel,
+                                max_tenants=intent.max_tenants,
+                                always_tenants=intent.always_tenants)
 
 
 @attributes(['tenant_id', 'group_id'])
@@ -1,6 +1,7 @@
 """
 Interface to be used by the scaling groups engine
 """
+from copy import deepcopy
 from datetime import datetime
 
 from croniter import croniter
@@ -79,6 +80,18 @@ class GroupState(object):
         """
         return other.__class__ != self.__class__ or not self.__eq__(other)
 
+    def __deepcopy__(self, memo):
+        """
+        Copy the servers and policy executions, keeping the same status
+        constant and ``now`` callable
+        """
+        return GroupState(
+            self.tenant_id, self.group_id, self.group_name,
+            deepcopy(self.active, memo), deepcopy(self.pending, memo),
+            self.group_touched, deepcopy(self.policy_touched, memo),
+            self.paused, self.status, self.error_reasons, self.desired,
+            self.now)
+
     def __repr__(self):
         """
         Prints out a representation of self
@@ -416,7 +429,9 @@ class IScalingGroup(Interface):
         takes a callable which produces a state, and then saves it if the
         callable successfully returns it, overwriting the entire previous state.
         This method should handle its own locking, if necessary.  If the
-        callback is unsuccessful, does not save.
+        callback is unsuccessful, does not save.  Implementations that do
+        not lock may call the callable again with the new state if the state
+        was changed concurrently.
 
         :param modifier_callable: a ``callable`` that takes as first two
             arguments the :class:`IScalingGroup`, a :class:`GroupState`, and
@@ -660,7 +675,9 @@ class IScalingGroupServersCache(Interface):
             active from autoscale's perpective. This field will be popped
             before storing the blob
         :param bool clear_others: Should any other cache from a different
-            update_time be deleted?
+            update_time be deleted? Either way, :meth:`get_servers` only
+            returns the servers of the latest update; implementations that
+            do not keep older caches ignore it.
 
         :return: Effect of None
         """
@@ -686,6 +703,28 @@ class IScalingScheduleCollection(Interface):
         :rtype: deferred :class:`list` of :class:`dict`
         """
 
+    def get_events(bucket, until, size=100):
+        """
+        Fetch a batch of scheduled events in a bucket without deleting them.
+
+        :param int bucket: Index of bucket from which to fetch events.
+        :param datetime until: Latest trigger time of the fetched events.
+        :param int size: The maximum number of events to fetch.
+        :return: Deferred that fires with a sequence of events ordered by
+            trigger time.
+        :rtype: deferred :class:`list` of :class:`dict`
+        """
+
+    def get_bucket_changes(buckets):
+        """
+        Get the markers of the last change of the given buckets. A bucket's
+        marker is replaced every time an event is written to it.
+
+        :param buckets: Indexes of the buckets
+        :return: Deferred that fires with a ``dict`` mapping bucket index to
+            its marker. Buckets that have never been changed are not in it.
+        """
+
     def add_cron_events(cron_events):
         """
         Add cron events equally distributed among the buckets.
@@ -15,7 +15,7 @@ from otter.util.config import config_value
 from otter.util.hashkey import generate_transaction_id
 from otter.util.deferredutils import unwrap_first_error
 
-from otter.json_schema import validate
+from otter.json_schema import validator
 
 
 def fails_with(mapping):
@@ -172,17 +172,20 @@ class InvalidJsonError(Exception):
 def validate_body(schema):
     """
     Decorator that validates dependent on the schema passed in.
-    See http://json-schema.org/ for schema documentation.
+    See http://json-schema.org/ for schema documentation. The schema's
+    validator is built once, when the decorator is created.
 
     :return: decorator
     """
+    validate = validator(schema).validate
+
     def decorator(f):
         @wraps(f)
         def _(self, request, *args, **kwargs):
             try:
                 request.content.seek(0)
                 data = json.loads(request.content.read())
-                validate(data, schema)
+                validate(data)
             except ValueError as e:
                 return defer.fail(InvalidJsonError())
             except ValidationError, e:
@@ -205,11 +205,9 @@ class OtterGroups(object):
         def fetch_active_caches(group_states):
             if not tenant_is_enabled(self.tenant_id, config_value):
                 return group_states, [None] * len(group_states)
-            d = gatherResults(
-                [get_active_cache(
-                    self.store.reactor, self.store.connection, self.tenant_id,
-                    state.group_id)
-                 for state in group_states])
+            d = get_active_caches(
+                self.store.reactor, self.store.connection, self.tenant_id,
+                [state.group_id for state in group_states])
             return d.addCallback(lambda cache: (group_states, cache))
 
         deferred = self.store.list_scaling_group_states(
@@ -470,6 +468,23 @@ def get_active_cache(reactor, connection, tenant_id, group_id):
     return d.addCallback(lambda (servers, _): {s['id']: s for s in servers})
 
 
+def get_active_caches(reactor, connection, tenant_id, group_ids):
+    """
+    Get active servers of many groups from servers cache table using a single
+    dispatcher
+
+    :return: Deferred of list of active servers dict of each group in
+        ``group_ids`` in same order
+    """
+    eff = CassScalingGroupServersCache.get_servers_of_groups(
+        tenant_id, group_ids, True)
+    disp = get_working_cql_dispatcher(reactor, connection)
+    d = perform(disp, eff)
+    return d.addCallback(
+        lambda caches: [{s['id']: s for s in caches[group_id][0]}
+                        for group_id in group_ids])
+
+
 class OtterGroup(object):
     """
     REST endpoints for managing a specific scaling group.
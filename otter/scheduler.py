@@ -6,9 +6,11 @@ in the first place.
 
 from datetime import datetime
 from functools import partial
+from heapq import heapify, heappop, heappush
 
 from twisted.application.service import MultiService
-from twisted.internet import defer
+from twisted.internet import defer, reactor
+from twisted.python.failure import Failure
 
 from otter.controller import (
     CannotExecutePolicyError, maybe_execute_scaling_policy, modify_and_trigger)
@@ -18,6 +20,7 @@ from otter.models.interface import (
     NoSuchPolicyError, NoSuchScalingGroupError, next_cron_occurrence)
 from otter.util.deferredutils import ignore_and_log
 from otter.util.hashkey import generate_transaction_id
+from otter.util.timestamp import datetime_to_epoch
 
 
 class SchedulerService(MultiService):
@@ -26,7 +29,8 @@ class SchedulerService(MultiService):
     """
 
     def __init__(self, dispatcher, batchsize, store, partitioner_factory,
-                 threshold=60):
+                 threshold=60, preload_window=None, clock=None,
+                 max_in_flight=None):
         """
         Initialize the scheduler service
 
@@ -35,16 +39,41 @@ class SchedulerService(MultiService):
         :param store: cassandra store
         :param partitioner_factory: Callable of (log, callback) ->
             :obj:`Partitioner`
+        :param preload_window: If given, number of seconds of upcoming events
+            to keep in memory for the owned buckets. Buckets are then checked
+            when their events trigger instead of on every partitioner tick,
+            and their events are read again only when the window runs out or
+            the bucket has changed. See :class:`EventTimer`.
+        :param clock: :obj:`IReactorTime` provider used by the event timer.
+            Defaults to the global reactor.
+        :param max_in_flight: Maximum number of events of a bucket processed
+            at a time. See :func:`check_events_in_bucket`.
         """
         MultiService.__init__(self)
         self.store = store
         self.threshold = threshold
         self.log = otter_log.bind(system='otter.scheduler')
-        self.partitioner = partitioner_factory(
-            self.log, partial(self._check_events, batchsize))
+        self.max_in_flight = max_in_flight
+        if preload_window is None:
+            self.timer = None
+            callback = partial(self._check_events, batchsize)
+        else:
+            self.timer = EventTimer(
+                clock or reactor, store, preload_window, batchsize,
+                partial(self._check_bucket, batchsize), self.log)
+            callback = self.timer.set_buckets
+        self.partitioner = partitioner_factory(self.log, callback)
         self.partitioner.setServiceParent(self)
         self.dispatcher = dispatcher
 
+    def stopService(self):
+        """
+        Stop the service and forget about any preloaded events
+        """
+        if self.timer is not None:
+            self.timer.stop()
+        return MultiService.stopService(self)
+
     def reset(self, path):
         """
         Reset the scheduler with a new path.
@@ -98,14 +127,212 @@ class SchedulerService(MultiService):
 
         return defer.gatherResults(
             [check_events_in_bucket(
-                log, self.dispatcher, self.store, bucket, utcnow, batchsize)
+                log, self.dispatcher, self.store, bucket, utcnow, batchsize,
+                self.max_in_flight)
              for bucket in buckets])
 
+    def _check_bucket(self, batchsize, bucket, now):
+        """
+        Check for events in a single bucket occurring at `now` and earlier
+        """
+        log = self.log.bind(scheduler_run_id=generate_transaction_id(),
+                            utcnow=now)
+        return check_events_in_bucket(
+            log, self.dispatcher, self.store, bucket, now, batchsize,
+            self.max_in_flight)
+
 
-def check_events_in_bucket(log, dispatcher, store, bucket, now, batchsize):
+class EventTimer(object):
+    """
+    Checks scheduler buckets at the trigger times of their events.
+
+    For every owned bucket, events triggering within the next ``window``
+    seconds are read ahead of time and their trigger times kept in a heap.
+    A bucket is checked as soon as one of its events is due rather than on
+    every partitioner tick. The events themselves are still claimed with
+    :meth:`IScalingScheduleCollection.fetch_and_delete` by the check, so the
+    heap only decides *when* a bucket is checked.
+
+    On every partitioner tick, the change markers of all the owned buckets
+    are got in a single read, and the events of a bucket are read again
+    only if it has changed since they were read or its window has passed.
+    Hence an event added by any node is found on the next tick, and the
+    window can be much longer than the partitioner interval.
+    """
+
+    def __init__(self, clock, store, window, batchsize, check_bucket, log):
+        """
+        :param clock: :obj:`IReactorTime` provider
+        :param store: :obj:`IScalingScheduleCollection` provider
+        :param window: Number of seconds of events to read ahead
+        :param int batchsize: Maximum number of events read at a time
+        :param check_bucket: Callable of (bucket, now) -> Deferred that
+            processes all the events of the bucket triggering until `now`
+        :param log: A bound log for logging
+        """
+        self.clock = clock
+        self.store = store
+        self.window = window
+        self.batchsize = batchsize
+        self.check_bucket = check_bucket
+        self.log = log
+        self._heap = []
+        self._loaded = {}
+        self._changes = {}
+        self._loading = {}
+        self._checking = set()
+        self._recheck = set()
+        self._delayed = None
+
+    def set_buckets(self, buckets):
+        """
+        Take ownership of given buckets, reading the windows of the ones that
+        are new, have changed or whose window has passed. This is the
+        partitioner callback.
+
+        :return: Deferred that fires with None when the windows are read
+        """
+        for bucket in set(self._loaded) - set(buckets):
+            del self._loaded[bucket]
+            self._changes.pop(bucket, None)
+        self._heap = [(t, b) for t, b in self._heap if b in buckets]
+        heapify(self._heap)
+        for bucket in buckets:
+            self._loaded.setdefault(bucket, None)
+
+        def got_changes(changes):
+            # All buckets are read if their changes could not be got
+            now = self.clock.seconds()
+            return defer.gatherResults(
+                [self._load(bucket, now, (changes or {}).get(bucket))
+                 for bucket in buckets
+                 if (changes is None or self._window_passed(bucket, now) or
+                     changes.get(bucket) != self._changes.get(bucket))])
+
+        def changes_failed(f):
+            self.log.err(f, 'scheduler-get-bucket-changes-error')
+
+        d = self.store.get_bucket_changes(buckets)
+        d.addErrback(changes_failed)
+        d.addCallback(got_changes)
+        return d.addCallback(lambda _: self._schedule())
+
+    def stop(self):
+        """
+        Forget all buckets and stop checking them
+        """
+        self._loaded.clear()
+        self._changes.clear()
+        del self._heap[:]
+        self._schedule()
+
+    def _window_passed(self, bucket, now):
+        loaded_until = self._loaded.get(bucket, 0)
+        return loaded_until is None or loaded_until <= now
+
+    def _load(self, bucket, now, change=None):
+        """
+        Read events of bucket triggering until the end of its next window,
+        replacing its events in the heap
+
+        :param change: Change marker of the bucket got before reading
+        """
+        if bucket in self._loading:
+            return self._loading[bucket]
+        until = now + self.window
+
+        def loaded(events):
+            if bucket not in self._loaded:
+                # not owned anymore
+                return
+            triggers = [datetime_to_epoch(event['trigger'])
+                        for event in events]
+            # Events are ordered by trigger. If the window did not fit in
+            # a batch, the rest will be read after these have triggered
+            self._loaded[bucket] = (
+                triggers[-1] if len(events) == self.batchsize else until)
+            self._changes[bucket] = change
+            self._heap = [(t, b) for t, b in self._heap if b != bucket]
+            heapify(self._heap)
+            for trigger in set(triggers):
+                heappush(self._heap, (trigger, bucket))
+
+        def done(_):
+            del self._loading[bucket]
+
+        d = self.store.get_events(
+            bucket, datetime.utcfromtimestamp(until), self.batchsize)
+        self._loading[bucket] = d
+        d.addCallback(loaded)
+        d.addErrback(self.log.err, 'scheduler-load-events-error',
+                     bucket=bucket)
+        return d.addCallback(done)
+
+    def _schedule(self):
+        """
+        Arrange for :meth:`_fire` to be called when the earliest event is due
+        """
+        if self._delayed is not None and self._delayed.active():
+            self._delayed.cancel()
+        self._delayed = None
+        if self._heap:
+            delay = max(self._heap[0][0] - self.clock.seconds(), 0)
+            self._delayed = self.clock.callLater(delay, self._fire)
+
+    def _fire(self):
+        """
+        Check the buckets that have events due
+        """
+        self._delayed = None
+        now = self.clock.seconds()
+        due = set()
+        while self._heap and self._heap[0][0] <= now:
+            due.add(heappop(self._heap)[1])
+        for bucket in due:
+            self._check(bucket)
+        self._schedule()
+
+    def _check(self, bucket):
+        """
+        Check bucket now or right after its ongoing check finishes
+        """
+        if bucket in self._checking:
+            self._recheck.add(bucket)
+            return
+        self._checking.add(bucket)
+        d = defer.maybeDeferred(
+            self.check_bucket, bucket,
+            datetime.utcfromtimestamp(self.clock.seconds()))
+        d.addErrback(self.log.err, 'scheduler-check-bucket-error',
+                     bucket=bucket)
+        d.addCallback(self._checked, bucket)
+
+    def _checked(self, _, bucket):
+        """
+        Called after bucket is checked. Check again if it was due meanwhile
+        and read its next window if the current one has passed
+        """
+        self._checking.discard(bucket)
+        if bucket not in self._loaded:
+            self._recheck.discard(bucket)
+            return
+        if bucket in self._recheck:
+            self._recheck.discard(bucket)
+            self._check(bucket)
+            return
+        now = self.clock.seconds()
+        if self._window_passed(bucket, now):
+            self._load(bucket, now, self._changes.get(bucket)).addCallback(
+                lambda _: self._schedule())
+
+
+def check_events_in_bucket(log, dispatcher, store, bucket, now, batchsize,
+                           max_in_flight=None):
     """
     Retrieves events in the given bucket that occur before or at now,
-    in batches of batchsize, for processing
+    in batches of batchsize, for processing. Next batch is fetched while
+    earlier batches are still being processed as long as at most
+    max_in_flight events are processed at a time.
 
     :param log: A bound log for logging
     :param dispatcher: Effect dispatcher
@@ -113,24 +340,83 @@ def check_events_in_bucket(log, dispatcher, store, bucket, now, batchsize):
     :param bucket: Bucket to check events in
     :param now: Time before which events are checked
     :param batchsize: Number of events to check at a time
+    :param max_in_flight: Maximum number of events processed at a time.
+        Defaults to batchsize, i.e. a batch is fetched only after the previous
+        one is processed
 
     :return: a deferred that fires with None
     """
 
-    log = log.bind(bucket=bucket)
+    checker = _BucketCheck(log.bind(bucket=bucket), dispatcher, store, bucket,
+                           now, batchsize,
+                           max(max_in_flight or batchsize, batchsize))
+    return checker.start()
 
-    def check_for_more(num_events):
-        if num_events == batchsize:
-            return _do_check()
 
-    def _do_check():
-        d = store.fetch_and_delete(bucket, now, batchsize)
-        d.addCallback(process_events, dispatcher, store, log)
-        d.addCallback(check_for_more)
-        d.addErrback(log.err)
-        return d
+class _BucketCheck(object):
+    """
+    State of a single :func:`check_events_in_bucket` run
+    """
 
-    return _do_check()
+    def __init__(self, log, dispatcher, store, bucket, now, batchsize,
+                 max_in_flight):
+        self.log = log
+        self.dispatcher = dispatcher
+        self.store = store
+        self.bucket = bucket
+        self.now = now
+        self.batchsize = batchsize
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.fetching = False
+        self.more = True
+        self.finished = defer.Deferred()
+
+    def start(self):
+        """
+        Start checking and return Deferred that fires with None when done
+        """
+        self._next_step()
+        return self.finished
+
+    def _next_step(self):
+        if self.fetching:
+            return
+        if self.more and self.in_flight + self.batchsize <= self.max_in_flight:
+            self._fetch()
+        elif self.in_flight == 0 and not self.finished.called:
+            self.finished.callback(None)
+
+    def _fetch(self):
+        self.fetching = True
+        d = self.store.fetch_and_delete(self.bucket, self.now, self.batchsize)
+        d.addCallback(self._fetched)
+        d.addErrback(self._fetch_failed)
+
+    def _fetched(self, events):
+        self.fetching = False
+        self.more = len(events) == self.batchsize
+        if events:
+            self.log.msg('sch-lag', scheduler_lag=(
+                self.now - events[0]['trigger']).total_seconds())
+        self.in_flight += len(events)
+        d = defer.maybeDeferred(process_events, events, self.dispatcher,
+                                self.store, self.log)
+        d.addBoth(self._processed, len(events))
+        self._next_step()
+
+    def _fetch_failed(self, f):
+        self.log.err(f)
+        self.fetching = False
+        self.more = False
+        self._next_step()
+
+    def _processed(self, result, num_events):
+        self.in_flight -= num_events
+        if isinstance(result, Failure):
+            self.log.err(result)
+            self.more = False
+        self._next_step()
 
 
 def process_events(events, dispatcher, store, log):
@@ -6,6 +6,8 @@ import os
 from copy import deepcopy
 from functools import partial
 
+from effect import ComposedDispatcher
+
 import jsonfig
 
 from kazoo.client import KazooClient
@@ -13,6 +15,7 @@ from kazoo.client import KazooClient
 from silverberg.cluster import RoundRobinCassandraCluster
 from silverberg.logger import LoggingCQLClient
 
+from twisted.application.internet import TimerService
 from twisted.application.service import MultiService, Service
 from twisted.application.strports import service
 from twisted.internet import reactor
@@ -33,12 +36,17 @@ from otter.constants import (
     CONVERGENCE_DIRTY_DIR,
     CONVERGENCE_PARTITIONER_PATH,
     get_service_configs)
-from otter.convergence.service import Converger
-from otter.effect_dispatcher import get_full_dispatcher
+from otter.convergence.gathering import (
+    TenantDataCache, get_tenant_data_dispatcher)
+from otter.convergence.service import (
+    ConvergenceQueue, Converger, get_convergence_queue_dispatcher)
+from otter.effect_dispatcher import get_full_dispatcher, get_legacy_dispatcher
 from otter.log import log
-from otter.log.cloudfeeds import CloudFeedsObserver
+from otter.log.cloudfeeds import CloudFeedsObserver, CloudFeedsPublisher
 from otter.log.formatters import add_to_fanout
-from otter.models.cass import CassAdmin, CassScalingGroupCollection
+from otter.models.cass import (
+    CassAdmin, CassScalingGroupCollection, CassTokenCache,
+    TenantResourceCounts)
 from otter.rest.admin import OtterAdmin
 from otter.rest.application import Otter
 from otter.rest.bobby import set_bobby
@@ -47,6 +55,7 @@ from otter.supervisor import SupervisorService, set_supervisor
 from otter.util.config import config_value, set_config_data
 from otter.util.cqlbatch import TimingOutCQLClient
 from otter.util.deferredutils import timeout_deferred
+from otter.util.ratelimit import rate_limiters
 from otter.util.zkpartitioner import Partitioner
 
 assert os.environ.get("PYRSISTENT_NO_C_EXTENSION"), (
@@ -201,8 +210,18 @@ def makeService(config):
             config_value('cassandra.timeout') or 30),
         log.bind(system='otter.silverberg'))
 
+    counts = None
+    counters_conf = config_value('limits.counters')
+    if counters_conf is not None:
+        counts = TenantResourceCounts(cassandra_cluster, reactor)
+        TimerService(
+            counters_conf.get('reconcile_interval', 300),
+            counts.reconcile_touched,
+            log.bind(system='otter.counts')).setServiceParent(parent)
+
     store = CassScalingGroupCollection(
-        cassandra_cluster, reactor, config_value('limits.absolute.maxGroups'))
+        cassandra_cluster, reactor, config_value('limits.absolute.maxGroups'),
+        counts, bool(config_value('cassandra.optimistic_state')))
     admin_store = CassAdmin(cassandra_cluster)
 
     bobby_url = config_value('bobby_url')
@@ -211,7 +230,11 @@ def makeService(config):
 
     service_configs = get_service_configs(config)
 
-    authenticator = generate_authenticator(reactor, config['identity'])
+    token_cache = None
+    if config_value('identity.shared_cache'):
+        token_cache = CassTokenCache(cassandra_cluster, reactor)
+    authenticator = generate_authenticator(reactor, config['identity'],
+                                           token_cache)
     supervisor = SupervisorService(authenticator, region, coiterate,
                                    service_configs)
     supervisor.setServiceParent(parent)
@@ -221,7 +244,9 @@ def makeService(config):
     health_checker = HealthChecker(reactor, {
         'store': getattr(store, 'health_check', None),
         'kazoo': store.kazoo_health_check,
-        'supervisor': supervisor.health_check
+        'supervisor': supervisor.health_check,
+        'rate_limiters': rate_limiters.health_check,
+        'group_cache': store.group_cache.health_check
     })
 
     # Setup cassandra cluster to disconnect when otter shuts down
@@ -250,12 +275,24 @@ def makeService(config):
     if cf_conf is not None:
         id_conf = deepcopy(config['identity'])
         id_conf['strategy'] = 'single_tenant'
+        cf_authenticator = generate_authenticator(reactor, id_conf)
+        publisher = CloudFeedsPublisher(
+            get_legacy_dispatcher(
+                reactor, cf_authenticator,
+                log.bind(system='otter.cloud_feed'), service_configs),
+            reactor,
+            max_size=cf_conf.get('queue_size', 10000),
+            concurrency=cf_conf.get('concurrency', 10),
+            stop_timeout=cf_conf.get('stop_timeout', 30))
+        publisher.setServiceParent(parent)
+        health_checker.checks['cloudfeeds'] = publisher.health_check
         add_to_fanout(CloudFeedsObserver(
             reactor=reactor,
-            authenticator=generate_authenticator(reactor, id_conf),
+            authenticator=cf_authenticator,
             tenant_id=cf_conf['tenant_id'],
             region=region,
-            service_configs=service_configs))
+            service_configs=service_configs,
+            publisher=publisher))
 
     # Setup Kazoo client
     if config_value('zookeeper'):
@@ -289,6 +326,8 @@ def makeService(config):
             # not finished and the kz_client is not set in which case
             # policy execution and group delete will fail
             store.kz_client = kz_client
+            if counts is not None:
+                counts.kz_client = kz_client
             # Setup kazoo to stop when shutting down
             parent.addService(FunctionalService(
                 stop=partial(call_after_supervisor,
@@ -298,7 +337,9 @@ def makeService(config):
                 parent, kz_client, dispatcher,
                 config_value('converger.interval') or 10,
                 config_value('converger.build_timeout') or 3600,
-                config_value('converger.limited_retry_iterations') or 10)
+                config_value('converger.limited_retry_iterations') or 10,
+                config_value('converger.max_concurrency'),
+                config_value('converger.tenant_max_concurrency'))
 
         d.addCallback(on_client_ready)
         d.addErrback(log.err, 'Could not start TxKazooClient')
@@ -307,10 +348,18 @@ def makeService(config):
 
 
 def setup_converger(parent, kz_client, dispatcher, interval, build_timeout,
-                    limited_retry_iterations):
+                    limited_retry_iterations, max_concurrency=None,
+                    tenant_max_concurrency=None):
     """
     Create a Converger service, which has a Partitioner as a child service, so
     that if the Converger is stopped, the partitioner is also stopped.
+
+    Tenant-wide data gathered during convergence is shared between groups of
+    the same tenant for at most the per-group convergence interval.
+
+    Groups are converged in the order of their priority, with at most
+    ``max_concurrency`` convergences running at a time and at most
+    ``tenant_max_concurrency`` of them for the same tenant.
     """
     partitioner_factory = partial(
         Partitioner,
@@ -319,10 +368,17 @@ def setup_converger(parent, kz_client, dispatcher, interval, build_timeout,
         partitioner_path=CONVERGENCE_PARTITIONER_PATH,
         time_boundary=15,  # time boundary
     )
+    cache = TenantDataCache(reactor, interval / 2)
+    queue = ConvergenceQueue(max_concurrency, tenant_max_concurrency)
+    dispatcher = ComposedDispatcher(
+        [get_tenant_data_dispatcher(cache),
+         get_convergence_queue_dispatcher(queue),
+         dispatcher])
     cvg = Converger(log, dispatcher, 10, partitioner_factory, build_timeout,
                     interval / 2,
                     limited_retry_iterations)
     cvg.setServiceParent(parent)
+    kz_client.add_listener(cvg.connection_state_changed)
     watch_children(kz_client, CONVERGENCE_DIRTY_DIR, cvg.divergent_changed)
 
 
@@ -344,6 +400,8 @@ def setup_scheduler(parent, dispatcher, store, kz_client):
         buckets, time_boundary)
     scheduler_service = SchedulerService(
         dispatcher, int(config_value('scheduler.batchsize')),
-        store, partitioner_factory)
+        store, partitioner_factory,
+        preload_window=config_value('scheduler.preload_window'),
+        max_in_flight=config_value('scheduler.max_in_flight'))
     scheduler_service.setServiceParent(parent)
     return scheduler_service
@@ -1,15 +1,19 @@
 """Tests for convergence gathering."""
 
+import json
 from copy import deepcopy
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import partial
 
 from effect import (
     ComposedDispatcher,
     Constant,
     Effect,
+    Func,
     ParallelEffects,
     TypeDispatcher,
+    base_dispatcher,
+    parallel,
     sync_perform)
 
 from effect.async import perform_parallel_async
@@ -23,6 +27,8 @@ from pyrsistent import freeze
 from toolz.curried import map
 from toolz.functoolz import compose
 
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter.auth import NoSuchEndpoint
@@ -32,6 +38,8 @@ from otter.cloud_client import (
 )
 from otter.constants import ServiceType
 from otter.convergence.gathering import (
+    GetTenantData,
+    TenantDataCache,
     extract_CLB_drained_at,
     get_all_launch_server_data,
     get_all_scaling_group_servers,
@@ -39,7 +47,10 @@ from otter.convergence.gathering import (
     get_clb_contents,
     get_rcv3_contents,
     get_scaling_group_servers,
-    mark_deleted_servers)
+    get_tenant_data_dispatcher,
+    mark_deleted_servers,
+    needs_full_sync,
+    resync_offset)
 from otter.convergence.model import (
     CLBDescription,
     CLBNode,
@@ -54,8 +65,8 @@ from otter.test.utils import (
     StubResponse,
     intent_func,
     nested_sequence,
+    noop,
     patch,
-    resolve_stubs,
     server
 )
 from otter.util.fp import assoc_obj
@@ -230,11 +241,11 @@ class GetScalingGroupServersTests(SynchronousTestCase):
         self.now = datetime(2010, 5, 31)
         self.freeze = compose(set, map(freeze))
 
-    def _invoke(self):
+    def _invoke(self, **kwargs):
         return get_scaling_group_servers(
             'tid', 'gid', self.now, cache_class=EffectServersCache,
             all_as_servers=intent_func("all-as"),
-            all_servers=intent_func("alls"))
+            all_servers=intent_func("alls"), **kwargs)
 
     def _test_no_cache(self, empty):
         current = [] if empty else [{'id': 'a', 'a': 'b'},
@@ -253,8 +264,9 @@ class GetScalingGroupServersTests(SynchronousTestCase):
 
     def test_from_cache(self):
         """
-        If cache is there then servers returned are updated with servers
-        not found in current list marked as deleted
+        If cache is there and it was last updated in an earlier resync window,
+        all servers are fetched and servers in cache not found in current
+        list are marked as deleted
         """
         asmetakey = "rax:autoscale:group:id"
         cache = [
@@ -270,13 +282,120 @@ class GetScalingGroupServersTests(SynchronousTestCase):
         last_update = datetime(2010, 5, 20)
         sequence = [
             (("cachegstidgid", False), lambda i: (cache, last_update)),
-            (("alls",), lambda i: current)]
+            (("alls", None, 100), lambda i: current),
+            (Log('gather-servers',
+                 dict(sync='full', servers=4, pages=1,
+                      bytes=4 * len(json.dumps(current[0])))), noop)]
         del_cache_server = deepcopy(cache[1])
         del_cache_server["status"] = "DELETED"
         self.assertEqual(
             self.freeze(perform_sequence(sequence, self._invoke())),
             self.freeze([del_cache_server, cache[-1]] + current[0:2]))
 
+    def test_changes_since_cache(self):
+        """
+        If cache was last updated in current resync window, only servers
+        changed since a little before the cache was updated are fetched and
+        merged with the cached servers.
+        """
+        asmetakey = "rax:autoscale:group:id"
+        cache = [
+            {'id': 'a', 'metadata': {asmetakey: "gid"}},  # gets updated
+            {'id': 'b', 'metadata': {asmetakey: "gid"}},  # deleted
+            {'id': 'd', 'metadata': {asmetakey: "gid"}},  # meta removed
+            {'id': 'c', 'metadata': {asmetakey: "gid"}}]  # same
+        changed = [
+            {'id': 'a', 'b': 'c', 'metadata': {asmetakey: "gid"}},
+            {'id': 'b', 'status': 'DELETED',
+             'metadata': {asmetakey: "gid"}},
+            {'id': 'z', 'z': 'w', 'metadata': {asmetakey: "gid"}},  # new
+            {'id': 'd', 'metadata': {"changed": "yes"}},
+            {'id': 'y', 'metadata': {asmetakey: "other"}}]  # other group
+        last_update = datetime(2010, 5, 31, 0, 59, 30)
+        self.now = datetime(2010, 5, 31, 1, 1)
+        sequence = [
+            (("cachegstidgid", False), lambda i: (cache, last_update)),
+            (("alls", datetime(2010, 5, 31, 0, 58, 30), 100),
+             lambda i: changed),
+            (Log('gather-servers',
+                 dict(sync='delta', servers=5, pages=1,
+                      bytes=5 * len(json.dumps(changed[0])), pages_saved=0,
+                      bytes_saved=0)), noop)]
+        self.assertEqual(
+            self.freeze(perform_sequence(
+                sequence, self._invoke(resync_interval=86400))),
+            self.freeze(changed[:3] + [cache[-1]]))
+
+    def test_changes_since_bytes_saved(self):
+        """
+        Pages and bytes saved by fetching only changed servers is logged as
+        the difference from fetching the cached servers, with bytes estimated
+        from the size of the first server.
+        """
+        cache = [{'id': str(i)} for i in range(250)]
+        last_update = datetime(2010, 5, 31, 0, 59, 30)
+        self.now = datetime(2010, 5, 31, 1, 1)
+        sequence = [
+            (("cachegstidgid", False), lambda i: (cache, last_update)),
+            (("alls", datetime(2010, 5, 31, 0, 58, 30), 100),
+             lambda i: []),
+            (Log('gather-servers',
+                 dict(sync='delta', servers=0, pages=1, bytes=0,
+                      pages_saved=2,
+                      bytes_saved=250 * len(json.dumps(cache[0])))), noop)]
+        perform_sequence(sequence, self._invoke(resync_interval=86400))
+
+    def test_needs_full_sync(self):
+        """
+        :func:`needs_full_sync` returns True only if the cache was last
+        updated in an earlier resync window.
+        """
+        self.assertFalse(needs_full_sync(
+            datetime(2010, 5, 31, 1, 0), datetime(2010, 5, 31, 1, 59), 3600))
+        self.assertTrue(needs_full_sync(
+            datetime(2010, 5, 31, 1, 59), datetime(2010, 5, 31, 2, 1), 3600))
+        self.assertTrue(needs_full_sync(
+            datetime(2010, 5, 30, 1, 30), datetime(2010, 5, 31, 1, 30), 3600))
+
+    def test_needs_full_sync_offset(self):
+        """
+        :func:`needs_full_sync` shifts the resync windows by the offset
+        """
+        self.assertTrue(needs_full_sync(
+            datetime(2010, 5, 31, 1, 0), datetime(2010, 5, 31, 1, 59), 3600,
+            600))
+        self.assertFalse(needs_full_sync(
+            datetime(2010, 5, 31, 1, 59), datetime(2010, 5, 31, 2, 1), 3600,
+            600))
+
+    def test_resync_offset(self):
+        """
+        :func:`resync_offset` is the same for a group every time, within the
+        interval, and differs between groups
+        """
+        offsets = [resync_offset('group{}'.format(i), 3600)
+                   for i in range(100)]
+        self.assertEqual(offsets, [resync_offset('group{}'.format(i), 3600)
+                                   for i in range(100)])
+        self.assertTrue(all(0 <= o < 3600 for o in offsets))
+        self.assertGreater(len(set(offsets)), 90)
+
+    def test_full_sync_in_group_window(self):
+        """
+        The full listing is done when the group's own window starts, not at
+        the wall-clock interval boundary
+        """
+        offset = resync_offset('gid', 3600)
+        window = datetime(2010, 5, 31, 1) + timedelta(seconds=offset)
+        last_update = window - timedelta(seconds=30)
+        self.now = window + timedelta(seconds=30)
+        sequence = [
+            (("cachegstidgid", False), lambda i: ([], last_update)),
+            (("alls", None, 100), lambda i: []),
+            (Log('gather-servers',
+                 dict(sync='full', servers=0, pages=1, bytes=0)), noop)]
+        self.assertEqual(perform_sequence(sequence, self._invoke()), [])
+
     def test_mark_deleted_servers_precedence(self):
         """
         In :func:`mark_deleted_servers`, if old list has common servers with
@@ -628,7 +747,7 @@ class GetRCv3ContentsTests(SynchronousTestCase):
 
 
 def _constant_as_eff(args, retval):
-    return lambda *a: Effect(Stub(Constant(retval))) if a == args else (1 / 0)
+    return lambda *a: Effect(Constant(retval)) if a == args else (1 / 0)
 
 
 class GetAllLaunchServerDataTests(SynchronousTestCase):
@@ -655,6 +774,11 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
              'links': [{'href': 'link2', 'rel': 'self'}]}
         ]
         self.now = datetime(2010, 10, 20, 03, 30, 00)
+        self.clock = Clock()
+        self.dispatcher = ComposedDispatcher([
+            get_tenant_data_dispatcher(TenantDataCache(self.clock, 10)),
+            TypeDispatcher({ParallelEffects: perform_parallel_async}),
+            base_dispatcher])
 
     def test_success(self):
         """
@@ -683,7 +807,7 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
                    links=freeze([{'href': 'link2', 'rel': 'self'}]),
                    json=freeze(self.servers[1]))
         ]
-        self.assertEqual(resolve_stubs(eff),
+        self.assertEqual(sync_perform(self.dispatcher, eff),
                          {'servers': expected_servers,
                           'lb_nodes': clb_nodes + rcv3_nodes})
 
@@ -701,4 +825,148 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
             get_clb_contents=_constant_as_eff((), []),
             get_rcv3_contents=_constant_as_eff((), []))
 
-        self.assertEqual(resolve_stubs(eff), {'servers': [], 'lb_nodes': []})
+        self.assertEqual(sync_perform(self.dispatcher, eff),
+                         {'servers': [], 'lb_nodes': []})
+
+    def test_lb_contents_shared_by_tenant_groups(self):
+        """
+        Load balancer contents are fetched once and shared between groups of
+        the same tenant, but not with groups of other tenants.
+        """
+        calls = []
+
+        def contents(kind):
+            return lambda: Effect(Func(lambda: calls.append(kind) or []))
+
+        def gather(tenant_id, group_id):
+            return get_all_launch_server_data(
+                tenant_id, group_id, self.now,
+                get_scaling_group_servers=lambda *a: Effect(Constant([])),
+                get_clb_contents=contents('clb'),
+                get_rcv3_contents=contents('rcv3'))
+
+        eff = parallel([gather('t1', 'g1'), gather('t1', 'g2'),
+                        gather('t2', 'g3')])
+        self.assertEqual(
+            sync_perform(self.dispatcher, eff),
+            [{'servers': [], 'lb_nodes': []}] * 3)
+        self.assertEqual(sorted(calls), ['clb', 'clb', 'rcv3', 'rcv3'])
+
+
+class TenantDataCacheTests(SynchronousTestCase):
+    """Tests for :obj:`TenantDataCache`."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = TenantDataCache(self.clock, 10)
+        self.fetches = []
+
+    def fetch(self, result):
+        """Return a fetch function that records its calls."""
+        def _fetch():
+            self.fetches.append(result)
+            return result
+        return _fetch
+
+    def test_miss(self):
+        """
+        Data is fetched if not cached, and is keyed by tenant and kind.
+        """
+        self.assertEqual(
+            self.successResultOf(
+                self.cache.get('t1', 'clb', self.fetch(succeed('a')))),
+            'a')
+        self.successResultOf(
+            self.cache.get('t2', 'clb', self.fetch(succeed('b'))))
+        self.successResultOf(
+            self.cache.get('t1', 'rcv3', self.fetch(succeed('c'))))
+        self.assertEqual(len(self.fetches), 3)
+
+    def test_hit(self):
+        """
+        Data fetched less than ``ttl`` seconds ago is returned without
+        fetching it again.
+        """
+        self.successResultOf(
+            self.cache.get('t', 'clb', self.fetch(succeed('a'))))
+        self.clock.advance(9)
+        self.assertEqual(
+            self.successResultOf(
+                self.cache.get('t', 'clb', self.fetch(succeed('b')))),
+            'a')
+        self.assertEqual(len(self.fetches), 1)
+
+    def test_expired(self):
+        """
+        Data fetched ``ttl`` seconds or more ago, measured from when the
+        fetch started, is fetched again.
+        """
+        d = Deferred()
+        self.cache.get('t', 'clb', self.fetch(d))
+        self.clock.advance(4)
+        d.callback('a')
+        self.clock.advance(6)
+        self.assertEqual(
+            self.successResultOf(
+                self.cache.get('t', 'clb', self.fetch(succeed('b')))),
+            'b')
+        self.assertEqual(len(self.fetches), 2)
+
+    def test_expired_evicted(self):
+        """
+        Expired data of other tenants is removed when data is cached.
+        """
+        self.cache.get('t1', 'clb', self.fetch(succeed('a')))
+        self.clock.advance(5)
+        self.cache.get('t2', 'clb', self.fetch(succeed('b')))
+        self.clock.advance(5)
+        self.cache.get('t3', 'clb', self.fetch(succeed('c')))
+        self.assertEqual(list(self.cache._cache),
+                         [('t2', 'clb'), ('t3', 'clb')])
+
+    def test_concurrent_fetch_shared(self):
+        """
+        Requests made while the data is being fetched wait for that fetch
+        instead of starting another one.
+        """
+        d = Deferred()
+        d1 = self.cache.get('t', 'clb', self.fetch(d))
+        d2 = self.cache.get('t', 'clb', self.fetch(succeed('b')))
+        self.assertNoResult(d1)
+        self.assertNoResult(d2)
+        d.callback('a')
+        self.assertEqual(self.successResultOf(d1), 'a')
+        self.assertEqual(self.successResultOf(d2), 'a')
+        self.assertEqual(len(self.fetches), 1)
+
+    def test_failure_not_cached(self):
+        """
+        A failed fetch is propagated to all waiters and is not cached.
+        """
+        d = Deferred()
+        d1 = self.cache.get('t', 'clb', self.fetch(d))
+        d2 = self.cache.get('t', 'clb', self.fetch(succeed('b')))
+        d.errback(ValueError('bad'))
+        self.failureResultOf(d1, ValueError)
+        self.failureResultOf(d2, ValueError)
+        self.assertEqual(
+            self.successResultOf(
+                self.cache.get('t', 'clb', self.fetch(succeed('b')))),
+            'b')
+        self.assertEqual(
+            self.failureResultOf(
+                self.cache.get('u', 'clb', self.fetch(fail(KeyError())))).type,
+            KeyError)
+
+    def test_perform_get_tenant_data(self):
+        """
+        :obj:`GetTenantData` is performed by fetching the wrapped effect with
+        the same dispatcher through the cache.
+        """
+        dispatcher = ComposedDispatcher([
+            get_tenant_data_dispatcher(self.cache), base_dispatcher])
+        eff = Effect(GetTenantData(
+            't', 'clb', Effect(Func(self.fetch('a')))))
+        self.assertEqual(sync_perform(dispatcher, eff), 'a')
+        self.assertEqual(sync_perform(dispatcher, eff), 'a')
+        self.assertEqual(self.fetches, ['a'])
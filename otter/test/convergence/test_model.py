@@ -19,8 +19,11 @@ from otter.convergence.model import (
     IDrainable,
     ILBDescription,
     ILBNode,
+    LBNodeIndex,
     NovaServer,
     RCv3Description,
+    RCv3Node,
+    RawJSON,
     ServerState,
     _private_ipv4_addresses,
     _servicenet_address,
@@ -605,6 +608,59 @@ class NovaServerTests(SynchronousTestCase):
         self.assertEqual(server.state, ServerState.UNKNOWN_TO_OTTER)
         self.assertEqual(server.json['status'], 'ablrduelh')
 
+    def test_json_not_frozen(self):
+        """
+        The JSON of the server is kept as :obj:`RawJSON`, and `json_dict`
+        returns a copy of it that can be modified.
+        """
+        server = NovaServer.from_server_details_json(self.servers[0])
+        self.assertIsInstance(server.json, RawJSON)
+        json_dict = server.json_dict()
+        json_dict['_is_as_active'] = True
+        self.assertEqual(json_dict,
+                         dict(self.servers[0], _is_as_active=True))
+        self.assertNotIn('_is_as_active', self.servers[0])
+
+    def test_json_dict_pmap(self):
+        """
+        `json_dict` thaws the JSON of the server if it is a :obj:`PMap`
+        """
+        server = NovaServer(id='a', state=ServerState.ACTIVE, created=0.0,
+                            image_id='image', flavor_id='flavor',
+                            json=freeze({'id': 'a', 'links': [{'a': 'b'}]}))
+        self.assertEqual(server.json_dict(),
+                         {'id': 'a', 'links': [{'a': 'b'}]})
+
+
+class RawJSONTests(SynchronousTestCase):
+    """
+    Tests for :class:`RawJSON`.
+    """
+    def setUp(self):
+        self.raw = {'id': 'a', 'metadata': {'k': 'v'}, 'links': [{'a': 'b'}]}
+        self.json = RawJSON(self.raw)
+
+    def test_frozen_values(self):
+        """
+        Values are frozen when looked up
+        """
+        self.assertEqual(self.json['metadata'], pmap({'k': 'v'}))
+        self.assertEqual(self.json.get('links'), freeze([{'a': 'b'}]))
+        self.assertIsNone(self.json.get('status'))
+        self.assertEqual(sorted(self.json), ['id', 'links', 'metadata'])
+        self.assertEqual(len(self.json), 3)
+
+    def test_equal_to_frozen(self):
+        """
+        It is equal to the frozen JSON and has the same hash
+        """
+        self.assertEqual(self.json, freeze(self.raw))
+        self.assertEqual(freeze(self.raw), self.json)
+        self.assertEqual(hash(self.json), hash(freeze(self.raw)))
+        self.assertEqual(self.json, RawJSON(dict(self.raw)))
+        self.assertNotEqual(self.json, RawJSON({'id': 'b'}))
+        self.assertNotEqual(self.json, freeze({'id': 'b'}))
+
 
 class IPAddressTests(SynchronousTestCase):
     """
@@ -664,3 +720,60 @@ class IPAddressTests(SynchronousTestCase):
         """
         del self.addresses["private"]
         self.assertEqual(_servicenet_address(self.server_dict), "")
+
+
+@implementer(ILBNode)
+@attributes(["node_id", "server_ids"])
+class DummyLBNode(object):
+    """
+    Fake LB node that matches servers with given IDs.
+    """
+    def matches(self, server):
+        """Does the server have one of the IDs?"""
+        return server.id in self.server_ids
+
+
+class LBNodeIndexTests(SynchronousTestCase):
+    """
+    Tests for :class:`LBNodeIndex`.
+    """
+    def setUp(self):
+        desc = CLBDescription(lb_id='12345', port=80)
+        rcv3_desc = RCv3Description(lb_id='abc')
+        self.clb1 = CLBNode(node_id='1', description=desc, address='10.1.1.1')
+        self.rcv3 = RCv3Node(node_id='2', description=rcv3_desc,
+                             cloud_server_id='s1')
+        self.dummy = DummyLBNode(node_id='3', server_ids=['s1', 's2'])
+        self.clb2 = CLBNode(node_id='4', description=desc, address='10.1.1.2')
+        self.clb3 = CLBNode(node_id='5', description=desc, address='10.1.1.1')
+        self.nodes = [self.clb1, self.rcv3, self.dummy, self.clb2, self.clb3]
+        self.index = LBNodeIndex(self.nodes)
+
+    def server(self, server_id, address):
+        return NovaServer(id=server_id, state=ServerState.ACTIVE, created=0.0,
+                          servicenet_address=address,
+                          image_id='image', flavor_id='flavor')
+
+    def test_nodes_of(self):
+        """
+        `nodes_of` returns the nodes matching the server in the order they
+        were given, like checking every node
+        """
+        for server in [self.server('s1', '10.1.1.1'),
+                       self.server('s2', '10.1.1.2'),
+                       self.server('s3', '10.1.1.3'),
+                       self.server('s4', '')]:
+            self.assertEqual(
+                self.index.nodes_of(server),
+                [node for node in self.nodes if node.matches(server)])
+        self.assertEqual(self.index.nodes_of(self.server('s1', '10.1.1.1')),
+                         [self.clb1, self.rcv3, self.dummy, self.clb3])
+
+    def test_nodes_of_not_nova_server(self):
+        """
+        Only nodes that are not indexed are checked against servers that are
+        not :class:`NovaServer`
+        """
+        server = DummyServer(servicenet_address='10.1.1.1')
+        server.id = 's1'
+        self.assertEqual(self.index.nodes_of(server), [self.dummy])
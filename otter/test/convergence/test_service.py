@@ -7,7 +7,8 @@ from datetime import datetime
 import attr
 
 from effect import (
-    ComposedDispatcher, Effect, Error, Func, base_dispatcher, sync_perform)
+    ComposedDispatcher, Effect, Error, Func, TypeDispatcher, base_dispatcher,
+    sync_perform, sync_performer)
 from effect.ref import (
     ModifyReference, ReadReference, Reference, reference_dispatcher)
 from effect.testing import (
@@ -20,9 +21,11 @@ import mock
 
 from pyrsistent import freeze, pbag, pmap, pset, s, thaw
 
-from twisted.internet.defer import fail, succeed
+from twisted.internet.defer import Deferred, fail, succeed
 from twisted.trial.unittest import SynchronousTestCase
 
+from txeffect import perform
+
 from otter.cloud_client import NoSuchCLBError, TenantScope
 from otter.constants import CONVERGENCE_DIRTY_DIR
 from otter.convergence.composition import get_desired_server_group_state
@@ -34,11 +37,17 @@ from otter.convergence.planning import plan_launch_server
 from otter.convergence.service import (
     ConcurrentError,
     ConvergenceExecutor,
+    ConvergencePriority,
+    ConvergenceQueue,
     ConvergenceStarter,
     Converger,
+    DivergentFlags,
+    QueueConvergence,
     converge_all_groups,
     converge_one_group,
-    execute_convergence, get_my_divergent_groups,
+    execute_convergence,
+    get_convergence_queue_dispatcher,
+    get_my_divergent_groups,
     is_autoscale_active,
     launch_server_executor,
     non_concurrently,
@@ -65,6 +74,7 @@ from otter.test.utils import (
     mock_group, mock_log,
     nested_sequence,
     noop,
+    patch,
     raise_,
     raise_to_exc_info,
     transform_eq)
@@ -177,13 +187,14 @@ class ConvergerTests(SynchronousTestCase):
         def converge_all_groups(currently_converging, recent, waiting,
                                 _my_buckets, all_buckets,
                                 divergent_flags, build_timeout, interval,
-                                limited_retry_iterations):
+                                limited_retry_iterations, **kwargs):
             return Effect(
                 ('converge-all', currently_converging, _my_buckets,
                  all_buckets, divergent_flags, build_timeout, interval,
                  limited_retry_iterations))
 
-        my_buckets = [0, 5]
+        # flag1 is in bucket 9 and flag2 in bucket 6
+        my_buckets = [0, 9]
         bound_sequence = [
             (GetChildren(CONVERGENCE_DIRTY_DIR),
                 lambda i: ['flag1', 'flag2']),
@@ -192,7 +203,7 @@ class ConvergerTests(SynchronousTestCase):
                              True),
                 my_buckets,
                 range(self.num_buckets),
-                ['flag1', 'flag2'],
+                ['flag1'],
                 3600,
                 15,
                 23),
@@ -206,6 +217,66 @@ class ConvergerTests(SynchronousTestCase):
             result, = self.fake_partitioner.got_buckets(my_buckets)
         self.assertEqual(self.successResultOf(result), 'foo')
 
+    def test_buckets_acquired_indexed(self):
+        """
+        When divergent flags have already been got from the children watch,
+        they are not got again from ZooKeeper when buckets are allocated.
+        """
+        def converge_all_groups(currently_converging, recent, waiting,
+                                _my_buckets, all_buckets,
+                                divergent_flags, build_timeout, interval,
+                                limited_retry_iterations, **kwargs):
+            return Effect(('converge-all', _my_buckets, divergent_flags))
+
+        sequence = self._log_sequence(
+            [(('converge-all', [6, 9], ['flag2', 'flag1']), noop)])
+        converger = self._converger(converge_all_groups, dispatcher=sequence)
+        converger.divergent_changed(['flag1', 'flag2', 'group1'])
+
+        with sequence.consume():
+            self.fake_partitioner.got_buckets([6, 9])
+
+    def test_buckets_acquired_relists(self):
+        """
+        Divergent flags are got again from ZooKeeper every `relist_ticks`
+        times buckets are allocated, and after the ZooKeeper connection state
+        changes.
+        """
+        def converge_all_groups(currently_converging, recent, waiting,
+                                _my_buckets, all_buckets,
+                                divergent_flags, build_timeout, interval,
+                                limited_retry_iterations, **kwargs):
+            return Effect(('converge-all', divergent_flags))
+
+        def relisted(flags):
+            return self._log_sequence(
+                [(GetChildren(CONVERGENCE_DIRTY_DIR), lambda i: flags),
+                 (('converge-all', flags), noop)])
+
+        converger = Converger(
+            self.log, None, self.num_buckets, self._pfactory,
+            build_timeout=3600, interval=15, limited_retry_iterations=23,
+            converge_all_groups=converge_all_groups, relist_ticks=3)
+        converger.divergent_changed(['t1_g'])
+        converger._dispatcher = self._log_sequence(
+            [(('converge-all', ['t1_g']), noop)])
+        for _ in range(2):
+            with converger._dispatcher.consume():
+                self.fake_partitioner.got_buckets([9])
+            converger._dispatcher = self._log_sequence(
+                [(('converge-all', ['t1_g']), noop)])
+        converger._dispatcher = relisted(['t1_h'])
+        with converger._dispatcher.consume():
+            self.fake_partitioner.got_buckets([9])
+
+        converger.connection_state_changed('SUSPENDED')
+        self.log.msg.assert_called_once_with(
+            'converger-zk-state-changed', zk_state='SUSPENDED',
+            otter_service='converger')
+        converger._dispatcher = relisted(['t1_g'])
+        with converger._dispatcher.consume():
+            self.fake_partitioner.got_buckets([9])
+
     def test_buckets_acquired_errors(self):
         """
         Errors raised from performing the converge_all_groups effect are
@@ -214,7 +285,7 @@ class ConvergerTests(SynchronousTestCase):
         def converge_all_groups(currently_converging, recent, waiting,
                                 _my_buckets, all_buckets,
                                 divergent_flags, build_timeout, interval,
-                                limited_retry_iterations):
+                                limited_retry_iterations, **kwargs):
             return Effect('converge-all')
 
         bound_sequence = [
@@ -267,22 +338,103 @@ class ConvergerTests(SynchronousTestCase):
         def converge_all_groups(currently_converging, recent, waiting,
                                 _my_buckets, all_buckets,
                                 divergent_flags, build_timeout, interval,
-                                limited_retry_iterations):
-            return Effect(('converge-all-groups', divergent_flags))
+                                limited_retry_iterations, take_fresh,
+                                creating):
+            self.assertIs(creating, converger.creating)
+            return Effect(('converge-all-groups', divergent_flags,
+                           take_fresh(divergent_flags)))
 
         intents = [
-            (('converge-all-groups', ['group1', 'group2']),
+            (('converge-all-groups', ['group1'], set(['group1'])),
              noop)
         ]
         sequence = self._log_sequence(intents)
 
         converger = self._converger(converge_all_groups, dispatcher=sequence)
 
-        # sha1('group1') % 10 == 3
+        # sha1('group1') % 10 == 3, sha1('group2') % 10 == 8
         self.fake_partitioner.current_state = PartitionState.ACQUIRED
-        self.fake_partitioner.my_buckets = [3]
+        self.fake_partitioner.my_buckets = [3, 8]
+        converger.divergent_flags.update(['group2'])
         with sequence.consume():
             converger.divergent_changed(['group1', 'group2'])
+        # group1 is not considered fresh once it has been converged
+        self.assertEqual(converger.divergent_flags.fresh, set())
+
+    def test_divergent_changed_removed(self):
+        """
+        When divergent flags are only removed, nothing is done.
+        """
+        converger = self._converger(lambda *a, **kw: 1 / 0,
+                                    dispatcher=SequenceDispatcher([]))
+        self.fake_partitioner.current_state = PartitionState.ACQUIRED
+        self.fake_partitioner.my_buckets = [3, 8]
+        converger.divergent_flags.update(['group1', 'group2'])
+        converger.divergent_changed(['group1'])
+        self.assertEqual(converger.divergent_flags.in_buckets([3, 8]),
+                         ['group1'])
+
+
+class DivergentFlagsTests(SynchronousTestCase):
+    """Tests for :obj:`DivergentFlags`."""
+
+    def setUp(self):
+        self.flags = DivergentFlags(10)
+
+    def test_update(self):
+        """
+        `update` indexes flags by bucket of their tenant and returns buckets
+        that got new flags
+        """
+        self.assertFalse(self.flags.initialized)
+        # t1 is in bucket 9, t7 in 7 and t6 in 3
+        self.assertEqual(self.flags.update(['t1_g', 't7_g']), set([7, 9]))
+        self.assertTrue(self.flags.initialized)
+        self.assertEqual(self.flags.update(['t1_g', 't7_g', 't6_g']),
+                         set([3]))
+        self.assertEqual(self.flags.in_buckets([3, 8, 9]), ['t6_g', 't1_g'])
+
+    def test_reset(self):
+        """
+        `reset` makes the index not initialized but keeps the flags
+        """
+        self.flags.update(['t1_g'])
+        self.flags.reset()
+        self.assertFalse(self.flags.initialized)
+        self.assertEqual(self.flags.in_buckets([9]), ['t1_g'])
+
+    def test_update_removed(self):
+        """
+        Flags not given in `update` are removed from the index
+        """
+        self.flags.update(['t1_g', 't1_h', 't2_g'])
+        self.assertEqual(self.flags.update(['t1_h']), set())
+        self.assertEqual(self.flags.in_buckets(range(10)), ['t1_h'])
+
+    def test_fresh(self):
+        """
+        Flags added after the first update are fresh until they are removed
+        or taken with `take_fresh`
+        """
+        self.flags.update(['t1_g'])
+        self.assertEqual(self.flags.fresh, set())
+        self.flags.update(['t1_g', 't2_g', 't6_g', 't7_g'])
+        self.assertEqual(self.flags.fresh, set(['t2_g', 't6_g', 't7_g']))
+        self.flags.update(['t1_g', 't2_g', 't6_g'])
+        self.assertEqual(self.flags.take_fresh(['t1_g', 't2_g']),
+                         set(['t2_g']))
+        self.assertEqual(self.flags.fresh, set(['t6_g']))
+
+    def test_only_new_flags_hashed(self):
+        """
+        Tenants of only the new flags are looked up
+        """
+        self.flags.update(['t1_g', 't2_g'])
+        bucket_of_tenant = patch(
+            self, 'otter.convergence.service.bucket_of_tenant',
+            return_value=3)
+        self.flags.update(['t1_g', 't2_g', 't6_g'])
+        bucket_of_tenant.assert_called_once_with('t6', 10)
 
 
 def add_to_recently(recently, group_id, cvg_time):
@@ -429,6 +581,34 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         ] + self._clean_divergent()
         self._verify_sequence(sequence)
 
+    def test_no_scaling_group_creating(self):
+        """
+        When the scaling group disappears, it is also removed from
+        ``creating``, which is passed on to ``execute_convergence``.
+        """
+        creating = Reference(pset([self.group_id]))
+        expected_error = NoSuchScalingGroupError(self.tenant_id, self.group_id)
+
+        def execute_convergence(*args, **kwargs):
+            self.assertIs(kwargs.pop('creating'), creating)
+            return self._execute_convergence(*args, **kwargs)
+
+        sequence = [
+            (self._exec_intent, lambda i: raise_(expected_error)),
+            (LogErr(CheckFailureValue(expected_error),
+                    'converge-fatal-error', {}),
+             noop),
+            (ModifyReference(creating,
+                             match_func(pset([self.group_id]), pset())),
+             noop),
+        ] + self._clean_divergent()
+        eff = converge_one_group(
+            Reference(pset()), Reference(pmap()), self.waiting,
+            self.tenant_id, self.group_id, self.version,
+            3600, 43, execute_convergence=execute_convergence,
+            creating=creating)
+        perform_sequence(sequence, eff, fallback_dispatcher=_get_dispatcher())
+
     def test_unexpected_errors(self):
         """
         Unexpected exceptions log a non-fatal error and don't clean up the
@@ -567,7 +747,8 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
             ('converge', tenant_id, group_id, version, build_timeout,
              limited_retry_iterations))
 
-    def _expect_group_converged(self, tenant_id, group_id):
+    def _expect_group_converged(self, tenant_id, group_id,
+                                priority=ConvergencePriority.RECHECK):
         """
         Return a SequenceDispatcher two-tuple that matches the usual sequence
         of intents for converging a single group.
@@ -576,14 +757,17 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
             BoundFields(mock.ANY,
                         dict(tenant_id=tenant_id, scaling_group_id=group_id)),
             nested_sequence([
-                (GetStat(
-                    path='/groups/divergent/{tenant_id}_{group_id}'.format(
-                        tenant_id=tenant_id, group_id=group_id)),
-                 lambda i: ZNodeStatStub(version=5)),
-                (TenantScope(mock.ANY, tenant_id),
+                (QueueConvergence(tenant_id, group_id, priority, mock.ANY),
                  nested_sequence([
-                     (('converge', tenant_id, group_id, 5, 3600, 23),
-                      lambda i: 'converged {}!'.format(group_id)),
+                     (GetStat(
+                         path='/groups/divergent/{}_{}'.format(tenant_id,
+                                                               group_id)),
+                      lambda i: ZNodeStatStub(version=5)),
+                     (TenantScope(mock.ANY, tenant_id),
+                      nested_sequence([
+                          (('converge', tenant_id, group_id, 5, 3600, 23),
+                           lambda i: 'converged {}!'.format(group_id)),
+                      ])),
                  ])),
             ]))
 
@@ -601,6 +785,7 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
              noop),
             (ReadReference(self.recently_converged), lambda i: pmap()),
             (Func(time.time), lambda i: 100),
+            (ReadReference(ref=self.waiting), lambda i: pmap()),
             parallel_sequence([[self._expect_group_converged('00', 'g1')],
                                [self._expect_group_converged('01', 'g2')]])
         ]
@@ -622,6 +807,7 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
              noop),
             (ReadReference(ref=self.recently_converged), lambda i: pmap()),
             (Func(time.time), lambda i: 100),
+            (ReadReference(ref=self.waiting), lambda i: pmap()),
             parallel_sequence([[self._expect_group_converged('01', 'g2')]])
         ]
         self.assertEqual(perform_sequence(sequence, eff), ['converged g2!'])
@@ -640,10 +826,41 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
             (ReadReference(ref=self.recently_converged),
              lambda i: pmap({'g1': 5})),
             (Func(time.time), lambda i: 14),
+            (ReadReference(ref=self.waiting), lambda i: pmap()),
             parallel_sequence([])  # No groups to converge
         ]
         self.assertEqual(perform_sequence(sequence, eff), [])
 
+    def test_take_fresh_only_queued(self):
+        """
+        Only the flags of the groups that are queued are taken with
+        ``take_fresh``, so that skipped groups keep their fresh flags.
+        """
+        taken = []
+
+        def take_fresh(flags):
+            taken.append(flags)
+            return set(flags)
+
+        eff = converge_all_groups(
+            self.currently_converging, self.recently_converged, self.waiting,
+            self.my_buckets, self.all_buckets, ['00_g1', '01_g2'], 3600, 15,
+            23, take_fresh=take_fresh,
+            converge_one_group=self._converge_one_group)
+        sequence = [
+            (ReadReference(ref=self.currently_converging), lambda i: pset()),
+            (Log('converge-all-groups', mock.ANY), noop),
+            (ReadReference(ref=self.recently_converged),
+             lambda i: pmap({'g1': 5})),
+            (Func(time.time), lambda i: 14),
+            (ReadReference(ref=self.waiting), lambda i: pmap()),
+            parallel_sequence([
+                [self._expect_group_converged(
+                    '01', 'g2', ConvergencePriority.FRESH)]])
+        ]
+        self.assertEqual(perform_sequence(sequence, eff), ['converged g2!'])
+        self.assertEqual(taken, [['01_g2']])
+
     def test_dont_filter_out_non_recently_converged(self):
         """
         If a group was converged in the past but not recently, it will be
@@ -666,6 +883,7 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
                              match_func("literally anything",
                                         pmap({'g2': 10}))),
              noop),
+            (ReadReference(ref=self.waiting), lambda i: pmap()),
             parallel_sequence([[self._expect_group_converged('00', 'g1')]])
         ]
         self.assertEqual(perform_sequence(sequence, eff), ['converged g1!'])
@@ -709,14 +927,180 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
              noop),
             (ReadReference(ref=self.recently_converged), lambda i: pmap()),
             (Func(time.time), lambda i: 100),
+            (ReadReference(ref=self.waiting), lambda i: pmap()),
             parallel_sequence([
                 [(BoundFields(mock.ANY, fields={'tenant_id': '00',
                                                 'scaling_group_id': 'g1'}),
-                  nested_sequence(get_bound_sequence('00', 'g1')))],
-             ]),
+                  nested_sequence([
+                      (QueueConvergence('00', 'g1',
+                                        ConvergencePriority.RECHECK,
+                                        mock.ANY),
+                       nested_sequence(get_bound_sequence('00', 'g1')))]))]
+            ]),
         ]
         self.assertEqual(perform_sequence(sequence, eff), [None])
 
+    def test_priorities(self):
+        """
+        Groups with fresh divergent flags are queued ahead of groups that were
+        creating servers, which are queued ahead of groups being re-checked
+        and then groups waiting on LIMITED_RETRY steps. The ``creating``
+        reference is passed on to ``converge_one_group``.
+        """
+        self.creating = Reference(pset(['g2']))
+
+        def converge_one_group(cc, rc, waiting, tenant_id, group_id, version,
+                               build_timeout, limited_retry_iterations,
+                               creating):
+            self.assertIs(creating, self.creating)
+            return Effect(
+                ('converge', tenant_id, group_id, version, build_timeout,
+                 limited_retry_iterations))
+
+        def take_fresh(flags):
+            self.assertEqual(flags, ['00_g1', '01_g2', '02_g3', '03_g4'])
+            return set(['00_g1', '01_g2'])
+
+        flags = ['00_g1', '01_g2', '02_g3', '03_g4']
+        self.my_buckets = self.all_buckets
+        eff = converge_all_groups(
+            self.currently_converging, self.recently_converged, self.waiting,
+            self.my_buckets, self.all_buckets, flags, 3600, 15, 23,
+            take_fresh=take_fresh, creating=self.creating,
+            converge_one_group=converge_one_group)
+        sequence = [
+            (ReadReference(ref=self.currently_converging), lambda i: pset()),
+            (Log('converge-all-groups', mock.ANY), noop),
+            (ReadReference(ref=self.recently_converged), lambda i: pmap()),
+            (Func(time.time), lambda i: 100),
+            (ReadReference(ref=self.waiting), lambda i: pmap({'g4': 1})),
+            (ReadReference(ref=self.creating),
+             lambda i: pset(['g2', 'g3'])),
+            parallel_sequence([
+                [self._expect_group_converged(
+                    '00', 'g1', ConvergencePriority.FRESH)],
+                [self._expect_group_converged(
+                    '01', 'g2', ConvergencePriority.FRESH)],
+                [self._expect_group_converged(
+                    '02', 'g3', ConvergencePriority.CREATING)],
+                [self._expect_group_converged(
+                    '03', 'g4', ConvergencePriority.LIMITED_RETRY)]])
+        ]
+        self.assertEqual(
+            perform_sequence(sequence, eff),
+            ['converged g1!', 'converged g2!', 'converged g3!',
+             'converged g4!'])
+
+
+class ConvergenceQueueTests(SynchronousTestCase):
+    """Tests for :obj:`ConvergenceQueue`."""
+
+    def setUp(self):
+        self.queue = ConvergenceQueue(2, tenant_limit=1)
+        self.calls = []
+        self.pending = {}
+
+    def _queue(self, key, tenant_id, priority):
+        def f(arg):
+            self.calls.append(key)
+            self.pending[key] = Deferred()
+            return self.pending[key].addCallback(lambda r: (arg, r))
+        return self.queue.run(key, tenant_id, priority, f, key)
+
+    def test_runs_immediately(self):
+        """
+        When there is a free slot, the function is called right away and the
+        result of the function is returned.
+        """
+        d = self._queue('g1', 't1', 2)
+        self.assertEqual(self.calls, ['g1'])
+        self.assertNoResult(d)
+        self.pending['g1'].callback('done')
+        self.assertEqual(self.successResultOf(d), ('g1', 'done'))
+        self.assertEqual(self.queue.running, 0)
+
+    def test_priority(self):
+        """
+        When slots are taken, the waiting calls are run in the order of their
+        priority, and in the order they were queued for the same priority.
+        """
+        self._queue('g1', 't1', 2)
+        self._queue('g2', 't2', 2)
+        self._queue('g3', 't3', 2)
+        self._queue('g4', 't4', 3)
+        self._queue('g5', 't5', 0)
+        self.assertEqual(self.calls, ['g1', 'g2'])
+        self.pending['g1'].callback(None)
+        self.assertEqual(self.calls, ['g1', 'g2', 'g5'])
+        self.pending['g5'].callback(None)
+        self.pending['g2'].callback(None)
+        self.assertEqual(self.calls, ['g1', 'g2', 'g5', 'g3', 'g4'])
+
+    def test_tenant_limit(self):
+        """
+        A tenant does not have more than ``tenant_limit`` calls running, and
+        calls of other tenants are run ahead of its waiting calls.
+        """
+        self._queue('g1', 't1', 2)
+        self._queue('g2', 't1', 0)
+        self._queue('g3', 't2', 2)
+        self.assertEqual(self.calls, ['g1', 'g3'])
+        self.pending['g3'].callback(None)
+        self.assertEqual(self.calls, ['g1', 'g3'])
+        self.pending['g1'].callback(None)
+        self.assertEqual(self.calls, ['g1', 'g3', 'g2'])
+
+    def test_failure(self):
+        """
+        Failures of the function are returned and free up its slot.
+        """
+        self.queue = ConvergenceQueue(1)
+        d = self.queue.run('g1', 't1', 2, lambda: 1 / 0)
+        self.failureResultOf(d, ZeroDivisionError)
+        self._queue('g2', 't1', 2)
+        self.assertEqual(self.calls, ['g2'])
+
+    def test_already_queued(self):
+        """
+        A key that is already waiting is not queued again, but it is run
+        with the higher of both priorities.
+        """
+        self.queue = ConvergenceQueue(1)
+        self._queue('g1', 't1', 2)
+        d2 = self._queue('g2', 't2', 3)
+        self._queue('g3', 't3', 2)
+        self.assertIsNone(self.successResultOf(self._queue('g2', 't2', 1)))
+        self.assertIsNone(self.successResultOf(self._queue('g3', 't3', 3)))
+        self.pending['g1'].callback(None)
+        self.assertEqual(self.calls, ['g1', 'g2'])
+        self.pending['g2'].callback('r')
+        self.assertEqual(self.successResultOf(d2), ('g2', 'r'))
+        self.assertEqual(self.calls, ['g1', 'g2', 'g3'])
+        self.pending['g3'].callback(None)
+        self.assertEqual(self.calls, ['g1', 'g2', 'g3'])
+
+    def test_no_limits(self):
+        """
+        Everything is run right away when there are no limits.
+        """
+        self.queue = ConvergenceQueue()
+        for i in range(5):
+            self._queue('g{}'.format(i), 't1', 2)
+        self.assertEqual(len(self.calls), 5)
+
+    def test_dispatcher(self):
+        """
+        :obj:`QueueConvergence` is performed by running its effect through the
+        queue.
+        """
+        disp = ComposedDispatcher([
+            get_convergence_queue_dispatcher(self.queue),
+            TypeDispatcher({str: sync_performer(lambda d, i: i + '!')})])
+        d = perform(disp, Effect(QueueConvergence('t1', 'g1', 0,
+                                                  Effect('converged'))))
+        self.assertEqual(self.successResultOf(d), 'converged!')
+        self.assertEqual(self.queue.running, 0)
+
 
 class GetMyDivergentGroupsTests(SynchronousTestCase):
 
@@ -862,7 +1246,7 @@ class ExecuteConvergenceTests(SynchronousTestCase):
              nested_sequence(exec_seq))
         ]
 
-    def _invoke(self, plan=None):
+    def _invoke(self, plan=None, creating=None):
         kwargs = {'plan': plan} if plan is not None else {}
         executor = attr.assoc(launch_server_executor,
                               gather=intent_func("gacd"), **kwargs)
@@ -870,7 +1254,8 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             self.tenant_id, self.group_id, build_timeout=3600,
             waiting=self.waiting,
             limited_retry_iterations=43,
-            get_executor=lambda _: executor)
+            get_executor=lambda _: executor,
+            creating=creating)
 
     def test_no_steps(self):
         """
@@ -1033,6 +1418,60 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             perform_sequence(self.get_seq() + sequence, self._invoke(plan)),
             ConvergenceIterationStatus.Continue())
 
+    def test_record_creating(self):
+        """
+        The group is added to ``creating`` when the plan creates servers.
+        """
+        creating = Reference(pset())
+        step = CreateServer(server_config=pmap({"foo": "bar"}))
+        step.as_effect = lambda: Effect("create-server")
+
+        def plan(*args, **kwargs):
+            return pbag([step])
+
+        sequence = [
+            parallel_sequence([[parallel_sequence([[
+                (Log('convergence-create-servers', mock.ANY), noop)]])]]),
+            (ModifyReference(creating,
+                             match_func(pset(), pset([self.group_id]))),
+             noop),
+            (Log(msg='execute-convergence', fields=mock.ANY), noop),
+            parallel_sequence([
+                [("create-server", lambda i: (StepResult.RETRY, []))]
+            ]),
+            (Log(msg='execute-convergence-results', fields=mock.ANY), noop),
+            clean_waiting(self.waiting, self.group_id),
+        ]
+        self.assertEqual(
+            perform_sequence(self.get_seq() + sequence,
+                             self._invoke(plan, creating)),
+            ConvergenceIterationStatus.Continue())
+
+    def test_record_not_creating(self):
+        """
+        The group is removed from ``creating`` when the plan does not create
+        servers.
+        """
+        creating = Reference(pset([self.group_id]))
+
+        def plan(*args, **kwargs):
+            return [TestStep(Effect("step"))]
+
+        sequence = [
+            parallel_sequence([]),
+            (ModifyReference(creating,
+                             match_func(pset([self.group_id]), pset())),
+             noop),
+            (Log(msg='execute-convergence', fields=mock.ANY), noop),
+            parallel_sequence([[("step", lambda i: (StepResult.RETRY, []))]]),
+            (Log(msg='execute-convergence-results', fields=mock.ANY), noop),
+            clean_waiting(self.waiting, self.group_id),
+        ]
+        self.assertEqual(
+            perform_sequence(self.get_seq() + sequence,
+                             self._invoke(plan, creating)),
+            ConvergenceIterationStatus.Continue())
+
     def _test_deleting_group(self, step_result, with_delete, exec_result):
 
         def _plan(dsg, *a, **kwargs):
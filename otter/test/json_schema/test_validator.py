@@ -0,0 +1,112 @@
+"""
+Tests for :mod:`otter.json_schema`
+"""
+
+from jsonschema import Draft3Validator, SchemaError, ValidationError
+
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.json_schema import (
+    group_examples, group_schemas, validate, validator)
+
+
+class ValidatorTests(SynchronousTestCase):
+    """
+    Tests for :func:`validator` and :func:`validate`
+    """
+
+    def setUp(self):
+        """
+        Sample schema with a union of object types, the second of which most
+        instances match
+        """
+        self.schema = {
+            "type": "object",
+            "properties": {
+                "server": {
+                    "type": [
+                        {"type": "object",
+                         "properties": {"volume": {"type": "string",
+                                                   "required": True}}},
+                        {"type": "object",
+                         "properties": {"image": {"type": "string",
+                                                  "required": True}}},
+                        "null"],
+                    "required": True
+                }
+            }
+        }
+        self.types = self.schema['properties']['server']['type']
+
+    def errors(self, v, instance):
+        """
+        Details of the errors found by the validator in the instance
+        """
+        return [(e.message, list(e.path), list(e.schema_path),
+                 [c.message for c in e.context])
+                for e in v.iter_errors(instance)]
+
+    def test_invalid_schema(self):
+        """
+        The schema is checked when building the validator
+        """
+        self.assertRaises(SchemaError, validator, {"type": 1})
+
+    def test_format_checker(self):
+        """
+        The validator checks the formats registered by the schemas
+        """
+        v = validator({"type": "string", "format": "cron"})
+        v.validate("* * * * *")
+        self.assertRaises(ValidationError, v.validate, "1 2 3")
+
+    def test_validate(self):
+        """
+        :func:`validate` raises the first validation error
+        """
+        validate({"server": {"image": "i"}}, self.schema)
+        self.assertRaises(ValidationError, validate, {"server": 1},
+                          self.schema)
+
+    def test_hint(self):
+        """
+        The union member matched last is remembered and tried first, and is
+        replaced when another member matches
+        """
+        v = validator(self.schema)
+        v.validate({"server": {"image": "i"}})
+        self.assertEqual(v.union_hints, {id(self.types): 1})
+        v.validate({"server": {"image": "j"}})
+        self.assertEqual(v.union_hints, {id(self.types): 1})
+        v.validate({"server": {"volume": "v"}})
+        self.assertEqual(v.union_hints, {id(self.types): 0})
+        v.validate({"server": None})
+        self.assertEqual(v.union_hints, {id(self.types): 0})
+
+    def test_same_errors(self):
+        """
+        Invalid instances get the same errors as from plain Draft 3 validation
+        whether or not there is a hint
+        """
+        v = validator(self.schema)
+        v.validate({"server": {"image": "i"}})
+        for instance in [{"server": 1}, {"server": {}},
+                         {"server": {"image": 1}}, {}]:
+            errors = self.errors(Draft3Validator(self.schema), instance)
+            self.assertNotEqual(errors, [])
+            self.assertEqual(self.errors(validator(self.schema), instance),
+                             errors)
+            self.assertEqual(self.errors(v, instance), errors)
+
+    def test_launch_config(self):
+        """
+        Examples of launch configurations, booted from volume or not, validate
+        in any order with the same validator
+        """
+        v = validator(group_schemas.launch_config)
+        examples = group_examples.launch_server_config()
+        bfv = examples[1]
+        del bfv['args']['server']['imageRef']
+        bfv['args']['server']['block_device_mapping'] = [{'volume_id': '1'}]
+        for example in examples + examples[::-1]:
+            v.validate(example)
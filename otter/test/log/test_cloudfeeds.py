@@ -8,7 +8,8 @@ from effect.testing import perform_sequence
 
 import mock
 
-from twisted.internet.defer import fail, succeed
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
 from twisted.python.failure import Failure
 from twisted.trial.unittest import SynchronousTestCase
 from twisted.web.client import ResponseFailed
@@ -19,6 +20,7 @@ from otter.cloud_client import TenantScope, has_code, service_request
 from otter.constants import ServiceType
 from otter.log.cloudfeeds import (
     CloudFeedsObserver,
+    CloudFeedsPublisher,
     UnsuitableMessage,
     add_event,
     cf_err, cf_fail, cf_msg,
@@ -303,6 +305,17 @@ class EventTests(SynchronousTestCase):
             'ord', 'tid', 'uuid')
         self.assertEqual(req, self._get_request('ERROR', 'uuid', 'tid'))
 
+    def test_request_format_unchanged(self):
+        """
+        Preparing a request does not change the request format
+        """
+        fmt = {'entry': {'content': {'event': {'type': 'INFO',
+                                               'product': {'a': 'b'}}}}}
+        prepare_request(fmt, {'c': 'd'}, True, 'time', 'ord', 'tid', 'id')
+        self.assertEqual(
+            fmt, {'entry': {'content': {'event': {'type': 'INFO',
+                                                  'product': {'a': 'b'}}}}})
+
 
 class CloudFeedsObserverTests(SynchronousTestCase):
     """
@@ -389,3 +402,178 @@ class CloudFeedsObserverTests(SynchronousTestCase):
             None, 'cf-unsuitable-message', unsuitable_message='bad',
             event_data={'event': 'dict'}, system='otter.cloud_feed',
             cf_msg='m')
+
+    def test_publisher(self):
+        """
+        Events are given to the publisher if there is one
+        """
+        publisher = mock.Mock(spec=['add'])
+        cf = self.make_cf(add_event=lambda *a: 'eff', publisher=publisher,
+                          get_disp=mock.NonCallableMock())
+        self.assertIsNone(
+            cf({'event': 'dict', 'cloud_feed': True, 'message': ('m', )}))
+        publisher.add.assert_called_once_with('eff', mock.ANY)
+
+
+class Publish(object):
+    """
+    Intent to publish an event whose result is given by ``d``
+    """
+    def __init__(self, d):
+        self.d = d
+
+
+class CloudFeedsPublisherTests(SynchronousTestCase):
+    """
+    Tests for :obj:`CloudFeedsPublisher`
+    """
+
+    def setUp(self):
+        """
+        Publisher of events whose results are Deferreds in `self.published`
+        """
+        self.published = []
+        self.log = mock_log()
+        self.clock = Clock()
+        self.publisher_log = mock_log()
+        self.publisher = CloudFeedsPublisher(
+            TypeDispatcher({Publish: deferred_performer(self._publish)}),
+            self.clock, log=self.publisher_log, max_size=5, concurrency=2,
+            stop_timeout=10)
+        self.publisher.startService()
+
+    def _publish(self, dispatcher, intent):
+        self.published.append(intent.d)
+        return intent.d
+
+    def add(self, n=1):
+        ds = [Deferred() for _ in range(n)]
+        for d in ds:
+            self.publisher.add(Effect(Publish(d)), self.log)
+        return ds
+
+    def test_concurrency(self):
+        """
+        Events are published as soon as they are added, at most
+        `concurrency` at a time, and the next one is published as soon as
+        any of them is done
+        """
+        self.add()
+        self.assertEqual(len(self.published), 1)
+        self.add(3)
+        self.assertEqual(len(self.published), 2)
+        self.assertEqual(self.publisher.stats()['in_flight'], 2)
+        self.published[1].callback(None)
+        self.assertEqual(len(self.published), 3)
+        self.published[2].callback(None)
+        self.assertEqual(len(self.published), 4)
+        self.assertEqual(
+            self.publisher.stats(),
+            {'queued': 0, 'in_flight': 2, 'published': 2, 'failed': 0,
+             'dropped': 0, 'max_size': 5})
+
+    def test_synchronous(self):
+        """
+        Events published synchronously do not hold up the others
+        """
+        ds = [succeed(None) for _ in range(4)]
+        for d in ds:
+            self.publisher.add(Effect(Publish(d)), self.log)
+        self.assertEqual(self.publisher.published, 4)
+        self.assertEqual(self.publisher.stats()['in_flight'], 0)
+        self.assertIsNone(self.successResultOf(self.publisher.flush()))
+
+    def test_not_running(self):
+        """
+        Events added when the publisher is not running are dropped and
+        counted
+        """
+        self.publisher.stopService()
+        self.assertFalse(self.publisher.add(Effect(Publish(None)), self.log))
+        self.assertEqual(self.published, [])
+        self.assertEqual(self.publisher.dropped, 1)
+        self.log.msg.assert_called_once_with('cf-publisher-stopped',
+                                             dropped=1)
+
+    def test_full(self):
+        """
+        Events added when the queue is full are dropped and counted
+        """
+        self.add(8)
+        self.assertEqual(self.publisher.stats()['queued'], 5)
+        self.assertEqual(self.publisher.dropped, 1)
+        self.log.msg.assert_called_once_with('cf-queue-full', dropped=1)
+        self.assertFalse(self.publisher.add(Effect(Publish(None)), self.log))
+
+    def test_failure(self):
+        """
+        Failure to publish an event is logged with the event's log and the
+        next event is published
+        """
+        self.add(3)[0].errback(ValueError('bad'))
+        self.log.err.assert_called_once_with(
+            CheckFailure(ValueError), 'cf-add-failure')
+        self.assertEqual(self.publisher.failed, 1)
+        self.assertEqual(len(self.published), 3)
+
+    def test_flush(self):
+        """
+        Flushing waits for the queued and in-flight events to be published,
+        and adding events while waiting does not add waiters
+        """
+        self.add(3)
+        d1 = self.publisher.flush()
+        d2 = self.publisher.flush()
+        self.add(2)
+        self.assertEqual(len(self.publisher._waiters), 2)
+        i = 0
+        while i < len(self.published):
+            self.assertNoResult(d1)
+            self.published[i].callback(None)
+            i += 1
+        self.assertIsNone(self.successResultOf(d1))
+        self.assertIsNone(self.successResultOf(d2))
+        self.assertEqual(self.publisher.published, 5)
+
+    def test_stop_drains(self):
+        """
+        Stopping the publisher waits for all the queued events to be
+        published
+        """
+        self.add(5)
+        d = self.publisher.stopService()
+        i = 0
+        while i < len(self.published):
+            self.assertNoResult(d)
+            self.published[i].callback(None)
+            i += 1
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.publisher.published, 5)
+
+    def test_stop_timeout(self):
+        """
+        Stopping the publisher waits only up to `stop_timeout` seconds for
+        the queue to drain, after which the events still queued are dropped
+        """
+        self.add(5)
+        d = self.publisher.stopService()
+        self.published[0].callback(None)
+        self.clock.advance(10)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.publisher.stats()['queued'], 0)
+        self.assertEqual(self.publisher.dropped, 2)
+        self.publisher_log.msg.assert_called_once_with(
+            'cf-stop-timeout', dropped=2, in_flight=2,
+            system='otter.cloud_feed')
+        # the events in flight finish without waiters left to notify
+        for d in self.published:
+            if not d.called:
+                d.callback(None)
+        self.assertEqual(self.publisher.published, 3)
+
+    def test_health_check(self):
+        """
+        The health check is always healthy and reports the queue metrics
+        """
+        self.assertEqual(self.publisher.health_check(),
+                         (True, self.publisher.stats()))
@@ -20,6 +20,7 @@ from twisted.trial.unittest import SynchronousTestCase
 from otter.log import audit
 from otter.log.bound import BoundLog
 from otter.log.formatters import (
+    EncodedJSON,
     ErrorFormattingWrapper,
     FanoutObserver,
     JSONObserverWrapper,
@@ -171,6 +172,32 @@ class JSONObserverWrapperTests(SynchronousTestCase):
         self.observer.assert_called_once_with(
             {'message': (SameJSON({'foo': str(failure)}),)})
 
+    def test_encoded_json(self):
+        """
+        JSONObserverWrapper writes out :obj:`EncodedJSON` values as they are
+        instead of encoding them as strings
+        """
+        eventDict = {'foo': EncodedJSON('[1, {"a": 2}]'), 'bar': '[3]',
+                     'baz': EncodedJSON('null')}
+        observer = JSONObserverWrapper(self.observer, sort_keys=True)
+        observer(eventDict)
+        self.observer.assert_called_once_with(
+            {'message': (json.dumps({'foo': [1, {'a': 2}], 'bar': '[3]',
+                                     'baz': None}, sort_keys=True),)})
+
+    def test_event_not_changed(self):
+        """
+        JSONObserverWrapper does not change the event it is given, so that
+        other observers of the same event see its original values
+        """
+        eventDict = {'message': ('mine', 'yours'),
+                     'foo': EncodedJSON('[1]')}
+        original = dict(eventDict)
+        observer = JSONObserverWrapper(self.observer)
+        observer(eventDict)
+        self.assertEqual(eventDict, original)
+        self.assertIs(eventDict['foo'], original['foo'])
+
     def test_message_is_concatenated(self):
         """
         message tuple in event is concatenated before passing on
@@ -3,15 +3,17 @@ Tests for log_spec.py
 """
 import json
 
-from toolz.dicttoolz import assoc, dissoc
+from toolz.dicttoolz import assoc, dissoc, merge
 
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter.convergence.model import DesiredServerGroupState
 
+from otter.log.formatters import EncodedJSON, JSONObserverWrapper
 from otter.log.spec import (
     SpecificationObserverWrapper,
     get_validated_event,
+    pack,
     split_cf_messages,
     split_execute_convergence,
     split_list_servers
@@ -19,6 +21,14 @@ from otter.log.spec import (
 from otter.test.utils import CheckFailureValue, raise_
 
 
+def encoded(event, *keys):
+    """
+    Return ``event`` with the values of ``keys`` JSON-encoded
+    """
+    return merge(event, {k: json.dumps(event[k], default=repr, sort_keys=True)
+                         for k in keys})
+
+
 class SpecificationObserverWrapperTests(SynchronousTestCase):
     """
     Tests for `SpecificationObserverWrapper`
@@ -197,6 +207,25 @@ class ExecuteConvergenceSplitTests(SynchronousTestCase):
         self.state = DesiredServerGroupState(
             server_config='config', capacity=1)
 
+    def test_no_split(self):
+        """
+        An event that is short enough is not split, but its large fields are
+        JSON-encoded already and written out as they are by
+        :func:`JSONObserverWrapper`
+        """
+        event = {'hi': 'there', 'desired': self.state, 'steps': ['steps'],
+                 'lb_nodes': ['1'], 'servers': [{'id': '1', 'a': 2}]}
+        [(result, message)] = split_execute_convergence(event.copy())
+        self.assertEqual(message, "Executing convergence")
+        self.assertEqual(
+            result,
+            encoded(event, 'desired', 'steps', 'lb_nodes', 'servers'))
+        messages = []
+        JSONObserverWrapper(messages.append, sort_keys=True)(result)
+        self.assertEqual(
+            messages,
+            [{'message': (json.dumps(event, default=repr, sort_keys=True),)}])
+
     def test_split_out_servers_if_servers_longer(self):
         """
         If the 'servers' parameter is longer than the 'lb_nodes' parameter,
@@ -215,11 +244,14 @@ class ExecuteConvergenceSplitTests(SynchronousTestCase):
 
         result = split_execute_convergence(event.copy(), max_length=length)
         expected = [
-            (dissoc(event, 'servers'), message),
-            (dissoc(event, 'desired', 'steps', 'lb_nodes'), message)
+            (encoded(dissoc(event, 'servers'), 'desired', 'steps', 'lb_nodes'),
+             message),
+            (encoded(dissoc(event, 'desired', 'steps', 'lb_nodes'), 'servers'),
+             message)
         ]
 
         self.assertEqual(result, expected)
+        self.assertIsInstance(result[1][0]['servers'], EncodedJSON)
 
     def test_split_out_lb_nodes_if_lb_nodes_longer(self):
         """
@@ -239,8 +271,10 @@ class ExecuteConvergenceSplitTests(SynchronousTestCase):
 
         result = split_execute_convergence(event.copy(), max_length=length)
         expected = [
-            (dissoc(event, 'lb_nodes'), message),
-            (dissoc(event, 'desired', 'steps', 'servers'), message)
+            (encoded(dissoc(event, 'lb_nodes'), 'desired', 'steps', 'servers'),
+             message),
+            (encoded(dissoc(event, 'desired', 'steps', 'servers'), 'lb_nodes'),
+             message)
         ]
 
         self.assertEqual(result, expected)
@@ -261,9 +295,11 @@ class ExecuteConvergenceSplitTests(SynchronousTestCase):
             max_length=len(json.dumps(short_event, default=repr)) + 5)
 
         expected = [
-            (short_event, message),
-            (dissoc(event, 'desired', 'steps', 'servers'), message),
-            (dissoc(event, 'desired', 'steps', 'lb_nodes'), message)
+            (encoded(short_event, 'desired', 'steps'), message),
+            (encoded(dissoc(event, 'desired', 'steps', 'servers'), 'lb_nodes'),
+             message),
+            (encoded(dissoc(event, 'desired', 'steps', 'lb_nodes'), 'servers'),
+             message)
         ]
 
         self.assertEqual(result, expected)
@@ -271,7 +307,8 @@ class ExecuteConvergenceSplitTests(SynchronousTestCase):
     def test_split_servers_into_multiple_if_servers_too_long(self):
         """
         Both 'servers' is too long to even fit in one event, split the servers
-        list, so there are more than 2 events returned.
+        list, so there are more than 2 events returned.  As many servers as
+        fit are put in each event.
         """
         def event(servers):
             return {'hi': 'there', "servers": servers}
@@ -282,15 +319,40 @@ class ExecuteConvergenceSplitTests(SynchronousTestCase):
             max_length=len(json.dumps(event(['0', '1']))))
 
         expected = [
-            ({'hi': 'there', 'lb_nodes': []}, message),
-            (event(['0', '1']), message),
-            (event(['2']), message),
-            (event(['3', '4']), message),
+            ({'hi': 'there', 'lb_nodes': '[]'}, message),
+            (encoded(event(['0', '1']), 'servers'), message),
+            (encoded(event(['2', '3']), 'servers'), message),
+            (encoded(event(['4']), 'servers'), message),
         ]
 
         self.assertEqual(result, expected)
 
 
+class PackTests(SynchronousTestCase):
+    """
+    Tests for :func:`pack`
+    """
+    def test_empty(self):
+        """
+        There is a single empty chunk if there are no elements
+        """
+        self.assertEqual(pack([], 10), [(0, 0)])
+
+    def test_greedy(self):
+        """
+        Each chunk holds as many consecutive elements as fit, counting the
+        separators between them
+        """
+        self.assertEqual(pack([3, 3, 3, 3, 3], 8, 2), [(0, 2), (2, 4), (4, 5)])
+        self.assertEqual(pack([3, 3, 3, 3, 3], 9, 0), [(0, 3), (3, 5)])
+
+    def test_big_element(self):
+        """
+        An element bigger than the maximum gets a chunk of its own
+        """
+        self.assertEqual(pack([1, 20, 1, 1], 5, 1), [(0, 1), (1, 2), (2, 4)])
+
+
 class CFMessageSplitTests(SynchronousTestCase):
     """
     Tests for splitting cf message type events
@@ -10,7 +10,8 @@ from functools import partial
 
 from effect import (
     Constant, Effect, ParallelEffects, TypeDispatcher, sync_perform)
-from effect.testing import perform_sequence, resolve_effect
+from effect.testing import (
+    parallel_sequence, perform_sequence, resolve_effect)
 
 from jsonschema import ValidationError
 
@@ -33,6 +34,9 @@ from twisted.trial.unittest import SynchronousTestCase
 
 from txeffect import deferred_performer
 
+from zope.interface.verify import verifyObject
+
+from otter.auth import ITokenCache
 from otter.json_schema import group_examples
 from otter.models.cass import (
     CQLQueryExecute,
@@ -40,13 +44,21 @@ from otter.models.cass import (
     CassScalingGroup,
     CassScalingGroupCollection,
     CassScalingGroupServersCache,
+    CassTokenCache,
+    GroupConfigCache,
+    MAX_TOKEN,
+    MIN_TOKEN,
+    StateConflictError,
+    TenantResourceCounts,
     WeakLocks,
+    WebhookCapabilityCache,
     _assemble_webhook_from_row,
     assemble_webhooks_in_policies,
     cql_eff,
     get_cql_dispatcher,
     perform_cql_query,
     serialize_json_data,
+    token_ranges,
     verified_view
 )
 from otter.models.interface import (
@@ -67,13 +79,16 @@ from otter.test.models.test_interface import (
     IScalingScheduleCollectionProviderMixin
 )
 from otter.test.utils import (
+    CheckFailure,
     DummyException,
     LockMixin,
     matches,
     mock_log,
+    noop,
     patch,
     test_dispatcher)
 from otter.util.config import set_config_data
+from otter.util.cqlbatch import batch
 from otter.util.timestamp import from_timestamp
 
 
@@ -967,7 +982,152 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.assertTrue(f.check(AssertionError))
         self.assertEqual(self.connection.execute.call_count, 0)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    def _optimistic_rows(self, *versions, **kwargs):
+        """
+        Responses to reading the state at each of the given versions and
+        writing it, which is applied only for the last version
+        """
+        rows = [[merge(scaling_group_entry,
+                       {'tenantId': self.tenant_id, 'groupId': self.group_id,
+                        'state_version': version}, kwargs)]
+                for version in versions]
+        applied = [[{'[applied]': False}]] * (len(versions) - 1)
+        return list(itertools.chain.from_iterable(
+            zip(rows, applied + [[{'[applied]': True}]])))
+
+    def _optimistic_calls(self, *versions):
+        """
+        Expected calls reading the state at each of the given versions and
+        writing the state returned by the modifier
+        """
+        view_cql = (
+            'SELECT "tenantId", "groupId", group_config, launch_config, '
+            'active, pending, "groupTouched", "policyTouched", paused, '
+            'desired, created_at, status, error_reasons, deleting, '
+            'state_version FROM scaling_group '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId')
+        update_cql = (
+            'UPDATE scaling_group SET active = :active, pending = :pending, '
+            '"groupTouched" = :groupTouched, '
+            '"policyTouched" = :policyTouched, '
+            'paused = :paused, desired = :desired, '
+            'state_version = :newVersion '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+            'IF created_at = :created_at AND state_version = :version')
+        key = {"tenantId": self.tenant_id, "groupId": self.group_id}
+        return list(itertools.chain.from_iterable(
+            [mock.call(view_cql, key, ConsistencyLevel.QUORUM),
+             mock.call(update_cql,
+                       merge(key, {"active": _S({}), "pending": _S({}),
+                                   "groupTouched": '0001-01-01T00:00:00Z',
+                                   "policyTouched": _S({}), "paused": True,
+                                   "desired": 5, "created_at": 23,
+                                   "version": version,
+                                   "newVersion": (version or 0) + 1}),
+                       ConsistencyLevel.QUORUM)]
+            for version in versions))
+
+    def _new_state(self, _group, _state, *args, **kwargs):
+        return GroupState(tenant_id=self.tenant_id,
+                          group_id=self.group_id,
+                          group_name='a',
+                          active={},
+                          pending={},
+                          group_touched=None,
+                          policy_touched={},
+                          paused=True,
+                          status=ScalingGroupStatus.ACTIVE,
+                          desired=5)
+
+    @mock.patch('otter.models.cass.serialize_json_data',
+                side_effect=lambda *args: _S(args[0]))
+    def test_modify_state_optimistic(self, mock_serial):
+        """
+        With ``optimistic_state``, ``modify_state`` writes the state the
+        modifier returns only if its version has not changed, bumping the
+        version, and does not take the group's ZooKeeper lock
+        """
+        self.group.optimistic_state = True
+        self.returns = self._optimistic_rows(3)
+        modifier = mock.Mock(side_effect=self._new_state)
+        d = self.group.modify_state(modifier, 'arg', kw=1)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.connection.execute.mock_calls,
+                         self._optimistic_calls(3))
+        modifier.assert_called_once_with(self.group, mock.ANY, 'arg', kw=1)
+        self.assertEqual(modifier.call_args[0][1].active, {'A': 'R'})
+        self.assertFalse(self.kz_client.Lock.called)
+
+    @mock.patch('otter.models.cass.serialize_json_data',
+                side_effect=lambda *args: _S(args[0]))
+    def test_modify_state_optimistic_conflict(self, mock_serial):
+        """
+        With ``optimistic_state``, ``modify_state`` reads and modifies the
+        state again if it was changed concurrently. A state that has never
+        been written optimistically has no version.
+        """
+        self.group.optimistic_state = True
+        self.returns = self._optimistic_rows(None, 1)
+        modifier = mock.Mock(side_effect=self._new_state)
+        d = self.group.modify_state(modifier)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.connection.execute.mock_calls,
+                         self._optimistic_calls(None, 1))
+        self.assertEqual(modifier.call_count, 2)
+        self.mock_log.bind.return_value.msg.assert_called_once_with(
+            mock.ANY, attempt=1, otter_msg_type='modify-state-conflict')
+
+    @mock.patch('otter.models.cass.serialize_json_data',
+                side_effect=lambda *args: _S(args[0]))
+    def test_modify_state_optimistic_gives_up(self, mock_serial):
+        """
+        With ``optimistic_state``, ``modify_state`` fails with
+        :class:`StateConflictError` if the state keeps changing concurrently
+        """
+        self.group.optimistic_state = True
+        self.group.max_state_conflicts = 2
+        self.returns = self._optimistic_rows(1, 2, 3)
+        d = self.group.modify_state(self._new_state)
+        self.failureResultOf(d, StateConflictError)
+        self.assertEqual(self.connection.execute.mock_calls,
+                         self._optimistic_calls(1, 2))
+
+    def test_modify_state_optimistic_deleting(self):
+        """
+        With ``optimistic_state``, ``modify_state`` fails with
+        :class:`NoSuchScalingGroupError` without calling the modifier if the
+        group is being deleted
+        """
+        self.group.optimistic_state = True
+        self.returns = self._optimistic_rows(1, deleting=True)
+        modifier = mock.Mock()
+        d = self.group.modify_state(modifier)
+        self.failureResultOf(d, NoSuchScalingGroupError)
+        self.assertFalse(modifier.called)
+
+    @mock.patch('otter.models.cass.serialize_json_data',
+                side_effect=lambda *args: _S(args[0]))
+    def test_modify_state_versioned_locked(self, mock_serial):
+        """
+        With ``versioned_state`` but not ``optimistic_state``, ``modify_state``
+        writes the state conditional on its version and bumps it, reading and
+        modifying it again on conflict, while holding the group's ZooKeeper
+        lock
+        """
+        self.group.versioned_state = True
+        self.returns = self._optimistic_rows(None, 1)
+        modifier = mock.Mock(side_effect=self._new_state)
+        d = self.group.modify_state(modifier)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.connection.execute.mock_calls,
+                         self._optimistic_calls(None, 1))
+        self.assertEqual(modifier.call_count, 2)
+        self.kz_client.Lock.assert_called_once_with(
+            '/locks/' + self.group.uuid)
+        self.lock._acquire.assert_called_once_with(timeout=120)
+        self.lock.release.assert_called_once_with()
+
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.succeed({}))
     def test_update_status(self, mock_vc):
         """
@@ -985,7 +1145,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.fail(NoSuchScalingGroupError('t', 'g')))
     def test_update_status_raises_nogroup_error(self, mock_vc):
         """
@@ -997,25 +1157,25 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.failureResultOf(d, NoSuchScalingGroupError)
         self.assertFalse(self.connection.execute.called)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.succeed({}))
     def test_update_status_deleting(self, mock_vc):
         """
-        Sets "deleting" column to true when status set is DELETING
+        Sets "deleting" column to true when status set is DELETING, if it is
+        not already set
         """
-        self.clock.advance(10.345)
+        self.returns = [[{'[applied]': True}]]
         d = self.group.update_status(ScalingGroupStatus.DELETING)
         self.assertIsNone(self.successResultOf(d))  # update returns None
         expectedCql = (
-            'INSERT INTO scaling_group("tenantId", "groupId", deleting) '
-            'VALUES (:tenantId, :groupId, :deleting) USING TIMESTAMP :ts')
-        expectedData = {"deleting": True,
-                        "groupId": '12345678g',
-                        "tenantId": '11111', 'ts': 10345000}
+            'UPDATE scaling_group SET deleting = true '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+            'IF deleting = false;')
+        expectedData = {"groupId": '12345678g', "tenantId": '11111'}
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.succeed({}))
     def test_update_error_reasons_success(self, mock_vc):
         """
@@ -1033,7 +1193,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.fail(NoSuchScalingGroupError('t', 'g')))
     def test_update_error_reasons_no_group(self, mock_vc):
         """
@@ -1145,7 +1305,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
             matches(IsInstance(NoSuchScalingGroupError)),
             self.mock_log)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.succeed({}))
     def test_update_config(self, view_config):
         """
@@ -1166,7 +1326,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.succeed({}))
     def test_update_launch(self, view_config):
         """
@@ -1187,7 +1347,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config')
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config')
     def test_update_configs_call_view_first(self, view_config):
         """
         When updating a config or launch config, `view_config` is called first
@@ -1227,7 +1387,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.fail(NoSuchScalingGroupError('t', 'g')))
     def test_naive_list_policies_with_no_policies(self, mock_view_config):
         """
@@ -1280,7 +1440,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.fail(NoSuchScalingGroupError('t', 'g')))
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_policies')
     def test_list_policies_with_policies(self, mock_naive, mock_view_config):
@@ -1298,7 +1458,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         mock_naive.assert_called_once_with(limit=100, marker=None)
         self.assertEqual(len(mock_view_config.mock_calls), 0)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.succeed({}))
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_policies',
                 return_value=defer.succeed([]))
@@ -1316,7 +1476,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         mock_naive.assert_called_once_with(limit=100, marker=None)
         mock_view_config.assert_called_with()
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.succeed({}))
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_policies')
     def test_list_policies_passes_limit_and_marker(self, mock_naive, _):
@@ -1333,7 +1493,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
 
         mock_naive.assert_called_once_with(limit=5, marker='blah')
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.fail(NoSuchScalingGroupError('t', 'g')))
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_policies',
                 return_value=defer.succeed([]))
@@ -1358,11 +1518,14 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         r = self.successResultOf(d)
         self.assertEqual(r, [{'id': 'policy1'}, {'id': 'policy3'}])
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.succeed({}))
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_webhooks',
-                return_value=defer.succeed([{'id': 'w1'},
-                                            {'id': 'w2'}]))
+                return_value=defer.succeed(
+                    [{'id': 'w1', 'capability': {'version': '1',
+                                                 'hash': 'h1'}},
+                     {'id': 'w2', 'capability': {'version': '1',
+                                                 'hash': 'h2'}}]))
     def test_delete_policy_valid_policy(self, mock_webhooks, mock_get_policy):
         """
         When you delete a scaling policy, it checks if the policy exists and
@@ -1387,13 +1550,29 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
             "tenantId": self.group.tenant_id,
             "groupId": self.group.uuid,
             "policyId": "3222",
-            "key0webhookKey": 'w1',
-            "key1webhookKey": 'w2'}
+            "key0webhookKey": 'h1',
+            "key1webhookKey": 'h2'}
 
         self.connection.execute.assert_called_once_with(
             expected_cql, expected_data, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
+                return_value=defer.succeed({}))
+    @mock.patch('otter.models.cass.CassScalingGroup._naive_list_webhooks',
+                return_value=defer.succeed(
+                    [{'id': 'w1', 'capability': {'version': '1',
+                                                 'hash': 'h1'}}]))
+    def test_delete_policy_invalidates_cache(self, mock_webhooks,
+                                             mock_get_policy):
+        """
+        The cached capabilities of the deleted policy's webhooks are
+        invalidated after they are deleted
+        """
+        self.group.webhook_cache = mock.Mock(spec=['invalidate'])
+        self.assertIsNone(self.successResultOf(self.group.delete_policy('3')))
+        self.group.webhook_cache.invalidate.assert_called_once_with(['h1'])
+
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.fail(NoSuchPolicyError('t', 'g', 'p')))
     def test_delete_policy_invalid_policy(self, mock_get_policy):
         """
@@ -1406,7 +1585,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.assertFalse(self.connection.execute.called)
         self.flushLoggedErrors(NoSuchPolicyError)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.fail(NoSuchScalingGroupError('t', 'g')))
     def test_update_config_bad(self, mock_vc):
         """
@@ -1421,17 +1600,17 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         When updating a policy, a `get_policy` is called first and if it fails,
         the rest of the update does not continue
         """
-        self.group.get_policy = mock.MagicMock(
+        self.group._get_policy = mock.MagicMock(
             return_value=defer.fail(DummyException("Cassandra failure")))
         self.failureResultOf(self.group.update_policy('1', {'b': 'lah'}),
                              DummyException)
 
         # view is called
-        self.group.get_policy.assert_called_once_with('1')
+        self.group._get_policy.assert_called_once_with('1')
         # but extra executes, to update, are not called
         self.assertFalse(self.connection.execute.called)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.succeed({}))
     def test_add_webhooks_valid_policy_return_value(self, mock_get_policy):
         """
@@ -1464,7 +1643,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
 
         self.assertEqual(result, expected_results)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.succeed({}))
     def test_add_webhooks_valid_policy_check_query(self, mock_get_policy):
         """
@@ -1558,7 +1737,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         d = self.group.create_webhooks('23456789', [{}, {'metadata': 'who'}])
         self.failureResultOf(d, NoSuchPolicyError)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.succeed({}))
     def test_add_webhooks_already_beyond_limits(self, _):
         """
@@ -1579,7 +1758,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_once_with(
             expected_cql, expected_data, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.succeed({}))
     def test_add_many_webhooks_beyond_limits(self, _):
         """
@@ -1618,7 +1797,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
             exp_cql, {'tenantId': self.tenant_id, 'groupId': self.group_id},
             ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.fail(NoSuchPolicyError('t', 'g', 'p')))
     def test_naive_list_webhooks_valid_policy(self, mock_get_policy):
         """
@@ -1656,7 +1835,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
         self.assertEqual(len(mock_get_policy.mock_calls), 0)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.fail(NoSuchPolicyError('t', 'g', 'p')))
     def test_naive_list_webhooks_empty_list(self, mock_get_policy):
         """
@@ -1717,7 +1896,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.succeed({}))
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_webhooks')
     def test_list_webhooks_valid_policy(self, mock_naive, mock_get_policy):
@@ -1741,7 +1920,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         mock_naive.assert_called_once_with('23456789', limit=100, marker=None)
         self.assertEqual(len(mock_get_policy.mock_calls), 0)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.succeed({}))
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_webhooks',
                 return_value=defer.succeed([]))
@@ -1756,7 +1935,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         mock_naive.assert_called_with('23456789', limit=100, marker=None)
         mock_get_policy.assert_called_once_with('23456789')
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.fail(NoSuchPolicyError('t', 'p', 'g')))
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_webhooks',
                 return_value=defer.succeed([]))
@@ -1771,7 +1950,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         mock_get_policy.assert_called_once_with('23456789')
         self.flushLoggedErrors(NoSuchPolicyError)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
                 return_value=defer.succeed({}))
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_webhooks')
     def test_list_webhooks_passes_limit_and_marker(self, mock_naive, _):
@@ -1788,7 +1967,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
 
         mock_naive.assert_called_once_with('1234', limit=5, marker='blah')
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.succeed('watever'))
     def test_view_webhook(self, mock_vc):
         """
@@ -1810,7 +1989,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.assertEqual(
             r, {'name': 'pokey', 'capability': {"version": "1", "hash": "h"}})
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
                 return_value=defer.succeed({}))
     def test_view_webhook_no_such_webhook(self, mock_vc):
         """
@@ -1919,6 +2098,239 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
 
+    @mock.patch('otter.models.cass.CassScalingGroup.get_webhook')
+    def test_delete_webhook_invalidates_cache(self, mock_gw):
+        """
+        The cached capability of the deleted webhook is invalidated after it
+        is deleted
+        """
+        self.returns = [None]
+        mock_gw.return_value = defer.succeed(
+            {'data': '{}', 'capability': {"version": "1", "hash": "h"}})
+        self.group.webhook_cache = mock.Mock(spec=['invalidate'])
+        d = self.group.delete_webhook('3444', '4555')
+        self.assertIsNone(self.successResultOf(d))
+        self.group.webhook_cache.invalidate.assert_called_once_with(['h'])
+
+    def mock_counts(self):
+        """
+        Give the group tenant resource counters whose updates succeed
+        """
+        self.group.counts = mock.Mock(spec=['update'])
+        self.group.counts.update.return_value = defer.succeed(None)
+        return self.group.counts.update
+
+    @mock.patch('otter.models.cass.CassScalingGroup.get_webhook')
+    def test_delete_webhook_counts(self, mock_gw):
+        """
+        Deleting a webhook decrements the tenant's webhook count
+        """
+        update = self.mock_counts()
+        self.returns = [None]
+        mock_gw.return_value = defer.succeed(
+            {'data': '{}', 'capability': {"version": "1", "hash": "h"}})
+        self.assertIsNone(
+            self.successResultOf(self.group.delete_webhook('3444', '4555')))
+        update.assert_called_once_with(mock.ANY, '11111', webhooks=-1)
+
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
+                return_value=defer.succeed({}))
+    def test_add_webhooks_counts(self, mock_get_policy):
+        """
+        Creating webhooks increments the tenant's webhook count by the number
+        of webhooks created
+        """
+        update = self.mock_counts()
+        self.returns = [[{'count': 0}], None]
+        self.successResultOf(self.group.create_webhooks(
+            '23456789', [{'name': 'a'}, {'name': 'b'}]))
+        update.assert_called_once_with(mock.ANY, '11111', webhooks=2)
+
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
+                return_value=defer.succeed({}))
+    def test_add_policies_counts(self, mock_vc):
+        """
+        Creating policies increments the tenant's policy count by the number
+        of policies created
+        """
+        set_config_data({'limits': {'absolute': {'maxPoliciesPerGroup': 10}}})
+        update = self.mock_counts()
+        self.returns = [[{'count': 0}], None]
+        self.successResultOf(
+            self.group.create_policies(group_examples.policy()[:2]))
+        update.assert_called_once_with(mock.ANY, '11111', policies=2)
+
+    @mock.patch('otter.models.cass.CassScalingGroup._get_policy',
+                return_value=defer.succeed({}))
+    @mock.patch('otter.models.cass.CassScalingGroup._naive_list_webhooks',
+                return_value=defer.succeed(
+                    [{'id': 'w1', 'capability': {'version': '1',
+                                                 'hash': 'h1'}},
+                     {'id': 'w2', 'capability': {'version': '1',
+                                                 'hash': 'h2'}}]))
+    def test_delete_policy_counts(self, mock_webhooks, mock_get_policy):
+        """
+        Deleting a policy decrements the tenant's policy count and its webhook
+        count by the number of the policy's webhooks
+        """
+        update = self.mock_counts()
+        self.assertIsNone(self.successResultOf(self.group.delete_policy('3')))
+        update.assert_called_once_with(
+            mock.ANY, '11111', policies=-1, webhooks=-2)
+
+    @mock.patch('otter.models.cass.CassScalingGroup._view_config',
+                return_value=defer.succeed({}))
+    def test_update_status_deleting_counts(self, mock_vc):
+        """
+        A group being deleted is not counted anymore, and is only uncounted
+        by the call that marked it as deleting
+        """
+        update = self.mock_counts()
+        self.returns = [[{'[applied]': True}], [{'[applied]': False}]]
+        for _ in range(2):
+            d = self.group.update_status(ScalingGroupStatus.DELETING)
+            self.assertIsNone(self.successResultOf(d))
+        update.assert_called_once_with(mock.ANY, '11111', groups=-1)
+
+    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._naive_list_all_webhooks')
+    def test_delete_group_counts(self, mock_naive, mock_view_state):
+        """
+        Deleting a group decrements the tenant's counts by the group, its
+        policies, counted before they are deleted, and its webhooks. A group
+        already being deleted is not counted again.
+        """
+        update = self.mock_counts()
+        mock_naive.side_effect = lambda: defer.succeed(
+            [{'webhookKey': 'w1'}, {'webhookKey': 'w2'}])
+        for status, groups in [(ScalingGroupStatus.ACTIVE, -1),
+                               (ScalingGroupStatus.DELETING, 0)]:
+            mock_view_state.return_value = defer.succeed(GroupState(
+                self.tenant_id, self.group_id, '', {}, {}, None, {}, False,
+                status))
+            self.returns = [[{'count': 3}], None]
+            self.assertIsNone(self.successResultOf(self.group.delete_group()))
+            update.assert_called_with(
+                mock.ANY, '11111', groups=groups, policies=-3, webhooks=-2)
+        self.connection.execute.assert_any_call(
+            'SELECT COUNT(*) FROM scaling_policies WHERE "tenantId" = '
+            ':tenantId AND "groupId" = :groupId;',
+            {'tenantId': '11111', 'groupId': '12345678g'},
+            ConsistencyLevel.QUORUM)
+
+    def test_view_config_cached(self):
+        """
+        With a group cache, the config and launch config are read from
+        cassandra only once as long as the time they were written does not
+        change, and are invalidated when updated
+        """
+        self.group.group_cache = GroupConfigCache(Clock(), fresh_ttl=0)
+        self.returns = [[{'group_config': '{"a": 1}', 'created_at': 24,
+                          'writetime(group_config)': 1}],
+                        [{'launch_config': '{"b": 2}', 'created_at': 24,
+                          'writetime(launch_config)': 1}],
+                        [{'writetime(group_config)': 1}],
+                        [{'writetime(launch_config)': 1}]]
+        for _ in range(2):
+            self.assertEqual(self.successResultOf(self.group.view_config()),
+                             {"a": 1})
+            self.assertEqual(
+                self.successResultOf(self.group.view_launch_config()),
+                {"b": 2})
+        self.assertEqual(self.connection.execute.call_count, 4)
+        self.connection.execute.assert_any_call(
+            'SELECT WRITETIME(group_config) FROM scaling_group '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+            'AND deleting=false;',
+            {'tenantId': self.tenant_id, 'groupId': self.group_id},
+            ConsistencyLevel.QUORUM)
+
+        # Changed by another node
+        self.returns = [[{'writetime(group_config)': 2}],
+                        [{'group_config': '{"a": 3}', 'created_at': 24,
+                          'writetime(group_config)': 2}]]
+        self.assertEqual(self.successResultOf(self.group.view_config()),
+                         {"a": 3})
+
+        # Changed by this node
+        self.returns = [[{'group_config': '{}', 'created_at': 24}], None,
+                        [{'group_config': '{"a": 4}', 'created_at': 24,
+                          'writetime(group_config)': 3}]]
+        self.successResultOf(self.group.update_config({"a": 4}))
+        self.assertEqual(self.successResultOf(self.group.view_config()),
+                         {"a": 4})
+        self.assertEqual(self.connection.execute.call_count, 9)
+
+    def test_view_config_cached_fresh(self):
+        """
+        With a group cache, the config is not read again nor its write time
+        checked within the cache's ``fresh_ttl`` of reading it
+        """
+        clock = Clock()
+        self.group.group_cache = GroupConfigCache(clock, fresh_ttl=1)
+        self.returns = [[{'group_config': '{"a": 1}', 'created_at': 24,
+                          'writetime(group_config)': 1}],
+                        [{'writetime(group_config)': 1}]]
+        for _ in range(2):
+            self.assertEqual(self.successResultOf(self.group.view_config()),
+                             {"a": 1})
+        self.assertEqual(self.connection.execute.call_count, 1)
+        clock.advance(1)
+        self.assertEqual(self.successResultOf(self.group.view_config()),
+                         {"a": 1})
+        self.assertEqual(self.connection.execute.call_count, 2)
+
+    def test_view_config_cached_group_deleted(self):
+        """
+        With a group cache, a cached config of a group that does not exist
+        anymore is not returned
+        """
+        self.group.group_cache = GroupConfigCache(Clock(), fresh_ttl=0)
+        self.returns = [[{'group_config': '{"a": 1}', 'created_at': 24,
+                          'writetime(group_config)': 1}], [], []]
+        self.successResultOf(self.group.view_config())
+        self.failureResultOf(self.group.view_config(),
+                             NoSuchScalingGroupError)
+
+    def test_get_policy_cached(self):
+        """
+        With a group cache, a policy is read from cassandra only once as long
+        as its version does not change, and is not returned once it is
+        deleted
+        """
+        self.group.group_cache = GroupConfigCache(Clock(), fresh_ttl=0)
+        self.returns = [[{'group_config': '{}', 'created_at': 24}],
+                        [{'data': '{"a": 1}', 'version': 'v1'}],
+                        [{'version': 'v1'}]]
+        for version in [None, 'v1']:
+            d = self.group.get_policy('3444', version)
+            self.assertEqual(self.successResultOf(d), {"a": 1})
+        self.assertEqual(self.connection.execute.call_count, 3)
+        self.connection.execute.assert_called_with(
+            'SELECT version FROM scaling_policies '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+            'AND "policyId" = :policyId;',
+            {'tenantId': self.tenant_id, 'groupId': self.group_id,
+             'policyId': '3444'},
+            ConsistencyLevel.QUORUM)
+
+        self.returns = [[{'version': 'v1'}]]
+        d = self.group.get_policy('3444', 'v2')
+        self.failureResultOf(d, NoSuchPolicyError)
+
+        # Updated by another node
+        self.returns = [[{'version': 'v2'}],
+                        [{'group_config': '{}', 'created_at': 24}],
+                        [{'data': '{"a": 2}', 'version': 'v2'}]]
+        d = self.group.get_policy('3444', 'v2')
+        self.assertEqual(self.successResultOf(d), {"a": 2})
+
+        # Deleted by another node
+        self.returns = [[], [{'group_config': '{}', 'created_at': 24}], []]
+        d = self.group.get_policy('3444')
+        self.failureResultOf(d, NoSuchPolicyError)
+        self.assertEqual(self.connection.execute.call_count, 10)
+
     @mock.patch('otter.models.cass.CassScalingGroup.get_webhook',
                 return_value=defer.fail(NoSuchWebhookError(*range(4))))
     def test_delete_non_existant_webhooks(self, mock_gw):
@@ -1977,13 +2389,15 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
                                                       mock_view_state):
         """
         ``delete_group`` deletes config, launch config, state, and the group's
-        policies and webhooks if the scaling group is empty.
+        policies and webhooks if the scaling group is empty. The webhooks'
+        cached capabilities are invalidated.
         """
         mock_view_state.return_value = defer.succeed(GroupState(
             self.tenant_id, self.group_id, '', {}, {}, None, {}, False,
             ScalingGroupStatus.ACTIVE))
         mock_naive.return_value = defer.succeed(
             [{'webhookKey': 'w1'}, {'webhookKey': 'w2'}])
+        self.group.webhook_cache = mock.Mock(spec=['invalidate'])
 
         self.returns = [None]
         self.clock.advance(34.575)
@@ -2019,6 +2433,8 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
 
         self.connection.execute.assert_called_once_with(
             expected_cql, expected_data, ConsistencyLevel.QUORUM)
+        self.group.webhook_cache.invalidate.assert_called_once_with(
+            ['w1', 'w2'])
 
         self.kz_client.Lock.assert_called_once_with(
             '/locks/' + self.group.uuid)
@@ -2027,6 +2443,28 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.kz_client.delete.assert_called_once_with(
             '/locks/' + self.group.uuid)
 
+    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._naive_list_all_webhooks')
+    def test_delete_group_servers_cache_delta(self, mock_naive,
+                                              mock_view_state):
+        """
+        ``delete_group`` also deletes the group's servers cache in the delta
+        layout if it is enabled
+        """
+        set_config_data({'servers_cache': {'delta': True}})
+        mock_view_state.return_value = defer.succeed(GroupState(
+            self.tenant_id, self.group_id, '', {}, {}, None, {}, False,
+            ScalingGroupStatus.ACTIVE))
+        mock_naive.return_value = defer.succeed([])
+        self.returns = [None]
+        self.successResultOf(self.group.delete_group())
+        query = self.connection.execute.call_args[0][0]
+        self.assertIn(
+            'DELETE FROM servers_cache '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+            'DELETE FROM servers_cache_delta '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId ', query)
+
     @mock.patch('otter.models.cass.CassScalingGroup.view_state')
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_all_webhooks')
     def test_delete_empty_scaling_group_with_zero_policies(self, mock_naive,
@@ -2157,7 +2595,7 @@ class GetPolicyTests(CassScalingGroupTestCase):
         """ Mock view_config """
         super(GetPolicyTests, self).setUp()
         self.mock_vc = patch(
-            self, 'otter.models.cass.CassScalingGroup.view_config',
+            self, 'otter.models.cass.CassScalingGroup._view_config',
             return_value=defer.succeed({}))
 
     def test_view_policy(self):
@@ -2468,7 +2906,7 @@ class CassScalingGroupUpdatePolicyTests(CassScalingGroupTestCase):
         """
         super(CassScalingGroupUpdatePolicyTests, self).setUp()
         self.get_policy = patch(
-            self, 'otter.models.cass.CassScalingGroup.get_policy')
+            self, 'otter.models.cass.CassScalingGroup._get_policy')
 
     def validate_policy_update(self, policy_json):
         """
@@ -2517,6 +2955,9 @@ class CassScalingGroupUpdatePolicyTests(CassScalingGroupTestCase):
         expected_cql = (
             'BEGIN BATCH '
 
+            'UPDATE scaling_schedule_buckets SET changed = :version '
+            'WHERE bucket = :bucket '
+
             'INSERT INTO scaling_schedule_v2(bucket, "tenantId", "groupId", '
             '"policyId", trigger, cron, version) '
             'VALUES (:bucket, :tenantId, :groupId, :policyId, :trigger, '
@@ -2562,6 +3003,9 @@ class CassScalingGroupUpdatePolicyTests(CassScalingGroupTestCase):
         expected_cql = (
             'BEGIN BATCH '
 
+            'UPDATE scaling_schedule_buckets SET changed = :version '
+            'WHERE bucket = :bucket '
+
             'INSERT INTO scaling_schedule_v2(bucket, "tenantId", "groupId", '
             '"policyId", trigger, version) '
             'VALUES (:bucket, :tenantId, :groupId, :policyId, :trigger, '
@@ -2597,6 +3041,9 @@ class CassScalingGroupUpdatePolicyTests(CassScalingGroupTestCase):
         expected_cql = (
             'BEGIN BATCH '
 
+            'UPDATE scaling_schedule_buckets SET changed = :version '
+            'WHERE bucket = :bucket '
+
             'INSERT INTO scaling_schedule_v2(bucket, "tenantId", "groupId", '
             '"policyId", trigger, cron, version) '
             'VALUES (:bucket, :tenantId, :groupId, :policyId, :trigger, '
@@ -2645,7 +3092,7 @@ class ScalingGroupAddPoliciesTests(CassScalingGroupTestCase):
         """
         super(ScalingGroupAddPoliciesTests, self).setUp()
         self.view_config = patch(
-            self, 'otter.models.cass.CassScalingGroup.view_config',
+            self, 'otter.models.cass.CassScalingGroup._view_config',
             return_value=defer.succeed({}))
         set_config_data(
             {'limits': {'absolute': {'maxPoliciesPerGroup': 1000}}})
@@ -2692,11 +3139,12 @@ class ScalingGroupAddPoliciesTests(CassScalingGroupTestCase):
         Before a policy is added, `view_config` is first called to determine
         that there is such a scaling group
         """
-        self.group.view_config = mock.MagicMock(return_value=defer.succeed({}))
+        self.group._view_config = mock.MagicMock(
+            return_value=defer.succeed({}))
         self.returns = [[{'count': 0}], None]
         d = self.group.create_policies([{"b": "lah"}])
         self.successResultOf(d)
-        self.group.view_config.assert_called_once_with()
+        self.group._view_config.assert_called_once_with()
 
     def test_add_scaling_policy(self):
         """
@@ -2752,6 +3200,9 @@ class ScalingGroupAddPoliciesTests(CassScalingGroupTestCase):
             'VALUES (:tenantId, :groupId, :policy0policyId, :policy0data, '
             ':policy0version) '
 
+            'UPDATE scaling_schedule_buckets SET changed = :policy0version '
+            'WHERE bucket = :policy0bucket '
+
             'INSERT INTO scaling_schedule_v2(bucket, "tenantId", "groupId", '
             '"policyId", '
             'trigger, version) '
@@ -2796,6 +3247,9 @@ class ScalingGroupAddPoliciesTests(CassScalingGroupTestCase):
             'VALUES (:tenantId, :groupId, :policy0policyId, :policy0data, '
             ':policy0version) '
 
+            'UPDATE scaling_schedule_buckets SET changed = :policy0version '
+            'WHERE bucket = :policy0bucket '
+
             'INSERT INTO scaling_schedule_v2(bucket, "tenantId", "groupId", '
             '"policyId", trigger, cron, version) '
             'VALUES (:policy0bucket, :tenantId, :groupId, :policy0policyId, '
@@ -2978,10 +3432,14 @@ class CassScalingScheduleCollectionTestCase(
             '"policyId", trigger, cron, version) '
             'VALUES (:event0bucket, :event0tenantId, :event0groupId, '
             ':event0policyId, :event0trigger, :event0cron, :event0version); '
+            'UPDATE scaling_schedule_buckets SET changed = :event0version '
+            'WHERE bucket = :event0bucket; '
             'INSERT INTO scaling_schedule_v2(bucket, "tenantId", "groupId", '
             '"policyId", trigger, cron, version) '
             'VALUES (:event1bucket, :event1tenantId, :event1groupId, '
             ':event1policyId, :event1trigger, :event1cron, :event1version); '
+            'UPDATE scaling_schedule_buckets SET changed = :event1version '
+            'WHERE bucket = :event1bucket; '
 
             'APPLY BATCH;')
         data = {'event0bucket': 2,
@@ -3006,6 +3464,42 @@ class CassScalingScheduleCollectionTestCase(
         self.connection.execute.assert_called_once_with(
             cql, data, ConsistencyLevel.ONE)
 
+    def test_get_events(self):
+        """
+        `get_events` fetches events triggering until the given time without
+        deleting them
+        """
+        events = [{'tenantId': '1d2', 'groupId': 'gr2', 'policyId': 'ef',
+                   'trigger': 100, 'cron': 'c1', 'version': 'v1'}]
+        self.returns = [events]
+
+        d = self.collection.get_events(2, 1234, 10)
+
+        self.assertEqual(self.successResultOf(d), events)
+        self.connection.execute.assert_called_once_with(
+            'SELECT "tenantId", "groupId", "policyId", "trigger", '
+            'cron, version FROM scaling_schedule_v2 '
+            'WHERE bucket = :bucket AND trigger <= :now LIMIT :size;',
+            {'bucket': 2, 'now': 1234, 'size': 10},
+            ConsistencyLevel.QUORUM)
+
+    def test_get_bucket_changes(self):
+        """
+        `get_bucket_changes` gets the change markers of the given buckets in
+        a single query
+        """
+        self.returns = [[{'bucket': 2, 'changed': 'c2'},
+                         {'bucket': 5, 'changed': 'c5'}]]
+
+        d = self.collection.get_bucket_changes([2, 3, 5])
+
+        self.assertEqual(self.successResultOf(d), {2: 'c2', 5: 'c5'})
+        self.connection.execute.assert_called_once_with(
+            'SELECT bucket, changed FROM scaling_schedule_buckets '
+            'WHERE bucket IN (:bucket0, :bucket1, :bucket2);',
+            {'bucket0': 2, 'bucket1': 3, 'bucket2': 5},
+            ConsistencyLevel.QUORUM)
+
     def test_get_oldest_event(self):
         """
         Tests for `get_oldest_event`
@@ -3557,6 +4051,8 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
         self.assertEqual(g.uuid, '12345678')
         self.assertEqual(g.tenant_id, '123')
         self.assertIs(g.local_locks, self.collection.local_locks)
+        self.assertIs(g.webhook_cache, self.collection.webhook_cache)
+        self.assertIs(g.group_cache, self.collection.group_cache)
 
     def test_webhook_info_by_hash(self):
         """
@@ -3590,6 +4086,22 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.ONE)
 
+    def test_webhook_info_by_hash_cached(self):
+        """
+        `webhook_info_by_hash` caches found and unrecognized capabilities
+        """
+        self.returns = [
+            _cassandrify_data([
+                {'tenantId': '123', 'groupId': 'group1', 'policyId': 'pol1'}]),
+            []]
+        for _ in range(2):
+            d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
+            self.assertEqual(self.successResultOf(d),
+                             ('123', 'group1', 'pol1'))
+            d = self.collection.webhook_info_by_hash(self.mock_log, 'y')
+            self.failureResultOf(d, UnrecognizedCapabilityError)
+        self.assertEqual(self.connection.execute.call_count, 2)
+
     def test_get_counts(self):
         """
         Check get_count returns dictionary in proper format
@@ -3623,6 +4135,71 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
         self.assertEquals(result, expectedResults)
         self.connection.execute.assert_has_calls(calls)
 
+    def test_get_counts_from_counters(self):
+        """
+        With tenant resource counters, `get_counts` and `get_groups_count`
+        read the counters instead of counting rows
+        """
+        counts = {'groups': 1, 'policies': 2, 'webhooks': 3}
+        self.collection.counts = mock.Mock(spec=['get_counts'])
+        self.collection.counts.get_counts.side_effect = (
+            lambda tenant_id: defer.succeed(counts))
+        self.assertEqual(
+            self.successResultOf(
+                self.collection.get_counts(self.mock_log, '123')),
+            counts)
+        self.assertEqual(
+            self.successResultOf(
+                self.collection.get_groups_count(self.mock_log, '123')),
+            1)
+        self.collection.counts.get_counts.assert_called_with('123')
+        self.assertFalse(self.connection.execute.called)
+
+    def test_create_counts(self):
+        """
+        Creating a group with policies increments the tenant's group and
+        policy counts, and the groups are counted using the counters
+        """
+        counts = self.collection.counts = mock.Mock(
+            spec=['get_counts', 'update'])
+        counts.get_counts.return_value = defer.succeed({'groups': 0})
+        counts.update.return_value = defer.succeed(None)
+        self.returns = [None]
+        self.successResultOf(self.collection.create_scaling_group(
+            self.mock_log, '123', self.config, self.launch,
+            group_examples.policy()[:2]))
+        counts.get_counts.assert_called_once_with('123')
+        counts.update.assert_called_once_with(
+            matches(IsInstance(type(self.mock_log))), '123', groups=1,
+            policies=2)
+
+    def test_get_scaling_group_optimistic_state(self):
+        """
+        Groups got from the collection have versioned states if the tenant
+        is a convergence tenant, and modify them optimistically only if the
+        collection does too
+        """
+        set_config_data({'convergence-tenants': ['123']})
+        self.addCleanup(set_config_data, {})
+        get = partial(self.collection.get_scaling_group, self.mock_log)
+
+        def flags(group):
+            return group.versioned_state, group.optimistic_state
+
+        self.assertEqual(flags(get('123', 'g')), (True, False))
+        self.assertEqual(flags(get('234', 'g')), (False, False))
+        self.collection.optimistic_state = True
+        self.assertEqual(flags(get('123', 'g')), (True, True))
+        self.assertEqual(flags(get('234', 'g')), (False, False))
+
+    def test_get_scaling_group_counts(self):
+        """
+        Groups got from the collection share its counters
+        """
+        self.collection.counts = object()
+        group = self.collection.get_scaling_group(self.mock_log, '123', 'g')
+        self.assertIs(group.counts, self.collection.counts)
+
 
 class CassScalingGroupsCollectionHealthCheckTestCase(
         IScalingGroupCollectionProviderMixin, LockMixin, SynchronousTestCase):
@@ -3813,6 +4390,72 @@ class CassGroupServersCacheTests(SynchronousTestCase):
               "server_as_active": True}],
             ([{"d": "e"}], self.dt))
 
+    def _get_servers_of_groups_query(self, num_groups):
+        groups = ', '.join(':groupId{}'.format(i) for i in range(num_groups))
+        return ('SELECT "groupId", server_blob, server_as_active, '
+                'last_update FROM servers_cache '
+                'WHERE "tenantId"=:tenantId AND "groupId" IN '
+                '({});'.format(groups))
+
+    def test_get_servers_of_groups(self):
+        """
+        `get_servers_of_groups` fetches latest cache of each group in
+        parallel queries of `batch_size` groups each. Groups without cache
+        get ([], None)
+        """
+        dt_earlier = datetime(2010, 10, 15, 10, 0, 0)
+        eff = CassScalingGroupServersCache.get_servers_of_groups(
+            'tid', ['g1', 'g2', 'g3'], False, batch_size=2)
+        sequence = [
+            parallel_sequence([
+                [(CQLQueryExecute(
+                    query=self._get_servers_of_groups_query(2),
+                    params={'tenantId': 'tid', 'groupId0': 'g1',
+                            'groupId1': 'g2'},
+                    consistency_level=ConsistencyLevel.QUORUM),
+                  lambda i: [
+                      {'groupId': 'g1', 'server_blob': '{"c": "f"}',
+                       'last_update': dt_earlier, 'server_as_active': True},
+                      {'groupId': 'g1', 'server_blob': '{"a": "b"}',
+                       'last_update': self.dt, 'server_as_active': False}])],
+                [(CQLQueryExecute(
+                    query=self._get_servers_of_groups_query(1),
+                    params={'tenantId': 'tid', 'groupId0': 'g3'},
+                    consistency_level=ConsistencyLevel.QUORUM),
+                  lambda i: [
+                      {'groupId': 'g3', 'server_blob': '{"d": "e"}',
+                       'last_update': self.dt, 'server_as_active': True}])]
+            ])
+        ]
+        self.assertEqual(
+            perform_sequence(sequence, eff),
+            {'g1': ([{"a": "b"}], self.dt),
+             'g2': ([], None),
+             'g3': ([{"d": "e"}], self.dt)})
+
+    def test_get_servers_of_groups_as_active(self):
+        """
+        `get_servers_of_groups` returns only AS active servers if asked
+        """
+        eff = CassScalingGroupServersCache.get_servers_of_groups(
+            'tid', ['g1'], True)
+        sequence = [
+            parallel_sequence([
+                [(CQLQueryExecute(
+                    query=self._get_servers_of_groups_query(1),
+                    params={'tenantId': 'tid', 'groupId0': 'g1'},
+                    consistency_level=ConsistencyLevel.QUORUM),
+                  lambda i: [
+                      {'groupId': 'g1', 'server_blob': '{"a": "b"}',
+                       'last_update': self.dt, 'server_as_active': False},
+                      {'groupId': 'g1', 'server_blob': '{"d": "e"}',
+                       'last_update': self.dt, 'server_as_active': True}])]
+            ])
+        ]
+        self.assertEqual(
+            perform_sequence(sequence, eff),
+            {'g1': ([{"d": "e"}], self.dt)})
+
     def _test_insert_servers(self, eff, ts=2500000):
         query = (
             'BEGIN BATCH USING TIMESTAMP {} '
@@ -3846,10 +4489,10 @@ class CassGroupServersCacheTests(SynchronousTestCase):
         `insert_servers` deletes existing caches before inserting
         when clear_others=True
         """
-        self.cache.delete_servers = lambda: Effect("delete")
+        self.cache._delete_tables = lambda tables: Effect(("delete", tables))
         eff = self.cache.insert_servers(
             self.dt, [{"id": "a", "_is_as_active": True}, {"id": "b"}], True)
-        self.assertEqual(eff.intent, "delete")
+        self.assertEqual(eff.intent, ("delete", ["servers_cache"]))
         self.clock.advance(1)
         eff = resolve_effect(eff, None)
         self._test_insert_servers(eff, 3500000)
@@ -3873,6 +4516,323 @@ class CassGroupServersCacheTests(SynchronousTestCase):
                     merge(self.params, {"ts": 2500000})))
 
 
+class CassGroupServersCacheDeltaTests(SynchronousTestCase):
+    """
+    Tests for :class:`CassScalingGroupServersCache` using the delta layout
+    """
+
+    def setUp(self):
+        self.params = {"tenantId": 'tid', "groupId": 'gid'}
+        self.clock = Clock()
+        self.clock.advance(2.5)
+        self.cache = CassScalingGroupServersCache(
+            'tid', 'gid', self.clock, delta=True, dual_write=False)
+        self.dt = datetime(2010, 10, 20, 10, 0, 0)
+        self.legacy_read = CQLQueryExecute(
+            query=('SELECT server_blob, server_as_active, last_update '
+                   'FROM servers_cache '
+                   'WHERE "tenantId"=:tenantId AND "groupId"=:groupId '
+                   'ORDER BY last_update DESC;'),
+            params=self.params, consistency_level=ConsistencyLevel.QUORUM)
+        self.read = CQLQueryExecute(
+            query=('SELECT server_id, server_blob, server_as_active, '
+                   'last_update FROM servers_cache_delta '
+                   'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;'),
+            params=self.params, consistency_level=ConsistencyLevel.QUORUM)
+
+    def row(self, server_id, blob, as_active=False):
+        return {"server_id": server_id, "server_blob": blob,
+                "server_as_active": as_active, "last_update": self.dt}
+
+    def test_delta_default(self):
+        """
+        The delta layout is used if configured
+        """
+        self.addCleanup(set_config_data, {})
+        self.assertFalse(CassScalingGroupServersCache('t', 'g').delta)
+        set_config_data({'servers_cache': {'delta': True}})
+        self.assertTrue(CassScalingGroupServersCache('t', 'g').delta)
+
+    def test_dual_write_default(self):
+        """
+        The legacy layout is also written if configured
+        """
+        self.addCleanup(set_config_data, {})
+        self.assertFalse(CassScalingGroupServersCache('t', 'g').dual_write)
+        set_config_data({'servers_cache': {'delta': True, 'dual_write': True}})
+        self.assertTrue(CassScalingGroupServersCache('t', 'g').dual_write)
+
+    def test_get_servers(self):
+        """
+        `get_servers` returns all the servers of the group in the delta
+        layout, or only the AS active ones
+        """
+        rows = [self.row('a', '{"a": "b"}'), self.row('d', '{"d": "e"}', True)]
+        sequence = [(self.read, lambda i: rows)]
+        self.assertEqual(
+            perform_sequence(sequence, self.cache.get_servers(False)),
+            ([{"a": "b"}, {"d": "e"}], self.dt))
+        sequence = [(self.read, lambda i: rows)]
+        self.assertEqual(
+            perform_sequence(sequence, self.cache.get_servers(True)),
+            ([{"d": "e"}], self.dt))
+
+    def test_get_servers_no_servers(self):
+        """
+        `get_servers` returns no servers with the cache's update time if the
+        group's partition only has the static update time
+        """
+        sequence = [(self.read, lambda i: [self.row(None, None)])]
+        self.assertEqual(
+            perform_sequence(sequence, self.cache.get_servers(False)),
+            ([], self.dt))
+
+    def test_get_servers_legacy(self):
+        """
+        `get_servers` reads the legacy cache if the group has no cache in
+        the delta layout
+        """
+        sequence = [
+            (self.read, lambda i: []),
+            (self.legacy_read, lambda i: [self.row('a', '{"a": "b"}')])]
+        self.assertEqual(
+            perform_sequence(sequence, self.cache.get_servers(False)),
+            ([{"a": "b"}], self.dt))
+
+    def test_get_servers_dual_write(self):
+        """
+        With `dual_write`, `get_servers` reads both layouts and returns the
+        cache that was updated last, preferring the delta layout
+        """
+        self.cache.dual_write = True
+        later = datetime(2010, 10, 20, 10, 0, 1)
+        delta_rows = [self.row('a', '{"a": "b"}')]
+        for legacy_update, expected in [
+                (later, ([{"c": "d"}], later)),
+                (self.dt, ([{"a": "b"}], self.dt))]:
+            legacy_rows = [assoc(self.row('c', '{"c": "d"}'), 'last_update',
+                                 legacy_update)]
+            sequence = [(self.read, lambda i: delta_rows),
+                        (self.legacy_read, lambda i: legacy_rows)]
+            self.assertEqual(
+                perform_sequence(sequence, self.cache.get_servers(False)),
+                expected)
+
+    def test_get_servers_of_groups(self):
+        """
+        `get_servers_of_groups` reads the groups from the delta layout and
+        the ones without cache there from the legacy table
+        """
+        eff = CassScalingGroupServersCache.get_servers_of_groups(
+            'tid', ['g1', 'g2'], False, delta=True)
+        sequence = [
+            parallel_sequence([
+                [(CQLQueryExecute(
+                    query=('SELECT "groupId", server_id, server_blob, '
+                           'server_as_active, last_update '
+                           'FROM servers_cache_delta WHERE '
+                           '"tenantId"=:tenantId AND "groupId" IN '
+                           '(:groupId0, :groupId1);'),
+                    params={'tenantId': 'tid', 'groupId0': 'g1',
+                            'groupId1': 'g2'},
+                    consistency_level=ConsistencyLevel.QUORUM),
+                  lambda i: [assoc(self.row('a', '{"a": "b"}'),
+                                   'groupId', 'g1')])]
+            ]),
+            parallel_sequence([
+                [(CQLQueryExecute(
+                    query=('SELECT "groupId", server_blob, server_as_active, '
+                           'last_update FROM servers_cache '
+                           'WHERE "tenantId"=:tenantId AND "groupId" IN '
+                           '(:groupId0);'),
+                    params={'tenantId': 'tid', 'groupId0': 'g2'},
+                    consistency_level=ConsistencyLevel.QUORUM),
+                  lambda i: [assoc(self.row('c', '{"c": "d"}'),
+                                   'groupId', 'g2')])]
+            ])
+        ]
+        self.assertEqual(
+            perform_sequence(sequence, eff),
+            {'g1': ([{"a": "b"}], self.dt), 'g2': ([{"c": "d"}], self.dt)})
+
+    def test_get_servers_of_groups_dual_write(self):
+        """
+        With `dual_write`, `get_servers_of_groups` reads all the groups from
+        both layouts and takes the cache updated last for each group
+        """
+        later = datetime(2010, 10, 20, 10, 0, 1)
+        eff = CassScalingGroupServersCache.get_servers_of_groups(
+            'tid', ['g1', 'g2'], False, delta=True, dual_write=True)
+        sequence = [
+            parallel_sequence([
+                [(CQLQueryExecute(
+                    query=('SELECT "groupId", server_id, server_blob, '
+                           'server_as_active, last_update '
+                           'FROM servers_cache_delta WHERE '
+                           '"tenantId"=:tenantId AND "groupId" IN '
+                           '(:groupId0, :groupId1);'),
+                    params={'tenantId': 'tid', 'groupId0': 'g1',
+                            'groupId1': 'g2'},
+                    consistency_level=ConsistencyLevel.QUORUM),
+                  lambda i: [assoc(self.row('a', '{"a": "b"}'),
+                                   'groupId', 'g1'),
+                             assoc(self.row('e', '{"e": "f"}'),
+                                   'groupId', 'g2')])]
+            ]),
+            parallel_sequence([
+                [(CQLQueryExecute(
+                    query=('SELECT "groupId", server_blob, server_as_active, '
+                           'last_update FROM servers_cache '
+                           'WHERE "tenantId"=:tenantId AND "groupId" IN '
+                           '(:groupId0, :groupId1);'),
+                    params={'tenantId': 'tid', 'groupId0': 'g1',
+                            'groupId1': 'g2'},
+                    consistency_level=ConsistencyLevel.QUORUM),
+                  lambda i: [merge(self.row('c', '{"c": "d"}'),
+                                   {'groupId': 'g1', 'last_update': later}),
+                             merge(self.row('g', '{"g": "h"}'),
+                                   {'groupId': 'g2'})])]
+            ])
+        ]
+        self.assertEqual(
+            perform_sequence(sequence, eff),
+            {'g1': ([{"c": "d"}], later), 'g2': ([{"e": "f"}], self.dt)})
+
+    def _insert_query(self, i):
+        return (
+            'INSERT INTO servers_cache_delta ("tenantId", "groupId", '
+            'server_id, server_blob, server_as_active, updated) '
+            'VALUES(:tenantId, :groupId, :server_id{i}, :server_blob{i}, '
+            ':server_as_active{i}, :last_update);').format(i=i)
+
+    def _update_query(self):
+        return ('UPDATE servers_cache_delta SET last_update=:last_update '
+                'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
+
+    def test_insert_servers(self):
+        """
+        `insert_servers` writes only the servers that changed, deletes the
+        ones that are gone and updates the cache's update time, all in one
+        batch
+        """
+        rows = [self.row('a', '{"id": "a"}', True),
+                self.row('b', '{"id": "b"}'),
+                self.row('c', '{"id": "c"}')]
+        servers = [{"id": "a", "_is_as_active": True},
+                   {"id": "b", "_is_as_active": True}, {"id": "d"}]
+        query = batch(
+            [self._insert_query(1), self._insert_query(2),
+             'DELETE FROM servers_cache_delta WHERE "tenantId"=:tenantId AND '
+             '"groupId"=:groupId AND server_id=:deleted_id0;',
+             self._update_query()],
+            2500000)
+        params = merge(self.params, {
+            "last_update": self.dt,
+            "server_id1": "b", "server_blob1": '{"id": "b"}',
+            "server_as_active1": True,
+            "server_id2": "d", "server_blob2": '{"id": "d"}',
+            "server_as_active2": False,
+            "deleted_id0": "c"})
+        sequence = [(self.read, lambda i: rows),
+                    (CQLQueryExecute(
+                        query=query, params=params,
+                        consistency_level=ConsistencyLevel.QUORUM),
+                     noop)]
+        self.assertIsNone(perform_sequence(
+            sequence, self.cache.insert_servers(self.dt, servers, True)))
+
+    def test_insert_servers_not_clear_others(self):
+        """
+        `insert_servers` deletes the servers that are not given even when
+        `clear_others` is False, since the delta layout keeps only the latest
+        cache
+        """
+        query = batch(
+            ['DELETE FROM servers_cache_delta WHERE "tenantId"=:tenantId AND '
+             '"groupId"=:groupId AND server_id=:deleted_id0;',
+             self._update_query()],
+            2500000)
+        sequence = [(self.read, lambda i: [self.row('a', '{"id": "a"}'),
+                                           self.row('c', '{"id": "c"}')]),
+                    (CQLQueryExecute(
+                        query=query,
+                        params=merge(self.params, {"last_update": self.dt,
+                                                   "deleted_id0": "c"}),
+                        consistency_level=ConsistencyLevel.QUORUM),
+                     noop)]
+        self.assertIsNone(perform_sequence(
+            sequence, self.cache.insert_servers(self.dt, [{"id": "a"}],
+                                                False)))
+
+    def test_insert_servers_dual_write(self):
+        """
+        With `dual_write`, `insert_servers` writes the servers in the legacy
+        layout too, and keeps the legacy cache on the first update in the
+        delta layout
+        """
+        self.cache.dual_write = True
+        servers = [{"id": "a", "_is_as_active": True}]
+        legacy_query = batch(
+            ['INSERT INTO servers_cache ("tenantId", "groupId", last_update, '
+             'server_id, server_blob, server_as_active) '
+             'VALUES(:tenantId, :groupId, :last_update, :server_id0, '
+             ':server_blob0, :server_as_active0);'],
+            2500000)
+        delta_query = batch([self._insert_query(0), self._update_query()],
+                            2500000)
+        params = merge(self.params, {
+            "last_update": self.dt,
+            "server_id0": "a", "server_blob0": '{"id": "a"}',
+            "server_as_active0": True})
+        sequence = [
+            (CQLQueryExecute(query=legacy_query, params=params,
+                             consistency_level=ConsistencyLevel.QUORUM),
+             noop),
+            (self.read, lambda i: []),
+            (CQLQueryExecute(query=delta_query, params=params,
+                             consistency_level=ConsistencyLevel.QUORUM),
+             noop)]
+        self.assertIsNone(perform_sequence(
+            sequence, self.cache.insert_servers(self.dt, servers, False)))
+        self.assertEqual(servers, [{"id": "a"}])
+
+    def test_insert_servers_first(self):
+        """
+        The first `insert_servers` in the delta layout writes all the
+        servers and deletes the group's legacy cache
+        """
+        query = batch(
+            [self._insert_query(0), self._update_query(),
+             'DELETE FROM servers_cache '
+             'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;'],
+            2500000)
+        params = merge(self.params, {
+            "last_update": self.dt,
+            "server_id0": "a", "server_blob0": '{"id": "a"}',
+            "server_as_active0": False})
+        sequence = [(self.read, lambda i: []),
+                    (CQLQueryExecute(
+                        query=query, params=params,
+                        consistency_level=ConsistencyLevel.QUORUM),
+                     noop)]
+        self.assertIsNone(perform_sequence(
+            sequence, self.cache.insert_servers(self.dt, [{"id": "a"}],
+                                                True)))
+
+    def test_delete_servers(self):
+        """
+        `delete_servers` deletes the cache in both layouts
+        """
+        self.assertEqual(
+            self.cache.delete_servers(),
+            cql_eff(
+                batch(['DELETE FROM {} USING TIMESTAMP :ts WHERE '
+                       '"tenantId"=:tenantId AND "groupId"=:groupId;'.format(
+                           cf)
+                       for cf in ('servers_cache', 'servers_cache_delta')]),
+                merge(self.params, {"ts": 2500000})))
+
+
 class CassAdminTestCase(SynchronousTestCase):
     """
     Tests for :class:`CassAdmin`
@@ -3944,8 +4904,11 @@ class GetScalingGroupsTests(SynchronousTestCase):
     """Tests for ``get_all_groups``."""
 
     @mock.patch("otter.models.cass.CassScalingGroupCollection"
-                ".get_scaling_group_rows")
-    def test_success(self, mock_gsgr):
+                ".scan_all_scaling_group_rows")
+    def test_success(self, mock_scan):
+        """
+        Valid groups are kept from each scanned batch and grouped by tenant
+        """
         clock = Clock()
         client = mock.Mock(spec=CQLClient)
         collection = CassScalingGroupCollection(client, clock, 1)
@@ -3958,11 +4921,46 @@ class GetScalingGroupsTests(SynchronousTestCase):
             {'created_at': '0', 'desired': 'some', 'deleting': 'True', },
             {'created_at': '0', 'desired': 'some', 'status': 'ERROR'}]
         rows = [assoc(row, "tenantId", "t1") for row in rows]
-        mock_gsgr.return_value = defer.succeed(rows)
-        results = self.successResultOf(collection.get_all_groups())
-        self.assertEqual(results, {"t1": [rows[0], rows[3]]})
-        mock_gsgr.assert_called_once_with(
-            props=["status", "deleting", "created_at"])
+        rows.append(assoc(rows[0], "tenantId", "t2"))
+
+        def scan(consume, props, parallel):
+            consume(rows[:4])
+            consume(rows[4:])
+            return defer.succeed(None)
+
+        mock_scan.side_effect = scan
+        results = self.successResultOf(collection.get_all_groups(parallel=2))
+        self.assertEqual(results,
+                         {"t1": [rows[0], rows[3]], "t2": [rows[-1]]})
+        mock_scan.assert_called_once_with(
+            mock.ANY, props=["status", "deleting", "created_at"], parallel=2)
+
+    @mock.patch("otter.models.cass.CassScalingGroupCollection"
+                ".scan_all_scaling_group_rows")
+    def test_max_tenants(self, mock_scan):
+        """
+        With ``max_tenants``, only the groups of that many tenants with the
+        smallest IDs are kept as the rows are scanned, along with the groups
+        of ``always_tenants``
+        """
+        collection = CassScalingGroupCollection(
+            mock.Mock(spec=CQLClient), Clock(), 1)
+        rows = [{'tenantId': t, 'groupId': g, 'created_at': '0',
+                 'desired': 1, 'status': 'ACTIVE'}
+                for t, g in [('t5', 'a'), ('t3', 'b'), ('z', 'c'),
+                             ('t4', 'd'), ('t5', 'e'), ('t1', 'f'),
+                             ('t4', 'g'), ('t3', 'h')]]
+
+        def scan(consume, props, parallel):
+            consume(rows[:3])
+            consume(rows[3:])
+            return defer.succeed(None)
+
+        mock_scan.side_effect = scan
+        d = collection.get_all_groups(max_tenants=2, always_tenants=['z'])
+        self.assertEqual(
+            self.successResultOf(d),
+            {'t1': [rows[5]], 't3': [rows[1], rows[7]], 'z': [rows[2]]})
 
 
 class GetScalingGroupRowsTests(SynchronousTestCase):
@@ -3983,6 +4981,9 @@ class GetScalingGroupRowsTests(SynchronousTestCase):
         self.select = ('SELECT "groupId","tenantId",'
                        'active,desired,pending '
                        'FROM scaling_group ')
+        self.where_range = ('WHERE token("tenantId") > :start AND '
+                            'token("tenantId") <= :end LIMIT :limit;')
+        self.range = {'start': MIN_TOKEN, 'end': MAX_TOKEN}
 
     def _add_exec_args(self, query, params, ret):
         self.exec_args[freeze((query, params))] = ret
@@ -3995,7 +4996,8 @@ class GetScalingGroupRowsTests(SynchronousTestCase):
                    'desired': 3, 'created_at': 'c'}
                   for i in range(2) for j in range(2)]
         self._add_exec_args(
-            self.select + ' LIMIT :limit;', {'limit': 5}, groups)
+            self.select + self.where_range, merge(self.range, {'limit': 5}),
+            groups)
         d = self.collection.get_scaling_group_rows(batch_size=5)
         self.assertEqual(list(self.successResultOf(d)), groups)
 
@@ -4010,8 +5012,8 @@ class GetScalingGroupRowsTests(SynchronousTestCase):
         self._add_exec_args(
             ('SELECT "groupId","tenantId",active,'
              'desired,launch,pending '
-             'FROM scaling_group  LIMIT :limit;'),
-            {'limit': 5}, groups)
+             'FROM scaling_group ' + self.where_range),
+            merge(self.range, {'limit': 5}), groups)
         d = self.collection.get_scaling_group_rows(props=['launch'],
                                                    batch_size=5)
         self.assertEqual(list(self.successResultOf(d)), groups)
@@ -4025,15 +5027,16 @@ class GetScalingGroupRowsTests(SynchronousTestCase):
                    'desired': 3, 'created_at': 'c'}
                   for i in range(7)]
         self._add_exec_args(
-            self.select + ' LIMIT :limit;', {'limit': 5}, groups[:5])
+            self.select + self.where_range, merge(self.range, {'limit': 5}),
+            groups[:5])
         self._add_exec_args(
             self.select + ('WHERE "tenantId"=:tenantId AND '
                            '"groupId">:groupId LIMIT :limit;'),
             {'limit': 5, 'tenantId': 1, 'groupId': 4}, groups[5:])
         self._add_exec_args(
-            self.select + ('WHERE token("tenantId") > token(:tenantId)'
-                           ' LIMIT :limit;'),
-            {'limit': 5, 'tenantId': 1}, [])
+            self.select + ('WHERE token("tenantId") > token(:tenantId) AND '
+                           'token("tenantId") <= :end LIMIT :limit;'),
+            {'limit': 5, 'tenantId': 1, 'end': MAX_TOKEN}, [])
         d = self.collection.get_scaling_group_rows(batch_size=5)
         self.assertEqual(list(self.successResultOf(d)), groups)
 
@@ -4049,22 +5052,712 @@ class GetScalingGroupRowsTests(SynchronousTestCase):
                     'desired': 4, 'created_at': 'c'}
                    for i in range(9)]
         self._add_exec_args(
-            self.select + ' LIMIT :limit;', {'limit': 5}, groups1[:5])
+            self.select + self.where_range, merge(self.range, {'limit': 5}),
+            groups1[:5])
         where_tenant = ('WHERE "tenantId"=:tenantId AND '
                         '"groupId">:groupId LIMIT :limit;')
-        where_token = ('WHERE token("tenantId") > token(:tenantId) '
-                       'LIMIT :limit;')
+        where_token = ('WHERE token("tenantId") > token(:tenantId) AND '
+                       'token("tenantId") <= :end LIMIT :limit;')
         self._add_exec_args(
             self.select + where_tenant,
             {'limit': 5, 'tenantId': 1, 'groupId': 4}, groups1[5:])
         self._add_exec_args(
             self.select + where_token,
-            {'limit': 5, 'tenantId': 1}, groups2[:5])
+            {'limit': 5, 'tenantId': 1, 'end': MAX_TOKEN}, groups2[:5])
         self._add_exec_args(
             self.select + where_tenant,
             {'limit': 5, 'tenantId': 2, 'groupId': 4}, groups2[5:])
         self._add_exec_args(
             self.select + where_token,
-            {'limit': 5, 'tenantId': 2}, [])
+            {'limit': 5, 'tenantId': 2, 'end': MAX_TOKEN}, [])
         d = self.collection.get_scaling_group_rows(batch_size=5)
         self.assertEqual(list(self.successResultOf(d)), groups1 + groups2)
+
+    def test_scan_back_pressure(self):
+        """
+        `scan_scaling_group_rows` gives rows of the token range to the consumer
+        a batch at a time and fetches the next batch only after the
+        consumer's Deferred fires
+        """
+        groups = [{'tenantId': 1, 'groupId': i, 'desired': 3}
+                  for i in range(7)]
+        select = 'SELECT "groupId","tenantId",desired FROM scaling_group '
+        self._add_exec_args(
+            select + self.where_range,
+            {'limit': 5, 'start': -10, 'end': 10}, groups[:5])
+        self._add_exec_args(
+            select + ('WHERE "tenantId"=:tenantId AND '
+                      '"groupId">:groupId LIMIT :limit;'),
+            {'limit': 5, 'tenantId': 1, 'groupId': 4}, groups[5:])
+        self._add_exec_args(
+            select + ('WHERE token("tenantId") > token(:tenantId) AND '
+                      'token("tenantId") <= :end LIMIT :limit;'),
+            {'limit': 5, 'tenantId': 1, 'end': 10}, [])
+        consumed = []
+        waiting = []
+
+        def consume(rows):
+            consumed.append(rows)
+            waiting.append(defer.Deferred())
+            return waiting[-1]
+
+        d = self.collection.scan_scaling_group_rows(
+            consume, batch_size=5, token_range=(-10, 10))
+        self.assertEqual(consumed, [groups[:5]])
+        self.assertEqual(self.client.execute.call_count, 1)
+        waiting[0].callback(None)
+        self.assertEqual(consumed, [groups[:5], groups[5:]])
+        self.assertNoResult(d)
+        waiting[1].callback(None)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.client.execute.call_count, 3)
+
+    def test_scan_all_parallel(self):
+        """
+        `scan_all_scaling_group_rows` scans each of the token ranges
+        concurrently
+        """
+        scan = patch(self, 'otter.models.cass.CassScalingGroupCollection'
+                           '.scan_scaling_group_rows')
+        waiting = [defer.Deferred(), defer.Deferred()]
+        scan.side_effect = lambda *a: waiting[scan.call_count - 1]
+        d = self.collection.scan_all_scaling_group_rows(
+            'consume', props=['a'], batch_size=3, parallel=2)
+        self.assertEqual(
+            scan.call_args_list,
+            [mock.call('consume', ['a'], 3, r) for r in token_ranges(2)])
+        waiting[1].callback(None)
+        self.assertNoResult(d)
+        waiting[0].callback(None)
+        self.assertIsNone(self.successResultOf(d))
+
+
+class TokenRangesTests(SynchronousTestCase):
+    """
+    Tests for :func:`token_ranges`
+    """
+
+    def test_ranges(self):
+        """
+        The ranges are contiguous and cover the whole token ring
+        """
+        self.assertEqual(token_ranges(1), [(MIN_TOKEN, MAX_TOKEN)])
+        ranges = token_ranges(7)
+        self.assertEqual(len(ranges), 7)
+        self.assertEqual(ranges[0][0], MIN_TOKEN)
+        self.assertEqual(ranges[-1][1], MAX_TOKEN)
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+        sizes = [end - start for start, end in ranges]
+        self.assertTrue(max(sizes) - min(sizes) <= 1)
+
+
+class CassTokenCacheTests(SynchronousTestCase):
+    """
+    Tests for :class:`CassTokenCache`
+    """
+
+    def setUp(self):
+        """
+        Mock connection
+        """
+        self.connection = mock.MagicMock(spec=['execute'])
+        self.connection.execute.return_value = defer.succeed([])
+        self.clock = Clock()
+        self.clock.advance(1400000000)
+        self.cache = CassTokenCache(self.connection, self.clock)
+
+    def test_provides_interface(self):
+        """
+        CassTokenCache provides ITokenCache
+        """
+        verifyObject(ITokenCache, self.cache)
+
+    def test_get_token(self):
+        """
+        `get_token` returns creation time and token with catalog decoded
+        """
+        self.connection.execute.return_value = defer.succeed(
+            [{'created': datetime(2014, 5, 13, 16, 53, 20), 'token': 'tok',
+              'catalog': '[{"name": "cs"}]'}])
+        self.assertEqual(
+            self.successResultOf(self.cache.get_token('t1')),
+            (1400000000, ('tok', [{'name': 'cs'}])))
+        self.connection.execute.assert_called_once_with(
+            'SELECT created, token, catalog FROM identity_tokens '
+            'WHERE "tenantId" = :tenantId;', {'tenantId': 't1'},
+            ConsistencyLevel.ONE)
+
+    def test_get_token_none(self):
+        """
+        `get_token` returns None if there is no token
+        """
+        self.assertIsNone(self.successResultOf(self.cache.get_token('t1')))
+
+    def test_set_token(self):
+        """
+        `set_token` inserts the token with TTL
+        """
+        self.assertIsNone(self.successResultOf(
+            self.cache.set_token('t1', 1400000000, ('tok', [{'a': 'b'}]),
+                                 300)))
+        self.connection.execute.assert_called_once_with(
+            'INSERT INTO identity_tokens ("tenantId", created, token, '
+            'catalog) VALUES (:tenantId, :created, :token, :catalog) '
+            'USING TTL :ttl;',
+            {'tenantId': 't1', 'created': datetime(2014, 5, 13, 16, 53, 20),
+             'token': 'tok', 'catalog': '[{"a": "b"}]', 'ttl': 300},
+            ConsistencyLevel.ONE)
+
+    def test_delete_token(self):
+        """
+        `delete_token` deletes the token
+        """
+        self.assertIsNone(
+            self.successResultOf(self.cache.delete_token('t1')))
+        self.connection.execute.assert_called_once_with(
+            'DELETE FROM identity_tokens WHERE "tenantId" = :tenantId;',
+            {'tenantId': 't1'}, ConsistencyLevel.ONE)
+
+    def test_claim_refresh(self):
+        """
+        `claim_refresh` inserts claim if it does not exist and returns
+        whether it was inserted
+        """
+        for applied in [True, False]:
+            self.connection.execute.return_value = defer.succeed(
+                [{'[applied]': applied}])
+            self.assertEqual(
+                self.successResultOf(self.cache.claim_refresh('t1', 30)),
+                applied)
+        self.connection.execute.assert_called_with(
+            'INSERT INTO identity_token_claims ("tenantId", claimed) '
+            'VALUES (:tenantId, :claimed) IF NOT EXISTS USING TTL :ttl;',
+            {'tenantId': 't1', 'claimed': datetime(2014, 5, 13, 16, 53, 20),
+             'ttl': 30},
+            ConsistencyLevel.QUORUM)
+
+
+class TenantResourceCountsTests(SynchronousTestCase):
+    """
+    Tests for :class:`TenantResourceCounts`
+    """
+
+    get_query = ('SELECT groups, policies, webhooks, version '
+                 'FROM tenant_resource_counts WHERE "tenantId" = :tenantId;')
+    insert_query = (
+        'INSERT INTO tenant_resource_counts ("tenantId", groups, policies, '
+        'webhooks, version) VALUES (:tenantId, :groups, :policies, '
+        ':webhooks, 1) IF NOT EXISTS;')
+    update_query = (
+        'UPDATE tenant_resource_counts SET groups = :groups, '
+        'policies = :policies, webhooks = :webhooks, version = :newVersion '
+        'WHERE "tenantId" = :tenantId IF version = :version;')
+    count_queries = [
+        'SELECT COUNT(*) FROM scaling_group WHERE "tenantId"=:tenantId '
+        'AND deleting=false;',
+        'SELECT COUNT(*) FROM scaling_policies WHERE "tenantId"=:tenantId ;',
+        'SELECT COUNT(*) FROM policy_webhooks WHERE "tenantId"=:tenantId ;']
+
+    def setUp(self):
+        """
+        Connection storing the counts row in `stored` and returning row
+        counts from `rows`. Functions in `before_write` are called before
+        the next lightweight transactions, to change the counts concurrently.
+        """
+        self.stored = None
+        self.rows = {'groups': 1, 'policies': 2, 'webhooks': 3}
+        self.before_write = []
+        self.writes = []
+        self.connection = mock.MagicMock(spec=['execute'])
+        self.connection.execute.side_effect = self.execute
+        self.counts = TenantResourceCounts(self.connection, Clock())
+        self.log = mock_log()
+
+    def execute(self, query, params, consistency):
+        if query == self.get_query:
+            return defer.succeed([] if self.stored is None else
+                                 [self.stored])
+        if query in self.count_queries:
+            resource = self.counts.resources[self.count_queries.index(query)]
+            return defer.succeed([{'count': self.rows[resource]}])
+        assert query in (self.insert_query, self.update_query)
+        self.assertEqual(consistency, ConsistencyLevel.QUORUM)
+        if self.before_write:
+            self.before_write.pop(0)()
+        self.writes.append((query, params))
+        if query == self.insert_query:
+            applied = self.stored is None
+            version = 1
+        else:
+            applied = (self.stored is not None and
+                       self.stored['version'] == params['version'])
+            version = params.get('newVersion')
+        if applied:
+            self.stored = {r: params[r] for r in self.counts.resources}
+            self.stored['version'] = version
+        return defer.succeed([{'[applied]': applied}])
+
+    def store(self, version=1, **counts):
+        self.stored = merge({'groups': 0, 'policies': 0, 'webhooks': 0},
+                            counts, {'version': version})
+
+    def test_get(self):
+        """
+        `get` returns the tenant's counts, defaulting missing ones to 0,
+        or None if it has none
+        """
+        self.assertIsNone(self.successResultOf(self.counts.get('t')))
+        self.stored = {'groups': None, 'policies': 4, 'webhooks': None,
+                       'version': 3}
+        self.assertEqual(self.successResultOf(self.counts.get('t')),
+                         {'groups': 0, 'policies': 4, 'webhooks': 0})
+        self.connection.execute.assert_called_with(
+            self.get_query, {'tenantId': 't'}, ConsistencyLevel.QUORUM)
+
+    def test_count_rows(self):
+        """
+        `count_rows` counts the tenant's non-deleting groups and all its
+        policies and webhooks at QUORUM
+        """
+        self.assertEqual(self.successResultOf(self.counts.count_rows('t')),
+                         self.rows)
+        self.connection.execute.assert_has_calls(
+            [mock.call(query, {'tenantId': 't'}, ConsistencyLevel.QUORUM)
+             for query in self.count_queries])
+
+    def test_reconcile(self):
+        """
+        `reconcile` sets the counts to the row counts if they have not
+        changed in the meantime
+        """
+        self.store(version=4, groups=1, policies=5)
+        self.assertEqual(self.successResultOf(self.counts.reconcile('t')),
+                         self.rows)
+        self.assertEqual(
+            self.writes,
+            [(self.update_query, merge(self.rows, {'tenantId': 't',
+                                                   'version': 4,
+                                                   'newVersion': 5}))])
+        self.assertEqual(self.counts.touched, set())
+
+    def test_reconcile_conflict(self):
+        """
+        `reconcile` does not change counts that changed while the rows were
+        counted, and keeps the tenant to be reconciled again
+        """
+        self.store(groups=5)
+        self.before_write = [lambda: self.store(version=2, groups=6)]
+        self.assertEqual(self.successResultOf(self.counts.reconcile('t')),
+                         {'groups': 6, 'policies': 0, 'webhooks': 0})
+        self.assertEqual(self.stored['groups'], 6)
+        self.assertEqual(self.counts.touched, set(['t']))
+
+    def test_get_counts(self):
+        """
+        `get_counts` returns the counts, initializing them by counting the
+        rows if the tenant has none, in which case it is reconciled later
+        """
+        self.assertEqual(self.successResultOf(self.counts.get_counts('t')),
+                         self.rows)
+        self.assertEqual(self.writes,
+                         [(self.insert_query,
+                           merge(self.rows, {'tenantId': 't'}))])
+        self.assertEqual(self.counts.touched, set(['t']))
+        self.counts.touched = set()
+        self.store(version=2, groups=5)
+        self.assertEqual(self.successResultOf(self.counts.get_counts('t')),
+                         {'groups': 5, 'policies': 0, 'webhooks': 0})
+        self.assertEqual(len(self.writes), 1)
+        self.assertEqual(self.counts.touched, set())
+
+    def test_get_counts_initialized_concurrently(self):
+        """
+        When another node initializes the counts while `get_counts` counts
+        the rows, the counts are not initialized again and the other node's
+        are returned
+        """
+        self.before_write = [lambda: self.store(groups=7)]
+        self.assertEqual(self.successResultOf(self.counts.get_counts('t')),
+                         {'groups': 7, 'policies': 0, 'webhooks': 0})
+        self.assertEqual(self.stored['groups'], 7)
+
+    def test_update(self):
+        """
+        `update` adds the deltas to the counts and remembers the tenant as
+        touched, doing nothing if all the deltas are 0
+        """
+        self.store(groups=1, policies=2, webhooks=3)
+        d = self.counts.update(self.log, 't', groups=1, policies=0,
+                               webhooks=-2)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.writes,
+                         [(self.update_query,
+                           {'tenantId': 't', 'groups': 2, 'policies': 2,
+                            'webhooks': 1, 'version': 1,
+                            'newVersion': 2})])
+        self.assertEqual(self.counts.touched, set(['t']))
+        self.counts.touched = set()
+        d = self.counts.update(self.log, 't', groups=0)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(len(self.writes), 1)
+        self.assertEqual(self.counts.touched, set())
+
+    def test_update_conflict(self):
+        """
+        `update` reads the counts again and adds the deltas to them when they
+        are changed concurrently, so no change is lost
+        """
+        self.store(groups=1)
+        self.before_write = [lambda: self.store(version=2, groups=2)]
+        d = self.counts.update(self.log, 't', groups=1)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.stored,
+                         {'groups': 3, 'policies': 0, 'webhooks': 0,
+                          'version': 3})
+
+    def test_update_too_many_conflicts(self):
+        """
+        `update` gives up after `max_conflicts` retries, leaving the tenant
+        to be reconciled
+        """
+        self.counts.max_conflicts = 2
+        self.store(groups=1)
+        self.before_write = [
+            lambda v=v: self.store(version=v) for v in range(2, 5)]
+        d = self.counts.update(self.log, 't', groups=1)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(len(self.writes), 3)
+        self.log.msg.assert_called_once_with(
+            'update-counts-conflicts', tenant_id='t', conflicts=2)
+        self.assertEqual(self.counts.touched, set(['t']))
+
+    def test_update_uncounted(self):
+        """
+        `update` initializes a tenant's missing counts by counting its rows,
+        which already include the change
+        """
+        d = self.counts.update(self.log, 't', groups=1)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.writes,
+                         [(self.insert_query,
+                           merge(self.rows, {'tenantId': 't'}))])
+
+    def test_update_failure(self):
+        """
+        `update` logs failures without failing, leaving the tenant to be
+        reconciled
+        """
+        self.connection.execute.side_effect = (
+            lambda *a: defer.fail(DummyException()))
+        d = self.counts.update(self.log, 't', groups=1)
+        self.assertIsNone(self.successResultOf(d))
+        self.log.err.assert_called_once_with(
+            CheckFailure(DummyException), 'update-counts-failed')
+        self.assertEqual(self.counts.touched, set(['t']))
+
+    def test_reconcile_touched(self):
+        """
+        `reconcile_touched` reconciles every touched tenant while holding
+        the reconciliation lock, keeping the ones that failed for the next
+        time
+        """
+        self.counts.kz_client = mock.Mock(spec=['Lock'])
+        lock = self.counts.kz_client.Lock.return_value
+        lock.acquire.return_value = defer.succeed(True)
+        lock.release.return_value = defer.succeed(True)
+        self.counts.touched = set(['t1', 't2'])
+        reconcile = patch(self, 'otter.models.cass.TenantResourceCounts'
+                                '.reconcile')
+        reconcile.side_effect = lambda t: (
+            defer.fail(DummyException()) if t == 't2' else defer.succeed({}))
+        d = self.counts.reconcile_touched(self.log)
+        self.assertIsNone(self.successResultOf(d))
+        self.counts.kz_client.Lock.assert_called_once_with(
+            '/locks/reconcile_counts')
+        self.assertEqual(sorted(c[0][0] for c in reconcile.call_args_list),
+                         ['t1', 't2'])
+        self.assertTrue(lock.release.called)
+        self.assertEqual(self.counts.touched, set(['t2']))
+        self.log.err.assert_called_once_with(
+            CheckFailure(DummyException), 'reconcile-counts-failed',
+            tenant_id='t2')
+
+    def test_reconcile_touched_no_lock(self):
+        """
+        `reconcile_touched` reconciles nothing until the kazoo client is set
+        or if the lock cannot be acquired
+        """
+        reconcile = patch(self, 'otter.models.cass.TenantResourceCounts'
+                                '.reconcile')
+        self.counts.touched = set(['t1'])
+        self.assertIsNone(
+            self.successResultOf(self.counts.reconcile_touched(self.log)))
+
+        self.counts.kz_client = mock.Mock(spec=['Lock'])
+        lock = self.counts.kz_client.Lock.return_value
+        lock.acquire.return_value = defer.fail(DummyException())
+        self.assertIsNone(
+            self.successResultOf(self.counts.reconcile_touched(self.log)))
+        self.assertFalse(reconcile.called)
+        self.assertEqual(self.counts.touched, set(['t1']))
+        self.log.err.assert_called_once_with(
+            CheckFailure(DummyException), 'reconcile-counts-lock-failed')
+
+
+class WebhookCapabilityCacheTests(SynchronousTestCase):
+    """
+    Tests for :class:`WebhookCapabilityCache`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = WebhookCapabilityCache(self.clock, size=2, ttl=30,
+                                            negative_ttl=5)
+        self.fetches = []
+
+    def _get(self, capability_hash, result=('t', 'g', 'p')):
+        def fetch():
+            self.fetches.append(capability_hash)
+            if result is None:
+                return defer.fail(
+                    UnrecognizedCapabilityError(capability_hash, 1))
+            return defer.succeed(result)
+        return self.cache.get(capability_hash, fetch)
+
+    def test_found_cached_until_ttl(self):
+        """
+        Found capability is cached for ``ttl`` seconds
+        """
+        self.assertEqual(self.successResultOf(self._get('x')),
+                         ('t', 'g', 'p'))
+        self.clock.advance(29)
+        self.assertEqual(self.successResultOf(self._get('x', 'other')),
+                         ('t', 'g', 'p'))
+        self.assertEqual(self.fetches, ['x'])
+        self.clock.advance(1)
+        self.assertEqual(self.successResultOf(self._get('x', 'other')),
+                         'other')
+        self.assertEqual(self.fetches, ['x', 'x'])
+
+    def test_unrecognized_cached_until_negative_ttl(self):
+        """
+        Unrecognized capability is cached for ``negative_ttl`` seconds
+        """
+        self.failureResultOf(self._get('x', None),
+                             UnrecognizedCapabilityError)
+        self.clock.advance(4)
+        self.failureResultOf(self._get('x'), UnrecognizedCapabilityError)
+        self.assertEqual(self.fetches, ['x'])
+        self.clock.advance(1)
+        self.successResultOf(self._get('x'))
+        self.assertEqual(self.fetches, ['x', 'x'])
+
+    def test_errors_not_cached(self):
+        """
+        Fetch errors other than unrecognized capability are not cached
+        """
+        d = self.cache.get('x', lambda: defer.fail(ValueError('e')))
+        self.failureResultOf(d, ValueError)
+        self.successResultOf(self._get('x'))
+        self.assertEqual(self.fetches, ['x'])
+
+    def test_least_recently_used_evicted(self):
+        """
+        When the cache is full the least recently used entry is evicted
+        """
+        self._get('x')
+        self._get('y')
+        self._get('x')
+        self._get('z')
+        self._get('x')
+        self._get('y')
+        self.assertEqual(self.fetches, ['x', 'y', 'z', 'y'])
+
+    def test_invalidate(self):
+        """
+        Invalidated entries are fetched again
+        """
+        self._get('x')
+        self._get('y')
+        self.cache.invalidate(['x'])
+        self._get('x')
+        self._get('y')
+        self.assertEqual(self.fetches, ['x', 'y', 'x'])
+
+    def test_invalidate_during_fetch(self):
+        """
+        Info fetched while an invalidation happens is not cached
+        """
+        fetched = defer.Deferred()
+        d = self.cache.get('x', lambda: fetched)
+        self.cache.invalidate(['x'])
+        fetched.callback(('t', 'g', 'p'))
+        self.assertEqual(self.successResultOf(d), ('t', 'g', 'p'))
+        self._get('x')
+        self.assertEqual(self.fetches, ['x'])
+
+
+class GroupConfigCacheTests(SynchronousTestCase):
+    """
+    Tests for :class:`GroupConfigCache`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = GroupConfigCache(self.clock, size=2, ttl=30,
+                                      fresh_ttl=0)
+        self.fetches = []
+        self.stamp = 's1'
+        self.stamp_checks = 0
+
+    def _current_stamp(self):
+        self.stamp_checks += 1
+        return defer.succeed(self.stamp)
+
+    def _get(self, group, item='config', result={'a': 1}):
+        def fetch():
+            self.fetches.append((group, item))
+            return defer.succeed((result, self.stamp))
+        return self.cache.get(group, item, fetch, self._current_stamp)
+
+    def test_cached_until_ttl(self):
+        """
+        Items are cached for ``ttl`` seconds
+        """
+        self.assertEqual(self.successResultOf(self._get('g')), {'a': 1})
+        self.clock.advance(29)
+        self.assertEqual(self.successResultOf(self._get('g', result=2)),
+                         {'a': 1})
+        self.clock.advance(1)
+        self.assertEqual(self.successResultOf(self._get('g', result=2)), 2)
+        self.assertEqual(self.fetches, [('g', 'config')] * 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_stamp_checked(self):
+        """
+        Cached items are fetched again when their stamp is not the current
+        one anymore or the item does not exist
+        """
+        self._get('g', result=1)
+        self.assertEqual(self.stamp_checks, 0)
+        self.stamp = 's2'
+        self.assertEqual(self.successResultOf(self._get('g', result=2)), 2)
+        self.assertEqual(self.successResultOf(self._get('g', result=3)), 2)
+        self.assertEqual(self.stamp_checks, 2)
+        self.stamp = None
+        self.assertEqual(self.successResultOf(self._get('g', result=4)), 4)
+        self.assertEqual(len(self.fetches), 3)
+        self.assertEqual(
+            (self.cache.hits, self.cache.misses, self.cache.stale), (1, 3, 2))
+
+    def test_fresh_not_checked(self):
+        """
+        Cached items are returned without checking their stamp within
+        ``fresh_ttl`` seconds of being fetched or checked
+        """
+        self.cache = GroupConfigCache(self.clock, ttl=30, fresh_ttl=1)
+        self._get('g', result=1)
+        self.clock.advance(0.5)
+        self.stamp = 's2'
+        self.assertEqual(self.successResultOf(self._get('g', result=2)), 1)
+        self.assertEqual(self.stamp_checks, 0)
+        self.clock.advance(0.5)
+        self.assertEqual(self.successResultOf(self._get('g', result=2)), 2)
+        self.assertEqual(self.stamp_checks, 1)
+        self.clock.advance(1)
+        self.assertEqual(self.successResultOf(self._get('g', result=3)), 2)
+        self.clock.advance(0.5)
+        self.assertEqual(self.successResultOf(self._get('g', result=3)), 2)
+        self.assertEqual(self.stamp_checks, 2)
+        self.assertEqual(len(self.fetches), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (3, 2))
+
+    def test_stamp_check_fails(self):
+        """
+        Failure to check the stamp of a cached item is propagated
+        """
+        self._get('g')
+        d = self.cache.get('g', 'config', lambda: defer.succeed((2, 's1')),
+                           lambda: defer.fail(DummyException()))
+        self.failureResultOf(d, DummyException)
+
+    def test_returns_copies(self):
+        """
+        Changing a returned item does not change the cached one
+        """
+        self.successResultOf(self._get('g'))['a'] = 2
+        self.successResultOf(self._get('g'))['a'] = 3
+        self.assertEqual(self.successResultOf(self._get('g')), {'a': 1})
+
+    def test_items(self):
+        """
+        Items of the same group are cached separately
+        """
+        self._get('g', 'config')
+        self._get('g', 'launch_config')
+        self._get('g', 'config')
+        self.assertEqual(self.fetches,
+                         [('g', 'config'), ('g', 'launch_config')])
+
+    def test_failures_not_cached(self):
+        """
+        Failed fetches are not cached
+        """
+        d = self.cache.get('g', 'config',
+                           lambda: defer.fail(DummyException()),
+                           self._current_stamp)
+        self.failureResultOf(d, DummyException)
+        self._get('g')
+        self.assertEqual(self.fetches, [('g', 'config')])
+
+    def test_lru(self):
+        """
+        Least recently used groups are evicted beyond ``size``
+        """
+        self._get('x')
+        self._get('y')
+        self._get('x')
+        self._get('z')
+        self._get('x')
+        self._get('y')
+        self.assertEqual([g for g, _ in self.fetches], ['x', 'y', 'z', 'y'])
+
+    def test_invalidate(self):
+        """
+        All the items of an invalidated group are fetched again
+        """
+        self._get('x', 'config')
+        self._get('x', 'launch_config')
+        self._get('y')
+        self.cache.invalidate('x')
+        self._get('x', 'config')
+        self._get('x', 'launch_config')
+        self._get('y')
+        self.assertEqual(self.fetches,
+                         [('x', 'config'), ('x', 'launch_config'),
+                          ('y', 'config'), ('x', 'config'),
+                          ('x', 'launch_config')])
+
+    def test_invalidate_during_fetch(self):
+        """
+        Items fetched while an invalidation happens are not cached
+        """
+        fetched = defer.Deferred()
+        d = self.cache.get('x', 'config', lambda: fetched,
+                           self._current_stamp)
+        self.cache.invalidate('x')
+        fetched.callback((1, 's1'))
+        self.assertEqual(self.successResultOf(d), 1)
+        self._get('x')
+        self.assertEqual(self.fetches, [('x', 'config')])
+
+    def test_health_check(self):
+        """
+        The health check reports hit, miss and stale counters
+        """
+        self._get('x')
+        self._get('x')
+        self.assertEqual(
+            self.cache.health_check(),
+            (True, {'hits': 1, 'misses': 1, 'stale': 0, 'groups': 1}))
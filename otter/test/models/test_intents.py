@@ -10,7 +10,7 @@ from twisted.trial.unittest import SynchronousTestCase
 
 from otter.log.intents import get_log_dispatcher
 from otter.models.intents import (
-    DeleteGroup, GetScalingGroupInfo, ModifyGroupStatePaused,
+    DeleteGroup, GetAllGroups, GetScalingGroupInfo, ModifyGroupStatePaused,
     UpdateGroupErrorReasons, UpdateGroupStatus, UpdateServersCache,
     get_model_dispatcher)
 from otter.models.interface import (
@@ -170,3 +170,19 @@ class ScalingGroupIntentsTests(SynchronousTestCase):
         self.assertEqual(modified_state.paused, False)
         modified_state.paused = True
         self.assertEqual(self.state, modified_state)
+
+    def test_get_all_groups(self):
+        """
+        Performing :obj:`GetAllGroups` gets all the groups from the store,
+        scanning the configured number of token ranges concurrently
+        """
+        store = mock.Mock(spec=['get_all_groups'])
+        store.get_all_groups.return_value = succeed({'t': ['g']})
+        dispatcher = self.get_dispatcher(store)
+        r = sync_perform(
+            dispatcher,
+            Effect(GetAllGroups(parallel=4, max_tenants=5,
+                                always_tenants=('ct',))))
+        self.assertEqual(r, {'t': ['g']})
+        store.get_all_groups.assert_called_once_with(
+            parallel=4, max_tenants=5, always_tenants=('ct',))
@@ -2,6 +2,7 @@
 Tests for :mod:`otter.models.interface`
 """
 from collections import namedtuple
+from copy import deepcopy
 
 from twisted.trial.unittest import SynchronousTestCase
 
@@ -29,6 +30,27 @@ class GroupStateTestCase(SynchronousTestCase):
             "GroupState(tid, gid, name, 5, {'1': {}}, {}, date, {}, True, "
             "<ScalingGroupStatus=ACTIVE>)")
 
+    def test_deepcopy(self):
+        """
+        A deep copy of a state is equal to it, with the same status and
+        ``now``, but changing its servers does not change the original
+        """
+        now = lambda: 'now'
+        state = GroupState('tid', 'gid', 'name', {'1': {}}, {}, 'date',
+                           {'p': 'date'}, True, ScalingGroupStatus.ERROR,
+                           ['r'], desired=5, now=now)
+        copy = deepcopy(state)
+        self.assertEqual(copy, state)
+        self.assertIs(copy.status, ScalingGroupStatus.ERROR)
+        self.assertIs(copy.now, now)
+        self.assertEqual(copy.error_reasons, ('r',))
+        copy.add_job('2')
+        copy.active['1']['a'] = 1
+        copy.mark_executed('q')
+        self.assertEqual(state.pending, {})
+        self.assertEqual(state.active, {'1': {}})
+        self.assertEqual(state.policy_touched, {'p': 'date'})
+
     def test_default_desired_capacity_is_zero(self):
         """
         If no desired capacity is passed, the default value is zero.
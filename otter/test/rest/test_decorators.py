@@ -360,10 +360,11 @@ class ValidateBodyTestCase(SynchronousTestCase):
         self.request = mock.MagicMock(spec=["content"],
                                       content=self.request_content)
 
-        self.validate_patch = mock.patch(
-            'otter.rest.decorators.validate')
-        self.mock_validate = self.validate_patch.start()
-        self.addCleanup(self.validate_patch.stop)
+        self.validator_patch = mock.patch(
+            'otter.rest.decorators.validator')
+        self.mock_validator = self.validator_patch.start()
+        self.addCleanup(self.validator_patch.stop)
+        self.mock_validate = self.mock_validator.return_value.validate
 
     def test_success_case(self):
         """
@@ -390,7 +391,8 @@ class ValidateBodyTestCase(SynchronousTestCase):
         result = self.successResultOf(d)
 
         # assert that it was validated
-        self.mock_validate.assert_called_once_with(expected_value, schema)
+        self.mock_validator.assert_called_once_with(schema)
+        self.mock_validate.assert_called_once_with(expected_value)
 
         # assert that the json was parsed and passed back in the 'data' keyword
         expected_kwargs = dict(kwargs)
@@ -430,6 +432,28 @@ class ValidateBodyTestCase(SynchronousTestCase):
 
         self.failureResultOf(FakeApp().handle_body(self.request), ValidationError)
 
+    def test_validator_built_once(self):
+        """
+        The schema's validator is built when the decorator is created and
+        reused by every request
+        """
+        schema = {'some': 'schema'}
+
+        class FakeApp(object):
+            @validate_body(schema)
+            def handle_body(self, request, *args, **kwargs):
+                return defer.succeed(kwargs)
+
+        self.mock_validator.assert_called_once_with(schema)
+        for data in ({'a': 1}, {'b': 2}):
+            self.request_content.truncate(0)
+            json.dump(data, self.request_content)
+            self.assertEqual(
+                self.successResultOf(FakeApp().handle_body(self.request)),
+                {'data': data})
+        self.mock_validator.assert_called_once_with(schema)
+        self.assertEqual(self.mock_validate.call_count, 2)
+
 
 class LogArgumentsTestCase(SynchronousTestCase):
     """
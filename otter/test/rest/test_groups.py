@@ -253,6 +253,43 @@ class GetActiveCacheTests(SynchronousTestCase):
             ConsistencyLevel.QUORUM)
 
 
+class GetActiveCachesTests(SynchronousTestCase):
+    """
+    Tests for :func:`get_active_caches`
+    """
+
+    def test_success(self):
+        """
+        Returns servers of each group as dict keyed on id, fetched with one
+        query for all the groups
+        """
+        connection = mock.Mock(spec=CQLClient)
+        dt = datetime(1970, 1, 1)
+        connection.execute.return_value = defer.succeed(
+            [{'groupId': 'g1',
+              'server_blob': json.dumps({'id': 's1', 'links': 's1l'}),
+              'last_update': dt, 'server_as_active': True},
+             {'groupId': 'g1',
+              'server_blob': json.dumps({'id': 's2', 'links': 's2l'}),
+              'last_update': dt, 'server_as_active': False},
+             {'groupId': 'g3',
+              'server_blob': json.dumps({'id': 's3', 'links': 's3l'}),
+              'last_update': dt, 'server_as_active': True}])
+
+        d = groups.get_active_caches(
+            'reactor', connection, 'tid', ['g1', 'g2', 'g3'])
+        self.assertEqual(
+            self.successResultOf(d),
+            [{'s1': {'id': 's1', 'links': 's1l'}},
+             {},
+             {'s3': {'id': 's3', 'links': 's3l'}}])
+        connection.execute.assert_called_once_with(
+            mock.ANY,
+            {"tenantId": "tid", "groupId0": "g1", "groupId1": "g2",
+             "groupId2": "g3"},
+            ConsistencyLevel.QUORUM)
+
+
 class AllGroupsEndpointTestCase(RestAPITestMixin, SynchronousTestCase):
     """
     Tests for ``/{tenantId}/groups/`` endpoints (create, list)
@@ -393,7 +430,7 @@ class AllGroupsEndpointTestCase(RestAPITestMixin, SynchronousTestCase):
             "groups_links": []
         })
 
-    @mock.patch('otter.rest.groups.get_active_cache')
+    @mock.patch('otter.rest.groups.get_active_caches')
     def test_list_group_convergence(self, mock_gac):
         """
         ``list_all_scaling_groups`` returns state that has active servers
@@ -402,13 +439,16 @@ class AllGroupsEndpointTestCase(RestAPITestMixin, SynchronousTestCase):
         set_config_data({'convergence-tenants': ['11111'], 'url_root': 'root'})
         self.addCleanup(set_config_data, None)
 
-        mock_gac.return_value = defer.succeed({'s1': {'links': 'l'}})
+        mock_gac.return_value = defer.succeed(
+            [{'s1': {'links': 'l'}}, {}])
         self.mock_store.connection = 'connection'
         self.mock_store.reactor = 'reactor'
 
         self.mock_store.list_scaling_group_states.return_value = defer.succeed(
             [GroupState('11111', 'one', '1', None, None, None, {}, False,
-                        ScalingGroupStatus.ACTIVE, desired=2)]
+                        ScalingGroupStatus.ACTIVE, desired=2),
+             GroupState('11111', 'two', '2', None, None, None, {}, False,
+                        ScalingGroupStatus.ACTIVE, desired=0)]
         )
 
         body = self.assert_status_code(200)
@@ -417,8 +457,9 @@ class AllGroupsEndpointTestCase(RestAPITestMixin, SynchronousTestCase):
         self.assertEqual(resp['groups'][0]['state']['pendingCapacity'], 1)
         self.assertEqual(resp['groups'][0]['state']['active'],
                          [{'id': 's1', 'links': 'l'}])
+        self.assertEqual(resp['groups'][1]['state']['activeCapacity'], 0)
         mock_gac.assert_called_once_with(
-            'reactor', 'connection', '11111', 'one')
+            'reactor', 'connection', '11111', ['one', 'two'])
 
     def test_list_group_passes_limit_query(self):
         """
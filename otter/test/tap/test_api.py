@@ -5,10 +5,13 @@ Tests for the otter-api tap plugin.
 import json
 from copy import deepcopy
 
+from effect import Effect
+
 import mock
 
 from testtools.matchers import Contains, IsInstance
 
+from twisted.application.internet import TimerService
 from twisted.application.service import MultiService
 from twisted.internet import defer
 from twisted.internet.task import Clock
@@ -17,10 +20,13 @@ from twisted.trial.unittest import SynchronousTestCase
 from otter.auth import CachingAuthenticator, SingleTenantAuthenticator
 from otter.constants import (
     CONVERGENCE_DIRTY_DIR, ServiceType, get_service_configs)
-from otter.convergence.service import Converger
-from otter.log.cloudfeeds import CloudFeedsObserver
+from otter.convergence.gathering import GetTenantData
+from otter.convergence.service import Converger, QueueConvergence
+from otter.log.cloudfeeds import CloudFeedsObserver, CloudFeedsPublisher
 from otter.log.formatters import get_fanout, set_fanout
-from otter.models.cass import CassScalingGroupCollection as OriginalStore
+from otter.models.cass import (
+    CassScalingGroupCollection as OriginalStore, CassTokenCache,
+    TenantResourceCounts)
 from otter.supervisor import SupervisorService, get_supervisor, set_supervisor
 from otter.tap.api import (
     HealthChecker,
@@ -35,6 +41,7 @@ from otter.test.test_effect_dispatcher import full_intents
 from otter.test.utils import CheckFailure, matches, patch
 from otter.util.config import set_config_data
 from otter.util.deferredutils import DeferredPool
+from otter.util.ratelimit import rate_limiters
 from otter.util.zkpartitioner import Partitioner
 
 
@@ -435,6 +442,70 @@ class APIMakeServiceTests(SynchronousTestCase):
         makeService(test_config)
         self.assertEqual(self.store.max_groups, 100)
 
+    def test_no_counts(self):
+        """
+        CassScalingGroupCollection counts rows by default
+        """
+        makeService(test_config)
+        self.assertIsNone(self.store.counts)
+
+    def test_optimistic_state(self):
+        """
+        CassScalingGroupCollection modifies group states optimistically only
+        if configured
+        """
+        makeService(test_config)
+        self.assertFalse(self.store.optimistic_state)
+        config = deepcopy(test_config)
+        config['cassandra']['optimistic_state'] = True
+        makeService(config)
+        self.assertTrue(self.store.optimistic_state)
+
+    def test_counts(self):
+        """
+        CassScalingGroupCollection maintains tenant resource counters if
+        configured, and the touched tenants' counters are reconciled
+        periodically
+        """
+        config = deepcopy(test_config)
+        config['limits']['counters'] = {'reconcile_interval': 100}
+        parent = makeService(config)
+        self.assertIsInstance(self.store.counts, TenantResourceCounts)
+        self.assertIs(self.store.counts.connection,
+                      self.LoggingCQLClient.return_value)
+        self.assertIs(self.store.counts.reactor, self.reactor)
+        [timer] = [s for s in parent if isinstance(s, TimerService)]
+        self.assertEqual(timer.step, 100)
+        self.assertEqual(timer.call, (self.store.counts.reconcile_touched,
+                                      (self.log.bind.return_value,), {}))
+        self.log.bind.assert_any_call(system='otter.counts')
+
+    @mock.patch('otter.tap.api.get_full_dispatcher', return_value="disp")
+    @mock.patch('otter.tap.api.setup_scheduler')
+    @mock.patch('otter.tap.api.TxKazooClient')
+    @mock.patch('otter.tap.api.KazooClient')
+    @mock.patch('otter.tap.api.ThreadPool')
+    @mock.patch('otter.tap.api.TxLogger')
+    def test_counts_kazoo_client(self, mock_tx_logger, mock_thread_pool,
+                                 mock_kazoo_client, mock_txkz,
+                                 mock_setup_scheduler, mock_gfd):
+        """
+        The tenant resource counts get the kazoo client after it has
+        started, to reconcile from one node at a time
+        """
+        config = deepcopy(test_config)
+        config['limits']['counters'] = {'reconcile_interval': 100}
+        config['zookeeper'] = {'hosts': 'zk_hosts', 'threads': 20}
+        kz_client = mock.Mock(spec=['start', 'stop'])
+        start_d = defer.Deferred()
+        kz_client.start.return_value = start_d
+        mock_txkz.return_value = kz_client
+
+        makeService(config)
+        self.assertIsNone(self.store.counts.kz_client)
+        start_d.callback(None)
+        self.assertIs(self.store.counts.kz_client, kz_client)
+
     @mock.patch('otter.tap.api.reactor')
     @mock.patch('otter.tap.api.generate_authenticator')
     @mock.patch('otter.tap.api.SupervisorService', wraps=SupervisorService)
@@ -444,10 +515,26 @@ class APIMakeServiceTests(SynchronousTestCase):
         """
         self.addCleanup(lambda: set_supervisor(None))
         makeService(test_config)
-        mock_ga.assert_called_once_with(mock_reactor, test_config['identity'])
+        mock_ga.assert_called_once_with(mock_reactor, test_config['identity'],
+                                        None)
         self.assertIdentical(get_supervisor().authenticator,
                              mock_ga.return_value)
 
+    @mock.patch('otter.tap.api.reactor')
+    @mock.patch('otter.tap.api.generate_authenticator')
+    def test_authenticator_shared_cache(self, mock_ga, mock_reactor):
+        """
+        Authenticator is generated with tokens shared in Cassandra if
+        configured
+        """
+        self.addCleanup(lambda: set_supervisor(None))
+        config = deepcopy(test_config)
+        config['identity']['shared_cache'] = True
+        makeService(config)
+        cache = mock_ga.call_args[0][2]
+        self.assertIsInstance(cache, CassTokenCache)
+        self.assertIs(cache.clock, mock_reactor)
+
     @mock.patch('otter.tap.api.SupervisorService', wraps=SupervisorService)
     def test_health_checker_no_zookeeper(self, supervisor):
         """
@@ -464,6 +551,10 @@ class APIMakeServiceTests(SynchronousTestCase):
                          self.store.kazoo_health_check)
         self.assertEqual(self.health_checker.checks['supervisor'],
                          get_supervisor().health_check)
+        self.assertEqual(self.health_checker.checks['rate_limiters'],
+                         rate_limiters.health_check)
+        self.assertEqual(self.health_checker.checks['group_cache'],
+                         self.store.group_cache.health_check)
 
     @mock.patch('otter.tap.api.SupervisorService', wraps=SupervisorService)
     def test_supervisor_service_set_by_default(self, supervisor):
@@ -486,8 +577,8 @@ class APIMakeServiceTests(SynchronousTestCase):
 
         conf = deepcopy(test_config)
         conf['cloudfeeds'] = {'service': 'cloudFeeds', 'tenant_id': 'tid',
-                              'url': 'url'}
-        makeService(conf)
+                              'url': 'url', 'queue_size': 50}
+        parent = makeService(conf)
         serv_confs = get_service_configs(conf)
         serv_confs[ServiceType.CLOUD_FEEDS] = {
             'name': 'cloudFeeds', 'region': 'ord', 'url': 'url'}
@@ -501,7 +592,8 @@ class APIMakeServiceTests(SynchronousTestCase):
                 authenticator=matches(IsInstance(CachingAuthenticator)),
                 tenant_id='tid',
                 region='ord',
-                service_configs=serv_confs))
+                service_configs=serv_confs,
+                publisher=matches(IsInstance(CloudFeedsPublisher))))
 
         # single tenant authenticator is created
         authenticator = cf_observer.authenticator
@@ -509,6 +601,17 @@ class APIMakeServiceTests(SynchronousTestCase):
             authenticator._authenticator._authenticator._authenticator,
             SingleTenantAuthenticator)
 
+        # events are published from a queue by a child service that reports
+        # its health
+        publisher = cf_observer.publisher
+        self.assertIn(publisher, list(parent))
+        self.assertEqual(
+            (publisher.max_size, publisher.concurrency,
+             publisher.stop_timeout, publisher.clock),
+            (50, 10, 30, self.reactor))
+        self.assertEqual(self.health_checker.checks['cloudfeeds'],
+                         publisher.health_check)
+
     def test_cloudfeeds_no_setup(self):
         """
         Cloud feeds observer is not setup if it is not there in config
@@ -689,7 +792,7 @@ class APIMakeServiceTests(SynchronousTestCase):
         parent = makeService(config)
 
         mock_setup_converger.assert_called_once_with(
-            parent, kz_client, mock.ANY, 10, 3600, 10)
+            parent, kz_client, mock.ANY, 10, 3600, 10, None, None)
 
         dispatcher = mock_setup_converger.call_args[0][2]
 
@@ -710,14 +813,19 @@ class ConvergerSetupTests(SynchronousTestCase):
         service.
         """
         ms = MultiService()
-        kz_client = object()
+        kz_client = mock.Mock(spec=['add_listener'])
         dispatcher = object()
         interval = 50
         setup_converger(ms, kz_client, dispatcher, interval, 35, 52)
         [converger] = ms.services
         self.assertIs(converger.__class__, Converger)
         self.assertEqual(converger.build_timeout, 35)
-        self.assertEqual(converger._dispatcher, dispatcher)
+        tenant_data_disp, queue_disp, rest = converger._dispatcher.dispatchers
+        self.assertIs(rest, dispatcher)
+        self.assertIsNot(
+            tenant_data_disp(GetTenantData('t', 'clb', Effect('e'))), None)
+        self.assertIsNot(
+            queue_disp(QueueConvergence('t', 'g', 0, Effect('e'))), None)
         self.assertEqual(converger.interval, interval / 2)
         self.assertEqual(converger.limited_retry_iterations, 52)
         [partitioner] = converger.services
@@ -728,6 +836,19 @@ class ConvergerSetupTests(SynchronousTestCase):
         self.assertEqual(timer.step, interval)
         mock_watch_children.assert_called_once_with(
             kz_client, CONVERGENCE_DIRTY_DIR, converger.divergent_changed)
+        kz_client.add_listener.assert_called_once_with(
+            converger.connection_state_changed)
+
+    @mock.patch('otter.tap.api.watch_children')
+    @mock.patch('otter.tap.api.ConvergenceQueue')
+    def test_concurrency_limits(self, mock_queue, mock_watch_children):
+        """
+        Groups are converged through a :obj:`ConvergenceQueue` with the given
+        concurrency limits.
+        """
+        setup_converger(MultiService(), mock.Mock(spec=['add_listener']),
+                        object(), 50, 35, 52, 100, 5)
+        mock_queue.assert_called_once_with(100, 5)
 
 
 class SchedulerSetupTests(SynchronousTestCase):
@@ -772,6 +893,28 @@ class SchedulerSetupTests(SynchronousTestCase):
         self.assertEqual(svc.partitioner.kz_client, self.kz_client)
         self.assertEqual(svc.partitioner.partitioner_path, '/part_path')
         self.assertEqual(svc.dispatcher, "disp")
+        self.assertIsNone(svc.timer)
+        self.assertIsNone(svc.max_in_flight)
+
+    def test_max_in_flight(self):
+        """
+        `SchedulerService` is given configured ``max_in_flight``
+        """
+        self.config['scheduler']['max_in_flight'] = 500
+        set_config_data(self.config)
+        svc = setup_scheduler(self.parent, "disp", self.store, self.kz_client)
+        self.assertEqual(svc.max_in_flight, 500)
+
+    def test_preload_window(self):
+        """
+        `SchedulerService` preloads events when ``preload_window`` is
+        configured
+        """
+        self.config['scheduler']['preload_window'] = 30
+        set_config_data(self.config)
+        svc = setup_scheduler(self.parent, "disp", self.store, self.kz_client)
+        self.assertEqual(svc.timer.window, 30)
+        self.assertEqual(svc.partitioner.got_buckets, svc.timer.set_buckets)
 
     def test_mock_store_with_scheduler(self):
         """
@@ -8,6 +8,7 @@ from effect import Effect, sync_perform
 import mock
 
 from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.error import ConnectionRefusedError, TimeoutError
 from twisted.internet.task import Clock
 from twisted.python.failure import Failure
 from twisted.trial.unittest import SynchronousTestCase
@@ -19,6 +20,7 @@ from otter.auth import (
     CachingAuthenticator,
     IAuthenticator,
     ICachingAuthenticator,
+    ITokenCache,
     ImpersonatingAuthenticator,
     NoSuchEndpoint,
     SingleTenantAuthenticator,
@@ -35,7 +37,7 @@ from otter.auth import (
     user_for_tenant
 )
 from otter.effect_dispatcher import get_simple_dispatcher
-from otter.test.utils import SameJSON, iMock, mock_log, patch
+from otter.test.utils import CheckFailure, SameJSON, iMock, mock_log, patch
 from otter.util.http import APIError, UpstreamError
 
 
@@ -687,6 +689,14 @@ class CachingAuthenticatorTests(SynchronousTestCase):
         result = self.successResultOf(self.ca.authenticate_tenant(1))
         self.assertEqual(result, self.result)
 
+    def test_last_used_not_recorded(self):
+        """
+        When tenants were last used is not recorded without refreshing ahead
+        """
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.assertEqual(self.ca._last_used, {})
+
     def test_cache_expires(self):
         """
         authenticate_tenant will call auth_function again after the ttl has
@@ -782,6 +792,365 @@ class CachingAuthenticatorTests(SynchronousTestCase):
         self.assertEqual(self.successResultOf(d), 'r2')
 
 
+def _fake_authenticator(test):
+    """
+    Return an :obj:`IAuthenticator` whose ``authenticate_tenant`` returns
+    ``test.result``. It fails if the result is an exception.
+    """
+    auth = iMock(IAuthenticator)
+
+    def authenticate(tenant_id, log=None):
+        r = test.result
+        if isinstance(r, Deferred):
+            return r
+        return fail(r) if isinstance(r, Exception) else succeed(r)
+
+    auth.authenticate_tenant.side_effect = authenticate
+    return auth
+
+
+class RefreshAheadTests(SynchronousTestCase):
+    """
+    Tests for refreshing tokens ahead of expiry in `CachingAuthenticator`
+    """
+
+    def setUp(self):
+        """
+        Authenticator with TTL of 10 seconds refreshing 3 seconds before
+        expiry. Scheduled refreshes happen 1.5 seconds before expiry.
+        """
+        self.result = 't1'
+        self.auth = _fake_authenticator(self)
+        self.clock = Clock()
+        self.uniform = patch(self, 'otter.auth.random.uniform',
+                             return_value=1.5)
+        self.ca = CachingAuthenticator(self.clock, self.auth, 10,
+                                       refresh_margin=3)
+
+    def test_refreshes_in_background(self):
+        """
+        A token used within the margin of its expiry is returned and
+        refreshed in the background
+        """
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.clock.advance(7)
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't1')
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 1)
+
+        refresh_d = Deferred()
+        self.result = refresh_d
+        self.clock.advance(1)
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't1')
+        # only one refresh at a time
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.clock.advance(1)
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+
+        refresh_d.callback('t2')
+        self.clock.advance(4)
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't2')
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+
+    def test_refresh_error_logged(self):
+        """
+        An error refreshing in the background is logged and does not affect
+        the cached token
+        """
+        log = mock_log()
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.clock.advance(8)
+        self.result = APIError(500, '500')
+        self.assertEqual(
+            self.successResultOf(self.ca.authenticate_tenant(1, log=log)),
+            't1')
+        self.assertEqual(
+            log.err.call_args[0],
+            (CheckFailure(APIError), 'otter.auth.cache.refresh.error'))
+        self.assertEqual(
+            self.successResultOf(self.ca.authenticate_tenant(1, log=log)),
+            't1')
+
+    def test_scheduled_refresh(self):
+        """
+        Tokens of tenants used within the last TTL are refreshed at a random
+        time within the margin before they expire without being used then
+        """
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.uniform.assert_called_once_with(1.5, 3)
+        self.clock.advance(5)
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.result = 't2'
+        self.clock.advance(3.5)
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+        self.clock.advance(1.5)
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't2')
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+
+    def test_scheduled_refresh_idle(self):
+        """
+        Tokens of tenants not used within the last TTL are not refreshed
+        """
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        # refreshed since it was used at 0
+        self.clock.advance(8.5)
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+        # not used since
+        self.clock.advance(8.5)
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_last_used_expires_with_token(self):
+        """
+        When a tenant was last used is forgotten along with its token when
+        the token expires, is invalidated or could not be got
+        """
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.result = APIError(500, '500')
+        # refresh fails so the token is not refreshed again
+        self.clock.advance(8.5)
+        self.flushLoggedErrors(APIError)
+        self.assertEqual(self.ca._last_used, {1: 0})
+        self.clock.advance(2)
+        self.failureResultOf(self.ca.authenticate_tenant(1), APIError)
+        self.assertEqual(self.ca._last_used, {})
+        self.assertEqual(self.ca._cache, {})
+
+        self.result = 't1'
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.ca.invalidate(1)
+        self.assertEqual(self.ca._last_used, {})
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+class SharedCacheTests(SynchronousTestCase):
+    """
+    Tests for `CachingAuthenticator` with a shared :obj:`ITokenCache`
+    """
+
+    def setUp(self):
+        """
+        Authenticator with TTL of 10 seconds refreshing 3 seconds before
+        expiry and a shared cache. Scheduled refreshes happen 1.5 seconds
+        before expiry.
+        """
+        self.result = 't1'
+        self.auth = _fake_authenticator(self)
+        self.clock = Clock()
+        self.clock.advance(100)
+        patch(self, 'otter.auth.random.uniform', return_value=1.5)
+        self.shared = iMock(ITokenCache)
+        self.entry = None
+        self.shared.get_token.side_effect = lambda t: succeed(self.entry)
+        self.shared.set_token.return_value = succeed(None)
+        self.shared.delete_token.return_value = succeed(None)
+        self.claimed = True
+        self.shared.claim_refresh.side_effect = (
+            lambda t, ttl: succeed(self.claimed))
+        self.log = mock_log()
+        self.ca = CachingAuthenticator(self.clock, self.auth, 10,
+                                       shared_cache=self.shared,
+                                       refresh_margin=3)
+
+    def test_shared_hit(self):
+        """
+        Token found in the shared cache is used and cached in memory with
+        its creation time
+        """
+        self.entry = (95, 'ts')
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         'ts')
+        self.shared.get_token.assert_called_once_with(1)
+        self.assertFalse(self.auth.authenticate_tenant.called)
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         'ts')
+        self.assertEqual(self.shared.get_token.call_count, 1)
+        # expires based on shared creation time
+        self.entry = None
+        self.ca._refresh_margin = 0
+        self.clock.advance(6)
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't1')
+
+    def test_shared_miss_populates(self):
+        """
+        When token is not in the shared cache or has expired there, the
+        tenant is authenticated and the token is stored in the shared cache
+        """
+        self.entry = (80, 'ts')
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't1')
+        self.shared.set_token.assert_called_once_with(1, 100, 't1', 10)
+
+    def test_shared_error(self):
+        """
+        If the shared cache fails, the error is logged and tenant is
+        authenticated
+        """
+        self.shared.get_token.side_effect = None
+        self.shared.get_token.return_value = fail(ValueError('cass'))
+        self.shared.set_token.return_value = fail(ValueError('cass'))
+        self.assertEqual(
+            self.successResultOf(
+                self.ca.authenticate_tenant(1, log=self.log)),
+            't1')
+        self.assertEqual(
+            [c[1] for c in self.log.err.mock_calls],
+            [(CheckFailure(ValueError), 'otter.auth.cache.shared.error')] * 2)
+
+    def test_refresh_claimed(self):
+        """
+        Token is refreshed ahead of expiry only if the refresh is claimed
+        """
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.clock.advance(8)
+        self.result = 't2'
+        self.entry = (100, 't1')
+        self.claimed = False
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't1')
+        self.shared.claim_refresh.assert_called_once_with(1, 3)
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 1)
+
+        self.claimed = True
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+        self.shared.set_token.assert_called_with(1, 108, 't2', 10)
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't2')
+
+    def test_refreshed_elsewhere(self):
+        """
+        If another process has already refreshed the token, it is used
+        without claiming a refresh
+        """
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.clock.advance(8)
+        self.entry = (107, 't3')
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.assertFalse(self.shared.claim_refresh.called)
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't3')
+
+    def test_invalidate(self):
+        """
+        `invalidate` removes the token from the shared cache too
+        """
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.assertIsNone(self.successResultOf(self.ca.invalidate(1)))
+        self.shared.delete_token.assert_called_once_with(1)
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+
+
+class FailureCacheTests(SynchronousTestCase):
+    """
+    Tests for caching authentication failures in `CachingAuthenticator`
+    """
+
+    def setUp(self):
+        """
+        Authenticator caching failures for 5 seconds
+        """
+        self.result = APIError(401, '401')
+        self.auth = _fake_authenticator(self)
+        self.clock = Clock()
+        self.ca = CachingAuthenticator(self.clock, self.auth, 10,
+                                       failure_ttl=5)
+
+    def test_failure_cached(self):
+        """
+        Failure is returned without authenticating again until failure TTL
+        """
+        self.failureResultOf(self.ca.authenticate_tenant(1), APIError)
+        self.clock.advance(5)
+        self.failureResultOf(self.ca.authenticate_tenant(1), APIError)
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 1)
+        self.clock.advance(1)
+        self.result = 't1'
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't1')
+
+    def test_failure_per_tenant(self):
+        """
+        Failure of a tenant is not returned for other tenants
+        """
+        self.failureResultOf(self.ca.authenticate_tenant(1), APIError)
+        self.result = 't2'
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(2)),
+                         't2')
+
+    def test_invalidate(self):
+        """
+        `invalidate` forgets the failure
+        """
+        self.failureResultOf(self.ca.authenticate_tenant(1), APIError)
+        self.ca.invalidate(1)
+        self.result = 't1'
+        self.assertEqual(self.successResultOf(self.ca.authenticate_tenant(1)),
+                         't1')
+
+    def test_refresh_failure_cached(self):
+        """
+        Token is not refreshed ahead of expiry again within failure TTL of
+        a failed refresh
+        """
+        patch(self, 'otter.auth.random.uniform', return_value=1.5)
+        self.ca._refresh_margin = 3
+        self.result = 't1'
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.clock.advance(7.5)
+        self.result = APIError(401, '401')
+        log = mock_log()
+        self.successResultOf(self.ca.authenticate_tenant(1, log=log))
+        self.successResultOf(self.ca.authenticate_tenant(1, log=log))
+        self.clock.advance(1)
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+        self.assertEqual(log.err.call_count, 1)
+
+    def test_rejections_cached(self):
+        """
+        403 and 404 responses are cached too, also when wrapped in
+        `UpstreamError`
+        """
+        for tenant_id, code in [(1, 403), (2, 404)]:
+            self.result = UpstreamError(
+                Failure(APIError(code, 'rejected')), 'identity', 'auth')
+            self.failureResultOf(self.ca.authenticate_tenant(tenant_id),
+                                 UpstreamError)
+            self.failureResultOf(self.ca.authenticate_tenant(tenant_id),
+                                 UpstreamError)
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+
+    def test_transient_failures_not_cached(self):
+        """
+        5xx responses, timeouts and connection errors are not cached
+        """
+        errors = [APIError(500, '500'),
+                  UpstreamError(Failure(APIError(503, '503')), 'identity',
+                                'auth'),
+                  UpstreamError(Failure(TimeoutError()), 'identity', 'auth'),
+                  ConnectionRefusedError()]
+        for error in errors:
+            self.result = error
+            self.failureResultOf(self.ca.authenticate_tenant(1),
+                                 type(error))
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 4)
+        self.assertEqual(self.ca._failures, {})
+
+    def test_disabled(self):
+        """
+        Failures are not cached by default
+        """
+        ca = CachingAuthenticator(self.clock, self.auth, 10)
+        self.failureResultOf(ca.authenticate_tenant(1), APIError)
+        self.failureResultOf(ca.authenticate_tenant(1), APIError)
+        self.assertEqual(self.auth.authenticate_tenant.call_count, 2)
+
+
 class RetryingAuthenticatorTests(SynchronousTestCase):
     """
     Tests for `RetryingAuthenticator`
@@ -980,6 +1349,18 @@ class AuthenticatorTests(SynchronousTestCase):
         a = generate_authenticator(r, self.config)
         self.assertEqual(a._authenticator._wait, 5)
 
+    def test_shared_cache(self):
+        """
+        CachingAuthenticator is created with given shared cache, and refresh
+        margin and failure TTL from config
+        """
+        self.config['cache_refresh_margin'] = 20
+        self.config['cache_failure_ttl'] = 15
+        a = generate_authenticator(mock.Mock(), self.config, 'cache')
+        self.assertEqual(a._shared_cache, 'cache')
+        self.assertEqual(a._refresh_margin, 20)
+        self.assertEqual(a._failure_ttl, 15)
+
     def test_cache_ttl_defaults(self):
         """
         CachingAuthenticator is created with default of 300 if not given
@@ -76,6 +76,7 @@ from otter.test.worker.test_launch_server_v1 import fake_service_catalog
 from otter.util.config import set_config_data
 from otter.util.http import APIError, headers
 from otter.util.pure_http import Request, has_code
+from otter.util.ratelimit import RateLimiters
 from otter.util.weaklocks import WeakLocks
 
 
@@ -398,6 +399,42 @@ class DefaultThrottlerTests(SynchronousTestCase):
             locks, clock, ServiceType.CLOUD_SERVERS, 'post', 'any-tenant')
         self.assertIsNot(deleter, poster)
 
+    def test_rate_limit(self):
+        """
+        A configured create server rate limit takes precedence over the delay
+        and is applied per tenant.
+        """
+        set_config_data(
+            {"cloud_client": {
+                "throttling": {"create_server_delay": 1},
+                "rate_limits": {"create_server": {"tenant_rate": 1}}}})
+        clock = Clock()
+        limiters = RateLimiters()
+        bracket = partial(_default_throttler, WeakLocks(), clock,
+                          ServiceType.CLOUD_SERVERS, 'post',
+                          rate_limiters=limiters)
+        self.assertEqual(self.successResultOf(bracket('t1')(lambda: 1)), 1)
+        d = bracket('t1')(lambda: 2)
+        self.assertEqual(self.successResultOf(bracket('t2')(lambda: 3)), 3)
+        self.assertNoResult(d)
+        clock.advance(1)
+        self.assertEqual(self.successResultOf(d), 2)
+
+    def test_rate_limit_not_configured(self):
+        """
+        Without a rate limit the configured delay is used.
+        """
+        set_config_data(
+            {"cloud_client": {"throttling": {"create_server_delay": 1}}})
+        clock = Clock()
+        bracket = _default_throttler(
+            WeakLocks(), clock, ServiceType.CLOUD_SERVERS, 'post', 't1',
+            rate_limiters=RateLimiters())
+        d = bracket(lambda: 1)
+        self.assertNoResult(d)
+        clock.advance(1)
+        self.assertEqual(self.successResultOf(d), 1)
+
     def _test_throttle(self, cfg_name, stype, method):
         """Test a specific throttling configuration."""
         locks = WeakLocks()
@@ -1571,6 +1571,172 @@ class ModifyAndTriggerTests(SynchronousTestCase):
         self.failureResultOf(d, controller.CannotExecutePolicyError)
         self.assertTrue(self.disp.consumed())
 
+    def _locked_group(self):
+        """
+        Make the group's ``modify_state`` wait for ``self.lock`` before
+        calling the modifier with "state0", recording the state written
+        """
+        self.lock = defer.Deferred()
+        self.written = []
+
+        def modify_state(f, modify_state_reason=None):
+            self.lock.addCallback(lambda _: f(self.group, "state0"))
+            return self.lock.addCallback(self.written.append)
+
+        self.group.modify_state.side_effect = modify_state
+
+    def test_coalesced(self):
+        """
+        Modifications requested while the group's lock is being waited for
+        are applied in order with one modify_state and trigger convergence
+        once
+        """
+        self._locked_group()
+        calls = []
+
+        def modify(group, state, new):
+            calls.append((group, state))
+            return new
+
+        ds = [
+            controller.modify_and_trigger(
+                self.disp, self.group, self.logargs, modify, new,
+                modify_state_reason='r')
+            for new in ["state1", "state2", "state3"]]
+        self.assertEqual(self.group.modify_state.call_count, 1)
+        for d in ds:
+            self.assertNoResult(d)
+        self.lock.callback(None)
+        self.assertEqual(
+            calls,
+            [(self.group, "state0"), (self.group, "state1"),
+             (self.group, "state2")])
+        self.assertEqual(self.written, ["state3"])
+        for d in ds:
+            self.assertIsNone(self.successResultOf(d))
+        self.assertTrue(self.disp.consumed())
+
+    def test_coalesced_failures(self):
+        """
+        A coalesced modification that fails gets its own error and is
+        skipped by the ones after it
+        """
+        self._locked_group()
+        ce = controller.CannotExecutePolicyError("t", "g", "p", "w")
+        d1 = controller.modify_and_trigger(
+            self.disp, self.group, self.logargs, self.modify)
+        d2 = controller.modify_and_trigger(
+            self.disp, self.group, self.logargs, lambda *a: raise_(ce))
+        d3 = controller.modify_and_trigger(
+            self.disp, self.group, self.logargs,
+            lambda group, state: state + "!")
+        self.lock.callback(None)
+        self.assertEqual(self.written, ["newstate!"])
+        self.successResultOf(d1)
+        self.failureResultOf(d2, controller.CannotExecutePolicyError)
+        self.successResultOf(d3)
+        self.assertTrue(self.disp.consumed())
+
+    def test_coalesced_failure_changes_not_kept(self):
+        """
+        The changes made to the state by a coalesced modification that fails
+        are not kept by the ones after it
+        """
+        self._locked_group()
+        state = GroupState('t', 'g', 'n', {}, {}, None, {}, False,
+                           ScalingGroupStatus.ACTIVE, desired=2)
+        self.group.modify_state.side_effect = (
+            lambda f, modify_state_reason=None: self.lock.addCallback(
+                lambda _: f(self.group, state)).addCallback(
+                    self.written.append))
+
+        def set_desired_and_fail(group, state):
+            state.desired = 10
+            raise ValueError("a")
+
+        def add_one(group, state):
+            state.desired += 1
+            return state
+
+        d1 = controller.modify_and_trigger(
+            self.disp, self.group, self.logargs, set_desired_and_fail)
+        d2 = controller.modify_and_trigger(
+            self.disp, self.group, self.logargs, add_one)
+        self.lock.callback(None)
+        self.failureResultOf(d1, ValueError)
+        self.successResultOf(d2)
+        self.assertEqual([s.desired for s in self.written], [3])
+        self.assertEqual(state.desired, 2)
+
+    def test_different_reasons_not_coalesced(self):
+        """
+        Modifications with different reasons are not coalesced, so that
+        each modify_state gets its own reason
+        """
+        self._locked_group()
+        for reason in ['r1', 'r1', 'r2']:
+            controller.modify_and_trigger(
+                self.disp, self.group, self.logargs, self.modify,
+                modify_state_reason=reason)
+        self.assertEqual(
+            [c[1] for c in self.group.modify_state.call_args_list],
+            [{'modify_state_reason': 'r1'}, {'modify_state_reason': 'r2'}])
+
+    def test_modified_again(self):
+        """
+        If modify_state calls the modifier again because the state changed
+        concurrently, only the failures of the last call are kept
+        """
+        written = []
+
+        def modify_state(f, modify_state_reason=None):
+            d = defer.maybeDeferred(f, self.group, "state0")
+            d.addErrback(lambda _: f(self.group, "state1"))
+            return d.addCallback(written.append)
+
+        self.group.modify_state.side_effect = modify_state
+
+        def modify(group, state):
+            if state == "state0":
+                raise ValueError("a")
+            return "newstate"
+
+        d = controller.modify_and_trigger(
+            self.disp, self.group, self.logargs, modify)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(written, ["newstate"])
+        self.assertTrue(self.disp.consumed())
+
+    def test_not_coalesced_after_lock(self):
+        """
+        Modifications requested after the pending ones have started being
+        applied are done with another modify_state
+        """
+        self.group.pause_modify_state = True
+        controller.modify_and_trigger(
+            self.disp, self.group, self.logargs, self.modify)
+        set_config_data(None)
+        d = controller.modify_and_trigger(
+            self.disp, self.group, self.logargs, self.modify)
+        self.assertEqual(self.group.modify_state.call_count, 2)
+        self.assertNoResult(d)
+
+    def test_coalesced_modify_state_error(self):
+        """
+        If modify_state fails, all coalesced modifications fail with its
+        error and convergence is not triggered
+        """
+        self._locked_group()
+        ds = [
+            controller.modify_and_trigger(
+                self.disp, self.group, self.logargs, self.modify)
+            for _ in range(2)]
+        self.lock.errback(ValueError("a"))
+        for d in ds:
+            self.failureResultOf(d, ValueError)
+        self.assertFalse(self.disp.consumed())
+        self.assertEqual(controller._pending_modifications, {})
+
 
 _should_retry_params = ShouldDelayAndRetry(
     can_retry=retry_times(3),
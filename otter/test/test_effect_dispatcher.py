@@ -1,6 +1,6 @@
 """Tests for :module:`otter.effect_dispatcher`."""
 
-from effect import Constant, Delay, Effect, sync_perform
+from effect import Constant, Delay, Effect, TypeDispatcher, sync_perform
 from effect.ref import ReadReference, Reference
 
 from twisted.trial.unittest import SynchronousTestCase
@@ -102,3 +102,9 @@ class FullDispatcherTests(SynchronousTestCase, IntentSupportMixin):
 
     def get_intents(self):
         return full_intents()
+
+    def test_flat(self):
+        """
+        All the performers are looked up in one mapping.
+        """
+        self.assertIsInstance(self.get_dispatcher(), TypeDispatcher)
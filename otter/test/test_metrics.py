@@ -7,7 +7,7 @@ import time
 from datetime import datetime
 from io import StringIO
 
-from effect import Constant, Effect, Func, base_dispatcher
+from effect import Constant, Effect, Func, TypeDispatcher, base_dispatcher
 from effect.testing import SequenceDispatcher, perform_sequence
 
 import mock
@@ -18,10 +18,12 @@ from toolz.dicttoolz import keyfilter, merge
 from toolz.itertoolz import groupby
 
 from twisted.internet.base import ReactorBase
-from twisted.internet.defer import fail, succeed
+from twisted.internet.defer import Deferred, fail, succeed
 from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
+from txeffect import deferred_performer
+
 from otter.auth import IAuthenticator
 from otter.cloud_client import TenantScope, service_request
 from otter.constants import ServiceType
@@ -41,6 +43,7 @@ from otter.metrics import (
     makeService,
     unchanged_divergent_groups
 )
+from otter.models.cass import CassTokenCache
 from otter.test.test_auth import identity_config
 from otter.test.utils import (
     CheckFailureValue,
@@ -172,6 +175,34 @@ class GetAllMetricsTests(SynchronousTestCase):
                             get_all_metrics_effects=_game)
         self.assertEqual(self.successResultOf(d), ['foo'])
 
+    def test_limited_lazy(self):
+        """
+        At most 10 effects are performed at a time and an effect is created
+        only when a worker is free to perform it
+        """
+        class Wait(object):
+            def __init__(self, d):
+                self.d = d
+
+        waiting = []
+        dispatcher = TypeDispatcher(
+            {Wait: deferred_performer(lambda dispatcher, intent: intent.d)})
+
+        def _game(groups, log, _print=False):
+            for i in range(12):
+                waiting.append(Deferred())
+                yield Effect(Wait(waiting[-1]))
+
+        d = get_all_metrics(dispatcher, object(), "log",
+                            get_all_metrics_effects=_game)
+        self.assertEqual(len(waiting), 10)
+        waiting[3].callback([3])
+        self.assertEqual(len(waiting), 11)
+        # firing a result lets its worker create and perform the next effect
+        for i in [0, 1, 2] + range(4, 12):
+            waiting[i].callback([i])
+        self.assertEqual(sorted(self.successResultOf(d)), range(12))
+
 
 class AddToCloudMetricsTests(SynchronousTestCase):
     """
@@ -353,12 +384,14 @@ class GetTodaysScalingGroupsTests(SynchronousTestCase):
         since last time. Updates the current fetch in file
         """
         seq = [
-            (GetAllGroups(), const(self.groups)),
             (ReadFileLines("file"), const(["2", "0.0"])),
+            (GetAllGroups(parallel=3, max_tenants=7, always_tenants=("t1",)),
+             const(self.groups)),
             (Func(datetime.utcnow), const(datetime(1970, 1, 2))),
             (WriteFileLines("file", [7, 86400.0]), noop)
         ]
-        r = perform_sequence(seq, get_todays_scaling_groups(["t1"], "file"))
+        r = perform_sequence(
+            seq, get_todays_scaling_groups(["t1"], "file", parallel=3))
         self.assertEqual(
             r,
             keyfilter(lambda k: k in ["t{}".format(i) for i in range(1, 9)],
@@ -370,10 +403,11 @@ class GetTodaysScalingGroupsTests(SynchronousTestCase):
         from file
         """
         seq = [
-            (GetAllGroups(), const(self.groups)),
             (ReadFileLines("file"), lambda i: raise_(IOError("e"))),
             (LogErr(mock.ANY, "error reading previous number of tenants", {}),
              noop),
+            (GetAllGroups(max_tenants=5, always_tenants=("t1",)),
+             const(self.groups)),
             (Func(datetime.utcnow), const(datetime(1970, 1, 2))),
             (WriteFileLines("file", [5, 86400.0]), noop)
         ]
@@ -388,8 +422,9 @@ class GetTodaysScalingGroupsTests(SynchronousTestCase):
         Logs and ignores error writing to the file
         """
         seq = [
-            (GetAllGroups(), const(self.groups)),
             (ReadFileLines("file"), const(["2", "0.0"])),
+            (GetAllGroups(max_tenants=7, always_tenants=("t1",)),
+             const(self.groups)),
             (Func(datetime.utcnow), const(datetime(1970, 1, 2))),
             (WriteFileLines("file", [7, 86400.0]),
              lambda i: raise_(IOError("bad"))),
@@ -441,7 +476,7 @@ class CollectMetricsTests(SynchronousTestCase):
                        "convergence-tenants": ["ct"]}
 
         self.sequence = SequenceDispatcher([
-            (("gtsg", ["ct"], "lpath"), const(self.groups)),
+            (("gtsg", ["ct"], "lpath", 1), const(self.groups)),
             (TenantScope(mock.ANY, "tid"),
              nested_sequence([
                  (("atcm", 200, "r", "metrics", 2, self.log, False), noop)
@@ -490,12 +525,31 @@ class CollectMetricsTests(SynchronousTestCase):
         self.get_dispatcher.assert_called_once_with(
             _reactor, auth, self.log, mock.ANY, mock.ANY)
 
+    def test_scan_parallel(self):
+        """
+        The groups are scanned with the configured number of token ranges
+        scanned concurrently
+        """
+        sequence = SequenceDispatcher([
+            (("gtsg", ["ct"], "lpath", 4), const(self.groups)),
+            (TenantScope(mock.ANY, "tid"),
+             nested_sequence([
+                 (("atcm", 200, "r", "metrics", 2, self.log, False), noop)
+             ]))
+        ])
+        self.get_dispatcher.return_value = sequence
+        self.config['metrics']['scan_parallel'] = 4
+        with sequence.consume():
+            d = collect_metrics("reactor", self.config, self.log,
+                                client=self.client)
+            self.assertEqual(self.successResultOf(d), "metrics")
+
     def test_without_metrics(self):
         """
         Doesnt add metrics to blueflood if metrics config is not there
         """
         sequence = SequenceDispatcher([
-            (("gtsg", ["ct"], "last_tenant.txt"), const(self.groups))
+            (("gtsg", ["ct"], "last_tenant.txt", 1), const(self.groups))
         ])
         self.get_dispatcher.return_value = sequence
         del self.config["metrics"]
@@ -618,6 +672,16 @@ class ServiceTests(SynchronousTestCase):
         self.assertIsNone(self.successResultOf(d))
         self.log.err.assert_called_once_with(None, "Error collecting metrics")
 
+    def test_shared_token_cache(self):
+        """
+        Authenticator shares tokens in Cassandra if configured
+        """
+        self.config['identity'] = dict(identity_config, shared_cache=True)
+        s = self._service()
+        cache = s._service.call[2]['authenticator']._shared_cache
+        self.assertIsInstance(cache, CassTokenCache)
+        self.assertIs(cache.connection, self.client)
+
     def test_stop_service(self):
         """
         Client is disconnected when service is stopped
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 import mock
 
 from twisted.internet import defer
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter.controller import CannotExecutePolicyError
@@ -17,6 +18,7 @@ from otter.models.interface import (
     NoSuchScalingGroupError
 )
 from otter.scheduler import (
+    EventTimer,
     SchedulerService,
     add_cron_events,
     check_events_in_bucket,
@@ -196,9 +198,281 @@ class SchedulerServiceTests(SchedulerTests, DeferredFunctionMixin):
         log = self.scheduler_service.log.bind.return_value
         self.assertEqual(self.check_events_in_bucket.mock_calls,
                          [mock.call(log, "disp", self.mock_store, 2,
-                                    'utcnow', 100),
+                                    'utcnow', 100, None),
                           mock.call(log, "disp", self.mock_store, 3,
-                                    'utcnow', 100)])
+                                    'utcnow', 100, None)])
+
+
+class SchedulerServicePreloadTests(SchedulerTests):
+    """
+    Tests for `SchedulerService` when it preloads events
+    """
+
+    def setUp(self):
+        """
+        Create scheduler service with a preload window
+        """
+        super(SchedulerServicePreloadTests, self).setUp()
+        self.log = mock_log()
+        patch(self, 'otter.scheduler.otter_log').bind.return_value = self.log
+
+        def pfactory(log, callable):
+            self.fake_partitioner = FakePartitioner(log, callable)
+            return self.fake_partitioner
+
+        self.clock = Clock()
+        self.scheduler_service = SchedulerService(
+            "disp", 100, self.mock_store, pfactory, preload_window=60,
+            clock=self.clock, max_in_flight=300)
+        self.timer = self.scheduler_service.timer
+
+    def test_timer_gets_buckets(self):
+        """
+        The partitioner gives the buckets to the event timer, which checks
+        the buckets with `check_events_in_bucket`
+        """
+        self.assertEqual(self.fake_partitioner.got_buckets,
+                         self.timer.set_buckets)
+        self.assertIs(self.timer.clock, self.clock)
+        self.assertEqual(self.timer.window, 60)
+        self.assertEqual(self.timer.batchsize, 100)
+        check = patch(self, 'otter.scheduler.check_events_in_bucket',
+                      return_value=defer.succeed(None))
+        self.timer.check_bucket(2, 'now')
+        check.assert_called_once_with(
+            matches(IsBoundWith(scheduler_run_id='transaction-id',
+                                utcnow='now')),
+            'disp', self.mock_store, 2, 'now', 100, 300)
+
+    def test_stop_stops_timer(self):
+        """
+        Stopping the service stops the event timer
+        """
+        self.timer.stop = mock.Mock()
+        self.scheduler_service.startService()
+        self.scheduler_service.stopService()
+        self.timer.stop.assert_called_once_with()
+
+
+class EventTimerTests(SynchronousTestCase):
+    """
+    Tests for :class:`EventTimer`
+    """
+
+    def setUp(self):
+        """
+        Timer with window of 60 seconds and batches of 2 events
+        """
+        self.clock = Clock()
+        self.clock.advance(1000)
+        self.events = {}
+        self.store = iMock(IScalingScheduleCollection)
+        self.store.get_events.side_effect = (
+            lambda bucket, until, size: defer.succeed(
+                [{'trigger': datetime.utcfromtimestamp(t)}
+                 for t in self.events.pop(bucket, [])]))
+        self.changes = {}
+        self.store.get_bucket_changes.side_effect = (
+            lambda buckets: defer.succeed(
+                {b: c for b, c in self.changes.items() if b in buckets}))
+        self.checks = []
+        self.log = mock_log()
+        self.timer = EventTimer(
+            self.clock, self.store, 60, 2, self.check_bucket, self.log)
+
+    def check_bucket(self, bucket, now):
+        d = defer.Deferred()
+        self.checks.append((bucket, now, d))
+        return d
+
+    def checked(self):
+        """
+        Return buckets and times checked so far and finish their checks
+        """
+        checks, self.checks = self.checks, []
+        for _, _, d in checks:
+            d.callback(None)
+        return [(b, (now - datetime(1970, 1, 1)).total_seconds())
+                for b, now, _ in checks]
+
+    def test_fires_at_trigger(self):
+        """
+        Buckets are checked when their events are due and not before
+        """
+        self.events = {1: [1010, 1030], 2: [1005]}
+        d = self.timer.set_buckets([1, 2])
+        self.successResultOf(d)
+        self.store.get_events.assert_has_calls(
+            [mock.call(1, datetime.utcfromtimestamp(1060), 2),
+             mock.call(2, datetime.utcfromtimestamp(1060), 2)],
+            any_order=True)
+        self.clock.advance(4)
+        self.assertEqual(self.checked(), [])
+        self.clock.advance(1)
+        self.assertEqual(self.checked(), [(2, 1005)])
+        self.clock.advance(5)
+        self.assertEqual(self.checked(), [(1, 1010)])
+        self.clock.advance(20)
+        self.assertEqual(self.checked(), [(1, 1030)])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_overdue(self):
+        """
+        Events that are already due are checked right away
+        """
+        self.events = {1: [900]}
+        self.timer.set_buckets([1])
+        self.clock.advance(0)
+        self.assertEqual(self.checked(), [(1, 1000)])
+
+    def test_window_not_reloaded(self):
+        """
+        Window is not read again on a partitioner tick until it has passed
+        """
+        self.events = {1: [1030]}
+        self.timer.set_buckets([1])
+        self.timer.set_buckets([1])
+        self.assertEqual(self.store.get_events.call_count, 1)
+        self.clock.advance(30)
+        self.assertEqual(self.checked(), [(1, 1030)])
+        self.timer.set_buckets([1])
+        self.assertEqual(self.store.get_events.call_count, 1)
+        self.clock.advance(30)
+        self.timer.set_buckets([1])
+        self.store.get_events.assert_called_with(
+            1, datetime.utcfromtimestamp(1120), 2)
+
+    def test_changed_reloaded(self):
+        """
+        Window of a bucket that has changed since it was read is read again
+        on the next partitioner tick, replacing its events
+        """
+        self.events = {1: [1030], 2: [1040]}
+        self.timer.set_buckets([1, 2])
+        self.changes = {1: 'c1'}
+        self.events = {1: [1010]}
+        self.timer.set_buckets([1, 2])
+        self.store.get_events.assert_called_with(
+            1, datetime.utcfromtimestamp(1060), 2)
+        self.assertEqual(self.store.get_events.call_count, 3)
+        self.timer.set_buckets([1, 2])
+        self.assertEqual(self.store.get_events.call_count, 3)
+        self.clock.advance(10)
+        self.assertEqual(self.checked(), [(1, 1010)])
+        self.clock.advance(30)
+        self.assertEqual(self.checked(), [(2, 1040)])
+
+    def test_reads_per_tick(self):
+        """
+        Across partitioner ticks, the owned buckets' changes are got in one
+        read per tick and the events of a bucket are read only when its
+        window has passed or it has changed
+        """
+        self.timer.window = 600
+        for _ in range(10):
+            self.timer.set_buckets([1, 2, 3])
+            self.clock.advance(10)
+        self.changes = {2: 'c'}
+        for _ in range(10):
+            self.timer.set_buckets([1, 2, 3])
+            self.clock.advance(10)
+        self.assertEqual(self.store.get_bucket_changes.call_count, 20)
+        self.assertEqual(self.store.get_events.call_count, 4)
+
+    def test_changes_error(self):
+        """
+        If the buckets' changes cannot be got, the error is logged and the
+        windows of all the buckets are read
+        """
+        self.timer.set_buckets([1, 2])
+        self.store.get_bucket_changes.side_effect = (
+            lambda buckets: defer.fail(ValueError('bad')))
+        self.successResultOf(self.timer.set_buckets([1, 2]))
+        self.log.err.assert_called_once_with(
+            CheckFailure(ValueError), 'scheduler-get-bucket-changes-error')
+        self.assertEqual(self.store.get_events.call_count, 4)
+
+    def test_full_batch(self):
+        """
+        If the window does not fit in a batch, the rest of it is read after
+        the bucket is checked at the last read trigger
+        """
+        self.events = {1: [1010, 1020]}
+        self.timer.set_buckets([1])
+        self.clock.advance(10)
+        self.assertEqual(self.checked(), [(1, 1010)])
+        self.events = {1: [1040]}
+        self.clock.advance(10)
+        self.assertEqual(self.checked(), [(1, 1020)])
+        self.store.get_events.assert_called_with(
+            1, datetime.utcfromtimestamp(1080), 2)
+        self.clock.advance(20)
+        self.assertEqual(self.checked(), [(1, 1040)])
+
+    def test_recheck_after_ongoing(self):
+        """
+        A bucket due while it is being checked is checked again after the
+        ongoing check finishes
+        """
+        self.events = {1: [1010, 1020]}
+        self.timer.set_buckets([1])
+        self.clock.advance(10)
+        self.clock.advance(10)
+        self.assertEqual(len(self.checks), 1)
+        self.clock.advance(5)
+        self.assertEqual(self.checked(), [(1, 1010)])
+        self.assertEqual(self.checked(), [(1, 1025)])
+
+    def test_check_error_logged(self):
+        """
+        Errors checking a bucket are logged and do not stop the timer
+        """
+        self.events = {1: [1010], 2: [1020]}
+        self.timer.set_buckets([1, 2])
+        self.clock.advance(10)
+        self.checks.pop()[2].errback(ValueError('bad'))
+        self.log.err.assert_called_once_with(
+            CheckFailure(ValueError), 'scheduler-check-bucket-error',
+            bucket=1)
+        self.clock.advance(10)
+        self.assertEqual(self.checked(), [(2, 1020)])
+
+    def test_load_error_retried(self):
+        """
+        Errors reading a window are logged and the window is read again on
+        the next partitioner tick
+        """
+        self.store.get_events.side_effect = iter([
+            defer.fail(ValueError('bad')),
+            defer.succeed([{'trigger': datetime.utcfromtimestamp(1010)}])])
+        self.successResultOf(self.timer.set_buckets([1]))
+        self.log.err.assert_called_once_with(
+            CheckFailure(ValueError), 'scheduler-load-events-error',
+            bucket=1)
+        self.timer.set_buckets([1])
+        self.clock.advance(10)
+        self.assertEqual(self.checked(), [(1, 1010)])
+
+    def test_lost_buckets(self):
+        """
+        Buckets that are no longer owned are not checked
+        """
+        self.events = {1: [1010], 2: [1020]}
+        self.timer.set_buckets([1, 2])
+        self.timer.set_buckets([2])
+        self.clock.advance(10)
+        self.assertEqual(self.checked(), [])
+        self.clock.advance(10)
+        self.assertEqual(self.checked(), [(2, 1020)])
+
+    def test_stop(self):
+        """
+        `stop` cancels pending checks
+        """
+        self.events = {1: [1010]}
+        self.timer.set_buckets([1])
+        self.timer.stop()
+        self.assertEqual(self.clock.getDelayedCalls(), [])
 
 
 class CheckEventsInBucketTests(SchedulerTests):
@@ -225,26 +499,48 @@ class CheckEventsInBucketTests(SchedulerTests):
             self, 'otter.scheduler.process_events',
             side_effect=lambda e, d, s, l: defer.succeed(len(e)))
         self.log = mock.Mock()
+        self.now = datetime(2015, 1, 1)
 
     def test_fetch_called(self):
         """
         `fetch_and_delete` called correctly
         """
         d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
-                                   'utcnow', 100)
+                                   self.now, 100)
         self.successResultOf(d)
         self.mock_store.fetch_and_delete.assert_called_once_with(
-            1, 'utcnow', 100)
+            1, self.now, 100)
         self.log.bind.assert_called_once_with(bucket=1)
 
     def test_no_events(self):
         """When no events are fetched, they are not processed."""
         d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
-                                   'utcnow', 100)
+                                   self.now, 100)
         self.successResultOf(d)
         self.process_events.assert_called_once_with(
             [], "disp", self.mock_store, self.log.bind())
 
+    def test_no_events_real_process(self):
+        """
+        Empty fetches, including the one after a final full batch, are
+        processed by the real `process_events` without any error
+        """
+        self.process_events.side_effect = process_events
+        execute_event = patch(self, 'otter.scheduler.execute_event',
+                              return_value=defer.succeed(None))
+        patch(self, 'otter.scheduler.add_cron_events',
+              return_value=defer.succeed(None))
+        events = self._events(2)
+        self.returns = [events, []]
+
+        d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
+                                   self.now, 2)
+
+        self.successResultOf(d)
+        self.assertEqual(self.mock_store.fetch_and_delete.call_count, 2)
+        self.assertEqual(execute_event.call_count, 2)
+        self.assertFalse(self.log.bind.return_value.err.called)
+
     def test_events_in_limit(self):
         """
         When events fetched < 100, they are processed
@@ -252,19 +548,19 @@ class CheckEventsInBucketTests(SchedulerTests):
         events = [{'tenantId': '1234',
                    'groupId': 'scal44',
                    'policyId': 'pol4{}'.format(i),
-                   'trigger': 'now',
+                   'trigger': datetime(2015, 1, 1),
                    'cron': None,
                    'bucket': 1}
                   for i in range(10)]
         self.returns = [events]
 
         d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
-                                   'utcnow', 100)
+                                   self.now, 100)
 
         self.successResultOf(d)
         # Ensure fetch_and_delete and process_events is called only once
         self.mock_store.fetch_and_delete.assert_called_once_with(
-            1, 'utcnow', 100)
+            1, self.now, 100)
         self.process_events.assert_called_once_with(
             events, "disp", self.mock_store, self.log.bind())
 
@@ -275,7 +571,7 @@ class CheckEventsInBucketTests(SchedulerTests):
         self.returns = [ValueError('e')]
 
         d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
-                                   'utcnow', 100)
+                                   self.now, 100)
 
         self.successResultOf(d)
         self.log.bind.return_value.err.assert_called_once_with(
@@ -287,25 +583,25 @@ class CheckEventsInBucketTests(SchedulerTests):
         events1 = [{'tenantId': '1234',
                     'groupId': 'scal44',
                     'policyId': 'pol4{}'.format(i),
-                    'trigger': 'now',
+                    'trigger': datetime(2015, 1, 1),
                     'cron': None,
                     'bucket': 1}
                    for i in range(100)]
         events2 = [{'tenantId': '1235',
                     'groupId': 'scal54',
                     'policyId': 'pol4{}'.format(i),
-                    'trigger': 'now',
+                    'trigger': datetime(2015, 1, 1),
                     'cron': None,
                     'bucket': 1}
                    for i in range(10)]
         self.returns = [events1, events2]
 
         d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
-                                   'now', 100)
+                                   self.now, 100)
 
         self.successResultOf(d)
         self.assertEqual(self.mock_store.fetch_and_delete.mock_calls,
-                         [mock.call(1, 'now', 100)] * 2)
+                         [mock.call(1, self.now, 100)] * 2)
         self.assertEqual(self.process_events.mock_calls,
                          [mock.call(events1,
                                     "disp",
@@ -324,20 +620,20 @@ class CheckEventsInBucketTests(SchedulerTests):
         events = [{'tenantId': '1234',
                    'groupId': 'scal44',
                    'policyId': 'pol4{}'.format(i),
-                   'trigger': 'now',
+                   'trigger': datetime(2015, 1, 1),
                    'cron': None,
                    'bucket': 1}
                   for i in range(100)]
         self.returns = [events, ValueError('some')]
 
         d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
-                                   'now', 100)
+                                   self.now, 100)
 
         self.successResultOf(d)
         self.log.bind.return_value.err.assert_called_once_with(
             CheckFailure(ValueError))
         self.assertEqual(self.mock_store.fetch_and_delete.mock_calls,
-                         [mock.call(1, 'now', 100)] * 2)
+                         [mock.call(1, self.now, 100)] * 2)
         self.process_events.assert_called_once_with(events, "disp",
                                                     self.mock_store,
                                                     self.log.bind())
@@ -350,34 +646,132 @@ class CheckEventsInBucketTests(SchedulerTests):
         events1 = [{'tenantId': '1234',
                     'groupId': 'scal44',
                     'policyId': 'pol4{}'.format(i),
-                    'trigger': 'now',
+                    'trigger': datetime(2015, 1, 1),
                     'cron': None,
                     'bucket': 1} for i in range(100)]
         events2 = [{'tenantId': '1235',
                     'groupId': 'scal54',
                     'policyId': 'pol4{}'.format(i),
-                    'trigger': 'now',
+                    'trigger': datetime(2015, 1, 1),
                     'cron': None,
                     'bucket': 1} for i in range(100)]
         events3 = [{'tenantId': '1236',
                     'groupId': 'scal64',
                     'policyId': 'pol4{}'.format(i),
-                    'trigger': 'now',
+                    'trigger': datetime(2015, 1, 1),
                     'cron': None,
                     'bucket': 1} for i in range(10)]
         self.returns = [events1, events2, events3]
 
         d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
-                                   'now', 100)
+                                   self.now, 100)
 
         self.successResultOf(d)
         self.assertEqual(self.mock_store.fetch_and_delete.mock_calls,
-                         [mock.call(1, 'now', 100)] * 3)
+                         [mock.call(1, self.now, 100)] * 3)
         self.assertEqual(self.process_events.mock_calls,
                          [mock.call(events, "disp", self.mock_store,
                                     self.log.bind())
                           for events in [events1, events2, events3]])
 
+    def _events(self, num):
+        return [{'tenantId': '1234', 'groupId': 'scal44',
+                 'policyId': 'pol{}'.format(i),
+                 'trigger': datetime(2015, 1, 1), 'cron': None, 'bucket': 1}
+                for i in range(num)]
+
+    def test_prefetch_in_flight(self):
+        """
+        Next batch is fetched while earlier batches are processed as long as
+        at most `max_in_flight` events are processed at a time
+        """
+        batches = [self._events(2), self._events(2), self._events(2),
+                   self._events(1)]
+        self.returns = batches[:]
+        processing = []
+
+        def process(events, *_):
+            d = defer.Deferred()
+            processing.append(d)
+            return d
+
+        self.process_events.side_effect = process
+
+        d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
+                                   self.now, 2, 5)
+
+        # 2 batches of 2 are processing and third batch would exceed limit
+        self.assertEqual(len(processing), 2)
+        self.assertEqual(self.mock_store.fetch_and_delete.call_count, 2)
+        processing[0].callback(2)
+        self.assertEqual(len(processing), 3)
+        processing[1].callback(2)
+        processing[2].callback(2)
+        self.assertEqual(len(processing), 4)
+        self.assertNoResult(d)
+        processing[3].callback(1)
+        self.successResultOf(d)
+        self.assertEqual(self.process_events.mock_calls,
+                         [mock.call(events, "disp", self.mock_store,
+                                    self.log.bind())
+                          for events in batches])
+
+    def test_process_error_stops_fetch(self):
+        """
+        When processing a batch fails, the error is logged, no more batches
+        are fetched and result waits for batches being processed
+        """
+        self.returns = [self._events(2), self._events(2), self._events(2)]
+        processing = []
+
+        def process(events, *_):
+            d = defer.Deferred()
+            processing.append(d)
+            return d
+
+        self.process_events.side_effect = process
+
+        d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
+                                   self.now, 2, 4)
+
+        processing[0].errback(ValueError('bad'))
+        self.log.bind.return_value.err.assert_called_once_with(
+            CheckFailure(ValueError))
+        self.assertNoResult(d)
+        processing[1].callback(2)
+        self.successResultOf(d)
+        self.assertEqual(self.mock_store.fetch_and_delete.call_count, 2)
+
+    def test_lag_logged(self):
+        """
+        The lag of oldest fetched event behind the time events are checked
+        before is logged for each batch
+        """
+        events = self._events(2)
+        events[1]['trigger'] = datetime(2015, 1, 1, 0, 0, 10)
+        self.returns = [events]
+
+        d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
+                                   datetime(2015, 1, 1, 0, 0, 30), 100)
+
+        self.successResultOf(d)
+        self.log.bind.return_value.msg.assert_called_once_with(
+            'sch-lag', scheduler_lag=30.0)
+
+    def test_lag_not_logged_empty_bucket(self):
+        """
+        No lag is logged when the bucket has no pending events
+        """
+        self.returns = [[]]
+
+        d = check_events_in_bucket(self.log, "disp", self.mock_store, 1,
+                                   datetime(2015, 1, 1, 0, 0, 30), 100)
+
+        self.successResultOf(d)
+        self.assertFalse(self.log.bind.return_value.msg.called)
+        self.mock_store.fetch_and_delete.assert_called_once_with(
+            1, datetime(2015, 1, 1, 0, 0, 30), 100)
+
 
 class ProcessEventsTests(SchedulerTests):
     """
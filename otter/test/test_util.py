@@ -5,6 +5,8 @@ from datetime import datetime
 import mock
 import json
 
+from iso8601 import ParseError
+
 from twisted.trial.unittest import SynchronousTestCase
 from twisted.internet.defer import succeed, fail, Deferred
 from twisted.internet.task import Clock
@@ -442,6 +444,53 @@ class TimestampTests(SynchronousTestCase):
                 datetime(2015, 5, 1, 4, 51, 12, 78580)),
             1430455872.078580)
 
+    def test_timestamp_to_epoch_same_as_iso8601(self):
+        """
+        ``timestamp_to_epoch`` returns the same epoch as converting the
+        datetime parsed by iso8601, whether the timestamp is in one of the
+        formats it parses itself or in another one
+        """
+        self.patch(timestamp, '_epoch_cache', {})
+        for ts in ['2015-05-01T04:51:12Z', '2015-05-01T04:51:12.078580Z',
+                   '2015-05-01T04:51:12.0785Z', '2015-05-01T04:51:12+05:30',
+                   '2015-05-01T04:51:12.5-11:00', '0001-01-01T00:00:00Z',
+                   '2015-05-01 04:51:12Z', '20150501T045112Z',
+                   '2015-05-01T04:51:12', '2015-05-01T04:51:12.1234567Z',
+                   '2015-05-01T04:51Z', '2015-05-01']:
+            self.assertEqual(
+                timestamp.timestamp_to_epoch(ts),
+                timestamp.datetime_to_epoch(timestamp.from_timestamp(ts)),
+                ts)
+
+    def test_timestamp_to_epoch_invalid(self):
+        """
+        ``timestamp_to_epoch`` raises iso8601's ``ParseError`` for invalid
+        timestamps and does not remember them
+        """
+        self.patch(timestamp, '_epoch_cache', {})
+        for ts in ['2015-02-29T00:00:00Z', '2015-05-01T24:00:00Z', 'junk',
+                   None]:
+            self.assertRaises(ParseError, timestamp.timestamp_to_epoch, ts)
+        self.assertEqual(timestamp._epoch_cache, {})
+
+    def test_timestamp_to_epoch_cached(self):
+        """
+        ``timestamp_to_epoch`` remembers the epochs of timestamps until it has
+        remembered too many of them
+        """
+        cache = {'2015-05-01T04:51:12Z': 3.0}
+        self.patch(timestamp, '_epoch_cache', cache)
+        self.patch(timestamp, '_EPOCH_CACHE_SIZE', 2)
+        self.assertEqual(
+            timestamp.timestamp_to_epoch('2015-05-01T04:51:12Z'), 3.0)
+        self.assertEqual(
+            timestamp.timestamp_to_epoch('1970-01-01T00:00:01Z'), 1.0)
+        self.assertEqual(cache, {'2015-05-01T04:51:12Z': 3.0,
+                                 '1970-01-01T00:00:01Z': 1.0})
+        self.assertEqual(
+            timestamp.timestamp_to_epoch('1970-01-01T00:00:02Z'), 2.0)
+        self.assertEqual(cache, {'1970-01-01T00:00:02Z': 2.0})
+
 
 class ConfigTest(SynchronousTestCase):
     """
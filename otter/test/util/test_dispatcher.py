@@ -0,0 +1,74 @@
+"""
+Tests for :mod:`otter.util.dispatcher`.
+"""
+
+from effect import ComposedDispatcher, TypeDispatcher
+
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.util.dispatcher import flatten_dispatcher
+
+
+class A(object):
+    """Intent A"""
+
+
+class B(object):
+    """Intent B"""
+
+
+class C(object):
+    """Intent C"""
+
+
+class FlattenDispatcherTests(SynchronousTestCase):
+    """
+    Tests for :func:`flatten_dispatcher`
+    """
+
+    def test_type_dispatcher(self):
+        """
+        A tree of only type dispatchers becomes a single type dispatcher whose
+        mapping has the performer that the tree would have found first
+        """
+        tree = ComposedDispatcher([
+            TypeDispatcher({A: 'a1', B: None}),
+            ComposedDispatcher([
+                TypeDispatcher({A: 'a2', B: 'b2'}),
+                ComposedDispatcher([])]),
+            TypeDispatcher({C: 'c3', B: 'b3'})])
+        flat = flatten_dispatcher(tree)
+        self.assertEqual(flat,
+                         TypeDispatcher({A: 'a1', B: 'b2', C: 'c3'}))
+        for intent in [A(), B(), C(), object()]:
+            self.assertEqual(flat(intent), tree(intent))
+
+    def test_other_dispatchers(self):
+        """
+        Type mappings are not merged across dispatchers that are not type
+        based, which are kept in the same order
+        """
+        def other(intent):
+            return 'other' if isinstance(intent, B) else None
+
+        tree = ComposedDispatcher([
+            TypeDispatcher({A: 'a1'}),
+            ComposedDispatcher([TypeDispatcher({C: 'c2'}), other]),
+            TypeDispatcher({B: 'b3', A: 'a3'})])
+        flat = flatten_dispatcher(tree)
+        self.assertEqual(
+            flat,
+            ComposedDispatcher([TypeDispatcher({A: 'a1', C: 'c2'}), other,
+                                TypeDispatcher({B: 'b3', A: 'a3'})]))
+        for intent in [A(), B(), C(), object()]:
+            self.assertEqual(flat(intent), tree(intent))
+
+    def test_not_composed(self):
+        """
+        A dispatcher that is not composed finds the same performers after
+        flattening
+        """
+        self.assertEqual(flatten_dispatcher(TypeDispatcher({A: 'a'})),
+                         TypeDispatcher({A: 'a'}))
+        flat = flatten_dispatcher(lambda intent: 'p')
+        self.assertEqual(flat(A()), 'p')
@@ -0,0 +1,265 @@
+"""
+Tests for :mod:`otter.util.ratelimit`.
+"""
+
+from twisted.internet.defer import CancelledError, Deferred
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.util.config import set_config_data
+from otter.util.ratelimit import RateLimiter, RateLimiters, TokenBucket
+
+
+class TokenBucketTests(SynchronousTestCase):
+    """
+    Tests for :obj:`TokenBucket`
+    """
+
+    def setUp(self):
+        """
+        Bucket refilled with 2 tokens a second holding at most 3
+        """
+        self.clock = Clock()
+        self.bucket = TokenBucket(self.clock, 2, 3)
+
+    def test_invalid(self):
+        """
+        Rate must be positive and burst at least 1
+        """
+        self.assertRaises(ValueError, TokenBucket, self.clock, 0, 1)
+        self.assertRaises(ValueError, TokenBucket, self.clock, 1, 0)
+
+    def test_burst(self):
+        """
+        A full bucket hands out ``burst`` tokens immediately and the next
+        caller waits for the refill
+        """
+        ds = [self.bucket.acquire() for _ in range(4)]
+        for d in ds[:3]:
+            self.assertIsNone(self.successResultOf(d))
+        self.assertNoResult(ds[3])
+        self.assertEqual(self.bucket.waiting, 1)
+        self.clock.advance(0.4)
+        self.assertNoResult(ds[3])
+        self.clock.advance(0.1)
+        self.successResultOf(ds[3])
+        self.assertEqual(self.bucket.waiting, 0)
+
+    def test_fifo(self):
+        """
+        Waiters get tokens in the order they asked for them, at ``rate``
+        """
+        for _ in range(3):
+            self.bucket.acquire()
+        fired = []
+        for i in range(3):
+            self.bucket.acquire().addCallback(lambda _, i=i: fired.append(i))
+        self.clock.pump([0.5] * 3)
+        self.assertEqual(fired, [0, 1, 2])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_refill_capped(self):
+        """
+        The bucket never holds more than ``burst`` tokens
+        """
+        self.clock.advance(100)
+        ds = [self.bucket.acquire() for _ in range(4)]
+        self.assertNoResult(ds[3])
+
+    def test_cancel(self):
+        """
+        Cancelling a waiter gives up its place and stops the wake up when
+        nobody else is waiting
+        """
+        for _ in range(3):
+            self.bucket.acquire()
+        d1, d2 = self.bucket.acquire(), self.bucket.acquire()
+        d1.cancel()
+        self.failureResultOf(d1, CancelledError)
+        self.clock.advance(0.5)
+        self.successResultOf(d2)
+        d3 = self.bucket.acquire()
+        d3.cancel()
+        self.failureResultOf(d3, CancelledError)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_idle(self):
+        """
+        A bucket is idle only when it is full and nobody is waiting
+        """
+        self.assertTrue(self.bucket.idle())
+        self.bucket.acquire()
+        self.assertFalse(self.bucket.idle())
+        self.clock.advance(0.5)
+        self.assertTrue(self.bucket.idle())
+
+
+class RateLimiterTests(SynchronousTestCase):
+    """
+    Tests for :obj:`RateLimiter`
+    """
+
+    def setUp(self):
+        """
+        Sample clock
+        """
+        self.clock = Clock()
+
+    def test_no_limits(self):
+        """
+        Without any limits the function is called immediately with the given
+        arguments
+        """
+        limiter = RateLimiter(self.clock)
+        d = limiter.run('t', lambda *a, **kw: (a, kw), 1, b=2)
+        self.assertEqual(self.successResultOf(d), ((1,), {'b': 2}))
+        self.assertEqual(limiter.waits, 0)
+
+    def test_returns_deferred_result(self):
+        """
+        The result of a Deferred returned by the function is propagated
+        """
+        limiter = RateLimiter(self.clock, 1)
+        inner = Deferred()
+        d = limiter.run('t', lambda: inner)
+        self.assertNoResult(d)
+        inner.callback('r')
+        self.assertEqual(self.successResultOf(d), 'r')
+
+    def test_global(self):
+        """
+        The global limit applies across tenants
+        """
+        limiter = RateLimiter(self.clock, 1, 1)
+        d1 = limiter.run('t1', lambda: 1)
+        d2 = limiter.run('t2', lambda: 2)
+        self.successResultOf(d1)
+        self.assertNoResult(d2)
+        self.clock.advance(1)
+        self.successResultOf(d2)
+
+    def test_tenant(self):
+        """
+        The tenant limit applies separately to each tenant
+        """
+        limiter = RateLimiter(self.clock, tenant_rate=1)
+        d1 = limiter.run('t1', lambda: 1)
+        d2 = limiter.run('t1', lambda: 2)
+        d3 = limiter.run('t2', lambda: 3)
+        self.successResultOf(d1)
+        self.assertNoResult(d2)
+        self.successResultOf(d3)
+        self.clock.advance(1)
+        self.successResultOf(d2)
+
+    def test_tenant_before_global(self):
+        """
+        A tenant waiting for its own token does not hold up other tenants
+        waiting for the global one
+        """
+        limiter = RateLimiter(self.clock, 1, 2, tenant_rate=0.1)
+        limiter.run('t1', lambda: None)
+        d1 = limiter.run('t1', lambda: 1)
+        d2 = limiter.run('t2', lambda: 2)
+        self.assertNoResult(d1)
+        self.successResultOf(d2)
+
+    def test_stats(self):
+        """
+        Queue depth and wait times are reported
+        """
+        limiter = RateLimiter(self.clock, 1, 1, tenant_rate=1)
+        limiter.run('t1', lambda: None)
+        limiter.run('t1', lambda: None)
+        limiter.run('t2', lambda: None)
+        self.assertEqual(
+            limiter.stats(),
+            {'waiting': 2, 'tenants_waiting': 1, 'waits': 0,
+             'total_wait_time': 0, 'max_wait_time': 0})
+        self.clock.advance(1)
+        self.clock.advance(1)
+        self.assertEqual(
+            limiter.stats(),
+            {'waiting': 0, 'tenants_waiting': 0, 'waits': 2,
+             'total_wait_time': 3, 'max_wait_time': 2})
+
+    def test_cancel(self):
+        """
+        Cancelled calls are not run and stop being counted as waiting
+        """
+        limiter = RateLimiter(self.clock, 1, 1, tenant_rate=1)
+        limiter.run('t1', lambda: None)
+        d = limiter.run('t2', lambda: self.fail('called'))
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.assertEqual(limiter.waiting, 0)
+
+    def test_prunes_idle_tenants(self):
+        """
+        Idle tenant buckets are thrown away once there are many of them
+        """
+        limiter = RateLimiter(self.clock, tenant_rate=1)
+        limiter._min_prune_size = limiter._prune_size = 2
+        limiter.run('t1', lambda: None)
+        limiter.run('t2', lambda: None)
+        self.clock.advance(1)
+        limiter.run('t3', lambda: None)
+        self.assertEqual(limiter._tenants.keys(), ['t3'])
+
+
+class RateLimitersTests(SynchronousTestCase):
+    """
+    Tests for :obj:`RateLimiters`
+    """
+
+    def setUp(self):
+        """
+        Sample limiters
+        """
+        self.clock = Clock()
+        self.limiters = RateLimiters()
+        self.addCleanup(set_config_data, {})
+
+    def set_limits(self, **limits):
+        set_config_data({'cloud_client': {'rate_limits': limits}})
+
+    def test_not_configured(self):
+        """
+        No limiter is returned when it is not configured
+        """
+        set_config_data({})
+        self.assertIsNone(self.limiters.get('create_server', self.clock))
+
+    def test_configured(self):
+        """
+        The configured limiter is built once and shared
+        """
+        self.set_limits(create_server={'rate': 1, 'tenant_rate': 2,
+                                       'tenant_burst': 3})
+        limiter = self.limiters.get('create_server', self.clock)
+        self.assertIs(limiter.clock, self.clock)
+        self.assertEqual(limiter._global.rate, 1)
+        self.assertEqual(limiter._global.burst, 1)
+        self.assertEqual((limiter._tenant_rate, limiter._tenant_burst),
+                         (2, 3))
+        self.assertIs(self.limiters.get('create_server', self.clock),
+                      limiter)
+
+    def test_reconfigured(self):
+        """
+        A new limiter is built when the configuration changes
+        """
+        self.set_limits(create_server={'rate': 1})
+        limiter = self.limiters.get('create_server', self.clock)
+        self.set_limits(create_server={'rate': 2})
+        self.assertIsNot(self.limiters.get('create_server', self.clock),
+                         limiter)
+
+    def test_health_check(self):
+        """
+        The health check is always healthy and reports every limiter's stats
+        """
+        self.set_limits(create_server={'rate': 1})
+        limiter = self.limiters.get('create_server', self.clock)
+        self.assertEqual(self.limiters.health_check(),
+                         (True, {'create_server': limiter.stats()}))
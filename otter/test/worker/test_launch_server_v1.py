@@ -13,7 +13,7 @@ from testtools.matchers import IsInstance, MatchesRegex, StartsWith
 
 from toolz.dicttoolz import merge
 
-from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.defer import CancelledError, Deferred, fail, succeed
 from twisted.internet.task import Clock
 from twisted.python.failure import Failure
 from twisted.trial.unittest import SynchronousTestCase
@@ -38,8 +38,10 @@ from otter.undo import IUndoStack
 from otter.util.config import set_config_data
 from otter.util.deferredutils import TimedOutError, unwrap_first_error
 from otter.util.http import APIError, RequestError, wrap_request_error
+from otter.util.ratelimit import RateLimiters
 from otter.worker import launch_server_v1
 from otter.worker.launch_server_v1 import (
+    BuildPoller,
     CLBOrNodeDeleted,
     LB_MAX_RETRIES,
     LB_RETRY_INTERVAL_RANGE,
@@ -57,7 +59,9 @@ from otter.worker.launch_server_v1 import (
     delete_and_verify,
     delete_server,
     find_server,
+    get_build_poller,
     launch_server,
+    list_servers_changed_since,
     prepare_launch_config,
     remove_from_load_balancer,
     scrub_otter_metadata,
@@ -890,6 +894,116 @@ def _get_server_info(metadata=None, created=None):
     return config
 
 
+class BuildPollerTests(SynchronousTestCase):
+    """
+    Tests for :class:`BuildPoller`
+    """
+
+    def setUp(self):
+        """
+        Poller with a stubbed out listing of changed servers
+        """
+        self.clock = Clock()
+        self.log = mock_log()
+        self.poller = BuildPoller(self.log, 'http://url/', self.clock,
+                                  interval=20, since_margin=5)
+        self.listed = []
+        self.list_servers = patch(
+            self, 'otter.worker.launch_server_v1.list_servers_changed_since',
+            side_effect=self._list)
+        self.clock.advance(100)
+
+    def _list(self, *args, **kwargs):
+        d = Deferred()
+        self.listed.append((args, kwargs, d))
+        return d
+
+    def test_one_request_for_all_servers(self):
+        """
+        All the servers are refreshed with one listing of servers changed
+        since a little before they were added, using the latest auth token
+        """
+        d1 = self.poller.wait(self.log, 'token1', 's1')
+        self.clock.advance(10)
+        d2 = self.poller.wait(self.log, 'token2', 's2')
+        self.clock.advance(10)
+        self.assertEqual(
+            self.listed,
+            [(('http://url/', 'token2', 95), {'log': self.log}, mock.ANY)])
+        self.listed[0][2].callback([{'id': 's1', 'status': 'ACTIVE'},
+                                    {'id': 's2', 'status': 'BUILD'},
+                                    {'id': 's3', 'status': 'ACTIVE'}])
+        self.assertEqual(self.successResultOf(d1),
+                         {'server': {'id': 's1', 'status': 'ACTIVE'}})
+        self.assertNoResult(d2)
+
+        # next poll looks for changes since the last one
+        self.clock.advance(20)
+        self.assertEqual(self.listed[1][0], ('http://url/', 'token2', 115))
+
+    def test_unexpected_status(self):
+        """
+        Waiters errback with :class:`UnexpectedServerStatus` or
+        :class:`ServerDeleted` if their server goes into another state
+        """
+        d1 = self.poller.wait(self.log, 'token', 's1')
+        d2 = self.poller.wait(self.log, 'token', 's2')
+        self.clock.advance(20)
+        self.listed[0][2].callback([{'id': 's1', 'status': 'ERROR'},
+                                    {'id': 's2', 'status': 'DELETED'}])
+        f = self.failureResultOf(d1, UnexpectedServerStatus)
+        self.assertEqual((f.value.server_id, f.value.status),
+                         ('s1', 'ERROR'))
+        self.failureResultOf(d2, ServerDeleted)
+        self.assertEqual(self.poller.waiting, 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_poll_error(self):
+        """
+        Polling errors are logged and polling continues
+        """
+        d = self.poller.wait(self.log, 'token', 's1')
+        self.clock.advance(20)
+        self.listed[0][2].errback(APIError(500, ''))
+        self.log.err.assert_called_once_with(
+            CheckFailure(APIError), 'build-poll-failed')
+        self.assertNoResult(d)
+        self.clock.advance(20)
+        self.assertEqual(len(self.listed), 2)
+
+    def test_no_overlapping_polls(self):
+        """
+        A poll is not started while another is in progress
+        """
+        self.poller.wait(self.log, 'token', 's1')
+        self.clock.advance(20)
+        self.poller.wait(self.log, 'token', 's2')
+        self.clock.advance(40)
+        self.assertEqual(len(self.listed), 1)
+        self.listed[0][2].callback([])
+        self.clock.advance(20)
+        self.assertEqual(len(self.listed), 2)
+
+    def test_cancel(self):
+        """
+        Cancelling the only waiter stops polling
+        """
+        d = self.poller.wait(self.log, 'token', 's1')
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.assertEqual(self.poller.waiting, 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_stops_after_last_server(self):
+        """
+        Polling stops once there are no more servers to watch
+        """
+        self.poller.wait(self.log, 'token', 's1')
+        self.clock.advance(20)
+        self.listed[0][2].callback([{'id': 's1', 'status': 'ACTIVE'}])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
 class ServerTests(RequestBagTestMixin, SynchronousTestCase):
     """
     Test server manipulation functions.
@@ -1194,6 +1308,26 @@ class ServerTests(RequestBagTestMixin, SynchronousTestCase):
         self.successResultOf(ret_ds[1])
         self.successResultOf(ret_ds[2])
 
+    def test_create_server_rate_limited(self):
+        """
+        When a create server rate limit is configured, create_server posts
+        requests as the tenant's limit allows instead of one at a time
+        """
+        patch(self, 'otter.worker.launch_server_v1.rate_limiters',
+              new=RateLimiters())
+        set_config_data(merge(fake_config, {
+            'cloud_client': {'rate_limits': {
+                'create_server': {'tenant_rate': 1, 'tenant_burst': 2}}}}))
+        self.treq.post.side_effect = lambda *a, **kw: Deferred()
+
+        for tenant_id in ['t1', 't1', 't1', 't2']:
+            create_server('http://url/', 'my-auth-token', {'some': 'stuff'},
+                          clock=self.clock, tenant_id=tenant_id)
+
+        self.assertEqual(self.treq.post.call_count, 3)
+        self.clock.advance(1)
+        self.assertEqual(self.treq.post.call_count, 4)
+
     def _create_server(self, url, token, conf, **kwargs):
         d = create_server(url, token, conf, clock=self.clock, **kwargs)
         self.clock.advance(1)
@@ -1556,6 +1690,56 @@ class ServerTests(RequestBagTestMixin, SynchronousTestCase):
         self.assertEqual(defaults_by_name(wait_for_active)["timeout"],
                          2 * 60 * 60)
 
+    @mock.patch('otter.worker.launch_server_v1.list_servers_changed_since')
+    def test_wait_for_active_shared_poller(self, list_servers):
+        """
+        With a tenant ID, wait_for_active watches the server with the tenant's
+        shared :class:`BuildPoller`, timing out the same way.
+        """
+        clock = Clock()
+        list_servers.side_effect = lambda *a, **kw: succeed(
+            [{'id': 's1', 'status': 'ACTIVE'},
+             {'id': 's2', 'status': 'BUILD'}])
+        d1 = wait_for_active(self.log, 'http://url/', 'token', 's1',
+                             interval=5, timeout=6, clock=clock,
+                             tenant_id='t1')
+        d2 = wait_for_active(self.log, 'http://url/', 'token', 's2',
+                             interval=5, timeout=6, clock=clock,
+                             tenant_id='t1')
+        self.assertEqual(
+            get_build_poller('t1', 'http://url/', clock, 5).waiting, 2)
+        clock.advance(5)
+        self.assertEqual(list_servers.call_count, 1)
+        self.assertEqual(self.successResultOf(d1),
+                         {'server': {'id': 's1', 'status': 'ACTIVE'}})
+        self.assertNoResult(d2)
+        clock.advance(1)
+        self.failureResultOf(d2, TimedOutError)
+        self.assertEqual(clock.getDelayedCalls(), [])
+
+    def test_list_servers_changed_since(self):
+        """
+        list_servers_changed_since lists servers changed since the given time
+        following next links
+        """
+        self.treq.get.side_effect = lambda *a, **kw: succeed(
+            mock.Mock(code=200))
+        self.treq.json_content.side_effect = iter([
+            succeed({'servers': [{'id': 'a'}],
+                     'servers_links': [{'rel': 'next', 'href': 'next'}]}),
+            succeed({'servers': [{'id': 'b'}]})])
+
+        d = list_servers_changed_since('http://url/', 'my-auth-token', 0,
+                                       self.log)
+
+        self.assertEqual(self.successResultOf(d), [{'id': 'a'}, {'id': 'b'}])
+        self.assertEqual(
+            self.treq.get.mock_calls,
+            [mock.call('http://url/servers/detail?changes-since='
+                       '1970-01-01T00%3A00%3A00Z',
+                       headers=expected_headers(), log=self.log),
+             mock.call('next', headers=expected_headers(), log=self.log)])
+
     def _launch_server(self, launch_config, log=None, clock=None):
         """
         Helper method for calling :func:`launch_server`.
@@ -1624,12 +1808,13 @@ class ServerTests(RequestBagTestMixin, SynchronousTestCase):
         create_server.assert_called_once_with('http://dfw.openstack/',
                                               self.bags[-1].auth_token,
                                               expected_server_config,
-                                              log=mock.ANY)
+                                              log=mock.ANY,
+                                              tenant_id='1234')
 
         wait_for_active.assert_called_once_with(mock.ANY,
                                                 'http://dfw.openstack/',
                                                 self.bags[-1].auth_token,
-                                                '1')
+                                                '1', tenant_id='1234')
 
         log.bind.assert_called_once_with(server_name='as000000')
         log = log.bind.return_value
@@ -1904,7 +2089,7 @@ class ServerTests(RequestBagTestMixin, SynchronousTestCase):
         wfa_returns = [fail(UnexpectedServerStatus('1', 'ERROR', 'ACTIVE')),
                        fail(UnexpectedServerStatus('1', 'ERROR', 'ACTIVE')),
                        succeed(server_details)]
-        mock_wfa.side_effect = lambda *a: wfa_returns.pop(0)
+        mock_wfa.side_effect = lambda *a, **kw: wfa_returns.pop(0)
         mock_vd.side_effect = lambda *a: Deferred()
 
         clock = Clock()
@@ -1980,7 +2165,7 @@ class ServerTests(RequestBagTestMixin, SynchronousTestCase):
 
         wfa_returns = [fail(UnexpectedServerStatus('1', 'SOME', 'ACTIVE')),
                        succeed(server_details)]
-        mock_wfa.side_effect = lambda *a: wfa_returns.pop(0)
+        mock_wfa.side_effect = lambda *a, **kw: wfa_returns.pop(0)
 
         clock = Clock()
         d = self._launch_server(launch_config, clock=clock)
@@ -2016,7 +2201,7 @@ class ServerTests(RequestBagTestMixin, SynchronousTestCase):
                        fail(UnexpectedServerStatus('1', 'ERROR', 'ACTIVE')),
                        fail(UnexpectedServerStatus('1', 'ERROR', 'ACTIVE')),
                        fail(UnexpectedServerStatus('1', 'ERROR', 'ACTIVE'))]
-        mock_wfa.side_effect = lambda *a: wfa_returns.pop(0)
+        mock_wfa.side_effect = lambda *a, **kw: wfa_returns.pop(0)
 
         clock = Clock()
         d = self._launch_server(launch_config, clock=clock)
@@ -0,0 +1,68 @@
+"""
+Flattening of composed Effect dispatchers.
+"""
+
+from effect import ComposedDispatcher, TypeDispatcher
+
+
+def _leaves(dispatcher, leaves):
+    """
+    Append the dispatchers that are not :obj:`ComposedDispatcher` in the tree
+    of the given dispatcher to ``leaves``, in the order they would be
+    searched.
+    """
+    if isinstance(dispatcher, ComposedDispatcher):
+        for child in dispatcher.dispatchers:
+            _leaves(child, leaves)
+    else:
+        leaves.append(dispatcher)
+    return leaves
+
+
+def flatten_dispatcher(dispatcher):
+    """
+    Return a dispatcher that finds the same performer for every intent as the
+    given one, but with the mappings of all the :obj:`TypeDispatcher` in a
+    tree of :obj:`ComposedDispatcher` merged into as few dictionaries as
+    possible. This turns finding a performer from a search through every
+    dispatcher of the tree into one dictionary lookup by intent type.
+
+    Dispatchers that are neither composed nor type based, like
+    :obj:`effect.testing.SequenceDispatcher`, can look at more than the type
+    of the intent, so the type mappings before and after one of them are not
+    merged across it.
+
+    :return: :obj:`TypeDispatcher` if all the dispatchers in the tree are
+        type based, :obj:`ComposedDispatcher` of the merged
+        :obj:`TypeDispatcher` and other dispatchers otherwise
+    """
+    flat = []
+    run = []
+    for leaf in _leaves(dispatcher, []):
+        if isinstance(leaf, TypeDispatcher):
+            run.append(leaf.mapping)
+        else:
+            if run:
+                flat.append(_merged(run))
+                run = []
+            flat.append(leaf)
+    if run:
+        flat.append(_merged(run))
+    if len(flat) == 1 and isinstance(flat[0], TypeDispatcher):
+        return flat[0]
+    return ComposedDispatcher(flat)
+
+
+def _merged(mappings):
+    """
+    Return a :obj:`TypeDispatcher` with the performer of each type in the
+    first of the given mappings that has one that is not None.
+    """
+    merged = {}
+    for mapping in reversed(mappings):
+        if None in mapping.itervalues():
+            mapping = {intent_type: performer
+                       for intent_type, performer in mapping.iteritems()
+                       if performer is not None}
+        merged.update(mapping)
+    return TypeDispatcher(merged)
@@ -0,0 +1,241 @@
+"""
+Token-bucket rate limiting of Deferred-returning operations, both globally
+and per tenant.
+"""
+
+from collections import deque
+
+from twisted.internet.defer import Deferred, succeed
+
+from otter.util.config import config_value
+
+
+# Slack allowed when comparing token counts, so that floating point error in
+# the refill computation does not make a waiter miss the call that was
+# scheduled exactly when its token becomes available
+_EPSILON = 1e-9
+
+
+class TokenBucket(object):
+    """
+    A token bucket that holds at most ``burst`` tokens and is refilled at
+    ``rate`` tokens per second. Tokens are handed out to waiters in the order
+    in which they asked for them.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param float rate: Number of tokens added to the bucket every second
+    :param int burst: Maximum number of tokens the bucket can hold. The
+        bucket starts out full.
+    """
+
+    def __init__(self, clock, rate, burst=1):
+        if rate <= 0:
+            raise ValueError('rate must be positive: {}'.format(rate))
+        if burst < 1:
+            raise ValueError('burst must be at least 1: {}'.format(burst))
+        self.clock = clock
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = clock.seconds()
+        self._waiters = deque()
+        self._call = None
+
+    @property
+    def waiting(self):
+        """
+        Number of callers waiting for a token.
+        """
+        return len(self._waiters)
+
+    def idle(self):
+        """
+        Is the bucket full with nobody waiting on it? An idle bucket behaves
+        exactly like a freshly created one and can be thrown away.
+        """
+        self._refill()
+        return not self._waiters and self._tokens >= self.burst - _EPSILON
+
+    def acquire(self):
+        """
+        Take a token from the bucket.
+
+        :return: Deferred that fires with None when a token has been taken.
+            Cancelling it gives up the place in the queue.
+        """
+        d = Deferred(self._cancel)
+        self._waiters.append(d)
+        self._release()
+        return d
+
+    def _cancel(self, d):
+        self._waiters.remove(d)
+        if not self._waiters and self._call is not None:
+            self._call.cancel()
+            self._call = None
+
+    def _refill(self):
+        now = self.clock.seconds()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def _wake(self):
+        self._call = None
+        self._release()
+
+    def _release(self):
+        """
+        Hand out as many tokens as are available and schedule a wake up for
+        when the next one will be if anybody is still waiting.
+        """
+        self._refill()
+        ready = []
+        while self._waiters and self._tokens >= 1 - _EPSILON:
+            self._tokens = max(self._tokens - 1, 0)
+            ready.append(self._waiters.popleft())
+        if self._waiters and self._call is None:
+            self._call = self.clock.callLater(
+                (1 - self._tokens) / self.rate, self._wake)
+        for d in ready:
+            d.callback(None)
+
+
+class RateLimiter(object):
+    """
+    Limits the rate at which functions are run, both globally and per tenant.
+    A call first waits for a token from its tenant's bucket and then for one
+    from the global bucket, so a single busy tenant can only ever hold
+    ``tenant_burst`` of the global queue's places at once.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param float rate: Global calls per second. None for no global limit.
+    :param int burst: Global burst capacity
+    :param float tenant_rate: Calls per second for each tenant. None for no
+        per-tenant limit.
+    :param int tenant_burst: Burst capacity of each tenant
+
+    :ivar int waiting: Number of calls waiting for a token
+    :ivar int waits: Number of calls that had to wait for a token
+    :ivar float total_wait_time: Seconds spent waiting by all calls
+    :ivar float max_wait_time: Longest time a call has waited
+    """
+
+    # Number of tenant buckets beyond which idle ones are thrown away
+    _min_prune_size = 100
+
+    def __init__(self, clock, rate=None, burst=1, tenant_rate=None,
+                 tenant_burst=1):
+        self.clock = clock
+        self._global = (TokenBucket(clock, rate, burst)
+                        if rate is not None else None)
+        self._tenant_rate = tenant_rate
+        self._tenant_burst = tenant_burst
+        self._tenants = {}
+        self._prune_size = self._min_prune_size
+        self.waiting = 0
+        self.waits = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _tenant_bucket(self, tenant_id):
+        bucket = self._tenants.get(tenant_id)
+        if bucket is None:
+            if len(self._tenants) >= self._prune_size:
+                self._tenants = {t: b for t, b in self._tenants.iteritems()
+                                 if not b.idle()}
+                self._prune_size = max(self._min_prune_size,
+                                       2 * len(self._tenants))
+            bucket = TokenBucket(self.clock, self._tenant_rate,
+                                 self._tenant_burst)
+            self._tenants[tenant_id] = bucket
+        return bucket
+
+    def _acquire(self, bucket):
+        return bucket.acquire() if bucket is not None else succeed(None)
+
+    def run(self, tenant_id, f, *args, **kwargs):
+        """
+        Run ``f(*args, **kwargs)`` once the rate limits allow it.
+
+        :param tenant_id: Tenant on behalf of whom ``f`` is being run
+        :return: Deferred that fires with the result of ``f``
+        """
+        start = self.clock.seconds()
+        self.waiting += 1
+        tenant = (self._tenant_bucket(tenant_id)
+                  if self._tenant_rate is not None else None)
+        d = self._acquire(tenant)
+        d.addCallback(lambda _: self._acquire(self._global))
+
+        def acquired(result):
+            self.waiting -= 1
+            waited = self.clock.seconds() - start
+            if waited > 0:
+                self.waits += 1
+                self.total_wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
+            return result
+
+        d.addBoth(acquired)
+        return d.addCallback(lambda _: f(*args, **kwargs))
+
+    def stats(self):
+        """
+        Queue depth and wait time metrics of this limiter.
+        """
+        return {
+            'waiting': self.waiting,
+            'tenants_waiting': sum(1 for b in self._tenants.itervalues()
+                                   if b.waiting),
+            'waits': self.waits,
+            'total_wait_time': self.total_wait_time,
+            'max_wait_time': self.max_wait_time
+        }
+
+
+class RateLimiters(object):
+    """
+    Named :obj:`RateLimiter` instances built from the
+    ``cloud_client.rate_limits.<name>`` configuration, which looks like::
+
+        {"rate": 2, "burst": 5, "tenant_rate": 0.5, "tenant_burst": 2}
+
+    where every key is optional. A limiter is rebuilt if its configuration
+    changes.
+    """
+
+    def __init__(self):
+        self._limiters = {}
+
+    def get(self, name, clock):
+        """
+        Get the limiter called ``name``.
+
+        :return: :obj:`RateLimiter` or None if no limit is configured
+        """
+        cfg = config_value('cloud_client.rate_limits.' + name)
+        if not cfg:
+            self._limiters.pop(name, None)
+            return None
+        cached = self._limiters.get(name)
+        if cached is not None and cached[0] == cfg:
+            return cached[1]
+        limiter = RateLimiter(
+            clock, cfg.get('rate'), cfg.get('burst', 1),
+            cfg.get('tenant_rate'), cfg.get('tenant_burst', 1))
+        self._limiters[name] = (dict(cfg), limiter)
+        return limiter
+
+    def health_check(self):
+        """
+        Report the metrics of all the limiters in use. Rate limiting never
+        makes a node unhealthy.
+        """
+        return True, {name: limiter.stats()
+                      for name, (_, limiter) in self._limiters.iteritems()}
+
+
+# Limiters shared by everything creating servers in this process, regardless
+# of whether it goes through convergence or the legacy worker
+rate_limiters = RateLimiters()
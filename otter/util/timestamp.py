@@ -2,13 +2,30 @@
 Utilities for consistently handling timestamp formats in otter
 """
 
+import calendar
+import re
 from datetime import datetime
+
 import iso8601
-import calendar
 
 
 MIN = "{0}Z".format(datetime.min.isoformat())
 
+# The formats of the timestamps in Nova server details and Atom feeds, such
+# as "2015-05-01T04:51:12Z" or "2015-05-01T04:51:12.078580+00:00"
+_TIMESTAMP_REGEX = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?"
+    r"(?:Z|([-+])(\d{2}):(\d{2}))\Z")
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+# Timestamps converted by timestamp_to_epoch. The same server creation and
+# feed entry times are converted on every convergence iteration, so they are
+# remembered until there are too many of them, at which point the cache is
+# cleared.
+_epoch_cache = {}
+_EPOCH_CACHE_SIZE = 50000
+
 
 def now():
     """
@@ -40,7 +57,49 @@ def timestamp_to_epoch(timestamp):
     :param str timestamp: A UTC timestamp string
     :return: EPOCH seconds as float
     """
-    return datetime_to_epoch(from_timestamp(timestamp))
+    if not isinstance(timestamp, basestring):
+        return datetime_to_epoch(from_timestamp(timestamp))
+    epoch = _epoch_cache.get(timestamp)
+    if epoch is None:
+        epoch = _parse_epoch(timestamp)
+        if epoch is None:
+            epoch = datetime_to_epoch(from_timestamp(timestamp))
+        if len(_epoch_cache) >= _EPOCH_CACHE_SIZE:
+            _epoch_cache.clear()
+        _epoch_cache[timestamp] = epoch
+    return epoch
+
+
+def _parse_epoch(timestamp):
+    """
+    Convert a timestamp in one of the formats matched by
+    :data:`_TIMESTAMP_REGEX` to EPOCH seconds, without building timezone
+    aware ``datetime`` objects like :func:`iso8601.parse_date` does.
+
+    :return: EPOCH seconds as float, or None if the timestamp is in any other
+        format or is not a valid time, in which case it should be parsed by
+        :func:`from_timestamp`
+    """
+    match = _TIMESTAMP_REGEX.match(timestamp)
+    if match is None:
+        return None
+    (year, month, day, hour, minute, second, fraction,
+     tz_sign, tz_hour, tz_minute) = match.groups()
+    try:
+        ordinal = datetime(int(year), int(month), int(day), int(hour),
+                           int(minute), int(second)).toordinal()
+    except ValueError:
+        return None
+    seconds = ((ordinal - _EPOCH_ORDINAL) * 86400 + int(hour) * 3600 +
+               int(minute) * 60 + int(second))
+    if tz_sign is not None:
+        # the UTC time may be out of the range datetime supports
+        if int(tz_hour) > 23 or year in ('0001', '9999'):
+            return None
+        offset = int(tz_hour) * 3600 + int(tz_minute) * 60
+        seconds += offset if tz_sign == '-' else -offset
+    microsecond = int(fraction.ljust(6, '0')) if fraction else 0
+    return seconds + microsecond / 1000000.
 
 
 def datetime_to_epoch(dt):
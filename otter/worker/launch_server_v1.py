@@ -18,13 +18,14 @@ import json
 import re
 from functools import partial
 from urllib import urlencode
+from weakref import WeakValueDictionary
 
 from pyrsistent import freeze, thaw
 
 from toolz import comp
 
 from twisted.internet.defer import (
-    DeferredLock, DeferredSemaphore, gatherResults, inlineCallbacks,
+    Deferred, DeferredLock, DeferredSemaphore, gatherResults, inlineCallbacks,
     returnValue)
 from twisted.internet.task import deferLater
 from twisted.python.failure import Failure
@@ -35,17 +36,21 @@ from otter.convergence.composition import (
     prepare_server_launch_config)
 from otter.convergence.model import _servicenet_address
 from otter.convergence.steps import UnexpectedServerStatus, set_server_name
+from otter.log import log as otter_log
 from otter.util import logging_treq as treq
 from otter.util.config import config_value
-from otter.util.deferredutils import delay, log_with_time, retry_and_timeout
+from otter.util.deferredutils import (
+    delay, log_with_time, retry_and_timeout, timeout_deferred)
 from otter.util.hashkey import generate_server_name
 from otter.util.http import (
     APIError, RequestError, append_segments, check_success, headers,
     raise_error_on_code, wrap_request_error)
+from otter.util.ratelimit import rate_limiters
 from otter.util.retry import (
     TransientRetryError, compose_retries, exponential_backoff_interval,
     random_interval, repeating_interval, retry, retry_times,
     terminal_errors_except, transient_errors_except)
+from otter.util.timestamp import epoch_to_utctimestr
 from otter.worker._rcv3 import add_to_rcv3, remove_from_rcv3
 
 # Number of times to retry when adding/removing nodes from LB
@@ -86,13 +91,39 @@ def server_details(server_endpoint, auth_token, server_id, log=None):
     return d.addCallback(treq.json_content)
 
 
+def _check_built(log, server_id, server, time_building):
+    """
+    Check the status of a server that has been building for
+    ``time_building`` seconds.
+
+    :return: ``server`` if it is ACTIVE or None if it is still building
+    :raises: :class:`UnexpectedServerStatus` if it is in any other state
+    """
+    status = server['server']['status']
+
+    if status == 'ACTIVE':
+        log.msg(("Server changed from 'BUILD' to 'ACTIVE' within "
+                 "{time_building} seconds"),
+                time_building=time_building)
+        return server
+
+    elif status != 'BUILD':
+        log.msg("Server changed to '{status}' in {time_building} seconds",
+                time_building=time_building, status=status)
+        raise UnexpectedServerStatus(
+            server_id,
+            status,
+            'ACTIVE')
+
+
 def wait_for_active(log,
                     server_endpoint,
                     auth_token,
                     server_id,
                     interval=20,
                     timeout=7200,
-                    clock=None):
+                    clock=None,
+                    tenant_id=None):
     """
     Wait until the server specified by server_id's status is 'ACTIVE'
 
@@ -103,6 +134,9 @@ def wait_for_active(log,
     :param int interval: Polling interval in seconds.  Default: 20.
     :param int timeout: timeout to poll for the server status in seconds.
         Default 7200 (2 hours).
+    :param tenant_id: If given, the server is watched by the
+        :class:`BuildPoller` shared by all the servers of this tenant instead
+        of being polled on its own.
 
     :return: Deferred that fires when the expected status has been seen.
     """
@@ -113,37 +147,29 @@ def wait_for_active(log,
         from twisted.internet import reactor
         clock = reactor
 
+    timeout_description = ("Waiting for server <{0}> to change from BUILD "
+                           "state to ACTIVE state").format(server_id)
+
+    if tenant_id is not None:
+        poller = get_build_poller(tenant_id, server_endpoint, clock, interval)
+        d = poller.wait(log, auth_token, server_id)
+        timeout_deferred(d, timeout, clock, timeout_description)
+        return d
+
     start_time = clock.seconds()
 
     def poll():
         def check_status(server):
-            status = server['server']['status']
-            time_building = clock.seconds() - start_time
-
-            if status == 'ACTIVE':
-                log.msg(("Server changed from 'BUILD' to 'ACTIVE' within "
-                         "{time_building} seconds"),
-                        time_building=time_building)
-                return server
-
-            elif status != 'BUILD':
-                log.msg("Server changed to '{status}' in {time_building} seconds",
-                        time_building=time_building, status=status)
-                raise UnexpectedServerStatus(
-                    server_id,
-                    status,
-                    'ACTIVE')
-
-            else:
+            result = _check_built(log, server_id, server,
+                                  clock.seconds() - start_time)
+            if result is None:
                 raise TransientRetryError()  # just poll again
+            return result
 
         sd = server_details(server_endpoint, auth_token, server_id, log=log)
         sd.addCallback(check_status)
         return sd
 
-    timeout_description = ("Waiting for server <{0}> to change from BUILD "
-                           "state to ACTIVE state").format(server_id)
-
     return retry_and_timeout(
         poll, timeout,
         can_retry=transient_errors_except(UnexpectedServerStatus, ServerDeleted),
@@ -152,6 +178,180 @@ def wait_for_active(log,
         deferred_description=timeout_description)
 
 
+def list_servers_changed_since(server_endpoint, auth_token, since, log=None):
+    """
+    List the details of all servers that have changed since the given time,
+    following pagination links. Deleted servers are included with the status
+    ``DELETED``.
+
+    :param str server_endpoint: Server endpoint URI.
+    :param str auth_token: Keystone Auth token.
+    :param float since: EPOCH seconds
+    :param log: A bound logger
+
+    :return: Deferred that fires with a list of server details dicts
+    """
+    servers = []
+
+    def get_page(url):
+        d = treq.get(url, headers=headers(auth_token), log=log)
+        d.addCallback(check_success, [200, 203])
+        d.addCallback(treq.json_content)
+        return d.addCallback(got_page, url)
+
+    def got_page(body, url):
+        servers.extend(body['servers'])
+        links = [link['href'] for link in body.get('servers_links', [])
+                 if link['rel'] == 'next']
+        if links and links[0] != url:
+            return get_page(links[0])
+        return servers
+
+    return get_page('{path}?{query}'.format(
+        path=append_segments(server_endpoint, 'servers', 'detail'),
+        query=urlencode({'changes-since': epoch_to_utctimestr(since)})))
+
+
+class BuildPoller(object):
+    """
+    Watches all the building servers of a tenant with a single
+    ``changes-since`` listing of servers every ``interval`` seconds, instead
+    of fetching each server separately.
+
+    :param log: A bound logger to log polling errors to
+    :param str server_endpoint: Server endpoint URI.
+    :param clock: An :obj:`IReactorTime` provider
+    :param int interval: Polling interval in seconds
+    :param int since_margin: Seconds to look back further than the previous
+        poll, to account for clock skew between otter and Nova
+    """
+
+    def __init__(self, log, server_endpoint, clock, interval=20,
+                 since_margin=60):
+        self.log = log
+        self.server_endpoint = server_endpoint
+        self.clock = clock
+        self.interval = interval
+        self.since_margin = since_margin
+        self._waiters = {}
+        self._auth_token = None
+        self._since = None
+        self._call = None
+        self._polling = False
+
+    def wait(self, log, auth_token, server_id):
+        """
+        Wait for the server to leave BUILD state.
+
+        :param log: A bound logger.
+        :param str auth_token: Keystone Auth token. The most recent one given
+            is used for polling.
+        :param str server_id: Opaque nova server id.
+
+        :return: Deferred that fires with the server details, in the format
+            of :func:`server_details`, when the server becomes ACTIVE. It
+            errbacks with :class:`UnexpectedServerStatus` if the server goes
+            into any other state and with :class:`ServerDeleted` if it is
+            deleted. Cancelling it stops watching the server.
+        """
+        now = self.clock.seconds()
+        d = Deferred(lambda d: self._remove(server_id, d))
+        self._waiters.setdefault(server_id, []).append((d, log, now))
+        self._auth_token = auth_token
+        if self._since is None:
+            self._since = now - self.since_margin
+        self._schedule()
+        return d
+
+    @property
+    def waiting(self):
+        """
+        Number of servers being watched.
+        """
+        return len(self._waiters)
+
+    def _remove(self, server_id, d):
+        waiters = [w for w in self._waiters[server_id] if w[0] is not d]
+        if waiters:
+            self._waiters[server_id] = waiters
+        else:
+            del self._waiters[server_id]
+        if not self._waiters:
+            self._stop()
+
+    def _stop(self):
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+        self._since = None
+
+    def _schedule(self):
+        if self._waiters and self._call is None and not self._polling:
+            self._call = self.clock.callLater(self.interval, self._poll)
+
+    def _poll(self):
+        self._call = None
+        self._polling = True
+        poll_time = self.clock.seconds()
+        d = list_servers_changed_since(
+            self.server_endpoint, self._auth_token, self._since, log=self.log)
+        d.addCallbacks(self._update, self.log.err,
+                       callbackArgs=(poll_time,),
+                       errbackArgs=('build-poll-failed',))
+
+        def done(_):
+            self._polling = False
+            if self._waiters:
+                self._schedule()
+            else:
+                self._stop()
+
+        d.addCallback(done)
+
+    def _update(self, servers, poll_time):
+        """
+        Resolve the waiters of all the servers that have left BUILD state and
+        look for changes after this poll from now on.
+        """
+        self._since = poll_time - self.since_margin
+        for server in servers:
+            waiters = self._waiters.get(server['id'])
+            if waiters is None or server['status'] == 'BUILD':
+                continue
+            del self._waiters[server['id']]
+            for d, log, start in waiters:
+                if server['status'] == 'DELETED':
+                    d.errback(ServerDeleted(server['id']))
+                    continue
+                try:
+                    result = _check_built(log, server['id'],
+                                          {'server': server},
+                                          self.clock.seconds() - start)
+                except UnexpectedServerStatus:
+                    d.errback()
+                else:
+                    d.callback(result)
+
+
+_build_pollers = WeakValueDictionary()
+
+
+def get_build_poller(tenant_id, server_endpoint, clock, interval):
+    """
+    Get the :class:`BuildPoller` of the tenant's servers at the given
+    endpoint, creating it if there isn't one. A poller goes away once it has
+    no more servers to watch.
+    """
+    key = (tenant_id, server_endpoint)
+    poller = _build_pollers.get(key)
+    if poller is None:
+        poller = BuildPoller(
+            otter_log.bind(system='build_poller', tenant_id=tenant_id),
+            server_endpoint, clock, interval)
+        _build_pollers[key] = poller
+    return poller
+
+
 # limit on 1 servers to be created simultaneously
 MAX_CREATE_SERVER = 1
 create_server_sem = DeferredSemaphore(MAX_CREATE_SERVER)
@@ -236,8 +436,21 @@ class _NoCreatedServerFound(Exception):
         self.original = original_failure
 
 
+def _throttle_create_server(clock, tenant_id, post):
+    """
+    Call ``post`` as the ``create_server`` rate limit allows or, if no limit
+    is configured, one at a time with 1 second between server creations.
+    """
+    limiter = rate_limiters.get('create_server', clock)
+    if limiter is not None:
+        return limiter.run(tenant_id, post)
+    return create_server_sem.run(
+        lambda: post().addCallback(delay, clock, 1))
+
+
 def create_server(server_endpoint, auth_token, server_config, log=None,
-                  clock=None, retries=3, create_failure_delay=5, _treq=None):
+                  clock=None, retries=3, create_failure_delay=5, _treq=None,
+                  tenant_id=None):
     """
     Create a new server.  If there is an error from Nova from this call,
     checks to see if the server was created anyway.  If not, will retry the
@@ -263,6 +476,10 @@ def create_server(server_endpoint, auth_token, server_config, log=None,
     :param _treq: To be used for testing - what treq object to use
     :type treq: something with the same api as :obj:`treq`
 
+    :param tenant_id: Tenant the server is created for. Creations are rate
+        limited per tenant when ``cloud_client.rate_limits.create_server`` is
+        configured, and one at a time a second apart otherwise.
+
     :return: Deferred that fires with the CreateServer response as a dict.
     """
     path = append_segments(server_endpoint, 'servers')
@@ -310,12 +527,9 @@ def create_server(server_endpoint, auth_token, server_config, log=None,
         d.addBoth(_check_results, f)
         return d
 
-    def _create_with_delay():
-        d = _treq.post(path, headers=headers(auth_token),
-                       data=json.dumps({'server': server_config}), log=log)
-        # Add 1 second delay to space 1 second between server creations
-        d.addCallback(delay, clock, 1)
-        return d
+    def _post():
+        return _treq.post(path, headers=headers(auth_token),
+                          data=json.dumps({'server': server_config}), log=log)
 
     def _create_server():
         """
@@ -325,7 +539,7 @@ def create_server(server_endpoint, auth_token, server_config, log=None,
 
         If not, and if no further errors occur, server creation can be retried.
         """
-        d = create_server_sem.run(_create_with_delay)
+        d = _throttle_create_server(clock, tenant_id, _post)
         d.addCallback(check_success, [202], _treq=_treq)
         d.addCallback(_treq.json_content)
         d.addErrback(_check_server_created)
@@ -662,7 +876,8 @@ def launch_server(log, request_bag, scaling_group, launch_config, undo,
             ilog[0],
             server_endpoint,
             new_request_bag.auth_token,
-            server_id).addCallback(check_metadata)
+            server_id,
+            tenant_id=scaling_group.tenant_id).addCallback(check_metadata)
 
     def add_lb(server, new_request_bag):
         if lb_config:
@@ -675,7 +890,8 @@ def launch_server(log, request_bag, scaling_group, launch_config, undo,
 
     def _real_create_server(new_request_bag):
         auth_token = new_request_bag.auth_token
-        d = create_server(server_endpoint, auth_token, server_config, log=log)
+        d = create_server(server_endpoint, auth_token, server_config, log=log,
+                          tenant_id=scaling_group.tenant_id)
         d.addCallback(wait_for_server, new_request_bag)
         d.addCallback(add_lb, new_request_bag)
         return d
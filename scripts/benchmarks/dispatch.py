@@ -0,0 +1,133 @@
+"""
+Benchmark of the overhead of performing an intent with Otter's full effect
+dispatcher, comparing the nested composition of dispatchers with the
+flattened one, both at the top level and inside a :obj:`TenantScope`.
+
+Example:
+`PYTHONPATH=. python scripts/benchmarks/dispatch.py -n 100000`
+will time finding the performers of 100000 intents of each type, and the
+cost of flattening the dispatcher for each :obj:`TenantScope`
+"""
+
+from __future__ import print_function
+
+import timeit
+from argparse import ArgumentParser
+
+from effect import (
+    ComposedDispatcher, Constant, Effect, TypeDispatcher, base_dispatcher,
+    sync_perform)
+from effect.ref import reference_dispatcher
+
+from txeffect import make_twisted_dispatcher
+
+from otter.auth import (
+    Authenticate, InvalidateToken, perform_authenticate,
+    perform_invalidate_token)
+from otter.cloud_client import (
+    ServiceRequest, get_cloud_client_dispatcher, service_request)
+from otter.constants import ServiceType
+from otter.log.intents import (
+    Log, get_log_dispatcher, get_msg_time_dispatcher)
+from otter.models.cass import CQLQueryExecute, get_cql_dispatcher
+from otter.models.intents import get_model_dispatcher
+from otter.util.dispatcher import flatten_dispatcher
+from otter.util.pure_http import Request, perform_request
+from otter.util.retry import Retry, perform_retry
+from otter.util.zk import get_zk_dispatcher
+from otter.worker_intents import get_eviction_dispatcher
+
+
+def nested_full_dispatcher():
+    """
+    Return the full dispatcher composed as it was before being flattened
+    """
+    simple = ComposedDispatcher([
+        base_dispatcher,
+        TypeDispatcher({
+            Authenticate: perform_authenticate,
+            InvalidateToken: perform_invalidate_token,
+            Request: perform_request,
+            Retry: perform_retry,
+        }),
+        make_twisted_dispatcher(None),
+        reference_dispatcher,
+    ])
+    legacy = ComposedDispatcher([
+        get_cloud_client_dispatcher(None, None, None, None), simple])
+    return ComposedDispatcher([
+        legacy,
+        get_zk_dispatcher(None),
+        get_model_dispatcher(None, None),
+        get_eviction_dispatcher(None),
+        get_log_dispatcher(None, {}),
+        get_msg_time_dispatcher(None),
+        get_cql_dispatcher(None)
+    ])
+
+
+def dispatchers():
+    """
+    Return the nested and flattened full dispatchers, at the top level and
+    extended with a :obj:`ServiceRequest` performer like inside a
+    :obj:`TenantScope`
+    """
+    nested = nested_full_dispatcher()
+    scoped = ComposedDispatcher([
+        TypeDispatcher({ServiceRequest: lambda d, i, box: None}), nested])
+    return [('nested', nested), ('flat', flatten_dispatcher(nested)),
+            ('nested scope', scoped),
+            ('flat scope', flatten_dispatcher(scoped))]
+
+
+def intents():
+    """
+    Return intents found early, in the middle and last in the nested
+    dispatcher
+    """
+    return [
+        ('Constant', Constant(None)),
+        ('Log', Log('msg', {})),
+        ('CQLQueryExecute', CQLQueryExecute(query='q', params={},
+                                            consistency_level=1)),
+        ('ServiceRequest',
+         service_request(ServiceType.CLOUD_SERVERS, 'GET', 'servers').intent),
+    ]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=100000,
+                        help='Number of intents dispatched per timing')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of times each dispatch is timed')
+    args = parser.parse_args()
+
+    for name, dispatcher in dispatchers():
+        for intent_name, intent in intents():
+            if (intent_name == 'ServiceRequest' and
+                    not name.endswith('scope')):
+                continue
+            best = min(timeit.repeat(lambda: dispatcher(intent),
+                                     repeat=args.repeat, number=args.number))
+            print('{:<13} {:<16} {:6.3f} us/intent'.format(
+                name, intent_name, best / args.number * 1e6))
+        eff = Effect(Constant(None))
+        best = min(timeit.repeat(lambda: sync_perform(dispatcher, eff),
+                                 repeat=args.repeat,
+                                 number=args.number // 10))
+        print('{:<13} {:<16} {:6.3f} us/effect'.format(
+            name, 'perform Constant', best / (args.number // 10) * 1e6))
+
+    # Cost of extending the flat dispatcher for each TenantScope
+    flat = flatten_dispatcher(nested_full_dispatcher())
+    extend = TypeDispatcher({ServiceRequest: lambda d, i, box: None})
+    best = min(timeit.repeat(
+        lambda: flatten_dispatcher(ComposedDispatcher([extend, flat])),
+        repeat=args.repeat, number=args.number // 10))
+    print('{:<30} {:6.3f} us/scope'.format(
+        'flattening a scope', best / (args.number // 10) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark of logging "execute-convergence" events of large groups through the
+specification and JSON observers, comparing splitting the events by halving
+the lists of servers and CLB nodes until the events are short enough with
+packing them greedily from the encoded lengths of each server and node.
+
+Example:
+`PYTHONPATH=. python scripts/benchmarks/log_pipeline.py -s 1000 -n 2000`
+will time logging the event of a 1000 server group with 2000 CLB nodes
+"""
+
+from __future__ import print_function
+
+import timeit
+from argparse import ArgumentParser
+from datetime import datetime
+from functools import partial
+
+from pyrsistent import freeze, pset
+
+from toolz.curried import assoc
+from toolz.dicttoolz import keyfilter
+
+from otter.convergence.model import (
+    CLBDescription, CLBNode, DesiredServerGroupState, NovaServer,
+    ServerState)
+from otter.convergence.steps import CreateServer
+from otter.log.formatters import JSONObserverWrapper, ObserverWrapper
+from otter.log.spec import (
+    SpecificationObserverWrapper, _json_len, event_max_length,
+    get_validated_event, msg_types, split)
+
+
+def make_event(num_servers, num_nodes):
+    """
+    Return an "execute-convergence" event of a group with the given number of
+    servers, with all the CLB nodes on the group's CLB.
+    """
+    desc = CLBDescription(lb_id='1', port=80)
+    servers = [
+        NovaServer(id='server{}'.format(i), state=ServerState.ACTIVE,
+                   created=float(i), image_id='image', flavor_id='flavor',
+                   desired_lbs=pset([desc]),
+                   servicenet_address='10.0.{}.{}'.format(i // 256, i % 256),
+                   links=freeze([{'href': 'link{}'.format(i),
+                                  'rel': 'self'}]))
+        for i in range(num_servers)]
+    nodes = [
+        CLBNode(node_id='node{}'.format(i), description=desc,
+                address='10.0.{}.{}'.format(i // 256, i % 256))
+        for i in range(num_nodes)]
+    desired = DesiredServerGroupState(
+        server_config={'server': {'flavorRef': 'flavor'}},
+        capacity=num_servers, desired_lbs=pset([desc]))
+    return {'message': ('execute-convergence',), 'isError': False,
+            'system': 'otter', 'tenant_id': 'tenant', 'group_id': 'group',
+            'now': datetime(2015, 1, 1), 'desired': desired,
+            'steps': [CreateServer(server_config=freeze({}))],
+            'servers': servers, 'lb_nodes': nodes}
+
+
+def halving_split(event, max_length=event_max_length):
+    """
+    Split the event by halving the lists of servers and CLB nodes and encoding
+    them again until they are short enough.
+    """
+    message = "Executing convergence"
+    if _json_len(event) <= max_length:
+        return [(event, message)]
+    events = [(event, message)]
+    base_event = keyfilter(
+        lambda k: k not in ('desired', 'servers', 'lb_nodes', 'steps'),
+        event)
+    for thing in sorted(('servers', 'lb_nodes'),
+                        key=lambda k: _json_len(event[k]), reverse=True):
+        events.extend(
+            (e, message)
+            for e in split(assoc(base_event, thing), event[thing],
+                           max_length, _json_len))
+        del event[thing]
+        if _json_len(event) <= max_length:
+            break
+    return events
+
+
+def pipeline(split_execute_convergence):
+    """
+    Return the specification and JSON observer chain splitting
+    "execute-convergence" events with the given function, and the list the
+    JSON messages are written to.
+    """
+    messages = []
+    specs = assoc(msg_types, 'execute-convergence', split_execute_convergence)
+    observer = SpecificationObserverWrapper(
+        ObserverWrapper(
+            JSONObserverWrapper(
+                lambda e: messages.append(e['message'][0]), sort_keys=True),
+            hostname='benchmark'),
+        partial(get_validated_event, specs=specs))
+    return observer, messages
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-s', '--servers', type=int, default=1000,
+                        help='Number of servers in the group')
+    parser.add_argument('-n', '--nodes', type=int, default=2000,
+                        help='Number of CLB nodes of the group')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of times each pipeline is timed')
+    args = parser.parse_args()
+
+    event = make_event(args.servers, args.nodes)
+    print('{} servers, {} nodes'.format(args.servers, args.nodes))
+    greedy = msg_types['execute-convergence']
+    for name, splitter in [('halving', halving_split),
+                           ('greedy packing', greedy)]:
+        observer, messages = pipeline(splitter)
+        best = min(timeit.repeat(lambda: observer(event.copy()),
+                                 repeat=args.repeat, number=1))
+        print('{:<16} {:10.4f} seconds {:4d} events {:8d} bytes'.format(
+            name, best, len(messages) // args.repeat,
+            sum(map(len, messages)) // args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark of finding the load balancer nodes of every server while planning
+convergence, comparing checking every node of the tenant against each server
+with looking the nodes up in a :class:`LBNodeIndex`.
+
+Example:
+`PYTHONPATH=. python scripts/benchmarks/planning.py -s 500 -n 5000`
+will time planning a 500 server group of a tenant with 5000 CLB nodes
+"""
+
+from __future__ import print_function
+
+import timeit
+from argparse import ArgumentParser
+
+from pyrsistent import pset
+
+from otter.convergence.model import (
+    CLBDescription, CLBNode, DesiredServerGroupState, LBNodeIndex,
+    NovaServer, ServerState)
+from otter.convergence.planning import plan_launch_server
+
+
+def make_group(num_servers, num_nodes):
+    """
+    Return servers of a group that are all on a CLB, and the tenant's CLB
+    nodes of which the servers' nodes are the last ones.
+    """
+    desc = CLBDescription(lb_id='1', port=80)
+    servers = [
+        NovaServer(id='server{}'.format(i), state=ServerState.ACTIVE,
+                   created=float(i), image_id='image', flavor_id='flavor',
+                   desired_lbs=pset([desc]),
+                   servicenet_address='10.0.{}.{}'.format(i // 256, i % 256))
+        for i in range(num_servers)]
+    others = [
+        CLBNode(node_id='other{}'.format(i), description=desc,
+                address='10.1.{}.{}'.format(i // 256, i % 256))
+        for i in range(max(num_nodes - num_servers, 0))]
+    nodes = others + [
+        CLBNode(node_id='node{}'.format(i), description=desc,
+                address=server.servicenet_address)
+        for i, server in enumerate(servers)]
+    return servers, nodes
+
+
+def scan(servers, nodes):
+    """Find the nodes of every server by checking every node."""
+    return [[node for node in nodes if node.matches(server)]
+            for server in servers]
+
+
+def lookup(servers, nodes):
+    """Find the nodes of every server with an index."""
+    index = LBNodeIndex(nodes)
+    return [index.nodes_of(server) for server in servers]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-s', '--servers', type=int, default=500,
+                        help='Number of servers in the group')
+    parser.add_argument('-n', '--nodes', type=int, default=5000,
+                        help='Number of CLB nodes of the tenant')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of times each function is timed')
+    args = parser.parse_args()
+
+    servers, nodes = make_group(args.servers, args.nodes)
+    assert scan(servers, nodes) == lookup(servers, nodes)
+    desired = DesiredServerGroupState(
+        server_config={}, capacity=args.servers, desired_lbs=pset())
+
+    def plan():
+        return plan_launch_server(desired, 0, 3600, servers, nodes)
+
+    print('{} servers, {} nodes'.format(args.servers, len(nodes)))
+    for name, func in [('scan all nodes', lambda: scan(servers, nodes)),
+                       ('index lookup', lambda: lookup(servers, nodes)),
+                       ('plan_launch_server', plan)]:
+        best = min(timeit.repeat(func, repeat=args.repeat, number=1))
+        print('{:<20} {:10.4f} seconds'.format(name, best))
+
+
+if __name__ == '__main__':
+    main()
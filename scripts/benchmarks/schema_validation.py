@@ -0,0 +1,71 @@
+"""
+Benchmark of validating the bodies of group creation and policy update
+requests, comparing building a validator for every request with reusing the
+one built when the REST handler was decorated.
+
+Example:
+`PYTHONPATH=. python scripts/benchmarks/schema_validation.py -n 1000`
+will time validating 1000 bodies of each request
+"""
+
+from __future__ import print_function
+
+import timeit
+from argparse import ArgumentParser
+
+from jsonschema import Draft3Validator, validate
+
+from otter.json_schema import format_checker, group_examples, validator
+from otter.json_schema.group_schemas import policy
+from otter.json_schema.rest_schemas import create_group_request
+
+
+def payloads():
+    """
+    Return the schemas and example bodies of the requests
+    """
+    group = {
+        'groupConfiguration': group_examples.config()[0],
+        'launchConfiguration': group_examples.launch_server_config()[0],
+        'scalingPolicies': group_examples.policy()
+    }
+    return [('create group', create_group_request, group),
+            ('update policy', policy, group_examples.policy()[0])]
+
+
+def uncompiled(schema):
+    """
+    Validation as done before validators were reused: check the schema and
+    build a new validator for every body
+    """
+    return lambda body: validate(body, schema, cls=Draft3Validator,
+                                 format_checker=format_checker)
+
+
+def compiled(schema):
+    """
+    Validation with a validator built once
+    """
+    return validator(schema).validate
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=1000,
+                        help='Number of bodies validated per timing')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of times each validation is timed')
+    args = parser.parse_args()
+
+    for request, schema, body in payloads():
+        for name, make in [('uncompiled', uncompiled),
+                           ('compiled', compiled)]:
+            validate_body = make(schema)
+            best = min(timeit.repeat(lambda: validate_body(body),
+                                     repeat=args.repeat, number=args.number))
+            print('{:<14} {:<11} {:8.4f} seconds {:8.1f} us/body'.format(
+                request, name, best, best / args.number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark of the memory retained and the time taken to build the
+:obj:`NovaServer` objects of a group for one convergence iteration, comparing
+deep-freezing each server's Nova JSON with keeping it as :obj:`RawJSON`.
+
+Memory is measured as the number and size of the garbage-collected objects
+allocated while building the servers that are still alive afterwards. The
+Nova JSON itself is allocated before measuring as it is the response being
+parsed.
+
+Example:
+`PYTHONPATH=. python scripts/benchmarks/servers.py -s 1000`
+"""
+
+from __future__ import print_function
+
+import gc
+import sys
+import timeit
+from argparse import ArgumentParser
+
+import attr
+
+from pyrsistent import freeze
+
+from otter.convergence.model import NovaServer
+
+
+def server_json(i):
+    """Return Nova JSON of a server similar to what a group's servers have."""
+    server_id = 'a0b1c2d3-e4f5-4a6b-8c7d-{:012d}'.format(i)
+    return {
+        'id': server_id,
+        'name': 'as{:06x}'.format(i),
+        'status': 'ACTIVE',
+        'created': '2015-09-01T10:{:02d}:{:02d}Z'.format(i // 60 % 60, i % 60),
+        'updated': '2015-09-01T11:00:00Z',
+        'tenant_id': '123456',
+        'user_id': '654321',
+        'hostId': 'f' * 56,
+        'accessIPv4': '162.209.0.{}'.format(i % 256),
+        'accessIPv6': '2001:4800:7810:512::{:x}'.format(i),
+        'key_name': None,
+        'progress': 100,
+        'config_drive': '',
+        'OS-DCF:diskConfig': 'AUTO',
+        'OS-EXT-STS:power_state': 1,
+        'OS-EXT-STS:task_state': None,
+        'OS-EXT-STS:vm_state': 'active',
+        'flavor': {'id': 'general1-1',
+                   'links': [{'href': 'https://dfw/flavors/general1-1',
+                              'rel': 'bookmark'}]},
+        'image': {'id': 'image-id',
+                  'links': [{'href': 'https://dfw/images/image-id',
+                             'rel': 'bookmark'}]},
+        'addresses': {
+            'private': [{'addr': '10.0.{}.{}'.format(i // 256, i % 256),
+                         'version': 4}],
+            'public': [{'addr': '162.209.0.{}'.format(i % 256),
+                        'version': 4},
+                       {'addr': '2001:4800:7810:512::{:x}'.format(i),
+                        'version': 6}]},
+        'links': [{'href': 'https://dfw/v2/123456/servers/' + server_id,
+                   'rel': 'self'},
+                  {'href': 'https://dfw/123456/servers/' + server_id,
+                   'rel': 'bookmark'}],
+        'metadata': {
+            'rax:auto_scaling_group_id': 'group-id',
+            'rax:autoscale:group:id': 'group-id',
+            'rax:autoscale:lb:CloudLoadBalancer:12345':
+                '[{"port": 80}]',
+            'build_config': 'base_mgdops,rack_user_only',
+            'rax_service_level_automation': 'Complete'},
+    }
+
+
+def frozen(server_json):
+    """Build a server keeping deep-frozen copy of its JSON."""
+    return attr.assoc(NovaServer.from_server_details_json(server_json),
+                      json=freeze(server_json))
+
+
+def retained(func, jsons):
+    """
+    Return the number and total size of the objects allocated by calling
+    ``func`` with each JSON that are alive afterwards.
+    """
+    gc.collect()
+    before = set(id(o) for o in gc.get_objects())
+    servers = [func(j) for j in jsons]
+    gc.collect()
+    new = [o for o in gc.get_objects()
+           if id(o) not in before and o is not servers]
+    return len(new), sum(sys.getsizeof(o) for o in new)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-s', '--servers', type=int, default=1000,
+                        help='Number of servers in the group')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of times building servers is timed')
+    args = parser.parse_args()
+
+    jsons = [server_json(i) for i in range(args.servers)]
+    print('{} servers'.format(args.servers))
+    for name, func in [('deep-frozen json', frozen),
+                       ('raw json', NovaServer.from_server_details_json)]:
+        objects, size = retained(func, jsons)
+        best = min(timeit.repeat(lambda: [func(j) for j in jsons],
+                                 repeat=args.repeat, number=1))
+        print('{:<18} {:8d} objects {:10d} bytes {:8.4f} seconds'.format(
+            name, objects, size, best))
+
+
+if __name__ == '__main__':
+    main()
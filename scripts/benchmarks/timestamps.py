@@ -0,0 +1,73 @@
+"""
+Benchmark of converting the creation timestamps of a group's servers to EPOCH
+seconds, as is done on every convergence iteration, comparing parsing them
+with iso8601 with the specialised parser, both the first time they are seen
+and once they are remembered.
+
+Example:
+`PYTHONPATH=. python scripts/benchmarks/timestamps.py -s 10000`
+will time converting the timestamps of a 10000 server listing
+"""
+
+from __future__ import print_function
+
+import timeit
+from argparse import ArgumentParser
+
+from otter.util import timestamp
+
+
+def created(num_servers):
+    """
+    Return Nova's creation timestamps of servers created a second apart
+    """
+    return ['2015-09-01T{:02d}:{:02d}:{:02d}Z'.format(i // 3600 % 24,
+                                                      i // 60 % 60, i % 60)
+            for i in range(num_servers)]
+
+
+def iso8601(timestamps):
+    """
+    Convert the timestamps as was done before the specialised parser
+    """
+    for ts in timestamps:
+        timestamp.datetime_to_epoch(timestamp.from_timestamp(ts))
+
+
+def first_seen(timestamps):
+    """
+    Convert timestamps that have not been seen before
+    """
+    timestamp._epoch_cache.clear()
+    for ts in timestamps:
+        timestamp.timestamp_to_epoch(ts)
+
+
+def remembered(timestamps):
+    """
+    Convert timestamps that have all been seen before
+    """
+    for ts in timestamps:
+        timestamp.timestamp_to_epoch(ts)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-s', '--servers', type=int, default=10000,
+                        help='Number of servers in the listing')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Number of times each conversion is timed')
+    args = parser.parse_args()
+
+    timestamps = created(args.servers)
+    print('{} servers'.format(args.servers))
+    for name, convert in [('iso8601', iso8601), ('first seen', first_seen),
+                          ('remembered', remembered)]:
+        best = min(timeit.repeat(lambda: convert(timestamps),
+                                 repeat=args.repeat, number=1))
+        print('{:<12} {:8.4f} seconds {:6.2f} us/server'.format(
+            name, best, best / args.servers * 1e6))
+
+
+if __name__ == '__main__':
+    main()